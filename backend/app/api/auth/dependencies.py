@@ -0,0 +1,158 @@
+"""
+Authentication dependencies for routes.
+
+`resolve_owner` replaces the per-request `User.username == owner` lookup of
+the file and query routes:
+
+- With an `Authorization: Bearer <token>` header the token is verified and
+  must belong to `{owner}`, otherwise the request is rejected (401/403).
+  Tokens carry the numeric user id, and verified tokens are kept in a small
+  TTL cache, so repeat requests resolve the user without decoding the token
+  again or touching the database.
+- Without a token the owner is looked up by username as before (cached the
+  same way), unless AUTH_REQUIRED is set, in which case the request gets 401.
+
+`get_current_user` requires a valid token regardless of the path.
+"""
+from collections import OrderedDict
+from dataclasses import dataclass
+import threading
+import time
+
+from fastapi import Depends, HTTPException, Path, Request
+from sqlalchemy.orm import Session
+
+from auth.jwt_handler import decodeJWT
+from config import settings
+from config.database import get_db
+from models.sqlalchemy.users import User
+from services.telemetry import get_metrics
+
+
+@dataclass(frozen=True)
+class Identity:
+    """The authenticated (or path-named) user a request acts as."""
+    id: int
+    username: str
+
+
+class IdentityCache:
+    """Thread-safe LRU cache of resolved identities whose entries expire."""
+
+    def __init__(self, capacity: int, ttl: float):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Identity | None:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            identity, expires = entry
+            if expires <= now:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return identity
+
+    def put(self, key: str, identity: Identity, ttl: float | None = None):
+        # A token is never cached past its own expiry
+        ttl = self.ttl if ttl is None else min(self.ttl, ttl)
+        if ttl <= 0 or self.capacity <= 0:
+            return
+        with self._lock:
+            self._data[key] = (identity, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.capacity:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+identities = IdentityCache(settings.AUTH_CACHE_SIZE, settings.AUTH_CACHE_TTL)
+
+
+def _bearer_token(request: Request) -> str | None:
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    return token.strip()
+
+
+def _lookup_user(db: Session, username: str) -> Identity | None:
+    user = db.query(User.id, User.username).filter(User.username == username).first()
+    return Identity(id=user.id, username=user.username) if user else None
+
+
+def verify_token(token: str, db: Session) -> Identity:
+    """
+    Resolve a bearer token to its user, from the cache when it was seen recently.
+
+    Raises:
+        HTTPException: 401 if the token is invalid, expired or its user is gone
+    """
+    identity = identities.get(f"token:{token}")
+    get_metrics().cache_requests.labels("auth_token", "hit" if identity else "miss").inc()
+    if identity is not None:
+        return identity
+
+    payload = decodeJWT(token)
+    if not payload or not payload.get("userID"):
+        raise HTTPException(status_code=401, detail="Invalid or expired token",
+                            headers={"WWW-Authenticate": "Bearer"})
+    if payload.get("uid") is not None:
+        identity = Identity(id=int(payload["uid"]), username=payload["userID"])
+    else:
+        # Tokens issued before uid was added need one lookup
+        identity = _lookup_user(db, payload["userID"])
+        if identity is None:
+            raise HTTPException(status_code=401, detail="Invalid or expired token",
+                                headers={"WWW-Authenticate": "Bearer"})
+    identities.put(f"token:{token}", identity, ttl=payload["exp"] - time.time())
+    return identity
+
+
+def get_current_user(request: Request, db: Session = Depends(get_db)) -> Identity:
+    """Dependency: the user of the request's bearer token (401 without one)."""
+    token = _bearer_token(request)
+    if token is None:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    return verify_token(token, db)
+
+
+def resolve_owner(
+    request: Request,
+    owner: str = Path(..., description="Username of the owner"),
+    db: Session = Depends(get_db)
+) -> Identity:
+    """
+    Dependency: the user named by the `{owner}` path parameter.
+
+    Raises:
+        HTTPException: 401/403 if a token is sent that is invalid or belongs to
+            someone else, 401 if no token is sent and AUTH_REQUIRED is set, and
+            404 if the owner does not exist
+    """
+    token = _bearer_token(request)
+    if token is not None:
+        identity = verify_token(token, db)
+        if identity.username != owner:
+            raise HTTPException(status_code=403, detail="Token does not belong to this owner")
+        return identity
+
+    if settings.AUTH_REQUIRED:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+
+    identity = identities.get(f"user:{owner}")
+    get_metrics().cache_requests.labels("auth_owner", "hit" if identity else "miss").inc()
+    if identity is None:
+        identity = _lookup_user(db, owner)
+        if identity is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        identities.put(f"user:{owner}", identity)
+    return identity
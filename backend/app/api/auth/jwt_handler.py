@@ -11,11 +11,14 @@ def token_response(token: str):
         "access_token": token
     }
 
-def signJWT(userID: str):
+def signJWT(userID: str, uid: int | None = None):
+    # uid (the numeric user id) lets requests resolve the user without a DB lookup
     payload = {
         "userID": userID,
         "exp": int(time.time()) + 1800
     }
+    if uid is not None:
+        payload["uid"] = uid
     token = jwt.encode(payload, jwt_secret, algorithm=jwt_algorithm)
     return token_response(token)
 
@@ -0,0 +1,187 @@
+"""
+Admission control: a mixed interactive and bulk workload.
+
+Simulates the server's slots with asyncio sleeps and runs the same workload
+twice: behind a FIFO `asyncio.Semaphore` of ADMISSION_CONCURRENCY slots (no
+admission control) and through an `AdmissionController` with the configured
+limits. The workload:
+
+- interactive users sending short queries at a steady rate
+- one bulk user parsing a folder with many parallel requests, and a few
+  users parsing one file at a time
+- a batch job running long requests back to back
+
+Rejected clients wait for the Retry-After they were given and try again.
+Reports end-to-end query latency (p50/p95/p99, including retries), 429s and
+queue times per class, and Jain's fairness index of completed parses across
+the parse users.
+
+Exits non-zero if the interactive p95 is not at least --min-speedup times
+lower than behind the semaphore, an admitted request waited longer than its
+class's queue SLO, the bulk user was never rate limited, or parse fairness
+is below --min-fairness.
+
+Run from backend/app/api:
+    python -m benchmarks.bench_admission --seconds 10
+"""
+from benchmarks import offline  # noqa: F401  (must precede app imports)
+
+import argparse
+import asyncio
+from contextlib import asynccontextmanager
+import json
+import random
+import sys
+import time
+
+from benchmarks.bench_load import _summary
+from config import settings
+from services.admission import BATCH, INTERACTIVE, PARSE, AdmissionController, AdmissionRejected
+
+# Simulated service time per class, in seconds
+SERVICE_SECONDS = {INTERACTIVE: 0.02, PARSE: 0.3, BATCH: 1.0}
+
+# Slack allowed over a queue SLO for event loop scheduling
+SLO_TOLERANCE = 0.05
+
+
+class FifoSlots:
+    """The baseline: one semaphore, first come first served, nothing rejected."""
+
+    def __init__(self, concurrency: int):
+        self._slots = asyncio.Semaphore(concurrency)
+
+    @asynccontextmanager
+    async def admit(self, user_key: str, name: str):
+        async with self._slots:
+            yield
+
+
+class Workload:
+    """Clients of one run and what happened to their requests."""
+
+    def __init__(self, admission, deadline: float):
+        self.admission = admission
+        self.deadline = deadline
+        self.latency = {name: [] for name in SERVICE_SECONDS}
+        self.queue = {name: [] for name in SERVICE_SECONDS}
+        self.rejected = {name: 0 for name in SERVICE_SECONDS}
+        self.rejected_by_user = {}
+        self.completed_by_user = {}
+
+    async def request(self, user_key: str, name: str):
+        """One request, retried after each rejection until it runs or the run ends."""
+        start = time.monotonic()
+        while time.monotonic() < self.deadline:
+            enqueued = time.monotonic()
+            try:
+                async with self.admission.admit(user_key, name):
+                    self.queue[name].append(time.monotonic() - enqueued)
+                    await asyncio.sleep(SERVICE_SECONDS[name])
+            except AdmissionRejected as ar:
+                self.rejected[name] += 1
+                self.rejected_by_user[user_key] = self.rejected_by_user.get(user_key, 0) + 1
+                await asyncio.sleep(ar.retry_after)
+                continue
+            self.latency[name].append(time.monotonic() - start)
+            self.completed_by_user[user_key] = self.completed_by_user.get(user_key, 0) + 1
+            return
+
+    async def interactive_user(self, user_key: str, rate: float, rng: random.Random):
+        pending = set()
+        while time.monotonic() < self.deadline:
+            task = asyncio.create_task(self.request(user_key, INTERACTIVE))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+            await asyncio.sleep(rng.expovariate(rate))
+        await asyncio.gather(*pending)
+
+    async def closed_loop(self, user_key: str, name: str):
+        while time.monotonic() < self.deadline:
+            await self.request(user_key, name)
+
+
+def _jain(values: list[float]) -> float:
+    """Jain's fairness index: 1 when all values are equal, 1/n when one takes everything."""
+    total = sum(values)
+    if not total:
+        return 1.0
+    return total * total / (len(values) * sum(value * value for value in values))
+
+
+def _percentiles(samples: list[float]) -> dict:
+    summary = _summary(samples)
+    if samples:
+        ordered = sorted(samples)
+        summary["p99_ms"] = round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 2)
+    return summary
+
+
+async def run(admission, seconds: float, interactive_users: int, query_rate: float,
+              bulk_parallel: int, parse_users: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    workload = Workload(admission, time.monotonic() + seconds)
+    parsers = ["bulk"] + [f"parser-{i}" for i in range(parse_users)]
+    clients = [workload.interactive_user(f"reader-{i}", query_rate, rng) for i in range(interactive_users)]
+    clients += [workload.closed_loop("bulk", PARSE) for _ in range(bulk_parallel)]
+    clients += [workload.closed_loop(user_key, PARSE) for user_key in parsers[1:]]
+    clients += [workload.closed_loop("batch-job", BATCH) for _ in range(2)]
+    await asyncio.gather(*clients)
+
+    completed = [workload.completed_by_user.get(user_key, 0) for user_key in parsers]
+    return {
+        "interactive_latency": _percentiles(workload.latency[INTERACTIVE]),
+        "queue": {name: _percentiles(samples) for name, samples in workload.queue.items()},
+        "max_queue_seconds": {name: round(max(samples, default=0.0), 3)
+                              for name, samples in workload.queue.items()},
+        "rejected": workload.rejected,
+        "bulk_rejected": workload.rejected_by_user.get("bulk", 0),
+        "parses_completed": dict(zip(parsers, completed)),
+        "parse_fairness": round(_jain(completed), 3),
+    }
+
+
+async def scenario(seconds: float, interactive_users: int, query_rate: float, bulk_parallel: int,
+                   parse_users: int, seed: int = 0) -> dict:
+    concurrency = settings.ADMISSION_CONCURRENCY
+    baseline = await run(FifoSlots(concurrency), seconds, interactive_users, query_rate,
+                         bulk_parallel, parse_users, seed)
+    controller = AdmissionController(concurrency=concurrency, enabled=True)
+    admitted = await run(controller, seconds, interactive_users, query_rate,
+                         bulk_parallel, parse_users, seed)
+    admitted["controller"] = controller.stats()
+    return {
+        "seconds": seconds,
+        "concurrency": concurrency,
+        "service_seconds": SERVICE_SECONDS,
+        "fifo": baseline,
+        "admission": admitted,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seconds", type=float, default=10, help="Length of each run")
+    parser.add_argument("--interactive-users", type=int, default=6)
+    parser.add_argument("--query-rate", type=float, default=2, help="Queries per second per interactive user")
+    parser.add_argument("--bulk-parallel", type=int, default=12, help="Parallel parse requests of the bulk user")
+    parser.add_argument("--parse-users", type=int, default=3, help="Users parsing one file at a time")
+    parser.add_argument("--min-speedup", type=float, default=2.0)
+    parser.add_argument("--min-fairness", type=float, default=0.9)
+    args = parser.parse_args()
+
+    report = asyncio.run(scenario(args.seconds, args.interactive_users, args.query_rate,
+                                  args.bulk_parallel, args.parse_users))
+    fifo, admitted = report["fifo"], report["admission"]
+    slos = {name: limits["limits"]["queue_slo"] for name, limits in admitted["controller"]["classes"].items()}
+    report["checks"] = {
+        "interactive_p95_faster": admitted["interactive_latency"]["p95_ms"] * args.min_speedup
+        <= fifo["interactive_latency"]["p95_ms"],
+        "admitted_within_queue_slo": all(admitted["max_queue_seconds"][name] <= slos[name] + SLO_TOLERANCE
+                                         for name in slos),
+        "bulk_user_rate_limited": admitted["bulk_rejected"] > 0,
+        "parse_fairness": admitted["parse_fairness"] >= args.min_fairness,
+    }
+    print(json.dumps(report, indent=2))
+    if not all(report["checks"].values()):
+        sys.exit(1)
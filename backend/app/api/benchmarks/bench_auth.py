@@ -0,0 +1,96 @@
+"""
+Login bursts and identity resolution.
+
+Registers a user, then fires a burst of concurrent logins while another
+client keeps listing the user's files with a bearer token. Reports login
+throughput and the latency of the listing requests before and during the
+burst: bcrypt runs in its own small pool, so the burst should barely show
+up in the other requests. Also reports how often identity was served from
+the token cache.
+
+Runs against the real app in process with the stand-ins from
+benchmarks.offline. Exits non-zero if a login fails or the listing p95
+during the burst exceeds --max-slowdown times its p95 before it.
+
+Run from backend/app/api:
+    python -m benchmarks.bench_auth --logins 50
+"""
+from benchmarks import offline  # noqa: F401  (must precede app imports)
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+import httpx
+
+from benchmarks.bench_load import _summary
+from config import database
+from main import app
+from services.telemetry import get_metrics
+
+
+async def _probe(client: httpx.AsyncClient, headers: dict, stop: asyncio.Event, samples: list):
+    while not stop.is_set():
+        start = time.perf_counter()
+        response = await client.get("/file/get-all/auth-bench", headers=headers)
+        response.raise_for_status()
+        samples.append(time.perf_counter() - start)
+        await asyncio.sleep(0.005)
+
+
+async def scenario(logins: int) -> dict:
+    database.Base.metadata.create_all(bind=database.engine)
+    transport = httpx.ASGITransport(app=app)
+    credentials = {"username": "auth-bench", "password": "benchmark"}
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+        await client.post("/user/register", json={**credentials, "name": "auth", "email": "auth@example.com"})
+        token = (await client.post("/user/login", json=credentials)).json()["access_token"]["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        before = []
+        stop = asyncio.Event()
+        probe = asyncio.create_task(_probe(client, headers, stop, before))
+        await asyncio.sleep(1)
+        stop.set()
+        await probe
+
+        during = []
+        stop = asyncio.Event()
+        probe = asyncio.create_task(_probe(client, headers, stop, during))
+        started = time.perf_counter()
+        responses = await asyncio.gather(*(client.post("/user/login", json=credentials) for _ in range(logins)))
+        burst_seconds = time.perf_counter() - started
+        stop.set()
+        await probe
+
+    registry = get_metrics().registry
+    token_hits = registry.get_sample_value("rag_cache_requests_total", {"cache": "auth_token", "result": "hit"}) \
+        if registry else None
+    return {
+        "logins": logins,
+        "burst_seconds": round(burst_seconds, 3),
+        "logins_per_second": round(logins / burst_seconds, 1),
+        "failed_logins": sum(r.status_code != 200 for r in responses),
+        "list_files_before": _summary(before),
+        "list_files_during_burst": _summary(during),
+        "token_cache_hits": token_hits,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--logins", type=int, default=50)
+    parser.add_argument("--max-slowdown", type=float, default=5.0)
+    args = parser.parse_args()
+
+    report = asyncio.run(scenario(args.logins))
+    report["checks"] = {
+        "logins_succeeded": report["failed_logins"] == 0,
+        "requests_not_starved": report["list_files_during_burst"]["p95_ms"]
+        <= args.max_slowdown * report["list_files_before"]["p95_ms"],
+    }
+    print(json.dumps(report, indent=2))
+    if not all(report["checks"].values()):
+        sys.exit(1)
@@ -0,0 +1,167 @@
+"""
+Batch queries: many questions about one document, one by one and as a batch.
+
+Stores one large synthetic parse result and asks --questions questions about
+it, against the fake Ollama server:
+
+- one `process_query` after another, as extraction jobs did before
+- `process_query` for every question at once, --concurrency at a time
+- one batch (`prepare_batch_query` and `BatchAnswers`, what
+  POST /query/{owner}/{fileid}/batch runs) with the same concurrency
+
+Reports the time spent before the LLM calls (db_load, embed, search,
+prompt_build) summed over the questions, the wall time to the first and the
+last answer, and whether the batch chose chunks as good as single queries
+(the same scores; chunks with equal scores may be swapped).
+Finally it runs a batch whose generations cannot all get an LLM slot in
+time, so some questions fail, and checks that the others are still answered.
+
+Exits non-zero if a batch answer used chunks scoring differently from its
+single query, the batch does not prepare faster than single queries or finish
+faster than concurrent ones, its first answer does not arrive before half
+the batch time, or a failing question takes other answers down with it.
+
+Run from backend/app/api:
+    python -m benchmarks.bench_batch_query --chunks 5000 --questions 40
+"""
+from benchmarks import offline  # noqa: F401  (must precede app imports)
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+
+from benchmarks.bench_chat_sessions import PREPARE_STAGES, _populate
+from benchmarks.bench_chunking import _WORDS
+from benchmarks.fake_ollama import FakeOllamaServer
+from benchmarks.offline import FAKE_OLLAMA_PORT
+from config import database
+from services.llm_gateway import LLMBusyError, close_llm_gateway, get_llm_gateway
+from services.rag_service import BatchAnswers, prepare_batch_query, process_query
+from services.timing import StageTimer
+
+
+def _prepare_ms(timer: StageTimer) -> float:
+    return sum(timer.stages.get(stage, 0.0) for stage in PREPARE_STAGES)
+
+
+def _scores(chunks) -> list[float]:
+    # Chunks with equal scores may come back in either order, so results are compared by score
+    return sorted(round(chunk.score, 4) for chunk in chunks)
+
+
+async def _single(db, user_id: int, file_id: int, question: str, k: int) -> tuple[list[float], float]:
+    timer = StageTimer()
+    _, chunks, _ = await process_query(db, user_id, file_id, question, k, timer=timer)
+    return _scores(chunks), _prepare_ms(timer)
+
+
+async def _sequential(db, user_id: int, file_id: int, questions: list[str], k: int) -> dict:
+    start = time.perf_counter()
+    results = []
+    for question in questions:
+        results.append(await _single(db, user_id, file_id, question, k))
+        if len(results) == 1:
+            first = time.perf_counter() - start
+    return {"results": results, "first_s": first, "total_s": time.perf_counter() - start}
+
+
+async def _concurrent(db, user_id: int, file_id: int, questions: list[str], k: int, concurrency: int) -> dict:
+    slots = asyncio.Semaphore(concurrency)
+    start = time.perf_counter()
+    finished = []
+
+    async def ask(question):
+        async with slots:
+            result = await _single(db, user_id, file_id, question, k)
+        finished.append(time.perf_counter() - start)
+        return result
+
+    results = await asyncio.gather(*(ask(question) for question in questions))
+    return {"results": results, "first_s": min(finished), "total_s": time.perf_counter() - start}
+
+
+async def _batch(db, user_id: int, file_id: int, questions: list[str], k: int, concurrency: int) -> dict:
+    start = time.perf_counter()
+    timer = StageTimer()
+    prepared = await prepare_batch_query(db, user_id, file_id, questions, k, timer=timer)
+    answered = {}
+    errors = []
+    async for question in BatchAnswers(prepared, str(user_id), concurrency):
+        if not answered and not errors:
+            first = time.perf_counter() - start
+        if question.error is None:
+            answered[question.index] = _scores(question.chunks)
+        else:
+            errors.append(question.error)
+    return {"answered": answered, "errors": errors, "prepare_ms": _prepare_ms(timer),
+            "first_s": first, "total_s": time.perf_counter() - start}
+
+
+def _timing(run: dict) -> dict:
+    return {"first_answer_ms": round(run["first_s"] * 1000, 2), "total_ms": round(run["total_s"] * 1000, 2)}
+
+
+async def scenario(chunks: int, questions: int, k: int, concurrency: int, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    database.Base.metadata.create_all(bind=database.engine)
+    db = database.SessionLocal()
+    try:
+        user_id, file_id = _populate(db, chunks, rng)
+        asked = [f"What does it say about the {' '.join(rng.choices(_WORDS, k=3))}?" for _ in range(questions)]
+        with FakeOllamaServer(port=FAKE_OLLAMA_PORT, ttft=0.01, tokens=20, token_delay=0.001):
+            sequential = await _sequential(db, user_id, file_id, asked, k)
+            concurrent = await _concurrent(db, user_id, file_id, asked, k, concurrency)
+            batch = await _batch(db, user_id, file_id, asked, k, concurrency)
+
+            # More generations at once than the gateway runs, and almost no time to wait for a slot
+            gateway = get_llm_gateway()
+            queue_timeout, gateway.queue_timeout = gateway.queue_timeout, 0.005
+            try:
+                overloaded = await _batch(db, user_id, file_id, asked, k, questions)
+            finally:
+                gateway.queue_timeout = queue_timeout
+        await close_llm_gateway()
+    finally:
+        db.close()
+
+    single_prepare_ms = sum(prepare_ms for _, prepare_ms in sequential["results"])
+    return {
+        "chunks": chunks,
+        "questions": questions,
+        "concurrency": concurrency,
+        "prepare_ms": {"single_queries": round(single_prepare_ms, 2), "batch": round(batch["prepare_ms"], 2)},
+        "sequential": _timing(sequential),
+        "concurrent": _timing(concurrent),
+        "batch": _timing(batch),
+        "overloaded_batch": {
+            "answered": len(overloaded["answered"]),
+            "failed": len(overloaded["errors"]),
+            "busy_errors": sum(isinstance(error, LLMBusyError) for error in overloaded["errors"]),
+        },
+        "checks": {
+            "batch_matches_single": all(batch["answered"].get(i) == scores
+                                        for i, (scores, _) in enumerate(sequential["results"])),
+            "batch_prepares_faster": batch["prepare_ms"] < single_prepare_ms,
+            "batch_faster_than_concurrent": batch["total_s"] < concurrent["total_s"],
+            "first_answer_streams_early": batch["first_s"] < batch["total_s"] / 2,
+            "errors_isolated": (0 < len(overloaded["errors"]) < questions
+                                and len(overloaded["answered"]) + len(overloaded["errors"]) == questions),
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chunks", type=int, default=5000, help="Chunks in the parsed file")
+    parser.add_argument("--questions", type=int, default=40)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=2, help="Answers generated at the same time")
+    args = parser.parse_args()
+
+    report = asyncio.run(scenario(args.chunks, args.questions, args.k, args.concurrency))
+    print(json.dumps(report, indent=2))
+    if not all(report["checks"].values()):
+        sys.exit(1)
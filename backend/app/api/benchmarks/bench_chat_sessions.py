@@ -0,0 +1,162 @@
+"""
+Chat sessions: follow-up turns with and without server-side session state.
+
+Stores one large synthetic parse result, then asks the same series of
+questions about it twice: as independent queries (`process_query`) and as
+turns of one chat session (`process_chat_turn`), against the fake Ollama
+server. For each turn it reports the time spent before the LLM call
+(db_load, embed, search, prompt_build), the prompt tokens, and the share of
+the rendered conversation the server already held from the previous turn
+(what its KV cache can skip). It also checks that a turn answered by a
+worker that never saw the session (no cached vectors) continues the
+conversation, and that an idle session starts over.
+
+Exits non-zero if session turns after the first are not faster to prepare
+than independent queries, a follow-up turn (not compacting the history)
+does not reuse the whole previous conversation, another worker does not
+continue the session, or an idle session is not dropped.
+
+Run from backend/app/api:
+    python -m benchmarks.bench_chat_sessions --chunks 5000 --turns 12
+"""
+from benchmarks import offline  # noqa: F401  (must precede app imports)
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import time
+
+from benchmarks.bench_chunking import _WORDS
+from benchmarks.fake_ollama import FakeOllamaServer
+from benchmarks.offline import FAKE_OLLAMA_PORT
+from config import database, settings
+from models.sqlalchemy import content_blob  # noqa: F401  (files reference its table)
+from models.sqlalchemy.file import Files
+from models.sqlalchemy.parsed_file import ParsedContent
+from models.sqlalchemy.users import User
+from services.chat_sessions import sessions
+from services.embeddings import get_embedder
+from services.llm_gateway import close_llm_gateway
+from services.rag_service import process_chat_turn, process_query
+from services.timing import StageTimer
+
+# Stages before the LLM call
+PREPARE_STAGES = ("db_load", "embed", "search", "prompt_build")
+
+
+def _populate(db, chunks: int, rng: random.Random) -> tuple[int, int]:
+    user = User(name="chat", username="chat-bench", email="chat@example.com", password="x")
+    db.add(user)
+    db.flush()
+    file = Files(name="manual.txt", content_type="text/plain", s3key="bench/manual", user_id=user.id)
+    db.add(file)
+    db.flush()
+    texts = [" ".join(rng.choices(_WORDS, k=60)) + "." for _ in range(chunks)]
+    vectors = get_embedder().embed_documents(texts)
+    db.add(ParsedContent(file_id=file.id, user_id=user.id, raw_text="\n".join(texts), chunks=texts,
+                         vectors=vectors, chunking={"strategy": "bench"}))
+    db.commit()
+    return user.id, file.id
+
+
+async def _conversation(db, user_id: int, file_id: int, questions: list[str], k: int,
+                        session: bool, server: FakeOllamaServer) -> list[dict]:
+    turns = []
+    for question in questions:
+        before = dict(server.stats)
+        timer = StageTimer()
+        process = process_chat_turn if session else process_query
+        _, _, stats = await process(db, user_id, file_id, question, k, timer=timer)
+        rendered = server.stats["prompt_chars"] - before["prompt_chars"]
+        cached = server.stats["cached_prompt_chars"] - before["cached_prompt_chars"]
+        turns.append({
+            "prepare_ms": round(sum(timer.stages.get(stage, 0.0) for stage in PREPARE_STAGES), 2),
+            "prompt_tokens": stats["prompt_tokens"],
+            "prompt_chars": rendered,
+            "cached_chars": cached,
+            "cached_share": round(cached / rendered, 3),
+            "compacted": stats.get("compacted", False),
+        })
+    return turns
+
+
+async def _other_worker_continues(db, user_id: int, file_id: int, question: str, k: int) -> bool:
+    before = sessions.current(db, user_id, file_id).turn_count
+    # A worker that never served the session holds none of its vectors
+    sessions.clear()
+    _, _, stats = await process_chat_turn(db, user_id, file_id, question, k)
+    return stats["session_turn"] == before + 1
+
+
+def _idle_eviction(db, user_id: int, file_id: int) -> bool:
+    held = sessions.current(db, user_id, file_id) is not None
+    idle_seconds, sessions.idle_seconds = sessions.idle_seconds, 0.05
+    try:
+        time.sleep(0.1)
+        return held and sessions.current(db, user_id, file_id) is None
+    finally:
+        sessions.idle_seconds = idle_seconds
+
+
+async def scenario(chunks: int, turns: int, k: int, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    database.Base.metadata.create_all(bind=database.engine)
+    db = database.SessionLocal()
+    try:
+        user_id, file_id = _populate(db, chunks, rng)
+        questions = [f"What about the {' '.join(rng.choices(_WORDS, k=3))}?" for _ in range(turns)]
+        with FakeOllamaServer(port=FAKE_OLLAMA_PORT, ttft=0.01, tokens=30, token_delay=0) as server:
+            stateless = await _conversation(db, user_id, file_id, questions, k, False, server)
+            session = await _conversation(db, user_id, file_id, questions, k, True, server)
+            continued = await _other_worker_continues(db, user_id, file_id, questions[0], k)
+        await close_llm_gateway()
+        evicted = _idle_eviction(db, user_id, file_id)
+    finally:
+        db.close()
+
+    follow_ups = session[1:]
+    report = {
+        "chunks": chunks,
+        "turns": turns,
+        "history_tokens_limit": settings.CHAT_HISTORY_TOKENS,
+        "stateless": {
+            "prepare_ms_mean": round(statistics.fmean(t["prepare_ms"] for t in stateless), 2),
+            "prompt_tokens_mean": round(statistics.fmean(t["prompt_tokens"] for t in stateless), 1),
+            "cached_share_mean": round(statistics.fmean(t["cached_share"] for t in stateless), 3),
+        },
+        "session": {
+            "first_turn_prepare_ms": session[0]["prepare_ms"],
+            "follow_up_prepare_ms_mean": round(statistics.fmean(t["prepare_ms"] for t in follow_ups), 2),
+            "prompt_tokens_mean": round(statistics.fmean(t["prompt_tokens"] for t in session), 1),
+            "cached_share_mean": round(statistics.fmean(t["cached_share"] for t in follow_ups), 3),
+            "compactions": sum(t["compacted"] for t in session),
+        },
+        "turns_detail": {"stateless": stateless, "session": session},
+    }
+    # The whole previous conversation is cached unless the previous turn compacted it
+    extends = [session[i]["cached_chars"] >= session[i - 1]["prompt_chars"]
+               for i in range(1, len(session)) if not session[i - 1]["compacted"]]
+    report["checks"] = {
+        "follow_ups_prepare_faster": report["session"]["follow_up_prepare_ms_mean"] < report["stateless"]["prepare_ms_mean"],
+        "follow_ups_extend_previous_prompt": all(extends),
+        "follow_ups_mostly_cached": report["session"]["cached_share_mean"] > report["stateless"]["cached_share_mean"],
+        "other_worker_continues_session": continued,
+        "idle_session_evicted": evicted,
+    }
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chunks", type=int, default=5000, help="Chunks in the parsed file")
+    parser.add_argument("--turns", type=int, default=12)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    report = asyncio.run(scenario(args.chunks, args.turns, args.k))
+    print(json.dumps(report, indent=2))
+    if not all(report["checks"].values()):
+        sys.exit(1)
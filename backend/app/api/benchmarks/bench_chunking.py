@@ -0,0 +1,82 @@
+"""
+Chunking throughput benchmark.
+
+Generates a deterministic multi-MB synthetic document and measures how fast
+each chunking strategy processes it, along with the resulting chunk count and
+the largest chunk in embedding-model tokens (chunks above the embedder's
+window are truncated at embedding time).
+
+Run from backend/app/api:
+    python -m benchmarks.bench_chunking --size-mb 4 --repeat 3
+"""
+import argparse
+import json
+import random
+import time
+
+from config import settings
+from services.chunking import CHUNKING_STRATEGIES, get_chunker, get_tokenizer
+
+_WORDS = (
+    "document retrieval embedding context vector query answer section model "
+    "token budget paragraph latency throughput storage index parse chunk "
+    "report revenue quarter analysis policy contract clause appendix figure"
+).split()
+
+
+def synthetic_text(size_bytes: int, seed: int = 0) -> str:
+    """Build reproducible text with headings, sentences and paragraphs."""
+    rng = random.Random(seed)
+    parts = []
+    total = 0
+    section = 0
+    while total < size_bytes:
+        if rng.random() < 0.05:
+            section += 1
+            line = f"Section {section}: {rng.choice(_WORDS).title()} {rng.choice(_WORDS).title()}"
+        else:
+            sentences = []
+            for _ in range(rng.randint(2, 8)):
+                words = rng.choices(_WORDS, k=rng.randint(6, 24))
+                sentences.append(" ".join(words).capitalize() + ".")
+            line = " ".join(sentences)
+        parts.append(line)
+        total += len(line) + 1
+    return "\n".join(parts)
+
+
+def run(size_mb: float, repeat: int) -> dict:
+    text = synthetic_text(int(size_mb * 1024 * 1024))
+    tokenizer = get_tokenizer(settings.EMBEDDING_MODEL_NAME)
+    # Warm the tokenizer so model loading is not counted as chunking time
+    tokenizer("warm up", add_special_tokens=False)
+
+    results = {"text_mb": round(len(text) / (1024 * 1024), 2), "strategies": {}}
+    for name in CHUNKING_STRATEGIES:
+        chunker = get_chunker(name)
+        timings = []
+        chunks = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            chunks = chunker.split(text)
+            timings.append(time.perf_counter() - start)
+
+        token_counts = [len(ids) for ids in tokenizer(chunks, add_special_tokens=True)["input_ids"]]
+        best = min(timings)
+        results["strategies"][name] = {
+            "params": chunker.describe(),
+            "best_seconds": round(best, 4),
+            "mb_per_second": round(results["text_mb"] / best, 2),
+            "chunks": len(chunks),
+            "max_chunk_tokens": max(token_counts, default=0),
+            "chunks_over_window": sum(c > settings.EMBEDDING_MAX_TOKENS for c in token_counts),
+        }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size-mb", type=float, default=4.0)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    print(json.dumps(run(args.size_mb, args.repeat), indent=2))
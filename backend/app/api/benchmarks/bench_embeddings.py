@@ -0,0 +1,76 @@
+"""
+Embedding backend benchmark and equivalence check.
+
+Embeds the same set of synthetic chunks with every requested backend and
+reports throughput (sentences per second), per-query latency percentiles and,
+for each non-reference backend, how far its vectors are from the reference
+(PyTorch) vectors. The run exits non-zero if any backend drifts beyond the
+cosine tolerance.
+
+Run from backend/app/api:
+    python -m benchmarks.bench_embeddings --backends huggingface onnx onnx-int8
+"""
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from benchmarks.bench_chunking import synthetic_text
+from services.chunking import get_chunker
+from services.embeddings import create_embedder
+
+# Minimum cosine similarity to the reference vector per backend
+TOLERANCES = {"onnx": 0.999, "onnx-int8": 0.98}
+
+
+def run(backends: list[str], count: int, queries: int, threads: int) -> dict:
+    chunks = get_chunker("fixed").split(synthetic_text(count * 600))[:count]
+    query_texts = [c[:80] for c in chunks[:queries]]
+
+    results = {"chunks": len(chunks), "backends": {}}
+    reference = None
+    for name in backends:
+        embedder = create_embedder(name, threads=threads)
+        embedder.embed_array(chunks[:8])  # warm-up
+
+        start = time.perf_counter()
+        vectors = embedder.embed_array(chunks)
+        elapsed = time.perf_counter() - start
+
+        latencies = []
+        for text in query_texts:
+            t0 = time.perf_counter()
+            embedder.embed_query(text)
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+        entry = {
+            "sentences_per_second": round(len(chunks) / elapsed, 1),
+            "query_latency_ms_p50": round(float(np.percentile(latencies, 50)), 2),
+            "query_latency_ms_p95": round(float(np.percentile(latencies, 95)), 2),
+        }
+        if reference is None:
+            reference = vectors
+        else:
+            cosine = np.sum(vectors * reference, axis=1)
+            entry["min_cosine_to_reference"] = round(float(cosine.min()), 5)
+            entry["max_abs_diff"] = round(float(np.abs(vectors - reference).max()), 5)
+            entry["within_tolerance"] = bool(cosine.min() >= TOLERANCES.get(name, 0.999))
+        results["backends"][name] = entry
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--backends", nargs="+", default=["huggingface", "onnx", "onnx-int8"],
+                        help="Backends to compare; the first one is the reference")
+    parser.add_argument("--count", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--threads", type=int, default=0)
+    args = parser.parse_args()
+
+    report = run(args.backends, args.count, args.queries, args.threads)
+    print(json.dumps(report, indent=2))
+    if not all(b.get("within_tolerance", True) for b in report["backends"].values()):
+        sys.exit(1)
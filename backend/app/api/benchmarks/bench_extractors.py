@@ -0,0 +1,122 @@
+"""
+Text extraction throughput per format: fast-path extractors vs unstructured.
+
+Generates one synthetic document per format (plain text, Markdown, CSV,
+HTML, a text-layer PDF), extracts it with the extractor `select_extractor`
+picks and, when unstructured is installed, with `partition_whole`. Reports
+MB/s, element counts and speedup per format, plus a scanned-looking PDF
+(no text layer) to show the fallback. Exits non-zero if a synthetic document
+does not take the fast path or the scan does not fall back.
+
+Run from backend/app/api:
+    python -m benchmarks.bench_extractors --size-kb 512 --pdf-pages 100
+"""
+import argparse
+import json
+import random
+import sys
+import time
+
+from benchmarks.bench_chunking import synthetic_text, _WORDS
+from benchmarks.bench_partition import synthetic_pdf
+from services.extractors import ExtractorFallback, select_extractor
+
+
+def _sentence(rng: random.Random, words: int = 12) -> str:
+    return " ".join(rng.choices(_WORDS, k=words)).capitalize() + "."
+
+
+def synthetic_markdown(size: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    parts = []
+    while sum(len(p) for p in parts) < size:
+        parts.append(f"## {' '.join(rng.choices(_WORDS, k=3)).title()}\n")
+        parts.append(" ".join(_sentence(rng) for _ in range(5)) + "\n")
+        parts.append("".join(f"- {_sentence(rng, 6)}\n" for _ in range(3)) + "\n")
+    return "\n".join(parts)
+
+
+def synthetic_csv(size: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    rows = ["id,name,category,description"]
+    while sum(len(r) for r in rows) < size:
+        rows.append(f'{len(rows)},{rng.choice(_WORDS)},{rng.choice(_WORDS)},"{_sentence(rng, 8)}"')
+    return "\n".join(rows) + "\n"
+
+
+def synthetic_html(size: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    parts = ["<!DOCTYPE html><html><head><title>Report</title><style>p{margin:0}</style></head><body>"]
+    while sum(len(p) for p in parts) < size:
+        parts.append(f"<h2>{' '.join(rng.choices(_WORDS, k=3)).title()}</h2>")
+        parts.append("<p>" + " ".join(_sentence(rng) for _ in range(4)) + "</p>")
+        parts.append("<ul>" + "".join(f"<li>{_sentence(rng, 6)}</li>" for _ in range(3)) + "</ul>")
+        parts.append("<table><tr><th>Key</th><th>Value</th></tr>"
+                     f"<tr><td>{rng.choice(_WORDS)}</td><td>{rng.randint(1, 999)}</td></tr></table>")
+    return "".join(parts) + "</body></html>"
+
+
+def _measure(extract, content: bytes, repeat: int) -> dict:
+    elements = extract(content)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        extract(content)
+    seconds = (time.perf_counter() - start) / repeat
+    return {
+        "ms": round(seconds * 1000, 2),
+        "mb_per_second": round(len(content) / seconds / 1e6, 2),
+        "elements": len(elements),
+    }
+
+
+def run(size_kb: int, pdf_pages: int, repeat: int) -> dict:
+    samples = {
+        "text": (synthetic_text(size_kb * 1024).encode("utf-8"), "text/plain"),
+        "markdown": (synthetic_markdown(size_kb * 1024).encode("utf-8"), "text/markdown"),
+        "csv": (synthetic_csv(size_kb * 1024).encode("utf-8"), "text/csv"),
+        "html": (synthetic_html(size_kb * 1024).encode("utf-8"), "text/html"),
+        "pdf": (synthetic_pdf(pdf_pages), "application/pdf"),
+    }
+    try:
+        from services.partitioning import partition_whole
+        import unstructured.partition.auto  # noqa: F401
+    except ImportError:
+        partition_whole = None
+
+    report = {"formats": {}, "checks": {}}
+    for name, (content, content_type) in samples.items():
+        extractor = select_extractor(content, content_type)
+        row = {"bytes": len(content), "extractor": extractor.name if extractor else None}
+        try:
+            row["fast"] = _measure(extractor.extract, content, repeat)
+        except (AttributeError, ExtractorFallback) as e:
+            row["fast"] = {"fallback": str(e)}
+        if partition_whole is not None:
+            row["unstructured"] = _measure(lambda c: partition_whole(c, content_type), content, 1)
+            if "ms" in row["fast"]:
+                row["speedup"] = round(row["unstructured"]["ms"] / row["fast"]["ms"], 1)
+        report["formats"][name] = row
+        report["checks"][f"{name}_takes_fast_path"] = "ms" in row["fast"]
+
+    # A page without a text layer, like a scan, must fall back to unstructured
+    scan = synthetic_pdf(3, lines_per_page=0)
+    try:
+        select_extractor(scan, "application/pdf").extract(scan)
+        fell_back = False
+    except ExtractorFallback as e:
+        fell_back = e.reason == "no_text_layer"
+    report["checks"]["scan_falls_back"] = fell_back
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size-kb", type=int, default=512)
+    parser.add_argument("--pdf-pages", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    report = run(args.size_kb, args.pdf_pages, args.repeat)
+    print(json.dumps(report, indent=2))
+    if not all(report["checks"].values()):
+        sys.exit(1)
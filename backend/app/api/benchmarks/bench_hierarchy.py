@@ -0,0 +1,118 @@
+"""
+Hierarchical corpus search: vectors scanned, recall and latency against a flat scan.
+
+Builds a HierarchicalIndex over a synthetic corpus of documents made of
+sections made of chunks (each level a noisy copy of the one above, around a
+shared set of topics, so documents and sections cluster as real ones do) and
+searches it with queries near held-out chunks. For a range of document and
+section fan-outs it reports the vectors scored per query (document and
+section centroids plus chunks), the reduction against scoring every chunk,
+recall@k against the exact top-k and search latency.
+
+Exits non-zero if the default fan-outs (CORPUS_DOC_FANOUT and
+CORPUS_SECTION_FANOUT) scan less than --min-reduction times fewer vectors
+than the flat scan, or their recall@k falls below --min-recall.
+
+Run from backend/app/api:
+    python -m benchmarks.bench_hierarchy --documents 10000 --k 10
+"""
+from benchmarks import offline  # noqa: F401  (must precede app imports)
+
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from config import settings
+from services.hierarchical_index import DocumentVectors, HierarchicalIndex
+from services.vector_store import normalize, top_indices
+
+
+def _noisy(centers: np.ndarray, repeat: int, spread: float, rng: np.random.Generator) -> np.ndarray:
+    vectors = np.repeat(centers, repeat, axis=0)
+    return normalize(vectors + spread * rng.standard_normal(vectors.shape).astype(np.float32))
+
+
+def synthetic_corpus(documents: int, sections: int, chunks: int, dimension: int, topics: int,
+                     rng: np.random.Generator) -> np.ndarray:
+    """Chunk vectors of shape (documents, sections * chunks, dimension)."""
+    topic_vectors = normalize(rng.standard_normal((topics, dimension)).astype(np.float32))
+    doc_vectors = _noisy(topic_vectors[rng.integers(topics, size=documents)], 1, 0.06, rng)
+    section_vectors = _noisy(doc_vectors, sections, 0.05, rng)
+    chunk_vectors = _noisy(section_vectors, chunks, 0.04, rng)
+    return chunk_vectors.reshape(documents, sections * chunks, dimension)
+
+
+def run(documents: int, sections: int, chunks: int, dimension: int, topics: int, k: int, queries: int,
+        fanouts: list[tuple[int, int]], seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    corpus = synthetic_corpus(documents, sections, chunks, dimension, topics, rng)
+    starts = list(range(0, sections * chunks, chunks))
+    start = time.perf_counter()
+    index = HierarchicalIndex.build([DocumentVectors(number, vectors, starts) for number, vectors in enumerate(corpus)])
+    build_seconds = time.perf_counter() - start
+
+    flat = corpus.reshape(-1, dimension)
+    targets = rng.integers(len(flat), size=queries)
+    held_out = normalize(flat[targets] + 0.06 * rng.standard_normal((queries, dimension)).astype(np.float32))
+    truth = [set(top_indices(flat @ query, k).tolist()) for query in held_out]
+
+    flat_timings = []
+    for query in held_out:
+        start = time.perf_counter()
+        index.search(query, k, doc_fanout=0, section_fanout=0)
+        flat_timings.append((time.perf_counter() - start) * 1000)
+
+    report = {
+        **index.describe(), "k": k, "queries": queries, "build_seconds": round(build_seconds, 2),
+        "flat": {"vectors_scored": len(flat), "p50_ms": round(float(np.percentile(flat_timings, 50)), 3)},
+        "fanouts": [],
+    }
+    for doc_fanout, section_fanout in fanouts:
+        timings, scored, recall = [], [], []
+        for number, query in enumerate(held_out):
+            start = time.perf_counter()
+            rows, _, scanned = index.search(query, k, doc_fanout=doc_fanout, section_fanout=section_fanout)
+            timings.append((time.perf_counter() - start) * 1000)
+            scored.append(sum(scanned.values()))
+            recall.append(len(truth[number] & set(rows.tolist())) / k)
+        report["fanouts"].append({
+            "doc_fanout": doc_fanout,
+            "section_fanout": section_fanout,
+            "vectors_scored": int(np.mean(scored)),
+            "scan_reduction": round(len(flat) / float(np.mean(scored)), 1),
+            f"recall@{k}": round(float(np.mean(recall)), 4),
+            "p50_ms": round(float(np.percentile(timings, 50)), 3),
+            "p95_ms": round(float(np.percentile(timings, 95)), 3),
+        })
+
+    default = report["fanouts"][0]
+    report["checks"] = {
+        "default_scan_reduction": default["scan_reduction"] >= args.min_reduction,
+        "default_recall": default[f"recall@{k}"] >= args.min_recall,
+    }
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--documents", type=int, default=10000)
+    parser.add_argument("--sections", type=int, default=4, help="Sections per document")
+    parser.add_argument("--chunks", type=int, default=4, help="Chunks per section")
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--topics", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--min-reduction", type=float, default=10)
+    parser.add_argument("--min-recall", type=float, default=0.9)
+    args = parser.parse_args()
+
+    # The defaults first; the checks apply to them
+    fanouts = [(settings.CORPUS_DOC_FANOUT, settings.CORPUS_SECTION_FANOUT), (8, 16), (128, 256), (512, 1024)]
+    report = run(args.documents, args.sections, args.chunks, args.dimension, args.topics, args.k,
+                 args.queries, fanouts)
+    print(json.dumps(report, indent=2))
+    if not all(report["checks"].values()):
+        sys.exit(1)
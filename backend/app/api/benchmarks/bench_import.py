@@ -0,0 +1,91 @@
+"""
+Application import-time check.
+
+Imports `main` in a fresh interpreter with `-X importtime` and reports the
+wall time, the slowest top-level imports and whether any heavy ML library
+was imported eagerly. Heavy libraries must load on first use or in the
+background warm-up, never at import, so this exits non-zero if one shows up
+or the import takes longer than --max-seconds.
+
+Run from backend/app/api:
+    python -m benchmarks.bench_import --max-seconds 3
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+# Libraries that take seconds to import and must stay out of the import path
+HEAVY_MODULES = (
+    "torch",
+    "sentence_transformers",
+    "transformers",
+    "sklearn",
+    "unstructured",
+    "langchain",
+    "langchain_community",
+    "onnxruntime",
+)
+
+
+def measure(repeat: int) -> dict:
+    env = dict(os.environ)
+    # Required at import time; the engine is created but never connects here
+    env.setdefault("DATABASE_URL", "sqlite://")
+    env.setdefault("JWT_SECRET", "import-check")
+    env.setdefault("JWT_ALGORITHM", "HS256")
+    env["WARMUP_ON_STARTUP"] = "False"
+
+    wall = []
+    stderr = ""
+    for _ in range(repeat):
+        start = time.perf_counter()
+        completed = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                                   capture_output=True, text=True, env=env)
+        wall.append(time.perf_counter() - start)
+        if completed.returncode != 0:
+            sys.exit(f"Importing main failed:\n{completed.stderr[-2000:]}")
+        stderr = completed.stderr
+
+    # Lines look like: "import time:   self [us] | cumulative | imported package",
+    # nested imports being indented under the module that triggered them
+    total_us = 0
+    packages = []
+    imported = set()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        imported.add(name.split(".")[0])
+        if name == "main":
+            total_us = int(cumulative)
+        elif "." not in name:
+            packages.append((name, int(cumulative)))
+
+    slowest = sorted(packages, key=lambda item: item[1], reverse=True)[:15]
+    return {
+        "best_wall_seconds": round(min(wall), 3),
+        "import_main_ms": round(total_us / 1000, 1),
+        "slowest_imports_ms": {name: round(us / 1000, 1) for name, us in slowest},
+        "heavy_modules_imported": sorted(m for m in HEAVY_MODULES if m in imported),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    report = measure(args.repeat)
+    checks = {
+        "no_heavy_imports": not report["heavy_modules_imported"],
+        "within_time_budget": report["best_wall_seconds"] <= args.max_seconds,
+    }
+    report["checks"] = checks
+    print(json.dumps(report, indent=2))
+    if not all(checks.values()):
+        sys.exit(1)
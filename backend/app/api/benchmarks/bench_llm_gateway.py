@@ -0,0 +1,77 @@
+"""
+LLM gateway load check against the fake Ollama server.
+
+Scenario:
+- a "bulk" user fires many distinct prompts at once
+- an "interactive" user sends a few prompts shortly after
+- several callers send the same prompt concurrently
+
+Checks that the server never sees more than the configured concurrency,
+that the interactive user is not starved behind the bulk user (fair
+round-robin), and that identical in-flight prompts are coalesced. Prints the
+gateway metrics as JSON and exits non-zero if a check fails.
+
+Run from backend/app/api:
+    python -m benchmarks.bench_llm_gateway --concurrency 2 --bulk 20
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+
+from benchmarks.fake_ollama import FakeOllamaServer
+from services.llm_gateway import LLMGateway
+
+
+async def _timed(gateway: LLMGateway, prompt: str, user: str) -> float:
+    start = time.perf_counter()
+    await gateway.generate(prompt, user_key=user)
+    return time.perf_counter() - start
+
+
+async def scenario(url: str, concurrency: int, bulk: int, interactive: int, duplicates: int) -> dict:
+    gateway = LLMGateway(base_url=url, max_concurrency=concurrency, queue_timeout=120)
+    try:
+        bulk_tasks = [asyncio.create_task(_timed(gateway, f"bulk question {i}", "bulk")) for i in range(bulk)]
+        await asyncio.sleep(0.05)
+        interactive_tasks = [asyncio.create_task(_timed(gateway, f"interactive question {i}", "interactive"))
+                             for i in range(interactive)]
+        duplicate_tasks = [asyncio.create_task(_timed(gateway, "same question", f"dup-{i}"))
+                           for i in range(duplicates)]
+
+        bulk_latency = await asyncio.gather(*bulk_tasks)
+        interactive_latency = await asyncio.gather(*interactive_tasks)
+        await asyncio.gather(*duplicate_tasks)
+        return {
+            "bulk_mean_seconds": round(statistics.fmean(bulk_latency), 3),
+            "interactive_mean_seconds": round(statistics.fmean(interactive_latency), 3),
+            "gateway": gateway.stats(),
+        }
+    finally:
+        await gateway.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--concurrency", type=int, default=2)
+    parser.add_argument("--bulk", type=int, default=20)
+    parser.add_argument("--interactive", type=int, default=3)
+    parser.add_argument("--duplicates", type=int, default=5)
+    parser.add_argument("--port", type=int, default=11500)
+    args = parser.parse_args()
+
+    with FakeOllamaServer(port=args.port, ttft=0.1, tokens=20, token_delay=0.005) as server:
+        report = asyncio.run(scenario(server.url, args.concurrency, args.bulk, args.interactive, args.duplicates))
+        report["server"] = {k: v for k, v in server.stats.items() if k != "prompts"}
+
+    checks = {
+        "concurrency_respected": report["server"]["max_active"] <= args.concurrency,
+        "interactive_not_starved": report["interactive_mean_seconds"] < report["bulk_mean_seconds"],
+        "duplicates_coalesced": report["gateway"]["coalesced"] >= args.duplicates - 1,
+    }
+    report["checks"] = checks
+    print(json.dumps(report, indent=2))
+    if not all(checks.values()):
+        sys.exit(1)
@@ -0,0 +1,165 @@
+"""
+End-to-end load scenario: register -> upload -> parse -> query.
+
+N virtual users run concurrently against the real FastAPI app (in process,
+through httpx's ASGI transport). Each user registers, uploads its own
+synthetic document, parses it and then asks a series of questions.
+External services are replaced by local stand-ins (see benchmarks.offline):
+SQLite, moto S3, the deterministic hash embedder and the fake Ollama server.
+
+Prints latency percentiles per operation, mean query stage timings (from the
+Server-Timing header) and throughput as JSON. With --output the report is
+also appended as one JSON line, so runs can be tracked over time.
+
+Run from backend/app/api:
+    python -m benchmarks.bench_load --users 8 --queries 5 --doc-kb 64 --output bench_results.jsonl
+"""
+from benchmarks import offline  # noqa: F401  (must precede app imports)
+
+import argparse
+import asyncio
+from collections import defaultdict
+import json
+import platform
+import random
+import statistics
+import subprocess
+import time
+
+import httpx
+
+from benchmarks.bench_chunking import synthetic_text, _WORDS
+from benchmarks.fake_ollama import FakeOllamaServer
+from benchmarks.offline import FAKE_OLLAMA_PORT, mock_s3
+from config import database, settings
+from main import app
+from services.llm_gateway import close_llm_gateway
+
+
+def _summary(samples: list[float]) -> dict:
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 2),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 2),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+
+def _parse_server_timing(header: str) -> dict:
+    stages = {}
+    for entry in header.split(","):
+        name, _, duration = entry.strip().partition(";dur=")
+        if name and duration:
+            stages[name] = float(duration)
+    return stages
+
+
+class LoadRecorder:
+    """Collects latencies, errors and query stage timings from all virtual users."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.stages = defaultdict(list)
+
+    async def call(self, client: httpx.AsyncClient, operation: str, method: str, url: str, **kwargs):
+        start = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        self.latencies[operation].append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            self.errors[operation] += 1
+            return None
+        if "server-timing" in response.headers:
+            for stage, ms in _parse_server_timing(response.headers["server-timing"]).items():
+                self.stages[stage].append(ms)
+        return response
+
+
+async def virtual_user(client: httpx.AsyncClient, recorder: LoadRecorder, index: int, doc_kb: int, queries: int):
+    rng = random.Random(index)
+    username = f"bench-user-{index}"
+    await recorder.call(client, "register", "POST", "/user/register", json={
+        "name": username, "username": username, "email": f"{username}@example.com", "password": "benchmark",
+    })
+
+    document = synthetic_text(doc_kb * 1024, seed=index).encode("utf-8")
+    uploaded = await recorder.call(client, "upload", "POST", f"/file/upload/{username}",
+                                   files={"file": (f"doc-{index}.txt", document, "text/plain")})
+    if uploaded is None:
+        return
+    file_id = uploaded.json()["file"]["id"]
+
+    if await recorder.call(client, "parse", "GET", f"/file/parse/{username}/{file_id}") is None:
+        return
+
+    for _ in range(queries):
+        question = "What does the " + " ".join(rng.choices(_WORDS, k=4)) + " section say?"
+        await recorder.call(client, "query", "POST", f"/query/{username}/{file_id}",
+                            json={"query": question, "top_k": 5})
+
+
+async def scenario(users: int, queries: int, doc_kb: int) -> dict:
+    database.Base.metadata.create_all(bind=database.engine)
+    recorder = LoadRecorder()
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+            started = time.perf_counter()
+            await asyncio.gather(*(virtual_user(client, recorder, i, doc_kb, queries) for i in range(users)))
+            wall = time.perf_counter() - started
+    finally:
+        await close_llm_gateway()
+
+    return {
+        "wall_seconds": round(wall, 3),
+        "queries_per_second": round(len(recorder.latencies["query"]) / wall, 2),
+        "operations": {
+            op: {**_summary(samples), "errors": recorder.errors[op]}
+            for op, samples in recorder.latencies.items()
+        },
+        "query_stages_mean_ms": {
+            stage: round(statistics.fmean(values), 2) for stage, values in recorder.stages.items()
+        },
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--queries", type=int, default=5)
+    parser.add_argument("--doc-kb", type=int, default=64)
+    parser.add_argument("--ttft", type=float, default=0.05, help="Fake LLM time to first token (seconds)")
+    parser.add_argument("--output", help="Append the report as one JSON line to this file")
+    args = parser.parse_args()
+
+    with mock_s3(), FakeOllamaServer(port=FAKE_OLLAMA_PORT, ttft=args.ttft, tokens=20, token_delay=0.002):
+        results = asyncio.run(scenario(args.users, args.queries, args.doc_kb))
+
+    report = {
+        "benchmark": "load",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "config": {
+            "users": args.users, "queries": args.queries, "doc_kb": args.doc_kb, "llm_ttft": args.ttft,
+            "chunk_strategy": settings.CHUNK_STRATEGY, "embedding_backend": settings.EMBEDDING_BACKEND,
+            "embedding_workers": settings.EMBEDDING_WORKERS, "llm_max_concurrency": settings.LLM_MAX_CONCURRENCY,
+        },
+        "results": results,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "a") as f:
+            f.write(json.dumps(report) + "\n")
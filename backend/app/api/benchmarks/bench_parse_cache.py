@@ -0,0 +1,88 @@
+"""
+Repeat-open latency of the parse endpoint.
+
+Uploads and parses one synthetic document, then reopens it the three ways
+a client can:
+
+- uncached: the response cache is cleared before each request, so the full
+  parse result is loaded from the database and serialized every time
+- cached: the serialized result is served from the in-process cache
+- not_modified: the client sends the ETag it has and gets an empty 304
+
+Runs against the real app in process with the stand-ins from
+benchmarks.offline. Exits non-zero if a cached open is not faster than an
+uncached one or a revalidation does not return an empty 304.
+
+Run from backend/app/api:
+    python -m benchmarks.bench_parse_cache --doc-kb 1024 --repeat 50
+"""
+from benchmarks import offline  # noqa: F401  (must precede app imports)
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+import httpx
+
+from benchmarks.bench_chunking import synthetic_text
+from benchmarks.bench_load import _summary
+from benchmarks.offline import mock_s3
+from config import database
+from main import app
+from services.response_cache import parse_results
+
+
+async def _timed(client: httpx.AsyncClient, url: str, repeat: int, headers=None, clear=False):
+    samples = []
+    response = None
+    for _ in range(repeat):
+        if clear:
+            parse_results.clear()
+        start = time.perf_counter()
+        response = await client.get(url, headers=headers)
+        samples.append(time.perf_counter() - start)
+    return samples, response
+
+
+async def scenario(doc_kb: int, repeat: int) -> dict:
+    database.Base.metadata.create_all(bind=database.engine)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+        await client.post("/user/register", json={
+            "name": "cache", "username": "cache-bench", "email": "cache@example.com", "password": "benchmark",
+        })
+        document = synthetic_text(doc_kb * 1024).encode("utf-8")
+        uploaded = await client.post("/file/upload/cache-bench", files={"file": ("doc.txt", document, "text/plain")})
+        url = f"/file/parse/cache-bench/{uploaded.json()['file']['id']}"
+        first = await client.get(url)
+        first.raise_for_status()
+
+        uncached, _ = await _timed(client, url, repeat, clear=True)
+        cached, _ = await _timed(client, url, repeat)
+        not_modified, last = await _timed(client, url, repeat, headers={"If-None-Match": first.headers["etag"]})
+
+    return {
+        "response_bytes": len(first.content),
+        "uncached": _summary(uncached),
+        "cached": _summary(cached),
+        "not_modified": _summary(not_modified),
+        "checks": {
+            "cache_is_faster": _summary(cached)["p50_ms"] < _summary(uncached)["p50_ms"],
+            "revalidation_is_empty_304": last.status_code == 304 and not last.content,
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--doc-kb", type=int, default=1024)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    with mock_s3():
+        report = asyncio.run(scenario(args.doc_kb, args.repeat))
+    print(json.dumps(report, indent=2))
+    if not all(report["checks"].values()):
+        sys.exit(1)
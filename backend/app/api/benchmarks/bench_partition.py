@@ -0,0 +1,136 @@
+"""
+Document partitioning: whole file in one thread vs parallel page ranges.
+
+Partitions the same PDF with the current single-threaded path
+(`partition_whole`) and with the PartitionEngine at each worker count, and
+reports wall time, pages per second and speedup. By default a synthetic
+text PDF of --pages pages is generated; pass --pdf to use a real document
+(scanned or table-heavy PDFs show the largest gains).
+
+Exits non-zero if the parallel result loses document order or text, or if
+the largest worker count is not faster than the single-threaded path.
+
+Needs unstructured with PDF support and pypdf. Run from backend/app/api:
+    python -m benchmarks.bench_partition --pages 300 --workers 2 4 8
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import time
+
+from benchmarks.bench_chunking import _WORDS
+from services.partitioning import PartitionEngine, partition_whole, split_pdf
+
+
+def synthetic_pdf(pages: int, lines_per_page: int = 40, seed: int = 0) -> bytes:
+    """
+    Build a text-only PDF with a heading and lines of text on every page;
+    with lines_per_page=0 the pages have no text at all, like scans.
+    """
+    rng = random.Random(seed)
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for number in range(1, pages + 1):
+        lines = ([f"Section {number}"] + [" ".join(rng.choices(_WORDS, k=10)) for _ in range(lines_per_page)]
+                 if lines_per_page else [])
+        text = "".join(f"({line}) Tj T* " for line in lines)
+        stream = f"BT /F1 10 Tf 12 TL 50 770 Td {text}ET".encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_id = len(objects)
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id)
+        kids.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), pages)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for index, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (index, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def _text(elements: list) -> str:
+    return re.sub(r"\s+", " ", " ".join(str(el) for el in elements)).strip()
+
+
+def _in_order(elements: list) -> bool:
+    pages = [el.metadata.page_number for el in elements
+             if getattr(getattr(el, "metadata", None), "page_number", None) is not None]
+    return pages == sorted(pages)
+
+
+async def _parallel(content: bytes, workers: int, pages_per_task: int):
+    engine = PartitionEngine(workers=workers, pages_per_task=pages_per_task)
+    try:
+        # Start every worker (and its unstructured import) before timing
+        warm = split_pdf(content, 1)[:workers]
+        await asyncio.gather(*(engine.partition(part, "application/pdf") for _, _, part in warm))
+        start = time.perf_counter()
+        result = await engine.partition(content, "application/pdf")
+        return time.perf_counter() - start, result
+    finally:
+        engine.close()
+
+
+def run(content: bytes, worker_counts: list[int], pages_per_task: int) -> dict:
+    pages = sum(count for _, count, _ in split_pdf(content, 10_000))
+    partition_whole(split_pdf(content, 1)[0][2], "application/pdf")  # import and warm up
+    start = time.perf_counter()
+    baseline = partition_whole(content, "application/pdf")
+    baseline_seconds = time.perf_counter() - start
+    baseline_text = _text(baseline)
+
+    report = {
+        "pages": pages,
+        "pdf_bytes": len(content),
+        "cpus": os.cpu_count(),
+        "single_thread": {"seconds": round(baseline_seconds, 3), "pages_per_second": round(pages / baseline_seconds, 1),
+                          "elements": len(baseline)},
+        "parallel": {},
+    }
+    checks = {}
+    for workers in worker_counts:
+        seconds, result = asyncio.run(_parallel(content, workers, pages_per_task))
+        report["parallel"][workers] = {
+            "seconds": round(seconds, 3),
+            "pages_per_second": round(pages / seconds, 1),
+            "speedup": round(baseline_seconds / seconds, 2),
+            "elements": len(result.elements),
+            "tasks": result.tasks,
+            "failed_pages": result.failed_pages,
+        }
+        checks[f"{workers}_workers_in_order"] = _in_order(result.elements)
+        checks[f"{workers}_workers_same_text"] = _text(result.elements) == baseline_text
+    checks["parallel_is_faster"] = report["parallel"][max(worker_counts)]["speedup"] > 1
+    report["checks"] = checks
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--pdf", help="PDF to partition (default: a generated one)")
+    parser.add_argument("--pages", type=int, default=300, help="Pages of the generated PDF")
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4])
+    parser.add_argument("--pages-per-task", type=int, default=16)
+    args = parser.parse_args()
+
+    if args.pdf:
+        with open(args.pdf, "rb") as f:
+            content = f.read()
+    else:
+        content = synthetic_pdf(args.pages)
+
+    report = run(content, args.workers, args.pages_per_task)
+    print(json.dumps(report, indent=2))
+    if not all(report["checks"].values()):
+        sys.exit(1)
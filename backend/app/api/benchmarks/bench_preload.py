@@ -0,0 +1,120 @@
+"""
+Per-worker memory with and without gunicorn preload.
+
+Starts the production server twice (SERVER_PRELOAD on and off) with the
+same number of workers and waits until every worker reports ready, so each
+has loaded its models. It then reads each worker's memory from
+/proc/<pid>/smaps_rollup (Linux):
+
+- rss: resident pages, shared pages counted in full in every worker
+- pss: proportional share, with shared pages split between the processes using them
+- private: pages only this worker holds
+
+With preload the model weights are shared with the master, so private and
+pss per worker drop. Exits non-zero if preloading does not reduce private
+memory per worker.
+
+The server uses the configured backends, so run it where the models are
+available. From backend/app/api:
+    python -m benchmarks.bench_preload --workers 4 --port 5090
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+
+def _children(pid: int) -> list[int]:
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name may contain spaces; the parent pid follows its closing parenthesis
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == pid:
+            children.append(int(entry))
+    return children
+
+
+def _memory_mb(pid: int) -> dict:
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                values[parts[0].rstrip(":")] = int(parts[1])
+    return {
+        "rss": round(values.get("Rss", 0) / 1024, 1),
+        "pss": round(values.get("Pss", 0) / 1024, 1),
+        "private": round((values.get("Private_Clean", 0) + values.get("Private_Dirty", 0)) / 1024, 1),
+    }
+
+
+def _wait_ready(port: int, workers: int, timeout: float):
+    # Requests are spread over the workers, so several consecutive ready
+    # answers are needed before every worker has most likely loaded
+    deadline = time.monotonic() + timeout
+    streak = 0
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/health/ready", timeout=5) as response:
+                streak = streak + 1 if response.status == 200 else 0
+        except (urllib.error.URLError, ConnectionError):
+            streak = 0
+        if streak >= workers * 3:
+            return
+        time.sleep(0.2)
+    raise TimeoutError(f"Server on port {port} was not ready within {timeout:.0f}s")
+
+
+def measure(preload: bool, workers: int, port: int, timeout: float) -> dict:
+    env = dict(os.environ, SERVER_PRELOAD=str(preload), SERVER_WORKERS=str(workers),
+               PORT=str(port), WARMUP_ON_STARTUP="True")
+    server = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app"],
+                              env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        _wait_ready(port, workers, timeout)
+        per_worker = [_memory_mb(pid) for pid in _children(server.pid)]
+        master = _memory_mb(server.pid)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(60)
+
+    def mean(key):
+        return round(sum(w[key] for w in per_worker) / max(len(per_worker), 1), 1)
+
+    return {
+        "workers": len(per_worker),
+        "master_mb": master,
+        "worker_mean_mb": {key: mean(key) for key in ("rss", "pss", "private")},
+        "total_pss_mb": round(master["pss"] + sum(w["pss"] for w in per_worker), 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=5090)
+    parser.add_argument("--timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    report = {
+        "preload": measure(True, args.workers, args.port, args.timeout),
+        "no_preload": measure(False, args.workers, args.port, args.timeout),
+    }
+    saved = report["no_preload"]["worker_mean_mb"]["private"] - report["preload"]["worker_mean_mb"]["private"]
+    report["private_mb_saved_per_worker"] = round(saved, 1)
+    report["total_pss_mb_saved"] = round(report["no_preload"]["total_pss_mb"] - report["preload"]["total_pss_mb"], 1)
+    report["checks"] = {"preload_saves_memory": saved > 0}
+    print(json.dumps(report, indent=2))
+    if not all(report["checks"].values()):
+        sys.exit(1)
@@ -0,0 +1,119 @@
+"""
+Quantized vector search: recall, memory and latency against the exact path.
+
+Builds a flat, an int8 and a PQ VectorIndex over a synthetic corpus of
+clustered unit vectors (embeddings of real documents cluster by topic, which
+random vectors do not), and searches it with held-out queries. For every
+codec it reports recall@k against exact cosine top-k, resident memory, build
+time and search latency, next to `find_top_k_chunks_manual` on the same
+corpus, both from stored lists (as the query route calls it) and from a
+ready numpy matrix.
+
+Exits non-zero if a quantized codec's recall@k falls below --min-recall or
+it does not use less memory than float32.
+
+Run from backend/app/api:
+    python -m benchmarks.bench_quantization --size 200000 --k 10
+"""
+from benchmarks import offline  # noqa: F401  (must precede app imports)
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from services.rag_service import find_top_k_chunks_manual
+from services.vector_store import VectorIndex, normalize, top_indices
+
+
+def clustered_vectors(count: int, dimension: int, clusters: int, spread: float,
+                      rng: np.random.Generator) -> np.ndarray:
+    centers = rng.standard_normal((clusters, dimension)).astype(np.float32)
+    vectors = centers[rng.integers(clusters, size=count)]
+    vectors += spread * rng.standard_normal((count, dimension)).astype(np.float32)
+    return normalize(vectors)
+
+
+def _latency(search, queries: np.ndarray) -> dict:
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        search(query)
+        timings.append((time.perf_counter() - start) * 1000)
+    return {"p50_ms": round(float(np.percentile(timings, 50)), 3),
+            "p95_ms": round(float(np.percentile(timings, 95)), 3)}
+
+
+def run(size: int, dimension: int, k: int, queries: int, candidates: int, subspaces: int,
+        clusters: int, spread: float, seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    corpus = clustered_vectors(size + queries, dimension, clusters, spread, rng)
+    corpus, held_out = corpus[:size], corpus[size:]
+    ids = np.stack([np.arange(size) // 100, np.arange(size) % 100], axis=1)
+    truth = [set(top_indices(corpus @ query, k).tolist()) for query in held_out]
+
+    report = {
+        "size": size, "dimension": dimension, "k": k, "queries": queries, "rescore_candidates": candidates,
+        "float32_bytes": int(corpus.nbytes),
+        "exact": {},
+        "codecs": {},
+    }
+    stored_vectors, stored_chunks = corpus.tolist(), [""] * size
+    report["exact"]["from_lists"] = _latency(
+        lambda q: find_top_k_chunks_manual("", stored_chunks, stored_vectors, k, query_vector=q), held_out[:20])
+    report["exact"]["from_matrix"] = _latency(lambda q: top_indices(corpus @ q, k), held_out)
+    del stored_vectors
+
+    checks = {}
+    for codec, params in (("flat", {}), ("int8", {}), ("pq", {"subspaces": subspaces})):
+        start = time.perf_counter()
+        index = VectorIndex.build(corpus, ids, codec=codec, seed=seed, **params)
+        build_seconds = time.perf_counter() - start
+        with tempfile.TemporaryDirectory() as directory:
+            # Search the saved index, so rescoring reads memory-mapped vectors as it does in service
+            index.save(directory)
+            index = VectorIndex.load(directory)
+            found = [index.search(query, k, candidates)[0] for query in held_out]
+            recall = np.mean([len(truth[i] & set(rows.tolist())) / k for i, rows in enumerate(found)])
+            no_rescore = np.mean([
+                len(truth[i] & set(top_indices(index.approximate_scores(query), k).tolist())) / k
+                for i, query in enumerate(held_out)
+            ])
+            report["codecs"][codec] = {
+                **index.describe(),
+                "bytes_per_vector": round(index.codes.nbytes / size, 1),
+                "memory_vs_float32": round(index.nbytes / corpus.nbytes, 3),
+                "build_seconds": round(build_seconds, 2),
+                f"recall@{k}": round(float(recall), 4),
+                f"recall@{k}_without_rescoring": round(float(no_rescore), 4),
+                "search": _latency(lambda q: index.search(q, k, candidates), held_out),
+            }
+            del index
+        if codec != "flat":
+            checks[f"{codec}_recall"] = report["codecs"][codec][f"recall@{k}"] >= args.min_recall
+            checks[f"{codec}_smaller_than_float32"] = report["codecs"][codec]["memory_vs_float32"] < 1
+    report["checks"] = checks
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--candidates", type=int, default=200, help="Rows rescored exactly per query")
+    parser.add_argument("--subspaces", type=int, default=48)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--spread", type=float, default=0.6, help="Noise around cluster centres")
+    parser.add_argument("--min-recall", type=float, default=0.9)
+    args = parser.parse_args()
+
+    report = run(args.size, args.dimension, args.k, args.queries, args.candidates, args.subspaces,
+                 args.clusters, args.spread)
+    print(json.dumps(report, indent=2))
+    if not all(report["checks"].values()):
+        sys.exit(1)
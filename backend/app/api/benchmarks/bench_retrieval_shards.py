@@ -0,0 +1,232 @@
+"""
+Retrieval shards: sharded corpus search against in-process search.
+
+Stores a synthetic corpus for several users, then starts retrieval shard
+processes (retrieval_service.py) on local ports, two replicas per shard,
+and searches every user's corpus through a `RetrievalClient`. Results are
+compared with the exact top-k of the in-process index (fan-outs disabled,
+so both are exact). It then:
+
+- stops one replica of a shard: searches must keep succeeding on the other
+- adds a shard: reports the share of files that moved (rendezvous hashing
+  moves about 1/n) and compares results again
+- switches to one shard per user (RETRIEVAL_SHARD_KEY=user) and compares
+
+Reports search latency and the vectors each shard process holds in memory.
+Exits non-zero if any comparison differs, a search fails after the replica
+is stopped, more than --max-moved of the files move when a shard is added,
+or a shard holds more than --max-shard-share of the vectors.
+
+Run from backend/app/api:
+    python -m benchmarks.bench_retrieval_shards --users 4 --files 40 --shards 2
+"""
+from benchmarks import offline  # noqa: F401  (must precede app imports)
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+from config import database, settings
+from models.sqlalchemy import content_blob  # noqa: F401  (files reference its table)
+from models.sqlalchemy.file import Files
+from models.sqlalchemy.parsed_file import ParsedContent
+from models.sqlalchemy.users import User
+from services.corpus_index import corpus_version, get_user_index
+from services.retrieval_shards import RetrievalClient, shard_for
+from services.vector_store import normalize
+
+FIRST_PORT = int(os.environ.get("BENCH_SHARD_PORT", 6101))
+
+
+def _populate(db, users: int, files: int, chunks: int, dimension: int, rng) -> dict[int, list[int]]:
+    corpus = {}
+    for number in range(users):
+        user = User(name=f"u{number}", username=f"shard-bench-{number}", email=f"shard{number}@example.com",
+                    password="x")
+        db.add(user)
+        db.flush()
+        corpus[user.id] = []
+        for file_number in range(files):
+            file = Files(name=f"doc{file_number}.txt", content_type="text/plain",
+                         s3key=f"bench/{user.id}/{file_number}", user_id=user.id)
+            db.add(file)
+            db.flush()
+            vectors = normalize(rng.standard_normal((chunks, dimension)).astype(np.float32))
+            db.add(ParsedContent(file_id=file.id, user_id=user.id, raw_text="text", chunking={"strategy": "bench"},
+                                 chunks=[f"chunk {i}" for i in range(chunks)], vectors=vectors.tolist()))
+            corpus[user.id].append(file.id)
+    db.commit()
+    return corpus
+
+
+class ShardProcesses:
+    """Retrieval shard servers on consecutive local ports."""
+
+    def __init__(self):
+        self.processes = {}
+        self._next_port = FIRST_PORT
+
+    def start(self) -> str:
+        port = self._next_port
+        self._next_port += 1
+        url = f"http://127.0.0.1:{port}"
+        self.processes[url] = subprocess.Popen(
+            [sys.executable, "retrieval_service.py", "--port", str(port)], env=os.environ.copy())
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            try:
+                if httpx.get(f"{url}/health", timeout=1).status_code == 200:
+                    return url
+            except httpx.HTTPError:
+                time.sleep(0.2)
+        raise RuntimeError(f"Retrieval shard on port {port} did not start")
+
+    def stop(self, url: str):
+        process = self.processes.pop(url)
+        process.terminate()
+        process.wait(timeout=10)
+
+    def held_vectors(self) -> dict[str, int]:
+        return {url: httpx.get(f"{url}/stats", timeout=5).json()["vectors"] for url in self.processes}
+
+    def close(self):
+        for url in list(self.processes):
+            self.stop(url)
+
+
+async def _search_all(client: RetrievalClient, queries: dict[int, np.ndarray], k: int,
+                      digests: dict[int, str]) -> tuple[dict, list]:
+    results, latency = {}, []
+    for user_id, vectors in queries.items():
+        for number, vector in enumerate(vectors):
+            start = time.perf_counter()
+            hits, _, _ = await client.search(user_id, vector, k, doc_fanout=0, section_fanout=0,
+                                             corpus=digests[user_id])
+            latency.append(time.perf_counter() - start)
+            results[(user_id, number)] = [(file_id, chunk) for file_id, chunk, _ in hits]
+    return results, latency
+
+
+def _ms(samples: list[float]) -> dict:
+    ordered = sorted(samples)
+    return {"p50_ms": round(statistics.median(ordered) * 1000, 2),
+            "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 2)}
+
+
+async def scenario(users: int, files: int, chunks: int, dimension: int, shards: int, queries: int, k: int,
+                   seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    # Shard processes inherit the database and index directory through the environment
+    os.environ["VECTOR_INDEX_DIR"] = settings.VECTOR_INDEX_DIR = tempfile.mkdtemp(prefix="rag-shard-indexes-")
+    os.environ["SNAPSHOT_DIR"] = settings.SNAPSHOT_DIR = ""
+    database.Base.metadata.create_all(bind=database.engine)
+    db = database.SessionLocal()
+    try:
+        corpus = _populate(db, users, files, chunks, dimension, rng)
+        query_vectors = {user_id: normalize(rng.standard_normal((queries, dimension)).astype(np.float32))
+                         for user_id in corpus}
+        # What the API sends along: the digest of its version of each user's corpus
+        digests = {user_id: corpus_version(db, user_id).digest for user_id in corpus}
+        expected, local_latency = {}, []
+        for user_id, vectors in query_vectors.items():
+            index = get_user_index(db, user_id)
+            for number, vector in enumerate(vectors):
+                start = time.perf_counter()
+                rows, _, _ = index.search(vector, k, doc_fanout=0, section_fanout=0)
+                local_latency.append(time.perf_counter() - start)
+                expected[(user_id, number)] = [(int(index.ids[row][0]), int(index.ids[row][1])) for row in rows]
+    finally:
+        db.close()
+
+    def matches(results: dict) -> bool:
+        return all(set(results[key]) == set(expected[key]) for key in expected)
+
+    servers = ShardProcesses()
+    client = None
+    try:
+        shard_map = {f"s{i}": [servers.start(), servers.start()] for i in range(shards)}
+        client = RetrievalClient(shard_map, key="file")
+        # The first search of each user builds the shards' indexes
+        await _search_all(client, {user_id: vectors[:1] for user_id, vectors in query_vectors.items()}, k, digests)
+        sharded, sharded_latency = await _search_all(client, query_vectors, k, digests)
+        held = servers.held_vectors()
+        total = sum(len(file_ids) for file_ids in corpus.values()) * chunks
+        shard_share = max(max(held[url] for url in urls) for urls in shard_map.values()) / total
+
+        # Lose one replica of the first shard
+        servers.stop(shard_map["s0"][0])
+        try:
+            after_failure, _ = await _search_all(client, query_vectors, k, digests)
+            failover_ok = matches(after_failure)
+        except Exception:
+            failover_ok = False
+
+        # Add a shard
+        all_files = [file_id for file_ids in corpus.values() for file_id in file_ids]
+        old_names = list(shard_map)
+        shard_map[f"s{shards}"] = [servers.start()]
+        client.rebalance(shard_map)
+        moved = sum(shard_for(file_id, old_names) != shard_for(file_id, list(shard_map)) for file_id in all_files)
+        rebalanced, rebalance_latency = await _search_all(client, query_vectors, k, digests)
+
+        # One shard per user
+        client.rebalance(shard_map, key="user")
+        by_user, _ = await _search_all(client, query_vectors, k, digests)
+        replica_stats = client.stats()
+    finally:
+        if client is not None:
+            await client.aclose()
+        servers.close()
+
+    return {
+        "users": users, "files": files, "chunks_per_file": chunks, "shards": shards, "k": k,
+        "in_process": _ms(local_latency),
+        "sharded": _ms(sharded_latency),
+        "after_rebalance": _ms(rebalance_latency),
+        "vectors_total": total,
+        "vectors_held_per_process": held,
+        "max_shard_share": round(shard_share, 3),
+        "files_moved_on_rebalance": round(moved / len(all_files), 3),
+        "replicas": replica_stats,
+        "results": {
+            "sharded_match": matches(sharded),
+            "failover_match": failover_ok,
+            "rebalanced_match": matches(rebalanced),
+            "user_key_match": matches(by_user),
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--files", type=int, default=40, help="Files per user")
+    parser.add_argument("--chunks", type=int, default=60, help="Chunks per file")
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--shards", type=int, default=2)
+    parser.add_argument("--queries", type=int, default=20, help="Queries per user")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--max-moved", type=float, default=0.5, help="Largest share of files moved by adding a shard")
+    parser.add_argument("--max-shard-share", type=float, default=0.75,
+                        help="Largest share of all vectors one shard may hold")
+    args = parser.parse_args()
+
+    report = asyncio.run(scenario(args.users, args.files, args.chunks, args.dimension, args.shards,
+                                  args.queries, args.k))
+    report["checks"] = {
+        **report["results"],
+        "rebalance_moves_few_files": report["files_moved_on_rebalance"] <= args.max_moved,
+        "shards_split_the_corpus": report["max_shard_share"] <= args.max_shard_share,
+    }
+    print(json.dumps(report, indent=2))
+    if not all(report["checks"].values()):
+        sys.exit(1)
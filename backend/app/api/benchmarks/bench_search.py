@@ -0,0 +1,66 @@
+"""
+Retrieval micro-benchmarks.
+
+Measures, for several corpus sizes:
+- top-k search with `find_top_k_chunks_manual`, starting from vectors in the
+  form they are stored in the database (lists of floats)
+- vector (de)serialization: the JSON round trip of the `vectors` column and
+  the list <-> numpy conversions around it
+
+Vectors are random unit vectors from a fixed seed, so runs are comparable.
+
+Run from backend/app/api:
+    python -m benchmarks.bench_search --sizes 1000 10000 50000 --repeat 5
+"""
+from benchmarks import offline  # noqa: F401  (must precede app imports)
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from services.rag_service import find_top_k_chunks_manual
+
+
+def _best(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run(sizes: list[int], dimension: int, k: int, repeat: int, seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    results = {"dimension": dimension, "k": k, "corpora": {}}
+    for size in sizes:
+        matrix = rng.standard_normal((size, dimension)).astype(np.float32)
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+        stored_vectors = matrix.tolist()
+        stored_chunks = [f"chunk {i}" for i in range(size)]
+        query = matrix[rng.integers(size)].tolist()
+        payload = json.dumps(stored_vectors)
+
+        search = _best(lambda: find_top_k_chunks_manual("", stored_chunks, stored_vectors, k, query_vector=query), repeat)
+        results["corpora"][size] = {
+            "search_ms": round(search * 1000, 3),
+            "searches_per_second": round(1 / search, 1),
+            "json_dumps_ms": round(_best(lambda: json.dumps(stored_vectors), repeat) * 1000, 3),
+            "json_loads_ms": round(_best(lambda: json.loads(payload), repeat) * 1000, 3),
+            "list_to_array_ms": round(_best(lambda: np.asarray(stored_vectors, dtype=np.float32), repeat) * 1000, 3),
+            "array_to_list_ms": round(_best(matrix.tolist, repeat) * 1000, 3),
+            "json_mb": round(len(payload) / (1024 * 1024), 2),
+        }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    print(json.dumps(run(args.sizes, args.dimension, args.k, args.repeat), indent=2))
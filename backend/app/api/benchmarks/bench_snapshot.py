@@ -0,0 +1,140 @@
+"""
+Corpus snapshots: warming up from a snapshot vs from the database.
+
+Fills the database with synthetic parse results, then measures:
+- loading every vector through the ORM with JSON decoding (what a cold
+  worker does today)
+- exporting a full snapshot, and an incremental one after more parses
+- opening the snapshots (memory-mapped) and reading every vector
+- building one user's corpus index with and without the snapshots
+- restoring a user's deleted parse results from the snapshots
+
+Exits non-zero if snapshot vectors differ from the database, the
+incremental snapshot holds more than the new parse results, the restore
+is incomplete, or reading the snapshot is not faster than the ORM.
+
+Run from backend/app/api:
+    python -m benchmarks.bench_snapshot --parses 300 --chunks 40
+"""
+from benchmarks import offline  # noqa: F401  (must precede app imports)
+
+import argparse
+from datetime import datetime, timedelta, timezone
+import json
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from config import database, settings
+from models.sqlalchemy import content_blob  # noqa: F401  (files reference its table)
+from models.sqlalchemy.file import Files
+from models.sqlalchemy.parsed_file import ParsedContent
+from models.sqlalchemy.users import User
+from services.corpus_index import get_user_index, indexes
+from services.corpus_snapshot import SnapshotSet, export_snapshot, import_snapshots, read_manifest
+
+
+def _populate(db, users: list[User], parses: int, chunks: int, dimension: int, created_at, rng) -> list[int]:
+    ids = []
+    for number in range(parses):
+        user = users[number % len(users)]
+        file = Files(name=f"doc{number}.txt", content_type="text/plain",
+                     s3key=f"bench/{created_at.timestamp()}/{number}", user_id=user.id)
+        db.add(file)
+        db.flush()
+        vectors = rng.standard_normal((chunks, dimension)).astype(np.float32)
+        db.add(ParsedContent(file_id=file.id, user_id=user.id, raw_text="text", chunking={"strategy": "bench"},
+                             chunks=[f"chunk {i} of {number}" for i in range(chunks)],
+                             vectors=vectors.tolist(), created_at=created_at))
+        ids.append(file.id)
+    db.commit()
+    return ids
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, round(time.perf_counter() - start, 3)
+
+
+def run(parses: int, chunks: int, dimension: int, users: int, seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    database.Base.metadata.create_all(bind=database.engine)
+    db = database.SessionLocal()
+    accounts = [User(name=f"u{i}", username=f"snapshot-bench-{i}", email=f"s{i}@example.com", password="x")
+                for i in range(users)]
+    db.add_all(accounts)
+    db.commit()
+    # Older parse results, so the incremental snapshot's overlap window excludes them
+    _populate(db, accounts, parses, chunks, dimension, datetime.now(timezone.utc) - timedelta(hours=2), rng)
+
+    def orm_load():
+        rows = db.query(ParsedContent.file_id, ParsedContent.vectors).all()
+        return {file_id: np.asarray(vectors, dtype=np.float32) for file_id, vectors in rows}
+
+    from_db, orm_seconds = _timed(orm_load)
+    root = tempfile.mkdtemp(prefix="rag-snapshots-")
+    full, export_seconds = _timed(lambda: export_snapshot(db, root))
+
+    new_ids = _populate(db, accounts, max(1, parses // 10), chunks, dimension, datetime.now(timezone.utc), rng)
+    incremental, incremental_seconds = _timed(lambda: export_snapshot(db, root, incremental=True))
+
+    def snapshot_load():
+        snapshots = SnapshotSet(root)
+        return {parse_id: np.array(entry.snapshot.vectors_of(entry.row)) for parse_id, entry in snapshots}
+
+    from_snapshot, snapshot_seconds = _timed(snapshot_load)
+    identical = all(np.array_equal(from_db[parse_id], from_snapshot[parse_id]) for parse_id in from_db)
+
+    settings.VECTOR_INDEX_DIR = tempfile.mkdtemp(prefix="rag-indexes-")
+    settings.SNAPSHOT_DIR = ""
+    _, build_from_db = _timed(lambda: get_user_index(db, accounts[0].id))
+    indexes.clear()
+    settings.VECTOR_INDEX_DIR = tempfile.mkdtemp(prefix="rag-indexes-")
+    settings.SNAPSHOT_DIR = root
+    _, build_from_snapshot = _timed(lambda: get_user_index(db, accounts[0].id))
+
+    # Lose one user's parse results and restore them
+    lost = db.query(ParsedContent).filter(ParsedContent.user_id == accounts[-1].id).delete()
+    db.commit()
+    restore, restore_seconds = _timed(lambda: import_snapshots(db, SnapshotSet(root), accounts[-1].id))
+    restored = {file_id: np.asarray(vectors, dtype=np.float32) for file_id, vectors in
+                db.query(ParsedContent.file_id, ParsedContent.vectors).filter(
+                    ParsedContent.user_id == accounts[-1].id)}
+    db.close()
+
+    report = {
+        "parse_results": len(from_db),
+        "vectors": sum(len(v) for v in from_db.values()),
+        "orm_load_seconds": orm_seconds,
+        "snapshot_load_seconds": snapshot_seconds,
+        "speedup": round(orm_seconds / max(snapshot_seconds, 1e-6), 1),
+        "full_export": {"seconds": export_seconds, **read_manifest(full)},
+        "incremental_export": {"seconds": incremental_seconds, **read_manifest(incremental)},
+        "user_index_build_seconds": {"from_database": build_from_db, "from_snapshot": build_from_snapshot},
+        "restore": {"seconds": restore_seconds, "deleted": lost, **restore},
+    }
+    report["checks"] = {
+        "snapshot_matches_database": identical,
+        "incremental_holds_only_new_parses": read_manifest(incremental)["parse_results"] == len(new_ids),
+        "restore_complete": restore["restored"] == lost and all(
+            np.array_equal(restored[parse_id], from_snapshot[parse_id]) for parse_id in restored),
+        "snapshot_faster_than_orm": snapshot_seconds < orm_seconds,
+    }
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--parses", type=int, default=300)
+    parser.add_argument("--chunks", type=int, default=40, help="Chunks per parse result")
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--users", type=int, default=5)
+    args = parser.parse_args()
+
+    report = run(args.parses, args.chunks, args.dimension, args.users)
+    print(json.dumps(report, indent=2))
+    if not all(report["checks"].values()):
+        sys.exit(1)
@@ -0,0 +1,161 @@
+"""
+Storage backends: upload and download throughput, ranged reads, atomic writes.
+
+Uploads documents of --size-mb to each backend (`local` in a temporary
+directory and `s3` against a moto mock), then reads them back whole (what
+parsing does: download and decode the text), streamed in chunks, and as
+random byte ranges. Reports MB/s per operation and the latency of ranged
+reads.
+
+Exits non-zero if any read returns different bytes from what was uploaded,
+a failed upload to the local backend leaves a partial object or temporary
+file behind, or the local backend is not faster than S3 at handing a
+document to the parser.
+
+Run from backend/app/api:
+    python -m benchmarks.bench_storage --size-mb 16 --files 8
+"""
+from benchmarks import offline  # noqa: F401  (must precede app imports)
+
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_chunking import _WORDS
+from benchmarks.bench_load import _summary
+from benchmarks.offline import mock_s3
+from services.storage import LocalStorage, create_storage
+
+# Bytes per ranged read
+RANGE_BYTES = 64 * 1024
+
+
+class FailingReader(io.RawIOBase):
+    """A file object that fails after `fail_after` bytes, like a dropped upload."""
+
+    def __init__(self, content: bytes, fail_after: int):
+        self._content = io.BytesIO(content)
+        self._fail_after = fail_after
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._content.tell() >= self._fail_after:
+            raise ConnectionError("client went away")
+        data = self._content.read(min(len(buffer), self._fail_after - self._content.tell()))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def _document(size: int, rng: random.Random) -> bytes:
+    words = rng.choices(_WORDS, k=size // 5)
+    text = " ".join(words).encode()
+    return (text * (size // max(1, len(text)) + 1))[:size]
+
+
+def _mb_per_second(size: int, seconds: float) -> float:
+    return round(size / (1024 * 1024) / seconds, 1)
+
+
+def run_backend(storage, documents: list[bytes], ranges: int, rng: random.Random) -> dict:
+    total = sum(len(document) for document in documents)
+    keys = [f"bench/doc-{i}" for i in range(len(documents))]
+
+    start = time.perf_counter()
+    for key, document in zip(keys, documents):
+        storage.upload(io.BytesIO(document), key, "text/plain")
+    upload_seconds = time.perf_counter() - start
+
+    # What parsing does: fetch the document and decode its text
+    intact = True
+    start = time.perf_counter()
+    for key, document in zip(keys, documents):
+        content = storage.download(key)
+        text = str(content, "utf-8")
+        intact &= len(text) == len(document) and content[:RANGE_BYTES] == document[:RANGE_BYTES]
+    parse_handoff_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for key, document in zip(keys, documents):
+        intact &= b"".join(storage.stream(key)) == document
+    stream_seconds = time.perf_counter() - start
+
+    range_latency = []
+    for _ in range(ranges):
+        i = rng.randrange(len(documents))
+        offset = rng.randrange(max(1, len(documents[i]) - RANGE_BYTES))
+        started = time.perf_counter()
+        data = b"".join(storage.stream(keys[i], offset, offset + RANGE_BYTES))
+        range_latency.append(time.perf_counter() - started)
+        intact &= data == documents[i][offset:offset + RANGE_BYTES]
+
+    intact &= all(storage.exists(key) and storage.size(key) == len(document)
+                  for key, document in zip(keys, documents))
+    for key in keys:
+        storage.delete(key)
+    intact &= not any(storage.exists(key) for key in keys)
+
+    return {
+        "upload_mb_s": _mb_per_second(total, upload_seconds),
+        "parse_handoff_mb_s": _mb_per_second(total, parse_handoff_seconds),
+        "parse_handoff_ms": round(parse_handoff_seconds * 1000, 2),
+        "stream_mb_s": _mb_per_second(total, stream_seconds),
+        "range_read": _summary(range_latency),
+        "intact": bool(intact),
+    }
+
+
+def failed_upload_is_atomic(storage: LocalStorage, size: int) -> bool:
+    """A dropped upload must leave the previous object as it was and no temporary file."""
+    key = "bench/atomic"
+    storage.upload(io.BytesIO(b"previous version"), key, "text/plain")
+    try:
+        storage.upload(io.BufferedReader(FailingReader(b"x" * size, size // 2)), key, "text/plain")
+    except Exception:
+        pass
+    else:
+        return False
+    content = storage.download(key)
+    leftovers = [name for name in os.listdir(storage.root / "bench") if name.endswith(".tmp")]
+    storage.delete(key)
+    return bytes(content) == b"previous version" and not leftovers
+
+
+def scenario(size_mb: float, files: int, ranges: int, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    documents = [_document(int(size_mb * 1024 * 1024), rng) for _ in range(files)]
+    local = LocalStorage(tempfile.mkdtemp(prefix="rag-bench-storage-"))
+    report = {
+        "size_mb": size_mb,
+        "files": files,
+        "backends": {"local": run_backend(local, documents, ranges, rng)},
+    }
+    with mock_s3():
+        report["backends"]["s3"] = run_backend(create_storage("s3"), documents, ranges, rng)
+    report["local_failed_upload_atomic"] = failed_upload_is_atomic(local, len(documents[0]))
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size-mb", type=float, default=16, help="Size of each document")
+    parser.add_argument("--files", type=int, default=8)
+    parser.add_argument("--ranges", type=int, default=200, help="Random 64 KB range reads per backend")
+    args = parser.parse_args()
+
+    report = scenario(args.size_mb, args.files, args.ranges)
+    local, s3 = report["backends"]["local"], report["backends"]["s3"]
+    report["checks"] = {
+        "reads_intact": local["intact"] and s3["intact"],
+        "failed_upload_atomic": report["local_failed_upload_atomic"],
+        "local_parse_handoff_faster": local["parse_handoff_mb_s"] > s3["parse_handoff_mb_s"],
+    }
+    print(json.dumps(report, indent=2))
+    if not all(report["checks"].values()):
+        sys.exit(1)
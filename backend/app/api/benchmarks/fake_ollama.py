@@ -0,0 +1,112 @@
+"""
+Fake Ollama server for local load tests.
+
+Implements the streaming `/api/chat` endpoint with configurable latency so
+the LLM gateway (and the whole query path) can be exercised without a GPU
+or a real model. It records how many generations ran concurrently, and how
+much of each rendered conversation repeats the previous conversation plus
+its answer, which a real server would find in its prompt (KV) cache.
+
+Run standalone from backend/app/api:
+    python -m benchmarks.fake_ollama --port 11500 --ttft 0.2 --tokens 40 --token-delay 0.01
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+import uvicorn
+
+
+def create_app(ttft: float = 0.2, tokens: int = 40, token_delay: float = 0.01) -> FastAPI:
+    """
+    Build the fake server application.
+
+    Args:
+        ttft: Seconds before the first token is streamed
+        tokens: Number of tokens in every answer
+        token_delay: Seconds between subsequent tokens
+    """
+    app = FastAPI(title="Fake Ollama")
+    app.state.stats = {"requests": 0, "active": 0, "max_active": 0, "prompts": [],
+                       "prompt_chars": 0, "cached_prompt_chars": 0}
+    # Previous rendered conversation followed by its answer, as a server cache would hold it
+    app.state.cached = ""
+
+    @app.post("/api/chat")
+    async def chat(request: Request):
+        body = await request.json()
+        prompt = body["messages"][-1]["content"]
+        stats = app.state.stats
+        stats["requests"] += 1
+        stats["prompts"].append(prompt)
+        rendered = "".join(f"<{m['role']}>{m['content']}" for m in body["messages"]) + "<assistant>"
+        cached = len(os.path.commonprefix([rendered, app.state.cached]))
+        stats["prompt_chars"] += len(rendered)
+        stats["cached_prompt_chars"] += cached
+
+        async def stream():
+            stats["active"] += 1
+            stats["max_active"] = max(stats["max_active"], stats["active"])
+            started = time.perf_counter()
+            try:
+                await asyncio.sleep(ttft)
+                # Deterministic answer derived from the prompt
+                seed = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+                app.state.cached = rendered + "".join(f"{seed[i % 64]} " for i in range(tokens))
+                for i in range(tokens):
+                    piece = {"model": body.get("model"), "message": {"role": "assistant", "content": f"{seed[i % 64]} "}, "done": False}
+                    yield json.dumps(piece) + "\n"
+                    await asyncio.sleep(token_delay)
+                duration_ns = int((time.perf_counter() - started) * 1e9)
+                yield json.dumps({"model": body.get("model"), "message": {"role": "assistant", "content": ""},
+                                  "done": True, "eval_count": tokens, "eval_duration": duration_ns}) + "\n"
+            finally:
+                stats["active"] -= 1
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    @app.get("/stats")
+    def get_stats():
+        return {k: v for k, v in app.state.stats.items() if k != "prompts"}
+
+    return app
+
+
+class FakeOllamaServer:
+    """Runs the fake server in a background thread for the duration of a benchmark."""
+
+    def __init__(self, port: int = 11500, **options):
+        self.app = create_app(**options)
+        self.url = f"http://127.0.0.1:{port}"
+        self._server = uvicorn.Server(uvicorn.Config(self.app, host="127.0.0.1", port=port, log_level="warning"))
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    @property
+    def stats(self) -> dict:
+        return self.app.state.stats
+
+    def __enter__(self):
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self._server.should_exit = True
+        self._thread.join(5)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--ttft", type=float, default=0.2)
+    parser.add_argument("--tokens", type=int, default=40)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.ttft, args.tokens, args.token_delay), host="127.0.0.1", port=args.port)
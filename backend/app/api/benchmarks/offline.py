@@ -0,0 +1,81 @@
+"""
+Hermetic environment for benchmarks.
+
+Importing this module before any application module points the app at
+local stand-ins, so benchmarks need no Postgres, AWS account, GPU or model
+download beyond the tokenizer:
+
+- SQLite database in a temporary directory (DATABASE_URL)
+- S3 credentials and bucket for a moto mock (see `mock_s3`), and a
+  temporary STORAGE_DIR for the local storage backend
+- the deterministic `hash` embedding backend defined here
+- the fake Ollama server on BENCH_OLLAMA_PORT (see benchmarks.fake_ollama)
+
+Settings are read when the app modules are imported, which is why this
+module must come first. Values already present in the environment win.
+"""
+import contextlib
+import hashlib
+import os
+import re
+import tempfile
+
+FAKE_OLLAMA_PORT = int(os.environ.get("BENCH_OLLAMA_PORT", 11500))
+BENCH_BUCKET = "rag-benchmark"
+
+_defaults = {
+    "DATABASE_URL": f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='rag-bench-'), 'bench.db')}",
+    "AWS_ACCESS_KEY": "testing",
+    "AWS_SECRET_ACCESS_KEY": "testing",
+    "AWS_REGION": "us-east-1",
+    "S3_BUCKET_NAME": BENCH_BUCKET,
+    "STORAGE_DIR": tempfile.mkdtemp(prefix="rag-bench-storage-"),
+    "EMBEDDING_BACKEND": "hash",
+    "OLLAMA_BASE_URL": f"http://127.0.0.1:{FAKE_OLLAMA_PORT}",
+    "JWT_SECRET": "benchmark",
+    "JWT_ALGORITHM": "HS256",
+}
+for _key, _value in _defaults.items():
+    os.environ.setdefault(_key, _value)
+
+import numpy as np  # noqa: E402
+
+from services.embeddings import EMBEDDING_BACKENDS, EmbeddingBackend  # noqa: E402
+
+_TOKEN = re.compile(r"\w+")
+
+
+class HashEmbeddingBackend(EmbeddingBackend):
+    """
+    Deterministic bag-of-words embedder (feature hashing).
+
+    Texts sharing words get similar vectors, so retrieval still behaves
+    sensibly, at a tiny fraction of the cost of a real model.
+    """
+    name = "hash"
+
+    def __init__(self, dimension: int = 384):
+        self.dimension = dimension
+
+    def embed_array(self, texts: list[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in _TOKEN.findall(text.lower()):
+                digest = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+                out[row, digest % self.dimension] += 1.0 if digest & (1 << 63) else -1.0
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.maximum(norms, 1e-12)
+
+
+EMBEDDING_BACKENDS.setdefault("hash", HashEmbeddingBackend)
+
+
+@contextlib.contextmanager
+def mock_s3(bucket: str = BENCH_BUCKET):
+    """Run the enclosed block against an in-process moto S3 with `bucket` created."""
+    import boto3
+    from moto import mock_aws
+
+    with mock_aws():
+        boto3.client("s3", region_name=os.environ["AWS_REGION"]).create_bucket(Bucket=bucket)
+        yield
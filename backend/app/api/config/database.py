@@ -19,7 +19,17 @@ DB_URL = os.getenv("DATABASE_URL")
 
 # Create SQLAlchemy engine with the configured database URL
 # This engine serves as the primary interface to the database
-engine = create_engine(DB_URL)
+if DB_URL and DB_URL.startswith("sqlite"):
+    # SQLite (used by the benchmarks) has no schemas, so tables declared in
+    # "public" are mapped to the default schema; sessions move between the
+    # event loop and worker threads, so connections must not be thread-bound
+    engine = create_engine(
+        DB_URL,
+        connect_args={"check_same_thread": False},
+        execution_options={"schema_translate_map": {"public": None}}
+    )
+else:
+    engine = create_engine(DB_URL)
 
 # Create a sessionmaker factory configured with our engine
 # autocommit=False: Transactions need to be explicitly committed
@@ -0,0 +1,262 @@
+"""
+Runtime settings module for the Document RAG API.
+
+This module collects the tunable knobs of the processing pipeline in one
+place. Values are read from environment variables (or the .env file) using
+python-decouple, with defaults that match the behaviour of a single-node
+development setup.
+"""
+from decouple import Csv, config
+
+# Name of the sentence-transformers model used for chunk and query embeddings
+EMBEDDING_MODEL_NAME = config("EMBEDDING_MODEL_NAME", default="all-MiniLM-L6-v2")
+
+# Maximum number of tokens the embedding model reads per input (MiniLM truncates at 256)
+EMBEDDING_MAX_TOKENS = config("EMBEDDING_MAX_TOKENS", default=256, cast=int)
+
+# Chunking strategy used at parse time: "token", "element" or "fixed"
+CHUNK_STRATEGY = config("CHUNK_STRATEGY", default="token")
+
+# Token budget per chunk for the token and element strategies.
+# Two tokens are reserved for the [CLS]/[SEP] markers added by the embedder.
+CHUNK_MAX_TOKENS = config("CHUNK_MAX_TOKENS", default=EMBEDDING_MAX_TOKENS - 2, cast=int)
+CHUNK_OVERLAP_TOKENS = config("CHUNK_OVERLAP_TOKENS", default=24, cast=int)
+
+# Character window for the fixed strategy (matches the original splitter settings)
+CHUNK_SIZE_CHARS = config("CHUNK_SIZE_CHARS", default=512, cast=int)
+CHUNK_OVERLAP_CHARS = config("CHUNK_OVERLAP_CHARS", default=50, cast=int)
+
+# Embedding backend: "huggingface" (PyTorch), "onnx" or "onnx-int8"
+EMBEDDING_BACKEND = config("EMBEDDING_BACKEND", default="huggingface")
+
+# CPU threads used by the embedding runtime (0 lets the runtime decide)
+EMBEDDING_THREADS = config("EMBEDDING_THREADS", default=0, cast=int)
+
+# Number of texts embedded per forward pass
+EMBEDDING_BATCH_SIZE = config("EMBEDDING_BATCH_SIZE", default=32, cast=int)
+
+# Optional local path to an exported ONNX model; downloaded from the hub when empty
+EMBEDDING_ONNX_PATH = config("EMBEDDING_ONNX_PATH", default="")
+
+# Dedicated embedding worker processes (0 embeds in the API process)
+EMBEDDING_WORKERS = config("EMBEDDING_WORKERS", default=0, cast=int)
+
+# Chunks per task sent to an embedding worker
+EMBEDDING_POOL_BATCH_SIZE = config("EMBEDDING_POOL_BATCH_SIZE", default=64, cast=int)
+
+# Times in a row an embedding worker is restarted after dying before it was
+# ready (e.g. the model fails to load) before the pool stops restarting it
+EMBEDDING_WORKER_RESTARTS = config("EMBEDDING_WORKER_RESTARTS", default=5, cast=int)
+
+# Seconds to wait for the embeddings of a query and of a document's chunks
+EMBEDDING_QUERY_TIMEOUT = config("EMBEDDING_QUERY_TIMEOUT", default=30.0, cast=float)
+EMBEDDING_DOCUMENT_TIMEOUT = config("EMBEDDING_DOCUMENT_TIMEOUT", default=600.0, cast=float)
+
+# Formats read by the lightweight extractors instead of unstructured:
+# any of text, markdown, csv, html, pdf (PDFs with a text layer); empty uses unstructured for all
+FAST_EXTRACTORS = config("FAST_EXTRACTORS", default="text,markdown,csv,html,pdf", cast=Csv())
+
+# Worker processes partitioning documents, PDFs in parallel page ranges
+# (0 partitions in the API process), and pages per partitioning task
+PARTITION_WORKERS = config("PARTITION_WORKERS", default=0, cast=int)
+PARTITION_PAGES_PER_TASK = config("PARTITION_PAGES_PER_TASK", default=16, cast=int)
+
+# Codec of the per-user corpus index searched by /query/{owner}/search:
+# "flat" (float32, exact), "int8" (4x smaller) or "pq" (product quantization,
+# one byte per subspace). Corpora smaller than VECTOR_QUANTIZE_MIN_VECTORS stay flat
+VECTOR_CODEC = config("VECTOR_CODEC", default="flat")
+VECTOR_QUANTIZE_MIN_VECTORS = config("VECTOR_QUANTIZE_MIN_VECTORS", default=4096, cast=int)
+
+# PQ subspaces (must divide the embedding dimension, 384 for MiniLM) and
+# vectors sampled to train a codec
+VECTOR_PQ_SUBSPACES = config("VECTOR_PQ_SUBSPACES", default=48, cast=int)
+VECTOR_TRAIN_SAMPLE = config("VECTOR_TRAIN_SAMPLE", default=50000, cast=int)
+
+# Candidates found on the codes that are rescored against the float vectors
+VECTOR_RESCORE_CANDIDATES = config("VECTOR_RESCORE_CANDIDATES", default=200, cast=int)
+
+# Corpus search is hierarchical: documents are ranked by the centroid of their
+# chunk vectors, then sections of the best CORPUS_DOC_FANOUT documents, and only
+# the chunks of the best CORPUS_SECTION_FANOUT sections are scanned (0 scans all)
+CORPUS_DOC_FANOUT = config("CORPUS_DOC_FANOUT", default=32, cast=int)
+CORPUS_SECTION_FANOUT = config("CORPUS_SECTION_FANOUT", default=64, cast=int)
+
+# Corpus search in separate retrieval shard processes (see retrieval_service.py).
+# RETRIEVAL_SHARDS lists the shards as "name=url,url;name=url": a name per shard
+# and the base URLs of its replicas. Empty runs retrieval in each API worker.
+# RETRIEVAL_SHARD_KEY places each user's whole corpus on one shard ("user") or
+# spreads a user's files across all shards ("file").
+RETRIEVAL_SHARDS = config("RETRIEVAL_SHARDS", default="")
+RETRIEVAL_SHARD_KEY = config("RETRIEVAL_SHARD_KEY", default="file")
+# File holding the shard map set through PUT /admin/retrieval. Every API worker
+# reloads it when it changes, and it overrides RETRIEVAL_SHARDS while it exists.
+# Empty refuses runtime changes.
+RETRIEVAL_SHARD_MAP_FILE = config("RETRIEVAL_SHARD_MAP_FILE", default="retrieval_shard_map.json")
+RETRIEVAL_TIMEOUT = config("RETRIEVAL_TIMEOUT", default=5.0, cast=float)
+# Seconds a replica that failed is tried only after the shard's other replicas
+RETRIEVAL_REPLICA_BACKOFF = config("RETRIEVAL_REPLICA_BACKOFF", default=10.0, cast=float)
+
+# Sections start at title elements; untitled runs are split every SECTION_MAX_CHUNKS chunks
+SECTION_MAX_CHUNKS = config("SECTION_MAX_CHUNKS", default=8, cast=int)
+
+# Directory for saved corpus indexes (float vectors are memory-mapped from
+# here), and how many users' indexes each worker keeps in memory
+VECTOR_INDEX_DIR = config("VECTOR_INDEX_DIR", default="indexes")
+VECTOR_INDEX_CACHE_SIZE = config("VECTOR_INDEX_CACHE_SIZE", default=32, cast=int)
+
+# Directory of corpus snapshots written by snapshot.py; corpus index builds
+# read vectors from current snapshots instead of the database (empty disables)
+SNAPSHOT_DIR = config("SNAPSHOT_DIR", default="snapshots")
+
+# Where uploaded documents are stored: "s3" (S3_BUCKET_NAME) or "local", a
+# directory on this node (STORAGE_DIR) whose files are memory-mapped for parsing
+STORAGE_BACKEND = config("STORAGE_BACKEND", default="s3")
+STORAGE_DIR = config("STORAGE_DIR", default="storage")
+
+# Ollama server and model used for answer generation
+OLLAMA_BASE_URL = config("OLLAMA_BASE_URL", default="http://localhost:11434")
+LLM_MODEL = config("LLM_MODEL", default="llama3")
+LLM_TEMPERATURE = config("LLM_TEMPERATURE", default=0.0, cast=float)
+
+# Generations allowed to run on the Ollama server at the same time, per API worker
+# (the server as a whole runs up to SERVER_WORKERS times as many)
+LLM_MAX_CONCURRENCY = config("LLM_MAX_CONCURRENCY", default=2, cast=int)
+
+# Seconds a request may wait for a generation slot before it is rejected
+LLM_QUEUE_TIMEOUT = config("LLM_QUEUE_TIMEOUT", default=30.0, cast=float)
+
+# Seconds allowed for a single generation (read timeout on the stream)
+LLM_REQUEST_TIMEOUT = config("LLM_REQUEST_TIMEOUT", default=120.0, cast=float)
+
+# Size of the persistent HTTP connection pool to the Ollama server
+LLM_MAX_CONNECTIONS = config("LLM_MAX_CONNECTIONS", default=8, cast=int)
+
+# Token budget for retrieved context in the RAG prompt
+LLM_CONTEXT_TOKENS = config("LLM_CONTEXT_TOKENS", default=1500, cast=int)
+
+# Batch queries (many questions about one file in one request): most questions
+# per request, and answers one batch generates on the LLM server at the same time
+BATCH_QUERY_MAX_QUESTIONS = config("BATCH_QUERY_MAX_QUESTIONS", default=100, cast=int)
+BATCH_QUERY_CONCURRENCY = config("BATCH_QUERY_CONCURRENCY", default=2, cast=int)
+
+# Chat sessions (follow-up questions about one file): memory per worker for the
+# decoded vectors of the files being discussed, in megabytes (conversations
+# are stored in the database), and seconds after which an idle session starts over
+CHAT_SESSION_CACHE_MB = config("CHAT_SESSION_CACHE_MB", default=256, cast=int)
+CHAT_SESSION_IDLE_SECONDS = config("CHAT_SESSION_IDLE_SECONDS", default=900, cast=float)
+
+# Tokens of verbatim conversation kept before the oldest turns are compressed
+# into one-line summaries, down to half this budget (the latest
+# CHAT_KEEP_TURNS turns always stay verbatim), and the token budget of those summaries
+CHAT_HISTORY_TOKENS = config("CHAT_HISTORY_TOKENS", default=3000, cast=int)
+CHAT_KEEP_TURNS = config("CHAT_KEEP_TURNS", default=2, cast=int)
+CHAT_SUMMARY_TOKENS = config("CHAT_SUMMARY_TOKENS", default=300, cast=int)
+
+# Weight of the previous question's vector in a follow-up's retrieval query
+CHAT_QUERY_CARRY = config("CHAT_QUERY_CARRY", default=0.3, cast=float)
+
+# Tokenizer used to count prompt tokens (defaults to the embedding tokenizer,
+# which is already loaded and counts conservatively for Llama-family models)
+CONTEXT_TOKENIZER = config("CONTEXT_TOKENIZER", default=EMBEDDING_MODEL_NAME)
+
+# Cross-encoder used for optional second-stage reranking
+RERANK_MODEL = config("RERANK_MODEL", default="cross-encoder/ms-marco-MiniLM-L-6-v2")
+
+# Candidates retrieved by cosine similarity before reranking
+RERANK_CANDIDATES = config("RERANK_CANDIDATES", default=20, cast=int)
+
+# Default per-request latency budget for retrieval plus reranking, in milliseconds
+RERANK_BUDGET_MS = config("RERANK_BUDGET_MS", default=300, cast=int)
+
+# Query/chunk pairs scored per cross-encoder forward pass, and cached scores kept
+RERANK_BATCH_SIZE = config("RERANK_BATCH_SIZE", default=16, cast=int)
+RERANK_CACHE_SIZE = config("RERANK_CACHE_SIZE", default=10000, cast=int)
+
+# Admission control in front of parsing and querying (see services/admission.py):
+# slots shared by all admitted requests, and per priority class
+# "rate per second per user, burst, slots the class may hold, queue-time SLO in seconds".
+# Every API worker applies them on its own, so the server as a whole admits up to
+# SERVER_WORKERS times as many requests.
+ADMISSION_ENABLED = config("ADMISSION_ENABLED", default=True, cast=bool)
+ADMISSION_CONCURRENCY = config("ADMISSION_CONCURRENCY", default=8, cast=int)
+ADMISSION_INTERACTIVE = config("ADMISSION_INTERACTIVE", default="5,20,8,2", cast=Csv(float))
+ADMISSION_PARSE = config("ADMISSION_PARSE", default="1,10,4,30", cast=Csv(float))
+ADMISSION_BATCH = config("ADMISSION_BATCH", default="0.5,5,2,120", cast=Csv(float))
+# File holding the limits set through PUT /admin/admission. Every API worker
+# reloads it when it changes, and it overrides the ADMISSION_* settings while it
+# exists. Empty refuses runtime changes.
+ADMISSION_LIMITS_FILE = config("ADMISSION_LIMITS_FILE", default="admission_limits.json")
+
+# Shared secret for the X-Admin-Token header of /admin/admission (empty disables those routes)
+ADMIN_TOKEN = config("ADMIN_TOKEN", default="")
+
+# Reject file and query requests without a bearer token (otherwise the
+# {owner} path parameter is trusted, as before tokens were checked)
+AUTH_REQUIRED = config("AUTH_REQUIRED", default=False, cast=bool)
+
+# Verified tokens and resolved users kept in memory: seconds and entries
+AUTH_CACHE_TTL = config("AUTH_CACHE_TTL", default=60, cast=float)
+AUTH_CACHE_SIZE = config("AUTH_CACHE_SIZE", default=10000, cast=int)
+
+# Threads hashing and verifying passwords with bcrypt
+AUTH_HASH_WORKERS = config("AUTH_HASH_WORKERS", default=2, cast=int)
+
+# In-process cache of serialized parse results, in megabytes (0 disables caching;
+# ETags and 304 responses still work)
+PARSE_CACHE_MB = config("PARSE_CACHE_MB", default=128, cast=int)
+
+# Prometheus metrics on /metrics (needs prometheus-client)
+METRICS_ENABLED = config("METRICS_ENABLED", default=True, cast=bool)
+# Under gunicorn every worker writes its metrics to files in this directory and
+# /metrics adds them up (prometheus_client multiprocess mode). Empty uses a new
+# temporary directory per server start; a set directory is emptied at start.
+METRICS_MULTIPROC_DIR = config("METRICS_MULTIPROC_DIR", default="")
+
+# OpenTelemetry span exporter: none | console | otlp | memory (needs opentelemetry-sdk)
+TRACING_EXPORTER = config("TRACING_EXPORTER", default="none")
+TRACING_SERVICE_NAME = config("TRACING_SERVICE_NAME", default="rag-narok-api")
+
+# Opt-in request profiling; when False no profiling code runs at all
+PROFILING_ENABLED = config("PROFILING_ENABLED", default=False, cast=bool)
+
+# Shared secret for the X-Profile header and the /admin/profiling endpoints
+PROFILING_TOKEN = config("PROFILING_TOKEN", default="")
+
+# Directory where profiles and memory reports are written
+PROFILING_DIR = config("PROFILING_DIR", default="profiles")
+
+# Fraction of requests to the hot paths profiled without a header (adjustable at runtime)
+PROFILING_SAMPLE_RATE = config("PROFILING_SAMPLE_RATE", default=0.0, cast=float)
+PROFILING_PATHS = config("PROFILING_PATHS", default="/query/,/file/parse/", cast=Csv())
+
+# Sampling interval of the statistical profiler, in seconds
+PROFILING_INTERVAL = config("PROFILING_INTERVAL", default=0.001, cast=float)
+
+# Trace allocations (tracemalloc) for profiled parse jobs by default
+PROFILING_MEMORY = config("PROFILING_MEMORY", default=False, cast=bool)
+
+# Load models in the background at startup (readiness waits for them);
+# when False they load on the first request that needs them
+WARMUP_ON_STARTUP = config("WARMUP_ON_STARTUP", default=True, cast=bool)
+
+# Production server (gunicorn.conf.py). 0 workers = one per available CPU
+SERVER_WORKERS = config("SERVER_WORKERS", default=0, cast=int)
+SERVER_MAX_WORKERS = config("SERVER_MAX_WORKERS", default=8, cast=int)
+
+# Load the app and model weights once in the master so workers share them copy-on-write
+SERVER_PRELOAD = config("SERVER_PRELOAD", default=True, cast=bool)
+
+# Seconds: idle keep-alive, silent-worker timeout, and drain time for in-flight
+# requests (long parses) on shutdown or restart
+SERVER_KEEPALIVE = config("SERVER_KEEPALIVE", default=5, cast=int)
+SERVER_TIMEOUT = config("SERVER_TIMEOUT", default=300, cast=int)
+SERVER_GRACEFUL_TIMEOUT = config("SERVER_GRACEFUL_TIMEOUT", default=120, cast=int)
+
+# Recycle each worker after this many requests (plus jitter) to bound memory growth; 0 disables
+SERVER_MAX_REQUESTS = config("SERVER_MAX_REQUESTS", default=2000, cast=int)
+SERVER_MAX_REQUESTS_JITTER = config("SERVER_MAX_REQUESTS_JITTER", default=200, cast=int)
+
+# Pending connections queued by the kernel, and request header limits
+SERVER_BACKLOG = config("SERVER_BACKLOG", default=2048, cast=int)
+SERVER_LIMIT_REQUEST_LINE = config("SERVER_LIMIT_REQUEST_LINE", default=8190, cast=int)
+SERVER_LIMIT_REQUEST_FIELDS = config("SERVER_LIMIT_REQUEST_FIELDS", default=100, cast=int)
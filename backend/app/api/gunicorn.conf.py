@@ -0,0 +1,98 @@
+"""
+Gunicorn configuration for production serving.
+
+Runs the FastAPI app in several uvicorn worker processes:
+
+    cd backend/app/api
+    gunicorn -c gunicorn.conf.py main:app
+
+With SERVER_PRELOAD the app and the model weights are loaded once in the
+master process before the workers fork, so every worker shares the same
+memory pages copy-on-write instead of holding its own copy of the model.
+On SIGTERM workers stop accepting connections and get SERVER_GRACEFUL_TIMEOUT
+seconds to finish in-flight requests such as long parses. Prometheus metrics
+run in multiprocess mode, so /metrics reports all workers together. All knobs
+are in config/settings.py.
+"""
+import gc
+import os
+from pathlib import Path
+import tempfile
+
+# Tokenizers used in the master before fork would otherwise warn and
+# silently disable their thread pool in every worker
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+from config import settings  # noqa: E402
+
+
+def _metrics_dir() -> str:
+    if not settings.METRICS_MULTIPROC_DIR:
+        return tempfile.mkdtemp(prefix="rag-metrics-")
+    directory = Path(settings.METRICS_MULTIPROC_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    # Samples of a previous run would otherwise be added to this one's
+    for stale in directory.glob("*.db"):
+        stale.unlink()
+    return str(directory)
+
+
+# Must be set before prometheus_client is imported, which happens when the app loads
+if settings.METRICS_ENABLED and "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = _metrics_dir()
+
+
+def _available_cpus() -> int:
+    try:
+        # Respects CPU affinity (taskset, container cpusets)
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', 5050)}"
+worker_class = "uvicorn.workers.UvicornWorker"
+# Model inference is CPU bound, so one worker per CPU rather than the usual 2n+1
+workers = settings.SERVER_WORKERS or max(1, min(_available_cpus(), settings.SERVER_MAX_WORKERS))
+
+preload_app = settings.SERVER_PRELOAD
+keepalive = settings.SERVER_KEEPALIVE
+timeout = settings.SERVER_TIMEOUT
+graceful_timeout = settings.SERVER_GRACEFUL_TIMEOUT
+max_requests = settings.SERVER_MAX_REQUESTS
+max_requests_jitter = settings.SERVER_MAX_REQUESTS_JITTER
+backlog = settings.SERVER_BACKLOG
+limit_request_line = settings.SERVER_LIMIT_REQUEST_LINE
+limit_request_fields = settings.SERVER_LIMIT_REQUEST_FIELDS
+
+accesslog = "-"
+errorlog = "-"
+
+
+def when_ready(server):
+    """Runs once in the master, after the app is loaded and before workers fork."""
+    from config import database
+    from main import init_db
+
+    init_db()
+    # Connections opened here must not be inherited by the workers
+    database.engine.dispose()
+
+    if preload_app:
+        from services.warmup import preload_models
+        preload_models()
+        # Move everything allocated so far out of the garbage collector's
+        # reach, so collections in the workers do not touch (and copy) the
+        # shared pages
+        gc.freeze()
+    server.log.info(f"Starting {workers} workers (preload={preload_app})")
+
+
+def child_exit(server, worker):
+    """Runs in the master when a worker exits."""
+    try:
+        from prometheus_client import multiprocess
+    except ImportError:
+        return
+    # Counters of the exited worker keep counting towards the totals; only its live samples go
+    multiprocess.mark_process_dead(worker.pid)
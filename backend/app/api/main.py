@@ -5,23 +5,54 @@ This module initializes the FastAPI application, configures middleware,
 registers API routers, and sets up error handling. It also provides the
 entry point for running the application with uvicorn.
 """
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 from fastapi import FastAPI, Depends,Request
 from fastapi.middleware.cors import CORSMiddleware
 from config import database
-from routes import test,file,user,query_router
+from config import settings
+from routes import test,file,user,query_router,metrics,profiling,health,admission,retrieval
+from services.embedding_pool import shutdown_embedding_pool
+from services.partitioning import shutdown_partition_engine
+from services.llm_gateway import close_llm_gateway
+from services.retrieval_shards import close_retrieval_client
+from services.profiling import profile_request
+from services.telemetry import configure_tracing, get_metrics, instrument_engine, span, tracing_enabled
+from services.warmup import start_warm_up
 import os
+import time
 from sqlalchemy import inspect
 from fastapi.responses import JSONResponse
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Start loading models in the background (readiness reports when they are
+    done), then stop the embedding and partitioning workers and close the LLM
+    and retrieval shard connection pools when the server shuts down.
+    """
+    warmup_task = start_warm_up() if settings.WARMUP_ON_STARTUP else None
+    yield
+    if warmup_task is not None:
+        warmup_task.cancel()
+    shutdown_embedding_pool()
+    shutdown_partition_engine()
+    await close_llm_gateway()
+    await close_retrieval_client()
+
 # Initialize FastAPI with API metadata
 app = FastAPI(
     title="Document RAG API",
     description="API for document upload and querying",
     version="0.1.0",
-    openapi_url="/api/v1/openapi.json"
+    openapi_url="/api/v1/openapi.json",
+    lifespan=lifespan
 )
 
+# Metrics and tracing are configured once per process
+configure_tracing()
+instrument_engine(database.engine)
+
 def init_db():
     """
     Initialize the database by creating all tables defined in SQLAlchemy models.
@@ -53,6 +84,27 @@ async def general_exception_handler(request: Request, exc: Exception):
         }
     )
 
+@app.middleware("http")
+async def record_request_telemetry(request: Request, call_next):
+    """
+    Record latency per route template (not per raw path, so IDs do not
+    explode the label set) and wrap the request in a root span.
+    """
+    request_metrics = get_metrics()
+    if not request_metrics.enabled and not tracing_enabled():
+        return await call_next(request)
+
+    started = time.perf_counter()
+    with span("http.request", **{"http.method": request.method, "http.target": request.url.path}):
+        response = await call_next(request)
+    route = request.scope.get("route")
+    request_metrics.http_request_seconds.labels(
+        request.method,
+        route.path if route is not None else "unmatched",
+        str(response.status_code)
+    ).observe(time.perf_counter() - started)
+    return response
+
 # Configure CORS to allow cross-origin requests
 # This is important for the frontend to communicate with the API
 app.add_middleware(CORSMiddleware,
@@ -64,9 +116,19 @@ app.add_middleware(CORSMiddleware,
 
 # Register API routers for different functionality areas
 app.include_router(test.router)
+app.include_router(health.router)
 app.include_router(file.router)
 app.include_router(user.router)
 app.include_router(query_router.router)
+app.include_router(metrics.router)
+app.include_router(admission.router)
+app.include_router(retrieval.router)
+
+# Profiling is opt-in; when disabled neither the middleware nor the admin
+# routes exist, so it costs nothing
+if settings.PROFILING_ENABLED:
+    app.middleware("http")(profile_request)
+    app.include_router(profiling.router)
 
 
 # Entry point for running the application directly
@@ -0,0 +1,25 @@
+"""
+Admission control Pydantic models.
+
+This module defines the request body used to change the admission limits
+through the admin endpoint.
+"""
+from pydantic import BaseModel, Field
+from typing import Dict, Literal, Optional
+
+class ClassLimitsUpdate(BaseModel):
+    """
+    Limits of one priority class; fields left out keep their current value.
+    """
+    rate: Optional[float] = Field(default=None, ge=0.0, description="Sustained requests per second per user (0 disables rate limiting)")
+    burst: Optional[float] = Field(default=None, ge=1.0, description="Requests a user may make at once")
+    max_active: Optional[int] = Field(default=None, ge=1, description="Slots the class may hold at the same time")
+    queue_slo: Optional[float] = Field(default=None, gt=0.0, description="Longest acceptable wait for a slot, in seconds")
+
+class AdmissionUpdate(BaseModel):
+    """
+    Runtime admission settings; fields left out keep their current value.
+    """
+    enabled: Optional[bool] = Field(default=None, description="Apply admission control at all")
+    concurrency: Optional[int] = Field(default=None, ge=1, description="Slots shared by all admitted requests")
+    classes: Dict[Literal["interactive", "parse", "batch"], ClassLimitsUpdate] = Field(default={}, description="Limits per priority class")
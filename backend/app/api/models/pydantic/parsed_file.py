@@ -9,6 +9,8 @@ class ParsedContentBase(BaseModel):
     raw_text: Optional[str] = None
     chunks: Optional[List[Dict]] = None
     vectors: Optional[List[List[float]]] = None
+    chunking: Optional[Dict] = None
+    sections: Optional[Dict] = None
 
 class ParsedContentCreate(ParsedContentBase):
     pass
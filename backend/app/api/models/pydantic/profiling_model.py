@@ -0,0 +1,15 @@
+"""
+Profiling Pydantic models.
+
+This module defines the request body used to change the runtime profiling
+flags through the admin endpoint.
+"""
+from pydantic import BaseModel, Field
+from typing import Optional
+
+class ProfilingUpdate(BaseModel):
+    """
+    Runtime profiling flags; fields left out keep their current value.
+    """
+    sample_rate: Optional[float] = Field(default=None, ge=0.0, le=1.0, description="Fraction of hot-path requests to profile")
+    memory: Optional[bool] = Field(default=None, description="Trace allocations of profiled parse jobs")
@@ -5,7 +5,7 @@ This module defines the data validation models for document query requests
 and responses, using Pydantic for runtime type checking and serialization.
 """
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
 class QueryRequest(BaseModel):
     """
@@ -16,19 +16,23 @@ class QueryRequest(BaseModel):
     """
     query: str = Field(..., description="The user's natural language query.")
     top_k: int = Field(default=5, description="Number of relevant chunks to retrieve.")
-    # Optional: Add chat history for conversational context if needed later
-    # chat_history: Optional[List[dict]] = None
+    rerank: bool = Field(default=False, description="Rescore a larger candidate set with a cross-encoder before answering.")
+    rerank_candidates: Optional[int] = Field(default=None, ge=1, description="Candidates retrieved for reranking (defaults to the server setting).")
+    rerank_budget_ms: Optional[int] = Field(default=None, ge=0, description="Latency budget for retrieval plus reranking; reranking is skipped when it would not fit.")
+    include_timings: bool = Field(default=False, description="Include per-stage timings in the response body.")
+    session: bool = Field(default=False, description="Ask as the next turn of the server-side chat session about this file (started if there is none).")
 
 class SourceChunk(BaseModel):
     """
     Model representing a retrieved document chunk used as a source for an answer.
     
-    Includes the text of the chunk and its index for reference and attribution.
+    Includes the text of the chunk and its index for reference and attribution,
+    along with its retrieval scores.
     """
     chunk_index: int = Field(..., description="Index of the chunk in the original document")
     text: str = Field(..., description="Text content of the chunk")
-    # Optional: Add similarity score if available
-    # score: Optional[float] = None
+    score: Optional[float] = Field(default=None, description="Cosine similarity between the query and the chunk")
+    rerank_score: Optional[float] = Field(default=None, description="Cross-encoder relevance score, when reranking was applied")
 
 class QueryResponse(BaseModel):
     """
@@ -40,4 +44,67 @@ class QueryResponse(BaseModel):
     answer: str = Field(..., description="The generated answer to the query")
     source_chunks: List[SourceChunk] = Field(default=[], description="Chunks of text used to generate the answer")
     file_id: int = Field(..., description="ID of the queried file")
-    query: str = Field(..., description="The original query")
\ No newline at end of file
+    query: str = Field(..., description="The original query")
+    prompt_tokens: Optional[int] = Field(default=None, description="Tokens in the prompt sent to the LLM")
+    context_tokens_saved: Optional[int] = Field(default=None, description="Tokens removed from the retrieved chunks by budgeting and de-duplication")
+    reranked: Optional[bool] = Field(default=None, description="Whether cross-encoder reranking was applied (None when not requested)")
+    session_turn: Optional[int] = Field(default=None, description="Number of this turn in the file's chat session (when session is set)")
+    timings: Optional[Dict[str, float]] = Field(default=None, description="Per-stage durations in milliseconds (when include_timings is set)")
+
+class CorpusSearchRequest(BaseModel):
+    """
+    Model for a search across all of a user's parsed files.
+    """
+    query: str = Field(..., description="The user's natural language query.")
+    top_k: int = Field(default=5, ge=1, le=100, description="Number of chunks to return.")
+    fan_out: Optional[int] = Field(default=None, ge=0, description="Files whose sections are searched (default CORPUS_DOC_FANOUT, 0 for all).")
+    section_fan_out: Optional[int] = Field(default=None, ge=0, description="Sections whose chunks are searched (default CORPUS_SECTION_FANOUT, 0 for all).")
+    include_timings: bool = Field(default=False, description="Include per-stage timings in the response body.")
+
+class CorpusChunk(SourceChunk):
+    """
+    A chunk found by a corpus search, with the file it belongs to.
+    """
+    file_id: int = Field(..., description="ID of the file the chunk belongs to")
+
+class CorpusSearchResponse(BaseModel):
+    """
+    Model for corpus search results, best first.
+    """
+    query: str = Field(..., description="The original query")
+    results: List[CorpusChunk] = Field(default=[], description="Most similar chunks across the user's files")
+    index: Optional[Dict[str, Any]] = Field(default=None, description="Codec and size of the index searched (None when nothing is parsed)")
+    scanned: Optional[Dict[str, int]] = Field(default=None, description="Files, sections and chunks scored (0 for a level that was not pruned)")
+    timings: Optional[Dict[str, float]] = Field(default=None, description="Per-stage durations in milliseconds (when include_timings is set)")
+
+class BatchQueryRequest(BaseModel):
+    """
+    Model for many questions about one document, answered in one request.
+    """
+    queries: List[str] = Field(..., min_length=1, description="Questions about the document, each answered on its own.")
+    top_k: int = Field(default=5, ge=1, le=100, description="Number of relevant chunks to retrieve per question.")
+    concurrency: Optional[int] = Field(default=None, ge=1, description="Answers generated at the same time (at most BATCH_QUERY_CONCURRENCY).")
+    include_timings: bool = Field(default=False, description="Include per-stage timings in the final line.")
+
+class BatchAnswer(BaseModel):
+    """
+    One line of a batch query response: the answer to one question, or why it failed.
+    """
+    index: int = Field(..., description="Position of the question in the request")
+    query: str = Field(..., description="The question")
+    answer: Optional[str] = Field(default=None, description="The generated answer (None when the question failed)")
+    source_chunks: List[SourceChunk] = Field(default=[], description="Chunks of text used to generate the answer")
+    prompt_tokens: Optional[int] = Field(default=None, description="Tokens in the prompt sent to the LLM")
+    status: int = Field(default=200, description="HTTP status the question would have had as a single query")
+    error: Optional[str] = Field(default=None, description="Why the question failed")
+    llm_ms: Optional[float] = Field(default=None, description="Milliseconds spent waiting for and generating the answer")
+
+class BatchSummary(BaseModel):
+    """
+    Last line of a batch query response, sent once every question has an answer or an error.
+    """
+    done: bool = Field(default=True, description="Always true; marks the end of the batch")
+    file_id: int = Field(..., description="ID of the queried file")
+    answered: int = Field(..., description="Questions answered")
+    failed: int = Field(..., description="Questions that failed")
+    timings: Optional[Dict[str, float]] = Field(default=None, description="Durations of the shared stages and of the whole batch in milliseconds (when include_timings is set)")
@@ -0,0 +1,41 @@
+"""
+Retrieval shard protocol Pydantic models.
+
+This module defines the requests and responses exchanged between the API
+and the retrieval shard processes (retrieval_service.py), and the request
+that changes the shard map at runtime.
+"""
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Literal, Optional, Tuple
+
+class ShardSearchRequest(BaseModel):
+    """
+    One shard's part of a corpus search.
+    
+    The shard map travels with every request, so a shard process knows which
+    files it owns without any state of its own.
+    """
+    user_id: int = Field(..., description="Owner of the corpus searched")
+    vector: str = Field(..., description="Query vector, base64-encoded float32")
+    top_k: int = Field(..., ge=1, description="Number of chunks to return")
+    doc_fanout: Optional[int] = Field(default=None, ge=0, description="Files whose sections are searched (shard default when unset)")
+    section_fanout: Optional[int] = Field(default=None, ge=0, description="Sections whose chunks are searched (shard default when unset)")
+    shard: str = Field(..., description="Name of the shard this request is for")
+    shards: List[str] = Field(..., min_length=1, description="Names of all shards in the map")
+    key: Literal["file", "user"] = Field(default="file", description="Whether files or whole users are placed on shards")
+    corpus: Optional[str] = Field(default=None, description="Digest of the caller's version of the user's whole corpus; while it is unchanged the shard reuses its file list")
+
+class ShardSearchResponse(BaseModel):
+    """
+    The shard's best chunks among the files it owns.
+    """
+    hits: List[Tuple[int, int, float]] = Field(default=[], description="(file_id, chunk_index, score), best first")
+    index: Optional[Dict[str, Any]] = Field(default=None, description="Description of the shard's index (None when it holds nothing of the user)")
+    scanned: Optional[Dict[str, int]] = Field(default=None, description="Files, sections and chunks scored")
+
+class ShardMapUpdate(BaseModel):
+    """
+    A new retrieval shard map; searches started afterwards use it.
+    """
+    shards: Dict[str, List[str]] = Field(..., min_length=1, description="Replica base URLs per shard name")
+    key: Optional[Literal["file", "user"]] = Field(default=None, description="Shard key (unchanged when unset)")
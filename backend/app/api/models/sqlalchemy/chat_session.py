@@ -0,0 +1,55 @@
+"""
+Chat session database model module.
+
+This module defines the SQLAlchemy ORM model for the chat_sessions table,
+which holds the conversation of each user about each file, so every API
+worker continues the same conversation.
+"""
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, JSON, LargeBinary
+from config.database import Base
+
+class ChatSessionState(Base):
+    """
+    Conversation state of one chat session (see services.chat_sessions).
+
+    Stores what a follow-up turn needs from the earlier ones: the turns kept
+    verbatim, the summary lines of compacted ones and the previous query
+    vector. The file's vectors are not stored here; each worker caches them.
+    """
+    __tablename__ = "chat_sessions"
+    __table_args__ = {
+        'schema': 'public',
+        'comment': 'Chat session conversations'
+    }
+
+    # User having the conversation
+    user_id = Column(Integer, ForeignKey("public.users.id", ondelete="CASCADE"), primary_key=True)
+
+    # File the conversation is about
+    file_id = Column(Integer, ForeignKey("public.files.id", ondelete="CASCADE"), primary_key=True)
+
+    # Parse result (row and created_at) the conversation's passages come from;
+    # a session on an older parse result starts over
+    parse_id = Column(Integer, nullable=False)
+    parsed_at = Column(DateTime(timezone=True), nullable=True)
+
+    # Turns kept verbatim ({"question", "context", "answer", "chunk_indices", "tokens"})
+    turns = Column(JSON, nullable=False)
+
+    # One-line summaries of compacted turns
+    summary = Column(JSON, nullable=False)
+
+    # Turns answered since the session started
+    turn_count = Column(Integer, nullable=False, default=0)
+
+    # Normalised query vector of the previous turn (float32 bytes)
+    last_query = Column(LargeBinary, nullable=True)
+
+    # Last turn; sessions idle for CHAT_SESSION_IDLE_SECONDS start over
+    updated_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+    # Incremented on every write, so concurrent turns in different workers
+    # cannot overwrite each other
+    revision = Column(Integer, nullable=False)
+
+    __mapper_args__ = {"version_id_col": revision}
@@ -0,0 +1,42 @@
+"""
+Content blob database model module.
+
+This module defines the SQLAlchemy ORM model for the content_blobs table.
+Uploaded bytes are stored once per distinct content (keyed by SHA-256),
+however many files reference them.
+"""
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime
+from sqlalchemy.sql import func
+from config.database import Base
+
+class ContentBlob(Base):
+    """
+    Content-addressed storage record.
+    
+    One row per distinct uploaded content. Files point at it through
+    `Files.content_hash`; `ref_count` counts those files, and the S3 object
+    and shared parse result are removed when it drops to zero.
+    """
+    __tablename__ = "content_blobs"
+    __table_args__ = {
+        'schema': 'public',
+        'comment': 'Deduplicated uploaded content'
+    }
+    
+    # Hex SHA-256 of the content (primary key)
+    sha256 = Column(String(64), primary_key=True)
+    
+    # S3 object key where the content is stored
+    s3key = Column(String(512), unique=True, nullable=False)
+    
+    # Size of the content in bytes
+    size_bytes = Column(BigInteger, nullable=False)
+    
+    # MIME type reported by the first upload
+    content_type = Column(String(100), nullable=False)
+    
+    # Number of files referencing this content
+    ref_count = Column(Integer, nullable=False, default=1)
+    
+    # Timestamp when the content was first stored
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -30,9 +30,13 @@ class Files(Base):
     # MIME type of the file (e.g., application/pdf)
     content_type = Column(String(100), nullable=False)
     
-    # S3 object key/path where the file is stored
+    # S3 object key/path where the file is stored; for deduplicated uploads
+    # this is a per-file name and the bytes live at the content blob's key
     s3key = Column(String(512), unique=True, nullable=False)
     
+    # SHA-256 of the content (None for files uploaded before deduplication)
+    content_hash = Column(String(64), ForeignKey("public.content_blobs.sha256"), nullable=True, index=True)
+    
     # References the user who owns this file
     user_id = Column(Integer, ForeignKey("public.users.id"), nullable=False)
     
@@ -26,12 +26,16 @@ class ParsedContent(Base):
         'comment': 'Processed document content for RAG'
     }
     
-    # File ID this content belongs to (primary key)
+    # File ID this content belongs to (primary key); for shared content this
+    # is the file that was parsed first
     file_id = Column(Integer, ForeignKey("public.files.id"), primary_key=True)
     
     # User who owns this content (for access control)
     user_id = Column(Integer, ForeignKey("public.users.id"), nullable=False)
     
+    # SHA-256 of the parsed content; every file with this hash shares the row
+    content_hash = Column(String(64), ForeignKey("public.content_blobs.sha256"), nullable=True, unique=True)
+    
     # Complete extracted text from the document
     raw_text = Column(String, nullable=True)
     
@@ -41,5 +45,12 @@ class ParsedContent(Base):
     # Vector embeddings for semantic search (stored as JSON array of arrays)
     vectors = Column(JSON, nullable=True)
     
+    # Chunking strategy and parameters used to produce the chunks
+    chunking = Column(JSON, nullable=True)
+    
+    # Section boundaries over the chunks ({"starts": [...], "source": ...}),
+    # used by hierarchical corpus search
+    sections = Column(JSON, nullable=True)
+    
     # Timestamp when the content was parsed
     created_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
@@ -27,8 +27,9 @@ class User(Base):
     # User's full name
     name = Column(String(255), nullable=False)
     
-    # Unique username for identification and login (also a primary key)
-    username = Column(String(255), unique=True, nullable=False, primary_key=True)
+    # Unique username for identification and login; `id` alone is the primary
+    # key because files and parsed content reference it
+    username = Column(String(255), unique=True, nullable=False)
     
     # User's email address for notifications and recovery
     email = Column(String(255), unique=True, nullable=False)
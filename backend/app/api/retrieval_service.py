@@ -0,0 +1,99 @@
+"""
+Retrieval shard server.
+
+Serves corpus search for the API tier when RETRIEVAL_SHARDS is set (see
+services/retrieval_shards.py). A shard process reads parse results from the
+same database and snapshots as the API, keeps the corpus indexes of the
+files its shard owns in memory (and saved under VECTOR_INDEX_DIR/shard_<name>/),
+and answers `POST /search` with its top-k. It holds no other state: which
+files it owns comes with each request, so any process can serve as a replica
+of any shard, and a rebalanced map takes effect on the next search. The
+file list of a user is read from the database once per version of the
+user's corpus (the digest the API sends), not on every search.
+
+Run from backend/app/api, one process per replica:
+    python retrieval_service.py --port 6001
+    python retrieval_service.py --port 6002
+and point the API at them:
+    RETRIEVAL_SHARDS="s0=http://127.0.0.1:6001;s1=http://127.0.0.1:6002"
+"""
+import argparse
+from collections import OrderedDict
+import threading
+
+from fastapi import Depends, FastAPI
+from sqlalchemy.orm import Session
+
+from config.database import get_db
+from models.pydantic.retrieval_model import ShardSearchRequest, ShardSearchResponse
+from models.sqlalchemy import content_blob  # noqa: F401  (files reference its table)
+from routes import metrics
+from services.corpus_index import CorpusVersion, corpus_version, get_user_index, indexes
+from services.retrieval_shards import ShardSpec, decode_vector
+
+# Shard versions remembered per (user, caller's corpus digest, shard)
+VERSION_CACHE_SIZE = 4096
+
+app = FastAPI(title="Document RAG retrieval shard", version="0.1.0")
+app.include_router(metrics.router)
+
+_versions = OrderedDict()
+_versions_lock = threading.Lock()
+
+
+def _shard_version(db: Session, user_id: int, corpus: str | None, shard: ShardSpec) -> CorpusVersion:
+    # The caller's digest covers all of the user's files and parse results, so
+    # the shard's subset cannot have changed while it is the same
+    if corpus is None:
+        return corpus_version(db, user_id, shard)
+    key = (user_id, corpus, shard)
+    with _versions_lock:
+        version = _versions.get(key)
+        if version is not None:
+            _versions.move_to_end(key)
+            return version
+    version = corpus_version(db, user_id, shard)
+    with _versions_lock:
+        _versions[key] = version
+        while len(_versions) > VERSION_CACHE_SIZE:
+            _versions.popitem(last=False)
+    return version
+
+
+@app.post("/search", response_model=ShardSearchResponse)
+def search(request: ShardSearchRequest, db: Session = Depends(get_db)):
+    """
+    Search the user's files owned by `request.shard`, building or loading
+    their index on first use and whenever they change.
+    """
+    shard = ShardSpec(request.shard, tuple(request.shards), request.key)
+    version = _shard_version(db, request.user_id, request.corpus, shard)
+    index = get_user_index(db, request.user_id, version)
+    if index is None:
+        return ShardSearchResponse()
+    rows, scores, scanned = index.search(decode_vector(request.vector), request.top_k,
+                                         request.doc_fanout, request.section_fanout)
+    hits = [(int(index.ids[row][0]), int(index.ids[row][1]), float(score)) for row, score in zip(rows, scores)]
+    return ShardSearchResponse(hits=hits, index=index.describe(), scanned=scanned)
+
+
+@app.get("/health")
+def health():
+    """Return 200 while the shard serves requests."""
+    return {"status": "alive"}
+
+
+@app.get("/stats")
+def stats():
+    """Report the indexes this process holds in memory."""
+    return indexes.stats()
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6001)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,64 @@
+"""
+Admission control administration routes module.
+
+This module lets operators inspect the admission controller (active and
+queued requests, decisions per priority class) and change its limits at
+runtime. Changed limits are saved to ADMISSION_LIMITS_FILE, which every API
+worker follows; the counts reported are those of the worker that answers.
+Every endpoint requires the `X-Admin-Token` header.
+"""
+import hmac
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+
+from config import settings
+from models.pydantic.admission_model import AdmissionUpdate
+from services.admission import get_admission, save_admission_limits
+
+def require_admin_token(x_admin_token: str | None = Header(default=None)):
+    """Reject requests without the configured admin token (never matches when unset)."""
+    if not x_admin_token or not settings.ADMIN_TOKEN or not hmac.compare_digest(x_admin_token, settings.ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid or missing admin token")
+
+router = APIRouter(
+    prefix="/admin/admission",
+    tags=['admission'],
+    dependencies=[Depends(require_admin_token)]
+)
+
+# Both handlers are async so they run on the event loop, which owns the
+# controller's state and its waiters' futures (a plain def would run in a thread)
+@router.get("")
+async def get_admission_state():
+    """
+    Return the admission limits and, per priority class, active and queued
+    requests and counts of admitted and rejected requests.
+    """
+    return get_admission().stats()
+
+@router.put("")
+async def update_admission(update: AdmissionUpdate):
+    """
+    Change admission limits without a restart, in every API worker.
+    
+    Args:
+        update: Settings to change
+        
+    Returns:
+        The resulting admission state of this worker
+        
+    Raises:
+        HTTPException: If runtime changes are disabled or the limits cannot be saved
+    """
+    if not settings.ADMISSION_LIMITS_FILE:
+        # The limits would only change in the worker handling this request
+        raise HTTPException(status_code=409, detail="Runtime admission changes are disabled (ADMISSION_LIMITS_FILE is not set)")
+    admission = get_admission()
+    previous = AdmissionUpdate.model_validate(admission.settings_snapshot())
+    admission.apply(update)
+    try:
+        save_admission_limits(admission)
+    except OSError as e:
+        admission.apply(previous)
+        raise HTTPException(status_code=500, detail=f"Could not save the admission limits: {e}")
+    return admission.stats()
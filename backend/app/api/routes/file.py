@@ -4,18 +4,32 @@ File handling routes module.
 This module provides API endpoints for uploading, listing, and processing files.
 It handles file uploads to S3, metadata storage in the database, and document parsing.
 """
-from fastapi import APIRouter, Depends, UploadFile, Path, HTTPException, File
+from fastapi import APIRouter, Depends, UploadFile, Path, HTTPException, File, Header, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
+from auth.dependencies import Identity, resolve_owner
 from config.database import get_db
+from routes.admission import require_admin_token
 from models.sqlalchemy.file import Files 
 from models.pydantic import file_model 
-from models.sqlalchemy.users import User
 from models.sqlalchemy.parsed_file import ParsedContent
 from models.pydantic.parsed_file import ParsedContentCreate, ParsedContentResponse 
 from datetime import datetime
-from services.s3handler import S3Handler
-from services.parse import parse_document, chunk_text 
-from langchain.embeddings import HuggingFaceEmbeddings 
+from urllib.parse import quote
+from services.storage import get_storage
+from services.content_store import (
+    store_content, find_parsed_content, find_parse_version, storage_key, release_file, dedup_stats
+)
+from services.response_cache import CachedResponse, parse_results, make_etag, etag_matches, serialize
+from services.parse import partition_document, join_elements
+from services.admission import PARSE, AdmissionRejected, get_admission, request_class, too_many_requests
+from services.chat_sessions import sessions as chat_sessions
+from services.chunking import get_chunker, section_starts
+from services.embedding_pool import embed_documents_async
+from services.profiling import memory_trace
+from services.telemetry import get_metrics
+from services.timing import StageTimer
 
 # Create router with prefix and tag for API documentation
 router = APIRouter(
@@ -23,10 +37,37 @@ router = APIRouter(
     tags=['file']
 )
 
+
+def _parse_etag(file: Files, parsed) -> str:
+    # A parse result is never modified in place, so its identity is its version
+    return make_etag(file.id, parsed.file_id, parsed.content_hash, parsed.created_at)
+
+
+def _parse_response(file: Files, parsed: ParsedContent, deduplicated: bool) -> CachedResponse:
+    body = serialize({
+        "file_id": file.id,
+        "user_id": file.user_id,
+        "raw_text": parsed.raw_text,
+        "chunks": parsed.chunks,
+        "chunking": parsed.chunking,
+        "sections": parsed.sections,
+        "parsed_at": parsed.created_at,
+        "deduplicated": deduplicated
+    })
+    return CachedResponse(etag=_parse_etag(file, parsed), body=body)
+
+
+def _send_parse_response(cached: CachedResponse) -> Response:
+    # no-cache: browsers keep the result but revalidate it with If-None-Match on every open
+    return Response(content=cached.body, media_type="application/json",
+                    headers={"ETag": cached.etag, "Cache-Control": "private, no-cache"})
+
+
 @router.post("/upload/{owner}")
 async def upload_file(
     owner: str = Path(..., description="Owner of the file"),
     file: UploadFile = File(...),
+    user: Identity = Depends(resolve_owner),
     db: Session = Depends(get_db)
 ):
     """
@@ -34,42 +75,54 @@ async def upload_file(
     
     This endpoint:
     1. Validates the file and owner
-    2. Uploads the file to S3
+    2. Hashes the content (SHA-256) and uploads it to storage unless identical
+       content is already stored
     3. Stores file metadata in the database
     
     Args:
         owner: Username of the file owner
         file: The file to upload
+        user: The owner, resolved from the bearer token or the path
         db: Database session dependency
     
     Returns:
         JSON response with file metadata
         
     Raises:
-        HTTPException: If file is missing, user not found, or upload fails
+        HTTPException: If file is missing, user not found, or upload fails,
+            and 409 if the file record collides with a concurrent upload
     """
     # Validate that file is provided
     if not file:
         raise HTTPException(status_code=400, detail="No file provided")
 
-    # Find user by username
-    user = db.query(User).filter(User.username == owner).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
-    # Upload file to S3
-    s3_handler = S3Handler()
-    s3_key = s3_handler.upload_file_to_s3(file, user.id)
-
-    # Create file metadata record in database
-    new_file = Files(
-        name=file.filename,
-        content_type=file.content_type,
-        s3key=s3_key,
-        user_id=user.id
-    )
-    db.add(new_file)
-    db.commit()
+    storage = get_storage()
+    content_key = None
+    try:
+        # Store the content once per distinct SHA-256; duplicates only add a reference
+        content_hash, size_bytes, deduplicated, content_key = store_content(db, storage, file.file,
+                                                                            file.content_type)
+
+        # Create file metadata record in database; s3key is a per-file name, the
+        # bytes live at the content's key. The reference is committed with it.
+        timestamp = datetime.now().strftime("%Y%m%d%H%M%S%f")
+        new_file = Files(
+            name=file.filename,
+            content_type=file.content_type,
+            s3key=f"user_{user.id}/{timestamp}_{content_hash[:12]}_{file.filename}",
+            user_id=user.id,
+            content_hash=content_hash
+        )
+        db.add(new_file)
+        db.commit()
+    except Exception as e:
+        # Neither the reference nor the file is kept; new content is not left in storage either
+        db.rollback()
+        if content_key is not None and not deduplicated:
+            storage.delete(content_key)
+        if isinstance(e, IntegrityError):
+            raise HTTPException(status_code=409, detail="The file conflicts with a concurrent upload; retry")
+        raise
     db.refresh(new_file)
     
     # Commented out code for immediate parsing
@@ -98,13 +151,17 @@ async def upload_file(
             "name": new_file.name,
             "user_id": new_file.user_id,
             "content_type": new_file.content_type,
-        }
+            "content_hash": content_hash,
+            "size_bytes": size_bytes,
+        },
+        "deduplicated": deduplicated
     }
 
 
 @router.get("/get-all/{owner}")
 def get_file_details(
     owner: str = Path(..., description="Owner username"),
+    user: Identity = Depends(resolve_owner),
     db: Session = Depends(get_db)
 ):
     """
@@ -115,6 +172,7 @@ def get_file_details(
     
     Args:
         owner: Username of the file owner
+        user: The owner, resolved from the bearer token or the path
         db: Database session dependency
         
     Returns:
@@ -123,11 +181,6 @@ def get_file_details(
     Raises:
         HTTPException: If user not found
     """
-    # Find user by username
-    user = db.query(User).filter(User.username == owner).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
     # Query all files for this user
     user_files = db.query(Files).filter(Files.user_id == user.id).all()
 
@@ -142,87 +195,118 @@ def get_file_details(
     return {"files": files_data}
 
 
-@router.get("/parse/{owner}/{fileid}")
-async def parse_file(
+def _byte_range(header: str | None, size: int) -> tuple[int, int] | None:
+    """
+    Parse a single-range `Range` header into [start, end), or None for the whole file.
+
+    Multiple ranges and other units are answered with the whole file, as RFC 9110 allows.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if not first:
+            # Suffix range: the last N bytes
+            start, end = max(0, size - int(last)), size
+        else:
+            start = int(first)
+            end = min(size, int(last) + 1) if last else size
+    except ValueError:
+        return None
+    if start >= end:
+        raise HTTPException(status_code=416, detail="Requested range not satisfiable",
+                            headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+
+@router.get("/download/{owner}/{fileid}")
+def download_file(
     owner: str = Path(..., description="Owner username"),
-    fileid: int = Path(..., description="ID of the file to parse"),
+    fileid: int = Path(..., description="ID of the file to download"),
+    range: str | None = Header(default=None),
+    user: Identity = Depends(resolve_owner),
     db: Session = Depends(get_db)
 ):
     """
-    Parse a specific file to extract text, generate chunks, and create embeddings.
+    Download a file's original bytes, streamed from storage.
     
-    This endpoint:
-    1. Validates file ownership
-    2. Checks if file is already parsed
-    3. If not, downloads from S3 and performs parsing
-    4. Stores parsed content in the database
+    A single byte range (`Range: bytes=start-end`) is answered with 206 and
+    only that part of the file is read from storage.
     
     Args:
         owner: Username of the file owner
-        fileid: ID of the file to parse
+        fileid: ID of the file to download
+        range: Optional Range header
+        user: The owner, resolved from the bearer token or the path
         db: Database session dependency
         
     Returns:
-        JSON response with parsed content information
+        Streaming response with the file content
         
     Raises:
-        HTTPException: If user or file not found, or parsing fails
+        HTTPException: If file not found, or 416 if the range is outside the file
     """
-    # Find user by username
-    user = db.query(User).filter(User.username == owner).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
-    # Find file by ID and verify ownership
     file_metadata = db.query(Files).filter(Files.id == fileid, Files.user_id == user.id).first()
     if not file_metadata:
         raise HTTPException(status_code=404, detail=f"File with ID {fileid} not found for user {owner}")
 
-    # Check if file is already parsed
-    existing_parse = db.query(ParsedContent).filter(ParsedContent.file_id == fileid).first()
-    if existing_parse:
-        # Return existing parsed content
-        parsed_data = db.query(ParsedContent).filter(
-            ParsedContent.file_id == fileid,
-            ParsedContent.user_id == user.id  
-        ).first()
-        return {
-        "file_id": parsed_data.file_id,
-        "user_id": parsed_data.user_id,
-        "raw_text": parsed_data.raw_text,
-        "chunks": parsed_data.chunks,
-        
-        "parsed_at": parsed_data.created_at 
-        }
+    storage = get_storage()
+    key = storage_key(db, file_metadata)
+    size = storage.size(key)
+    byte_range = _byte_range(range, size)
+    start, end = byte_range or (0, size)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Length": str(end - start),
+        "Content-Disposition": f"attachment; filename*=utf-8''{quote(file_metadata.name)}",
+    }
+    if byte_range is not None:
+        headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+    return StreamingResponse(storage.stream(key, start, end), status_code=206 if byte_range else 200,
+                             media_type=file_metadata.content_type, headers=headers)
+
+
+async def _parse_and_store(db: Session, user: Identity, file_metadata: Files):
+    """Download, partition, chunk and embed a file, store the result and send it."""
+    # Each pipeline stage below is traced and timed
+    timer = StageTimer("parse")
 
-    # File not yet parsed, download from S3
-    s3_handler = S3Handler()
+    # File not yet parsed, download it (the local backend returns a memory map)
     try:
-        file_content = s3_handler.download_file_from_s3(file_metadata.s3key)
+        with timer.stage("download"):
+            file_content = get_storage().download(storage_key(db, file_metadata))
     except HTTPException as e:
-        # Pass through HTTPExceptions from S3Handler
+        # Pass through HTTPExceptions from the storage backend
         raise e
     except Exception as e:
         # Convert other exceptions to HTTPException
-        raise HTTPException(status_code=500, detail=f"Unexpected error downloading file from S3: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Unexpected error downloading file from storage: {str(e)}")
+
+    # Chunking strategy is resolved up front so it is recorded even for empty files
+    chunker = get_chunker()
 
     # Handle empty file case
     if not file_content:
         raw_text = ""
+        elements = None
         chunks = []
         vectors = []
     else:
-        # Process the file content
+        # Process the file content (allocations are traced when the request is memory-profiled)
         try:
-            # Extract text from document
-            raw_text = await parse_document(file_content, file_metadata.content_type)
+            with memory_trace("parse"):
+                # Extract structured elements and text from document
+                with timer.stage("partition"):
+                    elements = await partition_document(file_content, file_metadata.content_type)
+                    raw_text = join_elements(elements)
             
-            # Split text into chunks
-            chunks = chunk_text(raw_text) # List[str]
+                # Split text into chunks (element-aware strategies use the elements)
+                with timer.stage("chunk"):
+                    chunks = chunker.split(raw_text, elements) # List[str]
 
-            # Generate embeddings for chunks
-            embedder = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-            vectors = embedder.embed_documents(chunks) # Returns List[List[float]]
+                # Generate embeddings for chunks off the event loop (worker pool when enabled)
+                with timer.stage("embed"):
+                    vectors = (await embed_documents_async(chunks)).tolist() # List[List[float]]
 
         except Exception as e:
             # Handle parsing errors
@@ -234,25 +318,154 @@ async def parse_file(
         user_id=user.id,
         raw_text=raw_text,
         chunks=chunks,     
-        vectors=vectors    
+        vectors=vectors,
+        chunking=chunker.describe(),
+        sections=section_starts(chunks, elements),
+        content_hash=file_metadata.content_hash
     )
     try:
-        db.add(parsed_content)
-        db.commit()
-        db.refresh(parsed_content)
+        with timer.stage("db_save"):
+            db.add(parsed_content)
+            db.commit()
+            db.refresh(parsed_content)
+    except IntegrityError:
+        db.rollback()
+        # A concurrent parse of identical content was stored first; use it
+        parsed_content = find_parsed_content(db, file_metadata)
+        if parsed_content is None:
+            raise HTTPException(status_code=500, detail="Failed to save parsed content to database")
     except Exception as e:
         db.rollback() 
         # Handle database errors
         raise HTTPException(status_code=500, detail=f"Failed to save parsed content to database: {str(e)}")
 
-    # Return parsed content information
-    return {
-        "file_id": parsed_content.file_id,
-        "user_id": parsed_content.user_id,
-        "raw_text": parsed_content.raw_text,
-        "chunks": parsed_content.chunks,
-        "parsed_at": parsed_content.created_at
-    }
+    metrics = get_metrics()
+    metrics.parse_bytes.inc(len(file_content or b""))
+    metrics.parse_chunks.inc(len(chunks))
+    metrics.parse_vectors.inc(len(vectors))
+
+    # Return parsed content information (a concurrent parse may have won the insert)
+    cached = _parse_response(file_metadata, parsed_content, parsed_content.file_id != file_metadata.id)
+    parse_results.put(file_metadata.id, cached)
+    return _send_parse_response(cached)
+
+
+
+@router.get("/parse/{owner}/{fileid}")
+async def parse_file(
+    owner: str = Path(..., description="Owner username"),
+    fileid: int = Path(..., description="ID of the file to parse"),
+    if_none_match: str | None = Header(default=None),
+    x_priority: str | None = Header(default=None),
+    user: Identity = Depends(resolve_owner),
+    db: Session = Depends(get_db)
+):
+    """
+    Parse a specific file to extract text, generate chunks, and create embeddings.
+    
+    This endpoint:
+    1. Validates file ownership
+    2. Checks if file is already parsed; if so, answers 304 when the client's
+       If-None-Match matches, or serves the (cached) result
+    3. If not, waits for admission at parse priority (`X-Priority: batch`
+       lowers it), downloads from S3 and performs parsing
+    4. Stores parsed content in the database
+    
+    Args:
+        owner: Username of the file owner
+        fileid: ID of the file to parse
+        if_none_match: ETag of a result the client already has
+        x_priority: Optional lower priority class for the request ("batch")
+        user: The owner, resolved from the bearer token or the path
+        db: Database session dependency
+        
+    Returns:
+        JSON response with parsed content information and its ETag, or an
+        empty 304 response
+        
+    Raises:
+        HTTPException: If user or file not found, or parsing fails, and 429
+            with Retry-After when admission control rejects the parse
+    """
+    # Find file by ID and verify ownership
+    file_metadata = db.query(Files).filter(Files.id == fileid, Files.user_id == user.id).first()
+    if not file_metadata:
+        raise HTTPException(status_code=404, detail=f"File with ID {fileid} not found for user {owner}")
+
+    # Check if the file, or identical content uploaded by anyone, is already
+    # parsed; only the version is read until the full result is needed
+    version = find_parse_version(db, file_metadata)
+    if version:
+        deduplicated = version.file_id != file_metadata.id
+        if deduplicated:
+            get_metrics().dedup_hits.labels("parse").inc()
+
+        etag = _parse_etag(file_metadata, version)
+        if etag_matches(if_none_match, etag):
+            get_metrics().cache_requests.labels("parse_result", "not_modified").inc()
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+
+        # Return existing parsed content, serialized once per version
+        cached = parse_results.get(file_metadata.id, etag)
+        if cached is None:
+            cached = _parse_response(file_metadata, find_parsed_content(db, file_metadata), deduplicated)
+            parse_results.put(file_metadata.id, cached)
+        return _send_parse_response(cached)
+
+    # Parsing is admitted at parse priority (or lower, see services.admission)
+    try:
+        async with get_admission().admit(str(user.id), request_class(PARSE, x_priority)):
+            return await _parse_and_store(db, user, file_metadata)
+    except AdmissionRejected as ar:
+        raise too_many_requests(ar)
+
+
+@router.delete("/{owner}/{fileid}")
+def delete_file(
+    owner: str = Path(..., description="Owner username"),
+    fileid: int = Path(..., description="ID of the file to delete"),
+    user: Identity = Depends(resolve_owner),
+    db: Session = Depends(get_db)
+):
+    """
+    Delete a file.
+    
+    The stored content and its parse result are shared by all files with the
+    same content hash, so they are only removed with the last such file.
+    
+    Args:
+        owner: Username of the file owner
+        fileid: ID of the file to delete
+        user: The owner, resolved from the bearer token or the path
+        db: Database session dependency
+        
+    Returns:
+        JSON response saying whether the stored content was removed as well
+        
+    Raises:
+        HTTPException: If user or file not found
+    """
+    file_metadata = db.query(Files).filter(Files.id == fileid, Files.user_id == user.id).first()
+    if not file_metadata:
+        raise HTTPException(status_code=404, detail=f"File with ID {fileid} not found for user {owner}")
+
+    content_deleted = release_file(db, get_storage(), file_metadata)
+    parse_results.invalidate(fileid)
+    chat_sessions.end(db, user.id, fileid)
+    return {"message": "File deleted", "file_id": fileid, "content_deleted": content_deleted}
+
+
+@router.get("/dedup/stats", dependencies=[Depends(require_admin_token)])
+def get_dedup_stats(db: Session = Depends(get_db)):
+    """
+    Report storage and parsing saved by content deduplication, across all
+    users; requires the `X-Admin-Token` header.
+    
+    Returns:
+        JSON with file and distinct-content counts, uploaded vs stored bytes
+        and how many files reuse another file's parse result
+    """
+    return dedup_stats(db)
 
 
 
@@ -0,0 +1,30 @@
+"""
+Health check routes module.
+
+Liveness says the process is serving requests; readiness additionally
+requires the models to be loaded, so traffic is only routed to warm workers.
+"""
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from services.warmup import readiness
+
+router = APIRouter(
+    prefix="/health",
+    tags=['health']
+)
+
+@router.get("/live")
+def live():
+    """Return 200 as long as the server can handle requests."""
+    return {"status": "alive"}
+
+@router.get("/ready")
+def ready():
+    """
+    Return 200 once all warmed-up components are loaded, 503 before that.
+    
+    The body lists each component's status and load time.
+    """
+    state = readiness.snapshot()
+    return JSONResponse(status_code=200 if state["ready"] else 503, content=state)
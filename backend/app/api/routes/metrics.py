@@ -0,0 +1,27 @@
+"""
+Metrics route module.
+
+This module exposes the Prometheus metrics collected by the telemetry
+service so they can be scraped. Under gunicorn the response covers all
+workers, not only the one that serves the scrape.
+"""
+from fastapi import APIRouter, HTTPException, Response
+
+from services.telemetry import get_metrics
+
+# No prefix: Prometheus scrapes /metrics by default
+router = APIRouter(tags=['metrics'])
+
+@router.get("/metrics", include_in_schema=False)
+def metrics():
+    """
+    Return all metrics in the Prometheus text exposition format.
+    
+    Raises:
+        HTTPException: If metrics are disabled or prometheus_client is not installed
+    """
+    collected = get_metrics()
+    if not collected.enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    body, content_type = collected.render()
+    return Response(content=body, media_type=content_type)
@@ -0,0 +1,64 @@
+"""
+Profiling administration routes module.
+
+This module lets operators adjust request profiling at runtime and fetch
+the stored profiles. It is only mounted when PROFILING_ENABLED is set, and
+every endpoint requires the `X-Profile-Token` header.
+"""
+import os
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Path
+from fastapi.responses import FileResponse
+
+from models.pydantic.profiling_model import ProfilingUpdate
+from services import profiling
+
+def require_profiling_token(x_profile_token: str | None = Header(default=None)):
+    """Reject requests without the configured profiling token."""
+    if not profiling.token_matches(x_profile_token):
+        raise HTTPException(status_code=403, detail="Invalid or missing profiling token")
+
+router = APIRouter(
+    prefix="/admin/profiling",
+    tags=['profiling'],
+    dependencies=[Depends(require_profiling_token)]
+)
+
+@router.get("")
+def get_profiling():
+    """
+    Return the current profiling flags and the stored profiles.
+    """
+    return {"settings": profiling.state.as_dict(), "profiles": profiling.list_profiles()}
+
+@router.put("")
+def update_profiling(update: ProfilingUpdate):
+    """
+    Change the sample rate and/or memory tracing flag without a restart.
+    
+    Args:
+        update: Flags to change
+        
+    Returns:
+        The resulting profiling flags
+    """
+    if update.sample_rate is not None:
+        profiling.state.sample_rate = update.sample_rate
+    if update.memory is not None:
+        profiling.state.memory = update.memory
+    return profiling.state.as_dict()
+
+@router.get("/{name}")
+def download_profile(name: str = Path(..., description="Profile file name")):
+    """
+    Download a stored profile or memory report.
+    
+    Raises:
+        HTTPException: If the profile does not exist
+    """
+    if name != os.path.basename(name):
+        raise HTTPException(status_code=400, detail="Invalid profile name")
+    path = os.path.join(profiling.profile_dir(), name)
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail=f"Profile {name} not found")
+    return FileResponse(path, filename=name)
@@ -5,13 +5,28 @@ Query handling routes module.
 This module provides API endpoints for querying documents using RAG (Retrieval Augmented Generation).
 It handles retrieving document content, finding relevant information, and generating answers to user queries.
 """
-from fastapi import APIRouter, Depends, HTTPException, Path, Body
+import logging
+from contextlib import AsyncExitStack
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Path, Body, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
+from auth.dependencies import Identity, resolve_owner
+from config import settings
 from config.database import get_db
-from models.sqlalchemy.users import User 
-from models.pydantic.query_model import QueryRequest, QueryResponse
-from services.rag_service import process_query 
+from models.pydantic.query_model import (BatchAnswer, BatchQueryRequest, BatchSummary, CorpusSearchRequest,
+                                         CorpusSearchResponse, QueryRequest, QueryResponse)
+from services.admission import (BATCH, INTERACTIVE, AdmissionRejected, get_admission, request_class,
+                                too_many_requests)
+from services.chat_sessions import sessions as chat_sessions
+from services.rag_service import (BatchAnswers, BatchQuestion, prepare_batch_query, process_chat_turn,
+                                  process_query, search_corpus)
+from services.retrieval_shards import RetrievalUnavailable
+from services.llm_gateway import LLMBusyError, LLMError, get_llm_gateway
+from services.timing import StageTimer
+
+logger = logging.getLogger(__name__)
 
 # Create router with prefix and tag for API documentation
 router = APIRouter(
@@ -19,11 +34,68 @@ router = APIRouter(
     tags=['query']
 )
 
+# Declared before /{owner}/{fileid}, which would otherwise match "search" as a file ID
+@router.post("/{owner}/search", response_model=CorpusSearchResponse)
+async def handle_corpus_search(
+    response: Response,
+    owner: str = Path(..., description="Username of the owner"),
+    request_body: CorpusSearchRequest = Body(...),
+    x_priority: str | None = Header(default=None),
+    user: Identity = Depends(resolve_owner),
+    db: Session = Depends(get_db)
+):
+    """
+    Finds the chunks most similar to a query across all of the owner's parsed files.
+    
+    No answer is generated. The search runs on the owner's corpus index,
+    whose codec (flat, int8 or pq) is reported in the response. Files and
+    then sections are ranked by their centroids first, and only the chunks of
+    the best `section_fan_out` sections of the best `fan_out` files are scored.
+    
+    Args:
+        response: Outgoing response, used to set the Server-Timing header
+        owner: Username of the owner
+        request_body: Query, number of chunks to return and fan-outs
+        x_priority: Optional lower priority class for the request ("parse" or "batch")
+        user: The owner, resolved from the bearer token or the path
+        db: Database session dependency
+        
+    Returns:
+        CorpusSearchResponse with the chunks, best first
+        
+    Raises:
+        HTTPException: 429 with Retry-After when admission control rejects the
+            request, 503 when a retrieval shard has no replica answering
+    """
+    timer = StageTimer("corpus_search")
+    try:
+        async with get_admission().admit(str(user.id), request_class(INTERACTIVE, x_priority)):
+            results, index, scanned = await search_corpus(db, user.id, request_body.query, request_body.top_k,
+                                                          request_body.fan_out, request_body.section_fan_out,
+                                                          timer=timer)
+    except AdmissionRejected as ar:
+        raise too_many_requests(ar)
+    except RetrievalUnavailable as ru:
+        raise HTTPException(status_code=503, detail=str(ru), headers={"Retry-After": str(int(ru.retry_after))})
+    timer.finish()
+    response.headers["Server-Timing"] = timer.server_timing()
+    return CorpusSearchResponse(
+        query=request_body.query,
+        results=results,
+        index=index,
+        scanned=scanned,
+        timings=timer.as_dict() if request_body.include_timings else None
+    )
+
+
 @router.post("/{owner}/{fileid}", response_model=QueryResponse)
 async def handle_document_query(
+    response: Response,
     owner: str = Path(..., description="Username of the file owner"),
     fileid: int = Path(..., description="ID of the file to query"),
     request_body: QueryRequest = Body(...),
+    x_priority: str | None = Header(default=None),
+    user: Identity = Depends(resolve_owner),
     db: Session = Depends(get_db)
 ):
     """
@@ -34,47 +106,226 @@ async def handle_document_query(
     2. Processes the query using the RAG service
     3. Returns the generated answer with source chunks
     
+    With `session` set the query is the next turn of the owner's chat session
+    about the file: earlier questions and answers are part of the prompt, and
+    the file's vectors and retrieved passages are reused between turns.
+    
+    Per-stage timings are always sent in the `Server-Timing` header and are
+    included in the body when `include_timings` is set.
+    
+    Queries are admitted as interactive requests (see services.admission);
+    `X-Priority: batch` runs one at batch priority instead.
+    
     Args:
+        response: Outgoing response, used to set the Server-Timing header
         owner: Username of the file owner
         fileid: ID of the file to query
         request_body: Query details including question and top_k parameter
+        x_priority: Optional lower priority class for the request ("parse" or "batch")
+        user: The owner, resolved from the bearer token or the path
         db: Database session dependency
         
     Returns:
         QueryResponse with answer and source chunks
         
     Raises:
-        HTTPException: If owner not found, file not found, or processing fails
+        HTTPException: If owner not found, file not found, or processing fails,
+            and 429 with Retry-After when admission control rejects the request
     """
-    # Find user by username
-    user = db.query(User).filter(User.username == owner).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="Owner user not found")
-    print(user.id)
-    
+    timer = StageTimer("query")
+
     try:
         # Process the query using the RAG service
         # This will retrieve relevant chunks and generate an answer
-        answer, source_chunks = await process_query(
-            db=db,
-            user_id=user.id,
-            file_id=fileid,
-            query=request_body.query,
-            top_k=request_body.top_k
-        )
+        async with get_admission().admit(str(user.id), request_class(INTERACTIVE, x_priority)):
+            answer, source_chunks, stats = await (process_chat_turn if request_body.session else process_query)(
+                db=db,
+                user_id=user.id,
+                file_id=fileid,
+                query=request_body.query,
+                top_k=request_body.top_k,
+                rerank=request_body.rerank,
+                rerank_candidates=request_body.rerank_candidates,
+                rerank_budget_ms=request_body.rerank_budget_ms,
+                timer=timer
+            )
+        timer.finish()
+        response.headers["Server-Timing"] = timer.server_timing()
 
         # Return the answer along with source information
         return QueryResponse(
             answer=answer,
             source_chunks=source_chunks,
             file_id=fileid,
-            query=request_body.query 
+            query=request_body.query,
+            prompt_tokens=stats.get("prompt_tokens"),
+            context_tokens_saved=stats.get("context_tokens_saved"),
+            reranked=stats.get("reranked"),
+            session_turn=stats.get("session_turn"),
+            timings=timer.as_dict() if request_body.include_timings else None
         )
 
     except ValueError as ve:
         # Handle validation errors (e.g., file not found, not parsed)
         raise HTTPException(status_code=404, detail=str(ve)) 
+    except AdmissionRejected as ar:
+        # Over the user's rate limit or the queue-time SLO; ask the client to retry later
+        raise too_many_requests(ar)
+    except LLMBusyError as be:
+        # The LLM gateway queue is full; ask the client to retry later
+        raise HTTPException(
+            status_code=503,
+            detail=str(be),
+            headers={"Retry-After": str(int(be.retry_after))}
+        )
     except Exception as e:
         # Log error and return generic error message
         print(f"Error processing query for file {fileid}, owner {owner}: {e}") 
-        raise HTTPException(status_code=500, detail="An internal error occurred while processing the query.")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="An internal error occurred while processing the query.")
+
+
+@router.post("/{owner}/{fileid}/batch", response_class=StreamingResponse)
+async def handle_batch_query(
+    owner: str = Path(..., description="Username of the file owner"),
+    fileid: int = Path(..., description="ID of the file to query"),
+    request_body: BatchQueryRequest = Body(...),
+    x_priority: str | None = Header(default=None),
+    user: Identity = Depends(resolve_owner),
+    db: Session = Depends(get_db)
+):
+    """
+    Answers many questions about one document in one request.
+    
+    The file's vectors are loaded once, all questions are embedded in one
+    batch and retrieved with one matrix product; the answers are then
+    generated at most `concurrency` at a time. The response is NDJSON
+    (`application/x-ndjson`): one BatchAnswer line per question, in the order
+    the answers complete, then a BatchSummary line. A question that fails
+    (e.g. the LLM is busy) gets a line with its `status` and `error` and
+    does not affect the others.
+    
+    The batch is admitted once, in the `batch` priority class, and holds its
+    admission slot until the last answer is generated.
+    
+    Args:
+        owner: Username of the file owner
+        fileid: ID of the file to query
+        request_body: Questions, top_k and concurrency
+        x_priority: Ignored unless lower than "batch" (there is no lower class)
+        user: The owner, resolved from the bearer token or the path
+        db: Database session dependency
+        
+    Returns:
+        StreamingResponse of BatchAnswer lines followed by a BatchSummary line
+        
+    Raises:
+        HTTPException: 400 if there are more than BATCH_QUERY_MAX_QUESTIONS
+            questions, 404 if the file is not parsed, and 429 with
+            Retry-After when admission control rejects the batch
+    """
+    if len(request_body.queries) > settings.BATCH_QUERY_MAX_QUESTIONS:
+        raise HTTPException(status_code=400,
+                            detail=f"At most {settings.BATCH_QUERY_MAX_QUESTIONS} questions per batch")
+    timer = StageTimer("batch_query")
+    # Entered here and left by BatchAnswers once the last answer is generated
+    admission = AsyncExitStack()
+    try:
+        try:
+            await admission.enter_async_context(get_admission().admit(str(user.id), request_class(BATCH, x_priority)))
+            questions = await prepare_batch_query(db, user.id, fileid, request_body.queries, request_body.top_k,
+                                                  timer=timer)
+        except BaseException:
+            await admission.aclose()
+            raise
+    except AdmissionRejected as ar:
+        raise too_many_requests(ar)
+    except ValueError as ve:
+        raise HTTPException(status_code=404, detail=str(ve))
+
+    concurrency = min(request_body.concurrency or settings.BATCH_QUERY_CONCURRENCY, settings.BATCH_QUERY_CONCURRENCY)
+    answers = BatchAnswers(questions, str(user.id), concurrency, on_done=admission.aclose)
+    return StreamingResponse(_stream_batch(answers, fileid, timer, request_body.include_timings),
+                             media_type="application/x-ndjson",
+                             headers={"Server-Timing": timer.server_timing()})
+
+
+def _batch_answer(question: BatchQuestion, file_id: int) -> BatchAnswer:
+    line = BatchAnswer(index=question.index, query=question.query, prompt_tokens=question.prompt_tokens,
+                       llm_ms=round(question.llm_seconds * 1000, 2))
+    error = question.error
+    if error is None:
+        line.answer = question.result.text
+        line.source_chunks = question.chunks
+    elif isinstance(error, LLMBusyError):
+        line.status, line.error = 503, str(error)
+    elif isinstance(error, LLMError):
+        line.status, line.error = 502, str(error)
+    else:
+        logger.error(f"Error answering batch question {question.index} for file {file_id}", exc_info=error)
+        line.status, line.error = 500, "An internal error occurred while processing the query."
+    return line
+
+
+async def _stream_batch(answers: BatchAnswers, file_id: int, timer: StageTimer, include_timings: bool):
+    answered = failed = 0
+    try:
+        async for question in answers:
+            line = _batch_answer(question, file_id)
+            if line.error is None:
+                answered += 1
+            else:
+                failed += 1
+            yield line.model_dump_json() + "\n"
+    finally:
+        # Only does anything when the client went away: unfinished generations nobody else waits
+        # for are cancelled, and admission is released once they stopped
+        answers.cancel()
+    # Wall time from the end of the prompts to the last answer (a timer stage cannot span the yields)
+    timer.stages["llm"] = timer.elapsed() * 1000 - sum(timer.stages.values())
+    timer.finish()
+    summary = BatchSummary(file_id=file_id, answered=answered, failed=failed,
+                           timings=timer.as_dict() if include_timings else None)
+    yield summary.model_dump_json() + "\n"
+
+
+@router.delete("/{owner}/{fileid}/session")
+def end_chat_session(
+    owner: str = Path(..., description="Username of the file owner"),
+    fileid: int = Path(..., description="ID of the file the session is about"),
+    user: Identity = Depends(resolve_owner),
+    db: Session = Depends(get_db)
+):
+    """
+    Ends the owner's chat session about a file; the next `session` query starts a new one.
+    
+    Args:
+        owner: Username of the file owner
+        fileid: ID of the file the session is about
+        user: The owner, resolved from the bearer token or the path
+        db: Database session dependency
+        
+    Returns:
+        JSON saying whether there was a session to end
+    """
+    return {"file_id": fileid, "ended": chat_sessions.end(db, user.id, fileid)}
+
+
+@router.get("/sessions/stats")
+def chat_session_stats(db: Session = Depends(get_db)):
+    """
+    Report the chat sessions: those not idle (in all workers), the idle
+    limit, and this worker's cache of file vectors and its limit.
+    """
+    return chat_sessions.stats(db)
+
+
+@router.get("/llm/stats")
+def llm_stats():
+    """
+    Report LLM gateway metrics.
+    
+    Returns:
+        JSON with request counts, queue depth, queue wait, time-to-first-token
+        and tokens-per-second summaries
+    """
+    return get_llm_gateway().stats()
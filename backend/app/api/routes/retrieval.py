@@ -0,0 +1,69 @@
+"""
+Retrieval shard administration routes module.
+
+This module reports the retrieval shard map and replica health, and changes
+the map at runtime to add, remove or move shards (see
+services/retrieval_shards.py). A changed map is saved to
+RETRIEVAL_SHARD_MAP_FILE, which every API worker follows. Every endpoint
+requires the `X-Admin-Token` header.
+"""
+from fastapi import APIRouter, Depends, HTTPException
+
+from config import settings
+from models.pydantic.retrieval_model import ShardMapUpdate
+from routes.admission import require_admin_token
+from services.retrieval_shards import get_retrieval_client, save_shard_map
+
+router = APIRouter(
+    prefix="/admin/retrieval",
+    tags=['retrieval'],
+    dependencies=[Depends(require_admin_token)]
+)
+
+def _client():
+    client = get_retrieval_client()
+    if client is None:
+        raise HTTPException(status_code=404, detail="Retrieval runs in process (RETRIEVAL_SHARDS is not set)")
+    return client
+
+@router.get("")
+def get_shard_map():
+    """
+    Return the shard key and, per shard, its replicas and whether each is healthy.
+    """
+    return _client().stats()
+
+@router.put("")
+def rebalance(update: ShardMapUpdate):
+    """
+    Replace the shard map; searches started afterwards use it, in every
+    API worker.
+    
+    Files (or users) move only between the shards that were added or
+    removed; their new shards index them on the next search.
+    
+    Args:
+        update: Replica URLs per shard name, and optionally the shard key
+        
+    Returns:
+        The new shard map
+        
+    Raises:
+        HTTPException: If retrieval is not sharded, runtime changes are
+            disabled, the map is invalid, or it cannot be saved
+    """
+    client = _client()
+    if not settings.RETRIEVAL_SHARD_MAP_FILE:
+        # The map would only change in the worker handling this request
+        raise HTTPException(status_code=409, detail="Runtime shard map changes are disabled (RETRIEVAL_SHARD_MAP_FILE is not set)")
+    previous = client.shard_map
+    try:
+        client.rebalance(update.shards, update.key)
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    try:
+        save_shard_map(client)
+    except OSError as e:
+        client.shard_map = previous
+        raise HTTPException(status_code=500, detail=f"Could not save the shard map: {e}")
+    return client.stats()
@@ -10,13 +10,12 @@ router = APIRouter(
 )
 
 @router.post("/register")
-def register(user_data: UserCreate, db: Session = Depends(get_db)):
-    return register_user(user_data, db)
+async def register(user_data: UserCreate, db: Session = Depends(get_db)):
+    return await register_user(user_data, db)
 
 @router.post("/login")
-def login(login_data: UserLogin, db: Session = Depends(get_db)):
-    print(login_data)
-    return login_user(login_data, db)
+async def login(login_data: UserLogin, db: Session = Depends(get_db)):
+    return await login_user(login_data, db)
 
 
 router.get("/logout")
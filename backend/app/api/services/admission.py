@@ -0,0 +1,392 @@
+"""
+Admission control module: per-user rate limits and priority scheduling.
+
+Parsing and answering queries compete for the same CPU cores, embedding
+workers and LLM server. Without admission control one user bulk-parsing a
+folder fills every slot, and interactive queries queue behind the batch.
+Every parse, query and search therefore passes through an
+`AdmissionController` before doing any work:
+
+1. Each request belongs to a priority class: `interactive` (queries, chat
+   turns, corpus search), `parse` or `batch`. A client may move its own
+   request down to a lower class (`X-Priority: batch`), never up.
+2. A token bucket per (user, class) limits the sustained request rate and
+   burst. A request without a token is rejected at once with the time until
+   the next token, which routes return as 429 with `Retry-After`.
+3. Admitted requests share ADMISSION_CONCURRENCY slots, and each class may
+   hold at most its `max_active` of them, so parses cannot take the slots
+   queries need. A free slot goes to the highest class with a waiter, and
+   within a class round-robin across users, so one user's backlog does not
+   delay everyone else's requests.
+4. Each class has a queue-time SLO. A request whose estimated wait (from the
+   queue ahead and the recent service time of its class) exceeds it is shed
+   at once, and one that has waited for the whole SLO gives up. Both are
+   answered with 429 and `Retry-After`.
+
+Each API worker runs its own controller, so rates and slots apply per
+worker. Limits are read from settings at startup and can be changed at
+runtime through /admin/admission, which saves them to ADMISSION_LIMITS_FILE;
+every worker applies that file the next time it admits a request after the
+file changed.
+"""
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import asdict, dataclass
+import json
+import logging
+import math
+import os
+from pathlib import Path
+import tempfile
+import time
+
+from fastapi import HTTPException
+
+from config import settings
+from models.pydantic.admission_model import AdmissionUpdate
+from services.telemetry import get_metrics
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, highest priority first
+INTERACTIVE = "interactive"
+PARSE = "parse"
+BATCH = "batch"
+PRIORITY_CLASSES = (INTERACTIVE, PARSE, BATCH)
+
+# Weight of the newest sample in a class's running mean service time
+SERVICE_TIME_SMOOTHING = 0.2
+
+# Idle buckets are refilled and dropped once there are this many
+MAX_BUCKETS = 10000
+
+
+@dataclass
+class ClassLimits:
+    """Limits of one priority class."""
+    # Sustained requests per second per user (0 disables rate limiting)
+    rate: float
+    # Requests a user may make at once before the rate applies
+    burst: float
+    # Slots the class may hold at the same time
+    max_active: int
+    # Longest acceptable wait for a slot, in seconds
+    queue_slo: float
+
+    @classmethod
+    def from_setting(cls, values) -> "ClassLimits":
+        rate, burst, max_active, queue_slo = (float(value) for value in values)
+        return cls(rate, burst, int(max_active), queue_slo)
+
+
+def default_limits() -> dict[str, ClassLimits]:
+    return {
+        INTERACTIVE: ClassLimits.from_setting(settings.ADMISSION_INTERACTIVE),
+        PARSE: ClassLimits.from_setting(settings.ADMISSION_PARSE),
+        BATCH: ClassLimits.from_setting(settings.ADMISSION_BATCH),
+    }
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is rate limited or would miss its queue-time SLO."""
+
+    def __init__(self, message: str, retry_after: float, reason: str):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+def too_many_requests(error: AdmissionRejected) -> HTTPException:
+    """The 429 response for a rejected request."""
+    return HTTPException(status_code=429, detail=str(error),
+                         headers={"Retry-After": str(max(1, math.ceil(error.retry_after)))})
+
+
+def request_class(default: str, requested: str | None) -> str:
+    """The class a request runs in: its route's class, or a lower one the client asked for."""
+    if requested not in PRIORITY_CLASSES:
+        return default
+    return max(default, requested, key=PRIORITY_CLASSES.index)
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at `rate` tokens per second up to `burst`."""
+
+    def __init__(self, burst: float, now: float):
+        self.tokens = burst
+        self.updated = now
+
+    def refill(self, limits: ClassLimits, now: float):
+        self.tokens = min(limits.burst, self.tokens + (now - self.updated) * limits.rate)
+        self.updated = now
+
+    def take(self, limits: ClassLimits, now: float) -> float:
+        """Take a token; returns 0, or the seconds until one is available."""
+        self.refill(limits, now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / limits.rate
+
+
+class AdmissionController:
+    """
+    Rate limits and prioritised, fair slot scheduling for one event loop.
+
+    Waiters are kept per class in one FIFO per user; when a slot is released
+    it goes to the oldest waiter of the next user in rotation, in the highest
+    class that has a waiter and is below its `max_active`.
+    """
+
+    def __init__(self, concurrency: int = settings.ADMISSION_CONCURRENCY,
+                 limits: dict[str, ClassLimits] | None = None,
+                 enabled: bool = settings.ADMISSION_ENABLED):
+        self.concurrency = concurrency
+        self.limits = limits or default_limits()
+        self.enabled = enabled
+        self.active = {name: 0 for name in PRIORITY_CLASSES}
+        self.service_seconds = {name: None for name in PRIORITY_CLASSES}
+        self.counts = {name: {"admitted": 0, "rate_limited": 0, "shed": 0, "timed_out": 0}
+                       for name in PRIORITY_CLASSES}
+        self._waiters = {name: OrderedDict() for name in PRIORITY_CLASSES}
+        self._buckets = {}
+
+    def queue_depth(self, name: str) -> int:
+        return sum(len(queue) for queue in self._waiters[name].values())
+
+    def _can_start(self, name: str) -> bool:
+        return (sum(self.active.values()) < self.concurrency
+                and self.active[name] < self.limits[name].max_active)
+
+    def _estimated_wait(self, name: str) -> float | None:
+        """Seconds until a new request of the class would start, from its recent service time."""
+        service = self.service_seconds[name]
+        if service is None:
+            return None
+        rank = PRIORITY_CLASSES.index(name)
+        ahead = sum(self.queue_depth(other) for other in PRIORITY_CLASSES[:rank + 1])
+        slots = max(1, min(self.concurrency, self.limits[name].max_active))
+        return (ahead + 1) * service / slots
+
+    def _reject(self, name: str, reason: str, message: str, retry_after: float):
+        self.counts[name][reason] += 1
+        get_metrics().admission_requests.labels(name, reason).inc()
+        raise AdmissionRejected(message, retry_after, reason)
+
+    def _take_token(self, user_key: str, name: str, now: float):
+        limits = self.limits[name]
+        if limits.rate <= 0:
+            return
+        if len(self._buckets) >= MAX_BUCKETS:
+            self._drop_full_buckets(now)
+        bucket = self._buckets.get((user_key, name))
+        if bucket is None:
+            bucket = self._buckets[(user_key, name)] = TokenBucket(limits.burst, now)
+        wait = bucket.take(limits, now)
+        if wait > 0:
+            self._reject(name, "rate_limited", f"Rate limit for {name} requests exceeded", wait)
+
+    def _drop_full_buckets(self, now: float):
+        # A full bucket is the same as no bucket
+        for key, bucket in list(self._buckets.items()):
+            limits = self.limits[key[1]]
+            bucket.refill(limits, now)
+            if bucket.tokens >= limits.burst:
+                del self._buckets[key]
+
+    async def _wait_for_slot(self, user_key: str, name: str, enqueued: float):
+        slo = self.limits[name].queue_slo
+        estimate = self._estimated_wait(name)
+        if estimate is not None and estimate > slo:
+            self._reject(name, "shed", f"Server busy: {name} requests would wait about {estimate:.1f}s",
+                         estimate)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[name].setdefault(user_key, deque()).append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), slo - (time.monotonic() - enqueued))
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was granted just as we gave up; hand it on
+                self._release(name)
+            else:
+                waiter.cancel()
+                self._discard(name, user_key, waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                self._reject(name, "timed_out", f"Server busy: no {name} slot within {slo:.1f}s",
+                             self._estimated_wait(name) or slo)
+            raise
+
+    def _release(self, name: str):
+        """Free a slot of class `name` and hand free slots to the best waiters."""
+        self.active[name] -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        for name in PRIORITY_CLASSES:
+            waiters = self._waiters[name]
+            while waiters and self._can_start(name):
+                user_key, queue = waiters.popitem(last=False)
+                waiter = queue.popleft()
+                if queue:
+                    # Move the user to the back of the rotation
+                    waiters[user_key] = queue
+                if not waiter.done():
+                    self.active[name] += 1
+                    waiter.set_result(None)
+
+    def _discard(self, name: str, user_key: str, waiter):
+        queue = self._waiters[name].get(user_key)
+        if queue is None:
+            return
+        try:
+            queue.remove(waiter)
+        except ValueError:
+            pass
+        if not queue:
+            del self._waiters[name][user_key]
+
+    @asynccontextmanager
+    async def admit(self, user_key: str, name: str):
+        """
+        Hold a slot of class `name` for the enclosed work.
+
+        Raises:
+            AdmissionRejected: If the user is over the class's rate limit, or
+                the request would wait (or has waited) longer than its SLO
+        """
+        if not self.enabled:
+            yield
+            return
+        enqueued = time.monotonic()
+        self._take_token(user_key, name, enqueued)
+        higher_waiting = any(self._waiters[other] for other in PRIORITY_CLASSES[:PRIORITY_CLASSES.index(name) + 1])
+        if self._can_start(name) and not higher_waiting:
+            self.active[name] += 1
+        else:
+            await self._wait_for_slot(user_key, name, enqueued)
+
+        started = time.monotonic()
+        self.counts[name]["admitted"] += 1
+        metrics = get_metrics()
+        metrics.admission_requests.labels(name, "admitted").inc()
+        metrics.admission_queue_seconds.labels(name).observe(started - enqueued)
+        try:
+            yield
+        finally:
+            service = time.monotonic() - started
+            previous = self.service_seconds[name]
+            self.service_seconds[name] = service if previous is None else (
+                SERVICE_TIME_SMOOTHING * service + (1 - SERVICE_TIME_SMOOTHING) * previous)
+            self._release(name)
+
+    def update(self, concurrency: int | None = None, enabled: bool | None = None,
+               limits: dict[str, dict] | None = None):
+        """
+        Change limits at runtime; waiting requests are dispatched under the
+        new ones. Like every method here, call it on the event loop.
+        """
+        if concurrency is not None:
+            self.concurrency = concurrency
+        if enabled is not None:
+            self.enabled = enabled
+        for name, changes in (limits or {}).items():
+            for field, value in changes.items():
+                if value is not None:
+                    setattr(self.limits[name], field, value)
+        self._dispatch()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "concurrency": self.concurrency,
+            "classes": {
+                name: {
+                    "limits": asdict(self.limits[name]),
+                    "active": self.active[name],
+                    "queued": self.queue_depth(name),
+                    "service_seconds": round(self.service_seconds[name], 4)
+                    if self.service_seconds[name] is not None else None,
+                    **self.counts[name],
+                }
+                for name in PRIORITY_CLASSES
+            },
+        }
+
+
+    def apply(self, update: AdmissionUpdate):
+        """Change the limits named in an admin update."""
+        self.update(
+            concurrency=update.concurrency,
+            enabled=update.enabled,
+            limits={name: changes.model_dump() for name, changes in update.classes.items()},
+        )
+
+    def settings_snapshot(self) -> dict:
+        """All current limits, in the form of an admin update."""
+        return {"enabled": self.enabled, "concurrency": self.concurrency,
+                "classes": {name: asdict(limits) for name, limits in self.limits.items()}}
+
+
+_controller = None
+# (mtime, size) of the limits file the controller last applied
+_limits_file_stamp = None
+
+
+def _file_stamp(path: Path) -> tuple[int, int] | None:
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _reload_limits_file(controller: AdmissionController):
+    """Apply the limits file to `controller` when it changed since it was last applied."""
+    global _limits_file_stamp
+    path = Path(settings.ADMISSION_LIMITS_FILE)
+    stamp = _file_stamp(path)
+    if stamp is None or stamp == _limits_file_stamp:
+        return
+    # Recorded even when the file is invalid, so it is reported once rather than on every request
+    _limits_file_stamp = stamp
+    try:
+        controller.apply(AdmissionUpdate.model_validate_json(path.read_bytes()))
+    except (OSError, ValueError) as e:
+        logger.error(f"Ignoring admission limits file {path}: {e}")
+        return
+    logger.info(f"Applied admission limits from {path}")
+
+
+def save_admission_limits(controller: AdmissionController):
+    """
+    Write the controller's limits to ADMISSION_LIMITS_FILE, so the other API
+    workers (and this one after a restart) apply them too.
+    """
+    global _limits_file_stamp
+    path = Path(settings.ADMISSION_LIMITS_FILE)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Written beside the file and renamed over it: workers read the old limits or the new ones
+    fd, staging = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as out:
+            json.dump(controller.settings_snapshot(), out, indent=2)
+        os.replace(staging, path)
+    except BaseException:
+        Path(staging).unlink(missing_ok=True)
+        raise
+    _limits_file_stamp = _file_stamp(path)
+
+
+def get_admission() -> AdmissionController:
+    """
+    Return the process-wide admission controller, creating it on first use.
+    It follows the limits file when there is one; call it on the event loop.
+    """
+    global _controller
+    if _controller is None:
+        _controller = AdmissionController()
+    if settings.ADMISSION_LIMITS_FILE:
+        _reload_limits_file(_controller)
+    return _controller
@@ -1,18 +1,34 @@
 from models.pydantic.users import UserCreate, UserLogin
 from auth.jwt_handler import signJWT
+from config import settings
 from models.sqlalchemy import users
 from passlib.context import CryptContext
 from fastapi import HTTPException
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# bcrypt is slow by design (hundreds of milliseconds per hash). It runs in its
+# own small pool, so a burst of logins neither blocks the event loop nor takes
+# the threads other requests run in; excess logins queue here instead.
+_hash_executor = ThreadPoolExecutor(max_workers=settings.AUTH_HASH_WORKERS, thread_name_prefix="bcrypt")
+
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
-def register_user(user_data:UserCreate, db):
+async def hash_password_async(password: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(_hash_executor, hash_password, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await asyncio.get_running_loop().run_in_executor(
+        _hash_executor, verify_password, plain_password, hashed_password
+    )
+
+async def register_user(user_data:UserCreate, db):
     # Check if user exists
     existing_user = db.query(users.User).filter(
         (users.User.username == user_data.username) | 
@@ -21,13 +37,18 @@ def register_user(user_data:UserCreate, db):
     
     if existing_user:
         raise HTTPException(status_code=400, detail="Username or email already exists")
-    
+
+    # End the read before hashing, so the connection is back in the pool
+    # while this request waits for bcrypt
+    db.rollback()
+    hashed_password = await hash_password_async(user_data.password)
+
     # Create new user
     new_user = users.User(
         name=user_data.name,
         username=user_data.username,
         email=user_data.email,
-        password=hash_password(user_data.password) 
+        password=hashed_password
     )
     
     db.add(new_user)
@@ -37,16 +58,18 @@ def register_user(user_data:UserCreate, db):
     
     return {"message": "User created successfully", "user_id": new_user.id}
 
-def login_user(login_data:UserLogin, db):
+async def login_user(login_data:UserLogin, db):
     
-    user = db.query(users.User).filter(
+    user = db.query(users.User.id, users.User.username, users.User.password).filter(
         users.User.username == login_data.username
     ).first()
+    # Release the connection before waiting for bcrypt (see register_user)
+    db.rollback()
     
-    if not user or not verify_password(login_data.password, user.password):
+    if not user or not await verify_password_async(login_data.password, user.password):
         raise HTTPException(status_code=401, detail="Invalid username or password")
     
-    token = signJWT(user.username)
+    token = signJWT(user.username, user.id)
 
     return {
         "message": "Login successful",
@@ -0,0 +1,342 @@
+"""
+Chat session module: server-side conversations about one file.
+
+A stateless query loads the parse result, decodes its vectors and builds a
+prompt from scratch, and a follow-up question knows nothing of the previous
+one. A `ChatSession` per (user, file) keeps, between turns:
+
+- the file's chunks and its normalised vector matrix, so follow-up turns
+  skip the database load and JSON decoding of the vectors
+- the query vector of the previous turn, blended into the next one
+  (CHAT_QUERY_CARRY) so short follow-ups ("and its cost?") retrieve in
+  context
+- the chunks already shown to the model; a later turn only adds passages
+  that are not in the conversation yet
+- the conversation itself, as chat messages
+
+The conversation is stored in the chat_sessions table
+(models.sqlalchemy.chat_session), so whichever API worker gets the next turn
+continues it. Only the decoded chunks and vectors are cached per worker, by
+parse result.
+
+The messages are append-only: each turn adds its new passages and question
+after the previous answer, so the prompt of turn n is a prefix of the prompt
+of turn n+1 and the LLM server can reuse its KV cache for it. When the
+turns exceed CHAT_HISTORY_TOKENS, the oldest ones are compressed into
+one-line question/answer summaries in the system message (kept within
+CHAT_SUMMARY_TOKENS) until half the budget is left or only CHAT_KEEP_TURNS
+turns remain, and their passages are forgotten. Only compaction changes the
+prefix, and compacting to half the budget keeps it rare.
+
+A session idle for CHAT_SESSION_IDLE_SECONDS starts over, as does one whose
+file was re-parsed; deleting the file deletes it. The cached vectors are
+bounded by CHAT_SESSION_CACHE_MB per worker.
+"""
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta, timezone
+import logging
+import re
+import threading
+
+import numpy as np
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
+
+from config import settings
+from models.pydantic.query_model import SourceChunk
+from models.sqlalchemy.chat_session import ChatSessionState
+from services.context_builder import count_tokens
+from services.telemetry import get_metrics
+from services.vector_store import normalize, top_indices
+
+logger = logging.getLogger(__name__)
+
+# Fixed start of every conversation; it never depends on the question
+CHAT_SYSTEM_PROMPT = (
+    "You answer questions about one document. Each question comes with CONTEXT passages from "
+    "the document; passages given earlier in the conversation still apply. Answer based ONLY on "
+    "the passages. If they do not contain the answer, state that you cannot answer based on the "
+    "provided information. Be concise."
+)
+
+CHAT_TURN_TEMPLATE = """
+CONTEXT:
+{context}
+
+QUESTION:
+{question}
+"""
+
+# Context of a turn whose passages were all shown in earlier turns
+NO_NEW_CONTEXT = "(no new passages; use the passages above)"
+
+# Characters of an answer kept in its summary line
+SUMMARY_ANSWER_CHARS = 200
+
+# Times a turn is appended again after another worker saved the session first
+RECORD_ATTEMPTS = 3
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+@dataclass
+class ChatTurn:
+    """One question and answer, with the passages first shown in it."""
+    question: str
+    context: str
+    answer: str
+    chunk_indices: list[int]
+    tokens: int
+
+    @property
+    def prompt(self) -> str:
+        return CHAT_TURN_TEMPLATE.format(context=self.context or NO_NEW_CONTEXT, question=self.question)
+
+
+def summarize_turn(turn: ChatTurn) -> str:
+    """One line standing in for a compacted turn: the question and the start of its answer."""
+    answer = " ".join(turn.answer.split())
+    first = _SENTENCE_END.split(answer, maxsplit=1)[0]
+    if len(first) > SUMMARY_ANSWER_CHARS:
+        first = first[:SUMMARY_ANSWER_CHARS].rsplit(" ", 1)[0] + "..."
+    return f"- Q: {' '.join(turn.question.split())} A: {first}"
+
+
+def _utc(value: datetime | None) -> datetime | None:
+    # SQLite returns naive datetimes; every timestamp here is UTC
+    if value is not None and value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+
+@dataclass
+class FileVectors:
+    """A parse result's chunks and normalised vector matrix, shared by its sessions in a worker."""
+    chunks: list[str]
+    vectors: np.ndarray
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.vectors.nbytes + sum(len(chunk) for chunk in self.chunks))
+
+
+@dataclass(eq=False)
+class ChatSession:
+    """Retrieval state and conversation of one user about one file."""
+    user_id: int
+    file_id: int
+    # (parse result row, created_at) the chunks and vectors were loaded from
+    version: tuple
+    chunks: list[str]
+    vectors: np.ndarray
+    turns: list[ChatTurn] = field(default_factory=list)
+    summary: list[str] = field(default_factory=list)
+    turn_count: int = 0
+    last_query: np.ndarray | None = None
+
+    @property
+    def shown(self) -> set[int]:
+        """Chunks whose passages are in the conversation (compacted turns' are forgotten)."""
+        return {index for turn in self.turns for index in turn.chunk_indices}
+
+    @property
+    def history_tokens(self) -> int:
+        return sum(turn.tokens for turn in self.turns)
+
+    def retrieve(self, query_vector, k: int) -> list[SourceChunk]:
+        """
+        Find the k chunks most similar to the query, blended with the
+        previous turn's query (CHAT_QUERY_CARRY).
+        """
+        query = normalize(query_vector)
+        self.last_query, previous = query, self.last_query
+        if previous is not None and settings.CHAT_QUERY_CARRY > 0:
+            query = normalize(query + settings.CHAT_QUERY_CARRY * previous)
+        scores = self.vectors @ query
+        return [SourceChunk(chunk_index=int(i), text=self.chunks[i], score=float(scores[i]))
+                for i in top_indices(scores, k)]
+
+    def messages(self) -> list[dict]:
+        """The conversation so far, as chat messages preceding the next question."""
+        system = CHAT_SYSTEM_PROMPT
+        if self.summary:
+            system += "\n\nEARLIER IN THIS CONVERSATION:\n" + "\n".join(self.summary)
+        messages = [{"role": "system", "content": system}]
+        for turn in self.turns:
+            messages.append({"role": "user", "content": turn.prompt})
+            messages.append({"role": "assistant", "content": turn.answer})
+        return messages
+
+    def record(self, turn: ChatTurn) -> bool:
+        """
+        Append a completed turn, compacting the oldest turns when the
+        conversation exceeds CHAT_HISTORY_TOKENS.
+
+        Returns:
+            Whether the conversation was compacted (its prefix changed)
+        """
+        self.turns.append(turn)
+        self.turn_count += 1
+        if self.history_tokens <= settings.CHAT_HISTORY_TOKENS:
+            return False
+        # Down to half the budget, so the following turns append to a stable prefix again
+        while self.history_tokens > settings.CHAT_HISTORY_TOKENS // 2 and len(self.turns) > settings.CHAT_KEEP_TURNS:
+            self.summary.append(summarize_turn(self.turns.pop(0)))
+        # Oldest summary lines go first once the summary is over budget
+        while len(self.summary) > 1 and sum(count_tokens(self.summary)) > settings.CHAT_SUMMARY_TOKENS:
+            self.summary.pop(0)
+        return True
+
+
+class VectorCache:
+    """
+    Thread-safe LRU of decoded file vectors keyed by parse version (parse
+    result row, created_at), bounded by their total size in bytes.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, version: tuple) -> FileVectors | None:
+        with self._lock:
+            entry = self._data.get(version)
+            if entry is not None:
+                self._data.move_to_end(version)
+        get_metrics().cache_requests.labels("chat_vectors", "hit" if entry else "miss").inc()
+        return entry
+
+    def put(self, version: tuple, chunks: list[str], vectors) -> FileVectors:
+        entry = FileVectors(list(chunks), normalize(vectors))
+        if entry.nbytes > self.max_bytes:
+            # Too large to keep; the turn still runs, without reuse on the next one
+            return entry
+        with self._lock:
+            self._data[version] = entry
+            self._data.move_to_end(version)
+            size = sum(e.nbytes for e in self._data.values())
+            while size > self.max_bytes and len(self._data) > 1:
+                _, evicted = self._data.popitem(last=False)
+                size -= evicted.nbytes
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"files": len(self._data), "size_bytes": sum(e.nbytes for e in self._data.values()),
+                    "max_bytes": self.max_bytes}
+
+
+class SessionStore:
+    """
+    Chat sessions keyed by (user_id, file_id), stored in the database so all
+    workers share them, plus this worker's cache of decoded file vectors.
+    Sessions idle for longer than `idle_seconds` start over.
+    """
+
+    def __init__(self, max_bytes: int, idle_seconds: float):
+        self.idle_seconds = idle_seconds
+        self.vectors = VectorCache(max_bytes)
+
+    def _cutoff(self) -> datetime:
+        return datetime.now(timezone.utc) - timedelta(seconds=self.idle_seconds)
+
+    def _row(self, db: Session, user_id: int, file_id: int) -> ChatSessionState | None:
+        # Read afresh: another worker may have saved a turn since this session last looked
+        return db.query(ChatSessionState).filter(
+            ChatSessionState.user_id == user_id, ChatSessionState.file_id == file_id
+        ).populate_existing().first()
+
+    def _live(self, row: ChatSessionState | None, version: tuple | None = None) -> bool:
+        if row is None or _utc(row.updated_at) < self._cutoff():
+            return False
+        return version is None or (row.parse_id, _utc(row.parsed_at)) == (version[0], _utc(version[1]))
+
+    def current(self, db: Session, user_id: int, file_id: int, version: tuple | None = None) -> ChatSessionState | None:
+        """The stored session, unless it went idle or (given `version`) is about another parse result."""
+        row = self._row(db, user_id, file_id)
+        return row if self._live(row, version) else None
+
+    def _restore(self, db: Session, session: ChatSession) -> ChatSessionState | None:
+        """Load the stored conversation into `session` (empty when there is none); returns the row."""
+        row = self._row(db, session.user_id, session.file_id)
+        current = self._live(row, session.version)
+        session.turns = [ChatTurn(**turn) for turn in row.turns] if current else []
+        session.summary = list(row.summary) if current else []
+        session.turn_count = row.turn_count if current else 0
+        session.last_query = (np.frombuffer(row.last_query, dtype=np.float32)
+                              if current and row.last_query is not None else None)
+        return row
+
+    def open(self, db: Session, user_id: int, file_id: int, version: tuple, vectors: FileVectors) -> ChatSession:
+        """
+        The user's session about the file: the stored conversation, or a new
+        one when there is none, it went idle or the file was re-parsed.
+        """
+        session = ChatSession(user_id, file_id, version, vectors.chunks, vectors.vectors)
+        self._restore(db, session)
+        get_metrics().cache_requests.labels("chat_session", "hit" if session.turn_count else "miss").inc()
+        return session
+
+    def record(self, db: Session, session: ChatSession, turn: ChatTurn) -> bool:
+        """
+        Append a completed turn to the stored conversation and save it.
+
+        A turn another worker saved since the session was opened is kept:
+        this one is appended after it (and `session` reloaded to include it).
+
+        Returns:
+            Whether the conversation was compacted (its prefix changed)
+        """
+        last_query = session.last_query
+        for _ in range(RECORD_ATTEMPTS):
+            row = self._restore(db, session)
+            session.last_query = last_query
+            compacted = session.record(turn)
+            started = row is None
+            if started:
+                row = ChatSessionState(user_id=session.user_id, file_id=session.file_id)
+                db.add(row)
+            row.parse_id, row.parsed_at = session.version
+            row.turns = [asdict(t) for t in session.turns]
+            row.summary = list(session.summary)
+            row.turn_count = session.turn_count
+            row.last_query = None if last_query is None else np.asarray(last_query, dtype=np.float32).tobytes()
+            row.updated_at = datetime.now(timezone.utc)
+            if started:
+                # Sessions nobody continued are removed when new ones start
+                db.query(ChatSessionState).filter(ChatSessionState.updated_at < self._cutoff()).delete(
+                    synchronize_session=False)
+            try:
+                db.commit()
+                return compacted
+            except (StaleDataError, IntegrityError):
+                # Another worker saved a turn (or started the session) first
+                db.rollback()
+        logger.warning(f"Chat turn on file {session.file_id} not saved: the session kept changing")
+        return compacted
+
+    def end(self, db: Session, user_id: int, file_id: int) -> bool:
+        """Forget a session; returns whether there was one."""
+        deleted = db.query(ChatSessionState).filter(
+            ChatSessionState.user_id == user_id, ChatSessionState.file_id == file_id
+        ).delete(synchronize_session=False)
+        db.commit()
+        return deleted > 0
+
+    def clear(self):
+        """Drop this worker's cached vectors."""
+        self.vectors.clear()
+
+    def stats(self, db: Session) -> dict:
+        active = db.query(ChatSessionState).filter(ChatSessionState.updated_at >= self._cutoff()).count()
+        return {"sessions": active, "idle_seconds": self.idle_seconds, "vectors": self.vectors.stats()}
+
+
+sessions = SessionStore(settings.CHAT_SESSION_CACHE_MB * 1024 * 1024, settings.CHAT_SESSION_IDLE_SECONDS)
@@ -0,0 +1,363 @@
+"""
+Text chunking module.
+
+This module splits extracted document text into chunks for embedding and
+retrieval. Three interchangeable strategies are provided:
+
+- token:   packs text up to a token budget measured with the embedding model's
+           own tokenizer, so no chunk is silently truncated by the embedder
+- element: follows the document structure reported by unstructured, starting a
+           new chunk at every title and packing paragraphs up to the token budget
+- fixed:   fixed-size character windows with overlap (the original behaviour)
+
+Boundary detection runs on a numpy array of code points rather than looping
+over characters in Python, which keeps chunking fast on multi-MB texts.
+"""
+from functools import lru_cache
+
+import numpy as np
+
+from config import settings
+
+# Code points treated as whitespace when looking for a place to cut
+_WHITESPACE = np.array([ord(c) for c in " \t\n\r\f\v\u00a0"], dtype=np.uint32)
+
+# Code points that end a sentence (when followed by whitespace)
+_SENTENCE_END = np.array([ord(c) for c in ".!?;:"], dtype=np.uint32)
+
+_NEWLINE = ord("\n")
+
+# unstructured element categories that open a new section
+_SECTION_CATEGORIES = {"Title", "Header"}
+
+
+@lru_cache(maxsize=4)
+def get_tokenizer(model_name: str = settings.EMBEDDING_MODEL_NAME):
+    """
+    Load (once) the fast tokenizer that belongs to the embedding model.
+
+    Args:
+        model_name: sentence-transformers model name, short or fully qualified
+
+    Returns:
+        A HuggingFace fast tokenizer instance
+    """
+    from transformers import AutoTokenizer
+
+    # Short sentence-transformers names live under the sentence-transformers org
+    repo_id = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+    return AutoTokenizer.from_pretrained(repo_id, use_fast=True)
+
+
+def _codepoints(text: str) -> np.ndarray:
+    """Return the text as a uint32 array with one code point per character."""
+    return np.frombuffer(text.encode("utf-32-le", errors="surrogatepass"), dtype=np.uint32)
+
+
+def _break_positions(text: str) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Find candidate cut positions in the text.
+
+    Returns:
+        Tuple of (sentence_breaks, word_breaks): sorted character offsets
+        right after a sentence end or line break, and right after any
+        whitespace character respectively
+    """
+    cp = _codepoints(text)
+    if cp.size < 2:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    is_space = np.isin(cp, _WHITESPACE)
+    after_sentence = np.isin(cp[:-1], _SENTENCE_END) & is_space[1:]
+    after_newline = cp[:-1] == _NEWLINE
+
+    sentence_breaks = np.flatnonzero(after_sentence | after_newline) + 1
+    word_breaks = np.flatnonzero(is_space) + 1
+    return sentence_breaks, word_breaks
+
+
+def _last_break(breaks: np.ndarray, low: int, high: int) -> int:
+    """Return the largest value of the sorted `breaks` array in (low, high], or -1."""
+    idx = int(np.searchsorted(breaks, high, side="right")) - 1
+    if idx >= 0 and breaks[idx] > low:
+        return int(breaks[idx])
+    return -1
+
+
+def _next_break(breaks: np.ndarray, low: int, high: int) -> int:
+    """Return the smallest value of the sorted `breaks` array in [low, high), or -1."""
+    idx = int(np.searchsorted(breaks, low, side="left"))
+    if idx < len(breaks) and breaks[idx] < high:
+        return int(breaks[idx])
+    return -1
+
+
+class Chunker:
+    """
+    Base class for chunking strategies.
+
+    Subclasses implement `split` and store their parameters in `self.params`,
+    which `describe` returns so the configuration can be recorded per parse.
+    """
+    name = "base"
+
+    def __init__(self, **params):
+        self.params = params
+
+    def split(self, text: str, elements: list | None = None) -> list[str]:
+        """
+        Split text into chunks.
+
+        Args:
+            text: The raw text to be chunked
+            elements: Optional unstructured elements the text was built from
+
+        Returns:
+            List of text chunks
+        """
+        raise NotImplementedError
+
+    def describe(self) -> dict:
+        """Return the strategy name and parameters as a JSON-serialisable dict."""
+        return {"strategy": self.name, **self.params}
+
+
+class FixedWindowChunker(Chunker):
+    """
+    Fixed-size character windows with overlap.
+
+    Windows are shortened to end at a sentence or word boundary when one is
+    available in the second half of the window.
+    """
+    name = "fixed"
+
+    def __init__(self, chunk_size: int = settings.CHUNK_SIZE_CHARS,
+                 chunk_overlap: int = settings.CHUNK_OVERLAP_CHARS):
+        if chunk_overlap >= chunk_size:
+            raise ValueError("chunk_overlap must be smaller than chunk_size")
+        super().__init__(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+
+    def split(self, text: str, elements: list | None = None) -> list[str]:
+        length = len(text)
+        sentence_breaks, word_breaks = _break_positions(text)
+
+        chunks = []
+        start = 0
+        while start < length:
+            end = min(start + self.chunk_size, length)
+            if end < length:
+                floor = start + self.chunk_size // 2
+                cut = _last_break(sentence_breaks, floor, end)
+                if cut < 0:
+                    cut = _last_break(word_breaks, floor, end)
+                if cut > 0:
+                    end = cut
+
+            piece = text[start:end].strip()
+            if piece:
+                chunks.append(piece)
+            if end >= length:
+                break
+
+            # Step back by the overlap, then forward to the next word start
+            next_start = max(end - self.chunk_overlap, start + 1)
+            snapped = _next_break(word_breaks, next_start, end)
+            start = snapped if snapped > 0 else next_start
+
+        return chunks
+
+
+class TokenBudgetChunker(Chunker):
+    """
+    Chunks measured in embedding-model tokens.
+
+    The whole text is tokenized once with offsets; chunk ends are then chosen
+    on the token grid, preferring sentence boundaries and falling back to word
+    boundaries, so every chunk fits the embedder's input window.
+    """
+    name = "token"
+
+    def __init__(self, max_tokens: int = settings.CHUNK_MAX_TOKENS,
+                 overlap_tokens: int = settings.CHUNK_OVERLAP_TOKENS,
+                 model_name: str = settings.EMBEDDING_MODEL_NAME):
+        if overlap_tokens >= max_tokens:
+            raise ValueError("overlap_tokens must be smaller than max_tokens")
+        super().__init__(max_tokens=max_tokens, overlap_tokens=overlap_tokens, tokenizer=model_name)
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.model_name = model_name
+
+    def split(self, text: str, elements: list | None = None) -> list[str]:
+        if not text:
+            return []
+
+        tokenizer = get_tokenizer(self.model_name)
+        encoded = tokenizer(
+            text,
+            add_special_tokens=False,
+            return_offsets_mapping=True,
+            return_attention_mask=False,
+            return_token_type_ids=False,
+            verbose=False,
+        )
+        offsets = np.asarray(encoded["offset_mapping"], dtype=np.int64).reshape(-1, 2)
+        token_count = len(offsets)
+        if token_count == 0:
+            return []
+        starts, ends = offsets[:, 0], offsets[:, 1]
+
+        # Map character boundaries onto the first token starting at or after them
+        sentence_breaks, word_breaks = _break_positions(text)
+        sentence_tokens = np.unique(np.searchsorted(starts, sentence_breaks))
+        word_tokens = np.unique(np.searchsorted(starts, word_breaks))
+
+        chunks = []
+        first = 0
+        min_fill = self.max_tokens // 2
+        while first < token_count:
+            last = min(first + self.max_tokens, token_count)
+            if last < token_count:
+                cut = _last_break(sentence_tokens, first + min_fill, last)
+                if cut < 0:
+                    cut = _last_break(word_tokens, first + min_fill, last)
+                if cut > 0:
+                    last = cut
+
+            piece = text[starts[first]:ends[last - 1]].strip()
+            if piece:
+                chunks.append(piece)
+            if last >= token_count:
+                break
+
+            next_first = max(last - self.overlap_tokens, first + 1)
+            snapped = _next_break(word_tokens, next_first, last)
+            first = snapped if snapped > 0 else next_first
+
+        return chunks
+
+
+class ElementAwareChunker(Chunker):
+    """
+    Structure-aware chunks built from unstructured elements.
+
+    A new chunk is started at every Title/Header element, and consecutive
+    elements are packed until the token budget is reached. Elements that are
+    larger than the budget on their own are split with the token strategy.
+    Without elements, each line of the text is treated as a paragraph.
+    """
+    name = "element"
+
+    def __init__(self, max_tokens: int = settings.CHUNK_MAX_TOKENS,
+                 overlap_tokens: int = settings.CHUNK_OVERLAP_TOKENS,
+                 model_name: str = settings.EMBEDDING_MODEL_NAME):
+        super().__init__(max_tokens=max_tokens, overlap_tokens=overlap_tokens, tokenizer=model_name)
+        self.max_tokens = max_tokens
+        self.fallback = TokenBudgetChunker(max_tokens, overlap_tokens, model_name)
+        self.model_name = model_name
+
+    def split(self, text: str, elements: list | None = None) -> list[str]:
+        if elements:
+            items = [(getattr(el, "category", "NarrativeText"), str(el).strip())
+                     for el in elements if el is not None]
+        else:
+            items = [("NarrativeText", line.strip()) for line in text.split("\n")]
+        items = [(category, body) for category, body in items if body]
+        if not items:
+            return []
+
+        # Count tokens for all elements in one batched tokenizer call
+        tokenizer = get_tokenizer(self.model_name)
+        encoded = tokenizer(
+            [body for _, body in items],
+            add_special_tokens=False,
+            return_attention_mask=False,
+            return_token_type_ids=False,
+            verbose=False,
+        )
+        counts = [len(ids) for ids in encoded["input_ids"]]
+
+        chunks = []
+        current = []
+        used = 0
+        for (category, body), count in zip(items, counts):
+            starts_section = category in _SECTION_CATEGORIES
+            if current and (starts_section or count > self.max_tokens or used + count > self.max_tokens):
+                chunks.append("\n".join(current))
+                current, used = [], 0
+
+            if count > self.max_tokens:
+                chunks.extend(self.fallback.split(body))
+                continue
+
+            current.append(body)
+            used += count
+
+        if current:
+            chunks.append("\n".join(current))
+        return chunks
+
+
+def section_starts(chunks: list[str], elements: list | None = None,
+                   max_chunks: int = settings.SECTION_MAX_CHUNKS) -> dict:
+    """
+    Group consecutive chunks into sections for hierarchical retrieval.
+
+    A section starts at each chunk with a line that is the text of a
+    Title/Header element (and not already in the previous chunk, which
+    overlap can repeat), and runs longer than max_chunks are split.
+
+    Args:
+        chunks: The document's chunks, in order
+        elements: Optional unstructured elements the chunks were built from
+        max_chunks: Most chunks in one section
+
+    Returns:
+        Dict with "starts", the first chunk index of each section, and
+        "source": "titles" if any section started at a title, else "windows"
+    """
+    titles = {str(el).strip() for el in elements or [] if getattr(el, "category", None) in _SECTION_CATEGORIES}
+    titles.discard("")
+    starts = [0] if chunks else []
+    titled = False
+    previous = set()
+    for index, chunk in enumerate(chunks):
+        found = {line.strip() for line in chunk.splitlines()} & titles if titles else set()
+        if index and found - previous:
+            starts.append(index)
+            titled = True
+        elif index and index - starts[-1] >= max_chunks:
+            starts.append(index)
+        previous = found
+    return {"starts": starts, "source": "titles" if titled else "windows"}
+
+
+# Registry of available strategies, keyed by the name used in settings and parse records
+CHUNKING_STRATEGIES = {
+    TokenBudgetChunker.name: TokenBudgetChunker,
+    ElementAwareChunker.name: ElementAwareChunker,
+    FixedWindowChunker.name: FixedWindowChunker,
+}
+
+
+def get_chunker(strategy: str | None = None, **params) -> Chunker:
+    """
+    Build a chunker for the given strategy.
+
+    Args:
+        strategy: Strategy name; defaults to the CHUNK_STRATEGY setting
+        **params: Strategy-specific parameters overriding the settings
+
+    Returns:
+        Configured Chunker instance
+
+    Raises:
+        ValueError: If the strategy name is unknown
+    """
+    name = strategy or settings.CHUNK_STRATEGY
+    if name not in CHUNKING_STRATEGIES:
+        raise ValueError(
+            f"Unknown chunking strategy '{name}'. Available: {', '.join(CHUNKING_STRATEGIES)}"
+        )
+    return CHUNKING_STRATEGIES[name](**params)
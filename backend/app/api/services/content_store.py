@@ -0,0 +1,225 @@
+"""
+Content-addressed storage module.
+
+Uploads are identified by the SHA-256 of their bytes, computed while
+streaming the upload. Identical content is stored once (in the storage
+backend, see services.storage) and parsed and embedded once:
+
+- `store_content` uploads new content under `content/sha256/<hash>/<generation>`,
+  or only adds a reference when the content is already stored. The reference
+  is committed by the caller together with the Files row that owns it
+- files with the same hash share one ParsedContent row (`find_parsed_content`)
+- `release_file` drops a file's reference; the stored object and the shared parse
+  result are deleted with the last file of that content
+
+Each stored copy gets a new generation in its key, so deleting the object of
+released content can never remove the object of a later upload of the same
+bytes. Content stored before generations has no suffix.
+"""
+import hashlib
+import logging
+import uuid
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models.sqlalchemy.content_blob import ContentBlob
+from models.sqlalchemy.file import Files
+from models.sqlalchemy.parsed_file import ParsedContent
+from services.storage import StorageBackend
+from services.telemetry import get_metrics
+
+logger = logging.getLogger(__name__)
+
+# Bytes read per step while hashing an upload
+HASH_READ_SIZE = 1024 * 1024
+
+
+def hash_fileobj(fileobj) -> tuple[str, int]:
+    """
+    Compute the SHA-256 of a file object in fixed-size reads.
+
+    Returns:
+        Tuple of (hex digest, size in bytes); the file is rewound afterwards
+    """
+    digest = hashlib.sha256()
+    size = 0
+    fileobj.seek(0)
+    while chunk := fileobj.read(HASH_READ_SIZE):
+        digest.update(chunk)
+        size += len(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest(), size
+
+
+def content_key(sha256: str, generation: str | None = None) -> str:
+    """Return the storage key of one stored copy of the content with this hash."""
+    return f"content/sha256/{sha256}/{generation}" if generation else f"content/sha256/{sha256}"
+
+
+def _add_reference(db: Session, sha256: str) -> bool:
+    # Atomic increment, so concurrent uploads of the same content count correctly
+    updated = db.query(ContentBlob).filter(ContentBlob.sha256 == sha256).update(
+        {ContentBlob.ref_count: ContentBlob.ref_count + 1}, synchronize_session=False
+    )
+    return updated > 0
+
+
+def store_content(db: Session, storage: StorageBackend, fileobj,
+                  content_type: str) -> tuple[str, int, bool, str]:
+    """
+    Store uploaded content once and take a reference to it.
+
+    The reference (a new ContentBlob or an incremented ref_count) is not
+    committed: the caller adds the Files row pointing at the returned hash
+    and commits both, or rolls both back and deletes the uploaded object
+    if the content was not deduplicated.
+
+    Args:
+        db: Database session
+        storage: Storage backend the content is uploaded to
+        fileobj: Binary file object with the upload
+        content_type: MIME type of the upload
+
+    Returns:
+        Tuple of (sha256, size in bytes, deduplicated, storage key), where
+        deduplicated means the content was already stored and no upload happened
+    """
+    sha256, size = hash_fileobj(fileobj)
+    key = content_key(sha256, uuid.uuid4().hex)
+    deduplicated = _add_reference(db, sha256)
+    if not deduplicated:
+        # Upload before recording the blob, so a recorded blob always has its object
+        storage.upload(fileobj, key, content_type)
+        try:
+            # A savepoint, so a lost race only undoes the blob insert and not the caller's work
+            with db.begin_nested():
+                db.add(ContentBlob(sha256=sha256, s3key=key, size_bytes=size,
+                                   content_type=content_type, ref_count=1))
+        except IntegrityError:
+            # A concurrent upload of the same content recorded it first
+            storage.delete(key)
+            _add_reference(db, sha256)
+            deduplicated = True
+    if deduplicated:
+        key = db.query(ContentBlob.s3key).filter(ContentBlob.sha256 == sha256).scalar()
+
+    if deduplicated:
+        metrics = get_metrics()
+        metrics.dedup_hits.labels("upload").inc()
+        metrics.dedup_bytes_saved.inc(size)
+        logger.info(f"Upload deduplicated: content {sha256[:12]} ({size} bytes) already stored")
+    return sha256, size, deduplicated, key
+
+
+def find_parsed_content(db: Session, file: Files) -> ParsedContent | None:
+    """
+    Return the parse result a file uses: the shared row for its content, or
+    its own row for files uploaded before deduplication.
+    """
+    return db.query(ParsedContent).filter(_parsed_content_of(file)).first()
+
+
+def find_parse_version(db: Session, file: Files):
+    """
+    Return the identity of a file's parse result without loading its text,
+    chunks or vectors: a row of (file_id, content_hash, created_at), or None.
+    """
+    return db.query(ParsedContent.file_id, ParsedContent.content_hash, ParsedContent.created_at).filter(
+        _parsed_content_of(file)
+    ).first()
+
+
+def _parsed_content_of(file: Files):
+    if file.content_hash:
+        return ParsedContent.content_hash == file.content_hash
+    return ParsedContent.file_id == file.id
+
+
+def storage_key(db: Session, file: Files) -> str:
+    """Return the storage key holding a file's bytes."""
+    if not file.content_hash:
+        return file.s3key
+    key = db.query(ContentBlob.s3key).filter(ContentBlob.sha256 == file.content_hash).scalar()
+    return key or content_key(file.content_hash)
+
+
+def release_file(db: Session, storage: StorageBackend, file: Files) -> bool:
+    """
+    Delete a file record and drop its reference to the stored content.
+
+    When no other file has the same content, the shared parse result and
+    the stored object are deleted too, whatever `ref_count` says (a
+    reference leaked by a failed upload must not keep the content forever).
+    A shared parse result recorded under the deleted file is handed over to
+    another file with the same content and gets a new `created_at`.
+
+    Returns:
+        True if the content itself was deleted
+    """
+    parsed = find_parsed_content(db, file)
+    delete_key = None
+
+    if file.content_hash:
+        db.query(ContentBlob).filter(ContentBlob.sha256 == file.content_hash).update(
+            {ContentBlob.ref_count: ContentBlob.ref_count - 1}, synchronize_session=False
+        )
+        blob = db.query(ContentBlob).filter(ContentBlob.sha256 == file.content_hash).first()
+        heir = db.query(Files).filter(Files.content_hash == file.content_hash, Files.id != file.id).first()
+        if heir is None:
+            if parsed is not None:
+                db.delete(parsed)
+            db.delete(file)
+            db.flush()
+            if blob is not None:
+                # Generation keys are never reused, so the object is only this blob's
+                delete_key = blob.s3key
+                db.delete(blob)
+        else:
+            if parsed is not None and parsed.file_id == file.id:
+                # A new created_at makes the handover look like an insert of a new parse result
+                # to snapshots and caches keyed by (parse_id, created_at)
+                parsed.file_id = heir.id
+                parsed.user_id = heir.user_id
+                parsed.created_at = func.now()
+                db.flush()
+            db.delete(file)
+    else:
+        if parsed is not None:
+            db.delete(parsed)
+        db.delete(file)
+        delete_key = file.s3key
+
+    db.commit()
+    # Deleted only after the commit, so a failed commit never loses content
+    if delete_key is not None:
+        storage.delete(delete_key)
+    return delete_key is not None
+
+
+def dedup_stats(db: Session) -> dict:
+    """
+    Report how much storage and parsing deduplication saves.
+
+    Returns:
+        Dict with file and content counts, stored vs uploaded bytes, and the
+        number of files served by another file's parse result
+    """
+    contents, stored, uploaded, files = db.query(
+        func.count(ContentBlob.sha256),
+        func.coalesce(func.sum(ContentBlob.size_bytes), 0),
+        func.coalesce(func.sum(ContentBlob.size_bytes * ContentBlob.ref_count), 0),
+        func.coalesce(func.sum(ContentBlob.ref_count), 0),
+    ).one()
+    shared_parses = db.query(func.coalesce(func.sum(ContentBlob.ref_count - 1), 0)).join(
+        ParsedContent, ParsedContent.content_hash == ContentBlob.sha256
+    ).scalar()
+    return {
+        "files": int(files),
+        "distinct_contents": int(contents),
+        "uploaded_bytes": int(uploaded),
+        "stored_bytes": int(stored),
+        "bytes_saved": int(uploaded - stored),
+        "files_sharing_a_parse": int(shared_parses),
+    }
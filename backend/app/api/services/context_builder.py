@@ -0,0 +1,199 @@
+"""
+Context assembly module.
+
+This module turns the retrieved chunks into the context block of the RAG
+prompt while keeping the prompt as short as possible:
+
+1. Chunks are packed in score order until the token budget is reached.
+2. Selected chunks that are neighbours in the document are merged, and the
+   text they share because of chunk overlap is emitted only once.
+3. Sentences that already appeared earlier in the context are dropped.
+
+Shorter prompts directly reduce LLM prefill time, so every query reports the
+resulting token counts.
+"""
+from dataclasses import dataclass, field
+import re
+
+from config import settings
+from models.pydantic.query_model import SourceChunk
+from services.chunking import get_tokenizer
+
+# Separator placed between non-adjacent context segments
+CONTEXT_SEPARATOR = "\n---\n"
+
+# Longest prefix/suffix overlap searched for when merging neighbouring chunks
+_MAX_OVERLAP_CHARS = 2000
+
+# Overlap shorter than this is treated as coincidence rather than chunk overlap
+_MIN_OVERLAP_CHARS = 8
+
+# Sentences shorter than this are never dropped as duplicates (e.g. "Yes.")
+_MIN_DEDUP_CHARS = 20
+
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@dataclass
+class ContextResult:
+    """Assembled context and the accounting behind it."""
+    text: str
+    chunks: list[SourceChunk]
+    context_tokens: int
+    candidate_tokens: int
+    dropped_chunks: int = 0
+    segments: list[str] = field(default_factory=list)
+
+
+def count_tokens(texts: list[str], tokenizer_name: str = settings.CONTEXT_TOKENIZER) -> list[int]:
+    """
+    Count tokens for several texts in one batched tokenizer call.
+
+    Args:
+        texts: Texts to measure
+        tokenizer_name: Model name whose tokenizer is used
+
+    Returns:
+        Token count per text
+    """
+    if not texts:
+        return []
+    encoded = get_tokenizer(tokenizer_name)(
+        texts,
+        add_special_tokens=False,
+        return_attention_mask=False,
+        return_token_type_ids=False,
+        verbose=False,
+    )
+    return [len(ids) for ids in encoded["input_ids"]]
+
+
+def _overlap_length(left: str, right: str) -> int:
+    """Return the length of the longest suffix of `left` that is a prefix of `right`."""
+    if not left or not right:
+        return 0
+    probe = right[:_MIN_OVERLAP_CHARS]
+    if len(probe) < _MIN_OVERLAP_CHARS:
+        return 0
+    start = max(0, len(left) - min(_MAX_OVERLAP_CHARS, len(right)))
+    position = left.find(probe, start)
+    while position != -1:
+        if right.startswith(left[position:]):
+            return len(left) - position
+        position = left.find(probe, position + 1)
+    return 0
+
+
+def _merge_run(texts: list[str]) -> str:
+    """Merge the texts of consecutive chunks, emitting overlapping text once."""
+    merged = texts[0]
+    for text in texts[1:]:
+        overlap = _overlap_length(merged, text)
+        if overlap:
+            merged += text[overlap:]
+        else:
+            merged += "\n" + text
+    return merged
+
+
+def _drop_repeated_sentences(segment: str, seen: set) -> str:
+    """Remove sentences already present in `seen`, recording new ones. Line breaks are kept."""
+    lines = []
+    for line in segment.split("\n"):
+        kept = []
+        for sentence in _SENTENCE_SPLIT.split(line):
+            sentence = sentence.strip()
+            if not sentence:
+                continue
+            key = _WHITESPACE.sub(" ", sentence).lower()
+            if len(key) >= _MIN_DEDUP_CHARS:
+                if key in seen:
+                    continue
+                seen.add(key)
+            kept.append(sentence)
+        if kept:
+            lines.append(" ".join(kept))
+    return "\n".join(lines)
+
+
+class ContextBudgeter:
+    """
+    Packs retrieved chunks into a token-bounded, de-duplicated context block.
+    """
+
+    def __init__(self, max_tokens: int = settings.LLM_CONTEXT_TOKENS,
+                 tokenizer_name: str = settings.CONTEXT_TOKENIZER,
+                 separator: str = CONTEXT_SEPARATOR):
+        self.max_tokens = max_tokens
+        self.tokenizer_name = tokenizer_name
+        self.separator = separator
+
+    def _assemble(self, chunks: list[SourceChunk]) -> list[str]:
+        """Build de-duplicated segments in document order from the selected chunks."""
+        ordered = sorted(chunks, key=lambda c: c.chunk_index)
+        runs = []
+        for chunk in ordered:
+            if runs and chunk.chunk_index == runs[-1][-1].chunk_index + 1:
+                runs[-1].append(chunk)
+            else:
+                runs.append([chunk])
+
+        seen = set()
+        segments = []
+        for run in runs:
+            segment = _drop_repeated_sentences(_merge_run([c.text for c in run]), seen)
+            if segment:
+                segments.append(segment)
+        return segments
+
+    def build(self, chunks: list[SourceChunk]) -> ContextResult:
+        """
+        Select and assemble context from retrieved chunks.
+
+        Args:
+            chunks: Retrieved chunks, most relevant first
+
+        Returns:
+            ContextResult with the context text, the chunks actually used
+            (in relevance order) and token counts
+        """
+        # Drop repeated chunk indices while keeping relevance order
+        unique = []
+        seen_indices = set()
+        for chunk in chunks:
+            if chunk.chunk_index not in seen_indices:
+                seen_indices.add(chunk.chunk_index)
+                unique.append(chunk)
+        if not unique:
+            return ContextResult(text="", chunks=[], context_tokens=0, candidate_tokens=0)
+
+        chunk_tokens = count_tokens([c.text for c in unique], self.tokenizer_name)
+        separator_tokens = count_tokens([self.separator], self.tokenizer_name)[0]
+        candidate_tokens = sum(chunk_tokens) + separator_tokens * (len(unique) - 1)
+
+        # Greedy packing by relevance; token counts of raw chunks are an upper
+        # bound because merging and de-duplication only remove text
+        selected = []
+        used = 0
+        for chunk, tokens in zip(unique, chunk_tokens):
+            cost = tokens + (separator_tokens if selected else 0)
+            if used + cost > self.max_tokens:
+                continue
+            selected.append(chunk)
+            used += cost
+
+        if not selected:
+            # Even the best chunk exceeds the budget; keep it rather than answer blind
+            selected = [unique[0]]
+
+        segments = self._assemble(selected)
+        text = self.separator.join(segments)
+        return ContextResult(
+            text=text,
+            chunks=selected,
+            context_tokens=count_tokens([text], self.tokenizer_name)[0] if text else 0,
+            candidate_tokens=candidate_tokens,
+            dropped_chunks=len(unique) - len(selected),
+            segments=segments,
+        )
@@ -0,0 +1,282 @@
+"""
+Corpus index module: one HierarchicalIndex per user over all of their parsed files.
+
+Searching a user's whole corpus with the per-file path would load and
+JSON-decode every `ParsedContent.vectors` column on each request. Instead
+the vectors are encoded once into a `HierarchicalIndex` (a chunk
+`VectorIndex` with the VECTOR_CODEC codec, corpora below
+VECTOR_QUANTIZE_MIN_VECTORS staying flat, under document and section
+centroids from `ParsedContent.sections`) and:
+
+- saved under VECTOR_INDEX_DIR/user_<id>/<version>/, so other workers and
+  restarts load it (codes into memory, float vectors memory-mapped) instead
+  of rebuilding
+- kept in an in-process LRU of VECTOR_INDEX_CACHE_SIZE users
+
+Vectors for a build are read from the corpus snapshots in SNAPSHOT_DIR when
+they hold a current copy (see services.corpus_snapshot), and from the
+database otherwise.
+
+A retrieval shard process (see services.retrieval_shards) builds the same
+index over the subset of the user's files its shard owns; the shard is part
+of the version, and its indexes are saved under VECTOR_INDEX_DIR/shard_<name>/.
+
+The version is a digest of the user's files, the parse results they use and
+the codec settings. It is read from the database on every search (without
+loading any vectors), so uploading, re-parsing or deleting a file, or
+changing the codec, leads to a rebuild on the next search.
+"""
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+import hashlib
+import logging
+import os
+from pathlib import Path
+import shutil
+import threading
+
+import numpy as np
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from config import settings
+from models.sqlalchemy.file import Files
+from models.sqlalchemy.parsed_file import ParsedContent
+from services.corpus_snapshot import get_snapshots
+from services.hierarchical_index import DocumentVectors, HierarchicalIndex
+from services.retrieval_shards import ShardSpec
+from services.telemetry import get_metrics
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CorpusVersion:
+    """The files a user's index covers and the digest identifying them."""
+    digest: str
+    # Parse result row (ParsedContent.file_id) used by each indexed file
+    parses: dict[int, int]
+    # created_at of each parse result, by parse result row
+    parsed_at: dict[int, datetime]
+    # The shard whose files are covered, or None for all of the user's files
+    shard: ShardSpec | None = None
+
+
+class IndexCache:
+    """
+    Thread-safe LRU of loaded indexes, keyed by user id (or user id and shard
+    name in a shard process), each with its version.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, digest: str) -> HierarchicalIndex | None:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] != digest:
+                return None
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, digest: str, index: HierarchicalIndex):
+        if self.capacity <= 0:
+            return
+        with self._lock:
+            self._data[key] = (digest, index)
+            self._data.move_to_end(key)
+            while len(self._data) > self.capacity:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            held = [index for _, index in self._data.values()]
+        return {"indexes": len(held), "vectors": sum(len(index) for index in held),
+                "memory_bytes": sum(index.chunks.nbytes for index in held), "capacity": self.capacity}
+
+
+class _KeyedLocks:
+    """One lock per index key, dropped once nobody holds or waits for it."""
+
+    def __init__(self):
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def hold(self, key):
+        with self._lock:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[key]
+
+
+indexes = IndexCache(settings.VECTOR_INDEX_CACHE_SIZE)
+
+# Concurrent searches of the same index wait for one build instead of building
+# it twice; builds of different users (or shards) run side by side
+_build_locks = _KeyedLocks()
+
+
+def corpus_version(db: Session, user_id: int, shard: ShardSpec | None = None) -> CorpusVersion:
+    """
+    Identify the parse results a user's files use, without loading them.
+
+    Files with identical content share one parse result; it is indexed once,
+    under the user's first such file. With `shard`, only the files the shard
+    owns are included (the first file is chosen among all of the user's
+    files, so shards never index the same parse result twice).
+    """
+    rows = db.query(Files.id, ParsedContent.file_id, ParsedContent.created_at).join(
+        ParsedContent,
+        or_(ParsedContent.content_hash == Files.content_hash,
+            and_(Files.content_hash.is_(None), ParsedContent.file_id == Files.id))
+    ).filter(Files.user_id == user_id).order_by(Files.id).all()
+
+    parses, parsed_at = {}, {}
+    digest = hashlib.blake2b(digest_size=12)
+    digest.update(f"{settings.VECTOR_CODEC}:{settings.VECTOR_PQ_SUBSPACES}:"
+                  f"{settings.VECTOR_QUANTIZE_MIN_VECTORS}:sections:{settings.SECTION_MAX_CHUNKS}".encode("utf-8"))
+    if shard is not None:
+        digest.update(f"|shard:{shard.digest}".encode("utf-8"))
+    seen = set()
+    for file_id, parse_id, created_at in rows:
+        if parse_id in seen:
+            continue
+        seen.add(parse_id)
+        if shard is not None and not shard.owns(user_id, file_id):
+            continue
+        parsed_at[parse_id] = created_at
+        parses[file_id] = parse_id
+        digest.update(f"|{file_id}:{parse_id}:{created_at}".encode("utf-8"))
+    return CorpusVersion(digest.hexdigest(), parses, parsed_at, shard)
+
+
+def _index_dir(user_id: int, digest: str | None = None, shard: ShardSpec | None = None) -> Path:
+    root = Path(settings.VECTOR_INDEX_DIR)
+    if shard is not None:
+        root = root / f"shard_{shard.name}"
+    directory = root / f"user_{user_id}"
+    return directory / digest if digest else directory
+
+
+def _on_shard(shard: ShardSpec | None) -> str:
+    return "" if shard is None else f" on shard {shard.name}"
+
+
+def _load_vectors(db: Session, version: CorpusVersion) -> list[DocumentVectors]:
+    file_of = {parse_id: file_id for file_id, parse_id in version.parses.items()}
+    documents = []
+
+    def add(parse_id: int, vectors, sections: dict | None):
+        if not len(vectors):
+            return
+        # Parse results from before sections were recorded are split into windows
+        starts = (sections or {}).get("starts") or list(range(0, len(vectors), max(1, settings.SECTION_MAX_CHUNKS)))
+        documents.append(DocumentVectors(file_of[parse_id], np.asarray(vectors, dtype=np.float32), starts))
+
+    # Parse results in a current snapshot are read from its memory map; only
+    # the rest go through the ORM and JSON decoding
+    missing = list(file_of)
+    snapshots = get_snapshots()
+    if snapshots is not None:
+        missing = []
+        for parse_id in file_of:
+            entry = snapshots.find(parse_id, version.parsed_at[parse_id])
+            if entry is None:
+                missing.append(parse_id)
+            else:
+                add(parse_id, entry.snapshot.vectors_of(entry.row), entry.snapshot.sections_of(entry.row))
+        get_metrics().cache_requests.labels("snapshot", "hit").inc(len(file_of) - len(missing))
+        get_metrics().cache_requests.labels("snapshot", "miss").inc(len(missing))
+
+    if missing:
+        query = db.query(ParsedContent.file_id, ParsedContent.vectors, ParsedContent.sections).filter(
+            ParsedContent.file_id.in_(missing)
+        ).yield_per(32)
+        for parse_id, vectors, sections in query:
+            add(parse_id, vectors or [], sections)
+    # Rows in file order, so a user's index is the same whichever source each file came from
+    return sorted(documents, key=lambda document: document.file_id)
+
+
+def _build(db: Session, user_id: int, version: CorpusVersion) -> HierarchicalIndex | None:
+    directory = _index_dir(user_id, version.digest, version.shard)
+    if (directory / "index.json").exists():
+        # Built by another worker, or before a restart
+        return HierarchicalIndex.load(directory)
+
+    documents = _load_vectors(db, version)
+    size = sum(len(document.vectors) for document in documents)
+    if not size:
+        return None
+    codec = settings.VECTOR_CODEC if size >= settings.VECTOR_QUANTIZE_MIN_VECTORS else "flat"
+    index = HierarchicalIndex.build(documents, codec=codec)
+    logger.info(f"Built {codec} index of {len(index)} vectors in {index.sections} sections of "
+                f"{index.documents} files for user {user_id}{_on_shard(version.shard)} ({index.chunks.nbytes} bytes in memory)")
+
+    # Written to a temporary directory and renamed, so readers never see a partial index
+    staging = _index_dir(user_id, f".{version.digest}.{os.getpid()}", version.shard)
+    index.save(staging)
+    try:
+        os.rename(staging, directory)
+    except OSError:
+        # Another worker saved the same version first
+        shutil.rmtree(staging, ignore_errors=True)
+    for old in _index_dir(user_id, shard=version.shard).iterdir():
+        if old.name != version.digest and not old.name.startswith("."):
+            shutil.rmtree(old, ignore_errors=True)
+    return HierarchicalIndex.load(directory)
+
+
+def get_user_index(db: Session, user_id: int, version: CorpusVersion | None = None) -> HierarchicalIndex | None:
+    """
+    Return the user's corpus index at its current version, loading or
+    building it when needed.
+
+    Returns:
+        The index, or None when the user has no parsed vectors
+    """
+    version = version or corpus_version(db, user_id)
+    if not version.parses:
+        return None
+    key = user_id if version.shard is None else (user_id, version.shard.name)
+    index = indexes.get(key, version.digest)
+    get_metrics().cache_requests.labels("vector_index", "hit" if index else "miss").inc()
+    if index is not None:
+        return index
+    with _build_locks.hold(key):
+        index = indexes.get(key, version.digest)
+        if index is None:
+            index = _build(db, user_id, version)
+            if index is not None:
+                indexes.put(key, version.digest, index)
+    return index
+
+
+def chunk_texts(db: Session, version: CorpusVersion, hits: list[tuple[int, int]]) -> dict[tuple[int, int], str]:
+    """Load the text of (file_id, chunk_index) hits, one row per file involved."""
+    wanted = {version.parses[file_id] for file_id, _ in hits}
+    chunks = dict(db.query(ParsedContent.file_id, ParsedContent.chunks).filter(
+        ParsedContent.file_id.in_(list(wanted))
+    ).all())
+    texts = {}
+    for file_id, chunk_index in hits:
+        parse_chunks = chunks.get(version.parses[file_id]) or []
+        if chunk_index < len(parse_chunks):
+            texts[(file_id, chunk_index)] = parse_chunks[chunk_index]
+    return texts
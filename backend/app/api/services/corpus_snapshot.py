@@ -0,0 +1,385 @@
+"""
+Corpus snapshot module: parse results in a columnar, memory-mappable layout.
+
+Warming caches or indexes from the database means reading every
+`ParsedContent` row through the ORM and JSON-decoding its vectors. A
+snapshot holds the same data column by column in flat files that a worker
+memory-maps in milliseconds:
+
+    <root>/<timestamp>-<scope>/
+        manifest.json       scope, time window, row counts, vector dimension
+        parse_id.npy        ParsedContent.file_id per parse result (int64)
+        user_id.npy         owner per parse result (int64)
+        created_at.npy      parse time, microseconds since the epoch (int64)
+        content_hash.npy    SHA-256 per parse result (S64, empty when none)
+        chunk_start.npy     first chunk row of each parse result, plus the total (int64)
+        vectors.f32         one float32 row per chunk, shape in the manifest
+        chunks.bin          chunk texts, UTF-8, concatenated
+        chunk_offsets.npy   byte offsets into chunks.bin, one per chunk plus the end
+        raw_text.bin        extracted text per parse result, UTF-8, concatenated
+        raw_text_offsets.npy
+        chunking.json       chunking description per parse result
+        sections.json       section boundaries per parse result (absent in older snapshots)
+
+Snapshots are full or incremental. An incremental snapshot holds the parse
+results created since the previous snapshot of the same scope. This relies on
+parse results only being added, deleted, or handed over to another file with
+the same content when their file is deleted (services.content_store.release_file).
+A handover changes the parse_id and sets a new `created_at`, so it is exported
+like a new parse result. `SnapshotSet` reads a
+whole directory of snapshots, the newest copy of each parse result winning,
+and only serves a parse result whose `created_at` matches the database, so a
+stale or deleted entry is never used.
+
+The CLI is `snapshot.py` next to `main.py`.
+"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+import json
+import logging
+import os
+from pathlib import Path
+import shutil
+import threading
+
+import numpy as np
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from config import settings
+from models.sqlalchemy.file import Files
+from models.sqlalchemy.parsed_file import ParsedContent
+
+logger = logging.getLogger(__name__)
+
+# Version of the layout written by export_snapshot
+SNAPSHOT_FORMAT = 1
+
+# Incremental snapshots start this long before the previous one ended:
+# created_at is set when a row is inserted, which can be a little before its
+# transaction commits. Rows exported twice are harmless.
+INCREMENTAL_OVERLAP = timedelta(seconds=60)
+
+# Parse results read from the database per batch while exporting
+EXPORT_BATCH_ROWS = 64
+
+
+def timestamp_us(value: datetime) -> int:
+    """Microseconds since the epoch; naive datetimes (SQLite) are taken as UTC."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(round(value.timestamp() * 1_000_000))
+
+
+def _from_us(value: int) -> datetime:
+    return datetime.fromtimestamp(value / 1_000_000, tz=timezone.utc)
+
+
+class _BlobWriter:
+    """Appends UTF-8 strings to a file and records their byte offsets."""
+
+    def __init__(self, path: Path):
+        self.file = open(path, "wb")
+        self.offsets = [0]
+
+    def write(self, text: str | None):
+        data = (text or "").encode("utf-8")
+        self.file.write(data)
+        self.offsets.append(self.offsets[-1] + len(data))
+
+    def close(self) -> np.ndarray:
+        self.file.close()
+        return np.asarray(self.offsets, dtype=np.int64)
+
+
+def list_snapshots(root: str | os.PathLike) -> list[Path]:
+    """Complete snapshot directories under root, oldest first."""
+    root = Path(root)
+    if not root.is_dir():
+        return []
+    return sorted(path for path in root.iterdir()
+                  if not path.name.startswith(".") and (path / "manifest.json").exists())
+
+
+def read_manifest(directory: str | os.PathLike) -> dict:
+    return json.loads((Path(directory) / "manifest.json").read_text())
+
+
+def _scope(user_id: int | None) -> str:
+    return "all" if user_id is None else f"user_{user_id}"
+
+
+def previous_end(root: str | os.PathLike, user_id: int | None = None) -> datetime | None:
+    """
+    End of the newest snapshot covering this scope (a user's parse results
+    are also covered by snapshots of everything), or None if there is none.
+    """
+    ends = [manifest["until"] for manifest in map(read_manifest, list_snapshots(root))
+            if manifest["scope"] in ("all", _scope(user_id))]
+    return _from_us(max(ends)) if ends else None
+
+
+def _parse_ids_of_user(db: Session, user_id: int) -> list[int]:
+    # The parse results a user's files use, including ones shared with other users
+    from services.corpus_index import corpus_version
+    return sorted(set(corpus_version(db, user_id).parses.values()))
+
+
+def export_snapshot(db: Session, root: str | os.PathLike, user_id: int | None = None,
+                    incremental: bool = False) -> Path:
+    """
+    Write the parse results of one user (or everyone) to a new snapshot.
+
+    Args:
+        db: Database session
+        root: Directory holding the snapshots
+        user_id: Export only the parse results this user's files use
+        incremental: Export only parse results created since the previous
+            snapshot of this scope (a full snapshot when there is none)
+
+    Returns:
+        Directory of the new snapshot
+    """
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    until = datetime.now(timezone.utc)
+    since = previous_end(root, user_id) if incremental else None
+    if since is not None:
+        since -= INCREMENTAL_OVERLAP
+
+    query = db.query(ParsedContent.file_id, ParsedContent.user_id, ParsedContent.created_at,
+                     ParsedContent.content_hash, ParsedContent.chunks, ParsedContent.vectors,
+                     ParsedContent.raw_text, ParsedContent.chunking, ParsedContent.sections)
+    if user_id is not None:
+        query = query.filter(ParsedContent.file_id.in_(_parse_ids_of_user(db, user_id)))
+    if since is not None:
+        query = query.filter(ParsedContent.created_at > since)
+    query = query.order_by(ParsedContent.file_id)
+
+    name = f"{until.strftime('%Y%m%dT%H%M%S%fZ')}-{_scope(user_id)}"
+    staging = root / f".{name}"
+    staging.mkdir()
+    try:
+        columns = {"parse_id": [], "user_id": [], "created_at": [], "content_hash": []}
+        chunk_start, chunking, sections = [0], [], []
+        dimension = None
+        chunks_out = _BlobWriter(staging / "chunks.bin")
+        raw_text_out = _BlobWriter(staging / "raw_text.bin")
+        with open(staging / "vectors.f32", "wb") as vectors_out:
+            for row in query.yield_per(EXPORT_BATCH_ROWS):
+                chunks, vectors = row.chunks or [], row.vectors or []
+                if len(chunks) != len(vectors):
+                    logger.warning(f"Parse result {row.file_id} has {len(chunks)} chunks but "
+                                   f"{len(vectors)} vectors; not exported")
+                    continue
+                matrix = np.asarray(vectors, dtype=np.float32)
+                if len(matrix):
+                    dimension = dimension or matrix.shape[1]
+                    if matrix.shape[1] != dimension:
+                        raise ValueError(f"Parse result {row.file_id} has {matrix.shape[1]}-dimensional "
+                                         f"vectors, others have {dimension}")
+                    vectors_out.write(matrix.tobytes())
+                for chunk in chunks:
+                    chunks_out.write(chunk)
+                raw_text_out.write(row.raw_text)
+                columns["parse_id"].append(row.file_id)
+                columns["user_id"].append(row.user_id)
+                columns["created_at"].append(timestamp_us(row.created_at))
+                columns["content_hash"].append((row.content_hash or "").encode("ascii"))
+                chunk_start.append(chunk_start[-1] + len(chunks))
+                chunking.append(row.chunking)
+                sections.append(row.sections)
+
+        np.save(staging / "chunk_offsets.npy", chunks_out.close())
+        np.save(staging / "raw_text_offsets.npy", raw_text_out.close())
+        np.save(staging / "chunk_start.npy", np.asarray(chunk_start, dtype=np.int64))
+        for column in ("parse_id", "user_id", "created_at"):
+            np.save(staging / f"{column}.npy", np.asarray(columns[column], dtype=np.int64))
+        np.save(staging / "content_hash.npy", np.asarray(columns["content_hash"], dtype="S64"))
+        (staging / "chunking.json").write_text(json.dumps(chunking))
+        (staging / "sections.json").write_text(json.dumps(sections))
+
+        manifest = {
+            "format": SNAPSHOT_FORMAT,
+            "scope": _scope(user_id),
+            "incremental": since is not None,
+            "since": timestamp_us(since) if since is not None else None,
+            "until": timestamp_us(until),
+            "parse_results": len(columns["parse_id"]),
+            "chunks": chunk_start[-1],
+            "dimension": dimension,
+        }
+        # Written last and renamed into place: a visible snapshot is complete
+        (staging / "manifest.json").write_text(json.dumps(manifest, indent=2))
+        os.rename(staging, root / name)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    logger.info(f"Snapshot {name}: {manifest['parse_results']} parse results, {manifest['chunks']} chunks")
+    return root / name
+
+
+class Snapshot:
+    """One snapshot directory, memory-mapped."""
+
+    def __init__(self, directory: str | os.PathLike):
+        self.directory = Path(directory)
+        self.manifest = read_manifest(self.directory)
+        if self.manifest["format"] != SNAPSHOT_FORMAT:
+            raise ValueError(f"Unsupported snapshot format {self.manifest['format']} in {self.directory}")
+        load = lambda name: np.load(self.directory / f"{name}.npy", mmap_mode="r")  # noqa: E731
+        self.parse_ids = np.asarray(load("parse_id"))
+        self.user_ids = load("user_id")
+        self.created_at = np.asarray(load("created_at"))
+        self.content_hashes = load("content_hash")
+        self.chunk_start = np.asarray(load("chunk_start"))
+        self.chunk_offsets = load("chunk_offsets")
+        self.raw_text_offsets = load("raw_text_offsets")
+        chunks, dimension = self.manifest["chunks"], self.manifest["dimension"]
+        self.vectors = (np.memmap(self.directory / "vectors.f32", dtype=np.float32, mode="r", shape=(chunks, dimension))
+                        if chunks and dimension else np.empty((0, dimension or 0), dtype=np.float32))
+        self._chunks = self._map("chunks.bin")
+        self._raw_text = self._map("raw_text.bin")
+        self._chunking = None
+        self._sections = None
+
+    def _map(self, name: str):
+        path = self.directory / name
+        return np.memmap(path, dtype=np.uint8, mode="r") if path.stat().st_size else np.empty(0, dtype=np.uint8)
+
+    def __len__(self) -> int:
+        return len(self.parse_ids)
+
+    def vectors_of(self, row: int) -> np.ndarray:
+        """The float32 vectors of the row-th parse result (a view into the memory map)."""
+        return self.vectors[self.chunk_start[row]:self.chunk_start[row + 1]]
+
+    def chunks_of(self, row: int) -> list[str]:
+        start, end = self.chunk_start[row], self.chunk_start[row + 1]
+        offsets = self.chunk_offsets[start:end + 1]
+        return [bytes(self._chunks[a:b]).decode("utf-8") for a, b in zip(offsets[:-1], offsets[1:])]
+
+    def raw_text_of(self, row: int) -> str:
+        return bytes(self._raw_text[self.raw_text_offsets[row]:self.raw_text_offsets[row + 1]]).decode("utf-8")
+
+    def chunking_of(self, row: int):
+        if self._chunking is None:
+            self._chunking = json.loads((self.directory / "chunking.json").read_text())
+        return self._chunking[row]
+
+    def sections_of(self, row: int) -> dict | None:
+        if self._sections is None:
+            path = self.directory / "sections.json"
+            self._sections = json.loads(path.read_text()) if path.exists() else [None] * len(self)
+        return self._sections[row]
+
+
+@dataclass(frozen=True)
+class SnapshotEntry:
+    """Where the newest copy of a parse result lives."""
+    snapshot: Snapshot
+    row: int
+    created_at: int
+
+
+class SnapshotSet:
+    """
+    All snapshots in a directory; for each parse result the newest copy wins.
+
+    Lookups take the parse result's `created_at` from the database and miss
+    when it differs, so deleted or re-created parse results are never served
+    from a snapshot.
+    """
+
+    def __init__(self, root: str | os.PathLike):
+        self.root = Path(root)
+        self.snapshots = [Snapshot(path) for path in list_snapshots(self.root)]
+        self.names = tuple(snapshot.directory.name for snapshot in self.snapshots)
+        self._entries = {}
+        for snapshot in self.snapshots:
+            for row, (parse_id, created_at) in enumerate(zip(snapshot.parse_ids.tolist(), snapshot.created_at.tolist())):
+                current = self._entries.get(parse_id)
+                if current is None or created_at >= current.created_at:
+                    self._entries[parse_id] = SnapshotEntry(snapshot, row, created_at)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(self._entries.items())
+
+    def find(self, parse_id: int, created_at: datetime) -> SnapshotEntry | None:
+        entry = self._entries.get(parse_id)
+        if entry is None or entry.created_at != timestamp_us(created_at):
+            return None
+        return entry
+
+    def vectors(self, parse_id: int, created_at: datetime) -> np.ndarray | None:
+        """The parse result's vectors if the snapshot copy is current, else None."""
+        entry = self.find(parse_id, created_at)
+        return None if entry is None else entry.snapshot.vectors_of(entry.row)
+
+
+_snapshots = None
+_snapshots_lock = threading.Lock()
+
+
+def get_snapshots() -> SnapshotSet | None:
+    """
+    The snapshots in SNAPSHOT_DIR, or None when there are none. Reopened
+    when snapshots are added or removed.
+    """
+    global _snapshots
+    if not settings.SNAPSHOT_DIR:
+        return None
+    names = tuple(path.name for path in list_snapshots(settings.SNAPSHOT_DIR))
+    with _snapshots_lock:
+        if not names:
+            _snapshots = None
+        elif _snapshots is None or _snapshots.names != names or _snapshots.root != Path(settings.SNAPSHOT_DIR):
+            _snapshots = SnapshotSet(settings.SNAPSHOT_DIR)
+            logger.info(f"Opened {len(names)} snapshots with {len(_snapshots)} parse results")
+        return _snapshots
+
+
+def import_snapshots(db: Session, snapshots: SnapshotSet, user_id: int | None = None) -> dict:
+    """
+    Restore parse results from snapshots into the database.
+
+    A parse result is restored when its file still exists and neither the
+    file nor its content has a parse result yet; existing rows are never
+    overwritten.
+
+    Returns:
+        Counts of restored and skipped parse results
+    """
+    restored = skipped = 0
+    for parse_id, entry in snapshots:
+        snapshot, row = entry.snapshot, entry.row
+        if user_id is not None and int(snapshot.user_ids[row]) != user_id:
+            continue
+        content_hash = snapshot.content_hashes[row].decode("ascii") or None
+        conditions = [ParsedContent.file_id == parse_id]
+        if content_hash:
+            conditions.append(ParsedContent.content_hash == content_hash)
+        exists = db.query(ParsedContent.file_id).filter(or_(*conditions)).first()
+        file = db.query(Files.id, Files.content_hash).filter(Files.id == parse_id).first()
+        if exists or file is None or file.content_hash != content_hash:
+            skipped += 1
+            continue
+        db.add(ParsedContent(
+            file_id=parse_id,
+            user_id=int(snapshot.user_ids[row]),
+            content_hash=content_hash,
+            raw_text=snapshot.raw_text_of(row),
+            chunks=snapshot.chunks_of(row),
+            vectors=np.asarray(snapshot.vectors_of(row)).tolist(),
+            chunking=snapshot.chunking_of(row),
+            sections=snapshot.sections_of(row),
+            created_at=_from_us(entry.created_at),
+        ))
+        restored += 1
+        if restored % EXPORT_BATCH_ROWS == 0:
+            db.commit()
+    db.commit()
+    return {"restored": restored, "skipped": skipped}
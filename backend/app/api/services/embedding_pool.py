@@ -0,0 +1,429 @@
+"""
+Embedding worker pool module.
+
+This module runs embedding in dedicated worker processes so that large
+documents use every core and do not compete with the API event loop.
+
+- Each worker process loads one copy of the configured embedding backend.
+- Documents are sharded into fixed-size chunk batches; each batch is one task.
+- Workers write float32 results into a shared-memory buffer that the parent
+  copies out directly, so vectors are never pickled as lists of floats.
+- Pending tasks are dispatched in priority order: query embeddings are always
+  handed to the next free worker ahead of queued ingestion batches.
+- A worker that dies is restarted with exponential backoff. One that keeps
+  dying before it is ready is given up after EMBEDDING_WORKER_RESTARTS
+  attempts, and pending work fails instead of waiting while no worker is
+  ready. Callers also stop waiting after EMBEDDING_QUERY_TIMEOUT or
+  EMBEDDING_DOCUMENT_TIMEOUT.
+
+The pool is enabled by setting EMBEDDING_WORKERS > 0. Without it, embedding
+runs in a thread of the API process using the shared backend.
+"""
+import asyncio
+from collections import deque
+from concurrent.futures import Future
+import heapq
+import itertools
+import logging
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from config import settings
+from services.embeddings import get_embedder
+from services.telemetry import get_metrics
+
+logger = logging.getLogger(__name__)
+
+# Dispatch priorities (lower runs first)
+PRIORITY_QUERY = 0
+PRIORITY_INGEST = 1
+
+# Seconds before restarting a dead worker, doubled per consecutive failure up to the maximum
+RESTART_BACKOFF = 1.0
+MAX_RESTART_BACKOFF = 60.0
+
+
+def _worker_main(worker_id: int, backend: str | None, threads: int, batch_size: int, conn, results):
+    """
+    Entry point of an embedding worker process.
+
+    Loads the model, publishes a shared-memory output buffer, then embeds
+    batches received on `conn` until it receives None.
+    """
+    from services.embeddings import create_embedder
+
+    embedder = create_embedder(backend, threads=threads)
+    dimension = embedder.embed_array(["warm up"]).shape[1]
+
+    shm = shared_memory.SharedMemory(create=True, size=batch_size * dimension * 4)
+    output = np.ndarray((batch_size, dimension), dtype=np.float32, buffer=shm.buf)
+    results.put(("ready", worker_id, (shm.name, dimension)))
+    try:
+        while True:
+            texts = conn.recv()
+            if texts is None:
+                break
+            try:
+                output[:len(texts)] = embedder.embed_array(texts)
+                results.put(("done", worker_id, len(texts)))
+            except Exception as e:
+                results.put(("error", worker_id, f"{type(e).__name__}: {e}"))
+    finally:
+        del output
+        shm.close()
+        shm.unlink()
+
+
+class _Job:
+    """A group of texts submitted together; completes when all its batches are done."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.remaining = 0
+        self.result = None
+        self.future = Future()
+        self.lock = threading.Lock()
+
+    def deliver(self, offset: int, vectors: np.ndarray):
+        with self.lock:
+            if self.future.done():
+                return
+            if self.result is None:
+                self.result = np.empty((self.size, vectors.shape[1]), dtype=np.float32)
+            self.result[offset:offset + len(vectors)] = vectors
+            self.remaining -= 1
+            if self.remaining == 0:
+                self.future.set_result(self.result)
+
+    def fail(self, error: Exception):
+        with self.lock:
+            if not self.future.done():
+                self.future.set_exception(error)
+
+
+class _Batch:
+    """One slice of a job, processed by a single worker."""
+
+    def __init__(self, job: _Job, offset: int, texts: list[str]):
+        self.job = job
+        self.offset = offset
+        self.texts = texts
+
+
+class _Worker:
+    """Parent-side handle of a worker process."""
+
+    def __init__(self, process, conn, failures: int = 0):
+        self.process = process
+        self.conn = conn
+        self.shm = None
+        self.output = None
+        self.batch = None
+        # Deaths in a row without becoming ready, and when to start it again (process is None meanwhile)
+        self.failures = failures
+        self.restart_at = None
+
+    @property
+    def ready(self) -> bool:
+        return self.output is not None
+
+    def attach(self, shm_name: str, dimension: int, batch_size: int):
+        self.shm = shared_memory.SharedMemory(name=shm_name)
+        self.output = np.ndarray((batch_size, dimension), dtype=np.float32, buffer=self.shm.buf)
+
+    def detach(self):
+        self.output = None
+        if self.shm is not None:
+            self.shm.close()
+            self.shm = None
+
+
+class EmbeddingPool:
+    """
+    Pool of embedding worker processes with priority dispatch.
+
+    A dispatcher thread hands the highest-priority pending batch to an idle
+    worker; a collector thread reads completions and copies vectors out of
+    the worker's shared-memory buffer into the job's result matrix.
+    """
+
+    def __init__(self, workers: int = settings.EMBEDDING_WORKERS,
+                 batch_size: int = settings.EMBEDDING_POOL_BATCH_SIZE,
+                 backend: str | None = None):
+        self.batch_size = batch_size
+        self.backend = backend
+        # Split the machine's cores between workers unless a thread count is configured
+        self.threads = settings.EMBEDDING_THREADS or max(1, (os.cpu_count() or 1) // workers)
+
+        # spawn avoids forking a parent that may already hold model/thread state
+        self._ctx = mp.get_context("spawn")
+        self._results = self._ctx.Queue()
+        self._pending = []
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._idle = deque()
+        self._workers = {}
+        self._closed = False
+
+        for worker_id in range(workers):
+            self._start_worker(worker_id)
+
+        threading.Thread(target=self._dispatch_loop, name="embedding-dispatch", daemon=True).start()
+        threading.Thread(target=self._collect_loop, name="embedding-collect", daemon=True).start()
+        logger.info(f"Started embedding pool with {workers} workers, {self.threads} threads each")
+
+    def _start_worker(self, worker_id: int, failures: int = 0):
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(worker_id, self.backend, self.threads, self.batch_size, child_conn, self._results),
+            name=f"embedding-worker-{worker_id}",
+            daemon=True,
+        )
+        process.start()
+        self._workers[worker_id] = _Worker(process, parent_conn, failures)
+
+    def submit(self, texts: list[str], priority: int = PRIORITY_INGEST) -> Future:
+        """
+        Queue texts for embedding.
+
+        Args:
+            texts: Texts to embed
+            priority: PRIORITY_QUERY or PRIORITY_INGEST
+
+        Returns:
+            Future resolving to a float32 array of shape (len(texts), dimension)
+        """
+        return self._submit(texts, priority).future
+
+    def _submit(self, texts: list[str], priority: int) -> _Job:
+        job = _Job(len(texts))
+        if not texts:
+            job.future.set_result(np.empty((0, 0), dtype=np.float32))
+            return job
+
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Embedding pool is shut down")
+            if not self._workers:
+                raise RuntimeError("No embedding workers are running (they failed to start)")
+            for offset in range(0, len(texts), self.batch_size):
+                job.remaining += 1
+                batch = _Batch(job, offset, texts[offset:offset + self.batch_size])
+                heapq.heappush(self._pending, (priority, next(self._sequence), batch))
+            self._cond.notify()
+        return job
+
+    async def embed(self, texts: list[str], priority: int = PRIORITY_INGEST,
+                    timeout: float | None = None) -> np.ndarray:
+        """
+        Async wrapper around submit.
+
+        Raises:
+            TimeoutError: If the vectors are not ready within `timeout` seconds;
+                the job's remaining batches are dropped
+        """
+        job = self._submit(texts, priority)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(job.future), timeout)
+        except asyncio.TimeoutError:
+            error = TimeoutError(f"Embedding did not finish within {timeout:g}s")
+            # Failing the job makes the dispatcher skip its batches still pending
+            job.fail(error)
+            raise error
+
+    def stats(self) -> dict:
+        """Return queue depth per priority and worker availability."""
+        with self._cond:
+            depth = {"query": 0, "ingest": 0}
+            for priority, _, _ in self._pending:
+                depth["query" if priority == PRIORITY_QUERY else "ingest"] += 1
+            return {"pending_batches": depth, "idle_workers": len(self._idle), "workers": len(self._workers)}
+
+    def _dispatch_loop(self):
+        while True:
+            with self._cond:
+                while not self._closed and not (self._pending and self._idle):
+                    self._cond.wait()
+                if self._closed:
+                    return
+                _, _, batch = heapq.heappop(self._pending)
+                if batch.job.future.done():
+                    # A sibling batch already failed; drop the rest of the job
+                    continue
+                worker_id = self._idle.popleft()
+                worker = self._workers[worker_id]
+                worker.batch = batch
+            try:
+                worker.conn.send(batch.texts)
+            except (OSError, ValueError) as e:
+                batch.job.fail(RuntimeError(f"Embedding worker {worker_id} unavailable: {e}"))
+
+    def _collect_loop(self):
+        last_check = time.monotonic()
+        while not self._closed:
+            if time.monotonic() - last_check >= 1.0:
+                self._check_workers()
+                last_check = time.monotonic()
+            try:
+                kind, worker_id, payload = self._results.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                return
+
+            with self._cond:
+                worker = self._workers.get(worker_id)
+                if worker is None:
+                    continue
+                batch, worker.batch = worker.batch, None
+
+                if kind == "ready":
+                    shm_name, dimension = payload
+                    worker.attach(shm_name, dimension, self.batch_size)
+                    worker.failures = 0
+                elif kind == "done":
+                    # Copy out before the worker is marked idle and may overwrite the buffer
+                    batch.job.deliver(batch.offset, worker.output[:payload].copy())
+                elif kind == "error":
+                    batch.job.fail(RuntimeError(payload))
+
+                self._idle.append(worker_id)
+                self._cond.notify()
+
+    def _check_workers(self):
+        """
+        Fail the in-flight batch of any crashed worker and restart it after a
+        backoff. Pending work is failed while workers die before becoming
+        ready, since nothing could pick it up.
+        """
+        now = time.monotonic()
+        failed_to_start = None
+        with self._cond:
+            if self._closed:
+                return
+            for worker_id, worker in list(self._workers.items()):
+                if worker.process is None:
+                    if now >= worker.restart_at:
+                        self._start_worker(worker_id, worker.failures)
+                    continue
+                if worker.process.is_alive():
+                    continue
+                exitcode = worker.process.exitcode
+                logger.error(f"Embedding worker {worker_id} exited with code {exitcode}")
+                if worker.batch is not None:
+                    worker.batch.job.fail(RuntimeError(f"Embedding worker {worker_id} crashed"))
+                    worker.batch = None
+                if not worker.ready:
+                    failed_to_start = f"Embedding worker {worker_id} exited with code {exitcode} before it was ready"
+                worker.detach()
+                if worker_id in self._idle:
+                    self._idle.remove(worker_id)
+
+                worker.failures += 1
+                if worker.failures > settings.EMBEDDING_WORKER_RESTARTS:
+                    logger.error(f"Embedding worker {worker_id} failed {worker.failures} times in a row; "
+                                 f"not restarting it")
+                    del self._workers[worker_id]
+                    continue
+                worker.process = None
+                worker.restart_at = now + min(MAX_RESTART_BACKOFF, RESTART_BACKOFF * 2 ** (worker.failures - 1))
+
+            if failed_to_start and not any(worker.ready for worker in self._workers.values()):
+                pending, self._pending = self._pending, []
+                for _, _, batch in pending:
+                    batch.job.fail(RuntimeError(failed_to_start))
+
+    def close(self, timeout: float = 5.0):
+        """Stop all workers and fail any pending work."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            pending, self._pending = self._pending, []
+            self._cond.notify_all()
+
+        for _, _, batch in pending:
+            batch.job.fail(RuntimeError("Embedding pool is shut down"))
+        # Workers waiting to be restarted have no process
+        workers = [worker for worker in self._workers.values() if worker.process is not None]
+        for worker in workers:
+            try:
+                worker.conn.send(None)
+            except (OSError, ValueError):
+                pass
+        for worker in workers:
+            worker.process.join(timeout)
+            if worker.process.is_alive():
+                worker.process.terminate()
+            worker.detach()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_embedding_pool() -> EmbeddingPool | None:
+    """Return the process-wide embedding pool, or None when it is disabled."""
+    global _pool
+    if settings.EMBEDDING_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = EmbeddingPool()
+        return _pool
+
+
+def shutdown_embedding_pool():
+    """Stop the embedding pool if it was started."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+async def embed_documents_async(texts: list[str]) -> np.ndarray:
+    """
+    Embed document chunks at ingestion priority.
+
+    Returns:
+        float32 array with one row per text
+    """
+    if not texts:
+        return np.empty((0, 0), dtype=np.float32)
+    get_metrics().embedding_batch_size.labels("document").observe(len(texts))
+    pool = get_embedding_pool()
+    if pool is not None:
+        return await pool.embed(texts, PRIORITY_INGEST, settings.EMBEDDING_DOCUMENT_TIMEOUT)
+    return await asyncio.to_thread(get_embedder().embed_array, texts)
+
+
+async def embed_queries_async(texts: list[str]) -> np.ndarray:
+    """
+    Embed queries at the highest priority, all in one batch.
+
+    Returns:
+        float32 array with one row per text
+    """
+    get_metrics().embedding_batch_size.labels("query").observe(len(texts))
+    pool = get_embedding_pool()
+    if pool is not None:
+        return await pool.embed(texts, PRIORITY_QUERY, settings.EMBEDDING_QUERY_TIMEOUT)
+    return await asyncio.to_thread(get_embedder().embed_array, texts)
+
+
+async def embed_query_async(text: str) -> np.ndarray:
+    """
+    Embed a query at the highest priority.
+
+    Returns:
+        float32 vector
+    """
+    return (await embed_queries_async([text]))[0]
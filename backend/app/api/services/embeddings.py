@@ -0,0 +1,221 @@
+"""
+Embedding backend module.
+
+This module provides a pluggable interface for turning text into vectors.
+All backends expose the same `embed_documents` / `embed_query` methods as
+LangChain embeddings, so they can be used anywhere HuggingFaceEmbeddings was
+used before. Available backends:
+
+- huggingface: sentence-transformers on PyTorch (the original behaviour)
+- onnx:        all-MiniLM-L6-v2 exported to ONNX and run with ONNX Runtime
+- onnx-int8:   the ONNX model with dynamically quantized int8 weights
+
+The backend is selected with the EMBEDDING_BACKEND setting.
+"""
+from functools import lru_cache
+import logging
+import os
+
+import numpy as np
+
+from config import settings
+from services.chunking import get_tokenizer
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingBackend:
+    """
+    Base class for embedding backends.
+
+    Subclasses implement `embed_array`, which returns a float32 matrix with
+    one L2-normalised row per input text. The list-returning methods are
+    derived from it.
+    """
+    name = "base"
+
+    def embed_array(self, texts: list[str]) -> np.ndarray:
+        """
+        Embed a list of texts.
+
+        Args:
+            texts: Texts to embed
+
+        Returns:
+            float32 array of shape (len(texts), dimension)
+        """
+        raise NotImplementedError
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Embed document chunks, returning one list of floats per chunk."""
+        if not texts:
+            return []
+        return self.embed_array(texts).tolist()
+
+    def embed_query(self, text: str) -> list[float]:
+        """Embed a single query string."""
+        return self.embed_array([text])[0].tolist()
+
+
+class HuggingFaceBackend(EmbeddingBackend):
+    """
+    sentence-transformers model running on PyTorch via LangChain.
+    """
+    name = "huggingface"
+
+    def __init__(self, model_name: str = settings.EMBEDDING_MODEL_NAME,
+                 threads: int = settings.EMBEDDING_THREADS):
+        from langchain.embeddings import HuggingFaceEmbeddings
+
+        if threads > 0:
+            import torch
+            torch.set_num_threads(threads)
+        self.model = HuggingFaceEmbeddings(model_name=model_name)
+
+    def embed_array(self, texts: list[str]) -> np.ndarray:
+        return np.asarray(self.model.embed_documents(texts), dtype=np.float32)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.model.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.model.embed_query(text)
+
+
+class OnnxBackend(EmbeddingBackend):
+    """
+    all-MiniLM-L6-v2 running on ONNX Runtime.
+
+    Reproduces the sentence-transformers pipeline (transformer, mean pooling,
+    L2 normalisation) without PyTorch. Inputs are sorted by length and padded
+    per batch, so short texts do not pay for the longest one in the call.
+    """
+    name = "onnx"
+
+    def __init__(self, model_name: str = settings.EMBEDDING_MODEL_NAME,
+                 model_path: str = settings.EMBEDDING_ONNX_PATH,
+                 threads: int = settings.EMBEDDING_THREADS,
+                 batch_size: int = settings.EMBEDDING_BATCH_SIZE,
+                 max_tokens: int = settings.EMBEDDING_MAX_TOKENS,
+                 quantized: bool = False):
+        import onnxruntime as ort
+
+        path = model_path or self._download_model(model_name)
+        if quantized:
+            path = self._quantized_copy(path)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        output_names = [o.name for o in self.session.get_outputs()]
+        self.output_name = "last_hidden_state" if "last_hidden_state" in output_names else output_names[0]
+        self.tokenizer = get_tokenizer(model_name)
+        self.batch_size = batch_size
+        self.max_tokens = max_tokens
+        if quantized:
+            self.name = "onnx-int8"
+        logger.info(f"Loaded ONNX embedding model from {path}")
+
+    @staticmethod
+    def _download_model(model_name: str) -> str:
+        """Fetch the ONNX export published alongside the sentence-transformers model."""
+        from huggingface_hub import hf_hub_download
+
+        repo_id = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+        return hf_hub_download(repo_id=repo_id, filename="onnx/model.onnx")
+
+    @staticmethod
+    def _quantized_copy(path: str) -> str:
+        """Create (once) an int8 dynamically quantized copy of the model next to it."""
+        quantized_path = f"{os.path.splitext(path)[0]}_int8.onnx"
+        if not os.path.exists(quantized_path):
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+
+            logger.info(f"Quantizing {path} to int8")
+            quantize_dynamic(path, quantized_path, weight_type=QuantType.QInt8)
+        return quantized_path
+
+    def embed_array(self, texts: list[str]) -> np.ndarray:
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+
+        # Process texts in length order so each batch pads to a similar size
+        order = np.argsort([len(t) for t in texts], kind="stable")
+        result = None
+        for offset in range(0, len(texts), self.batch_size):
+            batch_idx = order[offset:offset + self.batch_size]
+            vectors = self._embed_batch([texts[i] for i in batch_idx])
+            if result is None:
+                result = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+            result[batch_idx] = vectors
+        return result
+
+    def _embed_batch(self, texts: list[str]) -> np.ndarray:
+        encoded = self.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=self.max_tokens,
+            return_tensors="np",
+        )
+        feeds = {name: encoded[name].astype(np.int64) for name in self.input_names if name in encoded}
+        if "token_type_ids" in self.input_names and "token_type_ids" not in feeds:
+            feeds["token_type_ids"] = np.zeros_like(encoded["input_ids"], dtype=np.int64)
+
+        token_embeddings = self.session.run([self.output_name], feeds)[0]
+
+        # Mean pooling over non-padding tokens, then L2 normalisation
+        mask = encoded["attention_mask"][..., None].astype(np.float32)
+        summed = (token_embeddings * mask).sum(axis=1)
+        pooled = summed / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return (pooled / np.clip(norms, 1e-12, None)).astype(np.float32)
+
+
+def _onnx_int8(**params) -> OnnxBackend:
+    return OnnxBackend(quantized=True, **params)
+
+
+# Registry of available backends, keyed by the EMBEDDING_BACKEND setting value
+EMBEDDING_BACKENDS = {
+    "huggingface": HuggingFaceBackend,
+    "onnx": OnnxBackend,
+    "onnx-int8": _onnx_int8,
+}
+
+
+def create_embedder(backend: str | None = None, **params) -> EmbeddingBackend:
+    """
+    Build a new embedding backend instance.
+
+    Args:
+        backend: Backend name; defaults to the EMBEDDING_BACKEND setting
+        **params: Backend-specific parameters overriding the settings
+
+    Returns:
+        EmbeddingBackend instance
+
+    Raises:
+        ValueError: If the backend name is unknown
+    """
+    name = backend or settings.EMBEDDING_BACKEND
+    if name not in EMBEDDING_BACKENDS:
+        raise ValueError(
+            f"Unknown embedding backend '{name}'. Available: {', '.join(EMBEDDING_BACKENDS)}"
+        )
+    return EMBEDDING_BACKENDS[name](**params)
+
+
+@lru_cache(maxsize=1)
+def get_embedder() -> EmbeddingBackend:
+    """
+    Return the process-wide embedding backend selected by configuration.
+
+    The model is loaded on first call and shared by parsing and querying.
+    """
+    return create_embedder()
@@ -0,0 +1,324 @@
+"""
+Fast-path text extractors module.
+
+`unstructured` is slow to import and heavy per document even for formats
+that need no layout analysis. Extractors in this registry handle those
+formats directly and produce lightweight elements that chunking treats
+like unstructured's (text, category, page number):
+
+- text:     decoded text split into paragraphs, short standalone lines as titles
+- markdown: headings as titles, list items, paragraphs
+- csv:      one table row per element
+- html:     streamed through the standard library HTML parser; headings,
+            list items and block elements, without building a DOM
+- pdf:      the text layer of born-digital PDFs, page by page (pypdfium2
+            when installed, pypdf otherwise)
+
+The extractor is chosen by magic bytes first (a PDF is a PDF whatever its
+declared type) and then by content type. An extractor raises
+`ExtractorFallback` when the document needs the full partitioner, e.g. a
+scanned PDF without a text layer, and everything without an extractor goes
+to unstructured. The FAST_EXTRACTORS setting limits which extractors are used.
+"""
+import csv
+from dataclasses import dataclass
+from html.parser import HTMLParser
+from io import BytesIO, StringIO
+import logging
+import re
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Characters of text per page below which a PDF page counts as having no text layer
+PDF_MIN_PAGE_CHARS = 20
+
+# Share of PDF pages that must have a text layer for the fast path to be used
+PDF_MIN_TEXT_PAGES = 0.9
+
+# Characters fed to the HTML parser at a time
+HTML_FEED_SIZE = 64 * 1024
+
+
+class ExtractorFallback(Exception):
+    """Raised by an extractor when the document must go to unstructured instead."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+@dataclass
+class ElementMetadata:
+    page_number: int | None = None
+
+
+class TextElement:
+    """A document element with the attributes chunking reads from unstructured elements."""
+    __slots__ = ("text", "category", "metadata")
+
+    def __init__(self, text: str, category: str = "NarrativeText", page_number: int | None = None):
+        self.text = text
+        self.category = category
+        self.metadata = ElementMetadata(page_number)
+
+    def __str__(self):
+        return self.text
+
+    def __repr__(self):
+        return f"TextElement({self.category}, {self.text[:40]!r})"
+
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _decode(content: bytes) -> str:
+    # str() decodes any buffer, so a memory-mapped document is not copied to bytes first
+    try:
+        if content[:2] in (b"\xff\xfe", b"\xfe\xff"):
+            return str(content, "utf-16")
+        return str(content, "utf-8-sig")
+    except UnicodeDecodeError:
+        # Legacy encodings are detected by unstructured
+        raise ExtractorFallback("undecodable")
+
+
+def _looks_like_title(paragraph: str) -> bool:
+    # Same spirit as unstructured's title heuristic: one short line, no
+    # sentence punctuation at the end, and some letters
+    return ("\n" not in paragraph and len(paragraph.split()) <= 12
+            and not paragraph.endswith((".", ",", ";", ":", "!", "?"))
+            and any(c.isalpha() for c in paragraph))
+
+
+def _paragraphs(text: str, page_number: int | None = None, lines_as_paragraphs: bool = False) -> list[TextElement]:
+    blocks = _PARAGRAPH_BREAK.split(text)
+    if lines_as_paragraphs and len(blocks) == 1:
+        # Text without blank lines has one paragraph per line
+        blocks = text.splitlines()
+    elements = []
+    for paragraph in blocks:
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        category = "Title" if _looks_like_title(paragraph) else "NarrativeText"
+        elements.append(TextElement(_WHITESPACE.sub(" ", paragraph), category, page_number))
+    return elements
+
+
+class Extractor:
+    """Base class for extractors: `extract` turns document bytes into elements in order."""
+    name = "base"
+
+    def extract(self, content: bytes) -> list[TextElement]:
+        raise NotImplementedError
+
+
+class PlainTextExtractor(Extractor):
+    name = "text"
+
+    def extract(self, content: bytes) -> list[TextElement]:
+        return _paragraphs(_decode(content), lines_as_paragraphs=True)
+
+
+class MarkdownExtractor(Extractor):
+    name = "markdown"
+
+    _HEADING = re.compile(r"^\s{0,3}#{1,6}\s+(.*?)\s*#*\s*$")
+    _LIST_ITEM = re.compile(r"^\s*(?:[-*+]|\d+[.)])\s+(.*)$")
+
+    def extract(self, content: bytes) -> list[TextElement]:
+        elements = []
+        paragraph = []
+
+        def flush():
+            if paragraph:
+                elements.append(TextElement(" ".join(paragraph)))
+                paragraph.clear()
+
+        for line in _decode(content).splitlines():
+            if heading := self._HEADING.match(line):
+                flush()
+                if heading.group(1):
+                    elements.append(TextElement(heading.group(1), "Title"))
+            elif item := self._LIST_ITEM.match(line):
+                flush()
+                elements.append(TextElement(item.group(1).strip(), "ListItem"))
+            elif line.strip() and not line.lstrip().startswith("```"):
+                paragraph.append(line.strip())
+            else:
+                flush()
+        flush()
+        return elements
+
+
+class CsvExtractor(Extractor):
+    name = "csv"
+
+    def extract(self, content: bytes) -> list[TextElement]:
+        reader = csv.reader(StringIO(_decode(content), newline=""))
+        return [TextElement(", ".join(cell.strip() for cell in row), "Table")
+                for row in reader if any(cell.strip() for cell in row)]
+
+
+class _HtmlElementParser(HTMLParser):
+    """Collects text per block element while the document is fed in pieces."""
+
+    _SKIP = {"script", "style", "head", "noscript", "template", "svg"}
+    _CATEGORIES = {"h1": "Title", "h2": "Title", "h3": "Title", "h4": "Title", "h5": "Title", "h6": "Title",
+                   "li": "ListItem", "tr": "Table"}
+    # Tags that end the current element; table cells only separate text within their row
+    _BLOCKS = {"p", "div", "section", "article", "main", "header", "footer", "aside", "nav", "blockquote",
+               "pre", "ul", "ol", "table", "tr", "dt", "dd", "figcaption", "br", "hr", "li",
+               "h1", "h2", "h3", "h4", "h5", "h6", "body", "form"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.elements = []
+        self._text = []
+        self._category = "NarrativeText"
+        self._skip_depth = 0
+
+    def _flush(self):
+        text = _WHITESPACE.sub(" ", "".join(self._text)).strip()
+        self._text.clear()
+        if text:
+            self.elements.append(TextElement(text, self._category))
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self._SKIP:
+            self._skip_depth += 1
+        elif tag in self._BLOCKS:
+            self._flush()
+            self._category = self._CATEGORIES.get(tag, "NarrativeText")
+        elif tag in ("td", "th"):
+            self._text.append(" ")
+
+    def handle_endtag(self, tag):
+        if tag in self._SKIP:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in self._BLOCKS:
+            self._flush()
+            self._category = "NarrativeText"
+        elif tag in ("td", "th"):
+            self._text.append(" ")
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self._text.append(data)
+
+
+class HtmlExtractor(Extractor):
+    name = "html"
+
+    def extract(self, content: bytes) -> list[TextElement]:
+        text = _decode(content)
+        parser = _HtmlElementParser()
+        for start in range(0, len(text), HTML_FEED_SIZE):
+            parser.feed(text[start:start + HTML_FEED_SIZE])
+        parser.close()
+        parser._flush()
+        return parser.elements
+
+
+class PdfTextExtractor(Extractor):
+    """
+    Reads the text layer of a PDF. Documents where too many pages have no
+    text (scans) fall back to unstructured, which can OCR them.
+    """
+    name = "pdf"
+
+    def extract(self, content: bytes) -> list[TextElement]:
+        try:
+            pages = _pdf_page_texts(content)
+        except ImportError:
+            raise ExtractorFallback("pdf_library_missing")
+        except Exception as e:
+            logger.info(f"PDF text layer could not be read: {e}")
+            raise ExtractorFallback("unreadable")
+
+        with_text = sum(len(page.strip()) >= PDF_MIN_PAGE_CHARS for page in pages)
+        if not pages or with_text < PDF_MIN_TEXT_PAGES * len(pages):
+            raise ExtractorFallback("no_text_layer")
+
+        elements = []
+        for number, page in enumerate(pages, start=1):
+            # pypdf reports lines; blank lines and line-final periods are the
+            # only paragraph hints a text layer has
+            elements.extend(_paragraphs(re.sub(r"(?<=[.!?:])\n", "\n\n", page), number))
+        return elements
+
+
+def _pdf_page_texts(content: bytes) -> list[str]:
+    try:
+        import pypdfium2
+    except ImportError:
+        from pypdf import PdfReader
+        return [page.extract_text() or "" for page in PdfReader(BytesIO(content)).pages]
+
+    # PDFium reads text layers several times faster than pypdf
+    document = pypdfium2.PdfDocument(content if isinstance(content, bytes) else bytes(content))
+    try:
+        texts = []
+        for page in document:
+            textpage = page.get_textpage()
+            texts.append(textpage.get_text_range().replace("\r\n", "\n"))
+            textpage.close()
+            page.close()
+        return texts
+    finally:
+        document.close()
+
+
+# Registry of extractors, keyed by the names used in the FAST_EXTRACTORS setting
+EXTRACTORS = {
+    "text": PlainTextExtractor,
+    "markdown": MarkdownExtractor,
+    "csv": CsvExtractor,
+    "html": HtmlExtractor,
+    "pdf": PdfTextExtractor,
+}
+
+# Declared content types handled by each extractor
+CONTENT_TYPE_EXTRACTORS = {
+    "text/plain": "text",
+    "text/markdown": "markdown",
+    "text/x-markdown": "markdown",
+    "text/csv": "csv",
+    "application/csv": "csv",
+    "text/html": "html",
+    "application/xhtml+xml": "html",
+    "application/pdf": "pdf",
+    "application/x-pdf": "pdf",
+}
+
+
+def sniff_format(content: bytes) -> str | None:
+    """Identify a format from the document's leading bytes, when it has a signature."""
+    head = content[:512].lstrip()
+    if head.startswith(b"%PDF-"):
+        return "pdf"
+    if head.startswith(b"\xef\xbb\xbf"):
+        head = head[3:].lstrip()
+    if head[:15].lower().startswith((b"<!doctype html", b"<html")):
+        return "html"
+    return None
+
+
+def select_extractor(content: bytes, content_type: str | None) -> Extractor | None:
+    """
+    Pick the fast-path extractor for a document, or None to use unstructured.
+
+    Magic bytes win over the declared content type. Other binary formats
+    with a signature (Office documents, images) have no extractor.
+    """
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    name = sniff_format(content) or CONTENT_TYPE_EXTRACTORS.get(media_type)
+    if name is None or name not in settings.FAST_EXTRACTORS:
+        return None
+    if content[:4] in (b"PK\x03\x04", b"\xd0\xcf\x11\xe0"):
+        # Declared as text but actually an Office document
+        return None
+    return EXTRACTORS[name]()
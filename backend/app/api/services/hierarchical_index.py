@@ -0,0 +1,176 @@
+"""
+Hierarchical index module: document and section centroids over a chunk index.
+
+A flat search across many files scores every chunk of every file. A
+`HierarchicalIndex` adds two coarse levels over the same chunk rows:
+
+- documents, each summarised by the centroid of its chunk vectors
+- sections (runs of consecutive chunks that start at a title, recorded at
+  parse time in `ParsedContent.sections`), summarised the same way
+
+A query scores the document centroids and keeps the best `doc_fanout`
+documents, scores the sections of those documents and keeps the best
+`section_fanout`, and only then searches the chunks of the kept sections in
+the chunk `VectorIndex` (with its codec and rescoring). A level with no more
+entries than its fan-out is not pruned, so small corpora are searched
+exhaustively; larger fan-outs trade speed for recall.
+
+Centroids are means of the unit-length chunk vectors, normalised again, so
+they are computed from the vectors the index is built from anyway.
+"""
+from dataclasses import dataclass
+import os
+from pathlib import Path
+
+import numpy as np
+
+from config import settings
+from services.vector_store import VectorIndex, normalize, top_indices
+
+
+@dataclass
+class DocumentVectors:
+    """One document's input to `HierarchicalIndex.build`."""
+    file_id: int
+    vectors: np.ndarray
+    # First chunk index of each section, starting with 0
+    section_starts: list[int]
+
+
+def _fit_starts(starts: list[int] | None, count: int) -> list[int]:
+    # Boundaries outside the document (e.g. from a different chunking) are dropped
+    return sorted({start for start in starts or [] if 0 <= start < count} | {0})
+
+
+class HierarchicalIndex:
+    """
+    A chunk VectorIndex whose rows are grouped into sections and documents.
+
+    Rows are stored document by document and section by section, so each
+    section is a contiguous row range: `section_rows[s]:section_rows[s+1]`,
+    and each document a contiguous section range `doc_sections[d]:doc_sections[d+1]`.
+    """
+
+    def __init__(self, chunks: VectorIndex, doc_sections: np.ndarray, section_rows: np.ndarray,
+                 doc_centroids: np.ndarray, section_centroids: np.ndarray):
+        self.chunks = chunks
+        self.doc_sections = doc_sections
+        self.section_rows = section_rows
+        self.doc_centroids = doc_centroids
+        self.section_centroids = section_centroids
+
+    @classmethod
+    def build(cls, documents: list[DocumentVectors], codec: str = "flat", **params) -> "HierarchicalIndex":
+        """
+        Build the chunk index with `codec` and the centroids of every
+        document and section.
+        """
+        documents = [doc for doc in documents if len(doc.vectors)]
+        if not documents:
+            raise ValueError("Cannot build an index without vectors")
+        vectors = normalize(np.concatenate([np.asarray(doc.vectors, dtype=np.float32) for doc in documents]))
+        ids = np.concatenate([
+            np.stack([np.full(len(doc.vectors), doc.file_id), np.arange(len(doc.vectors))], axis=1)
+            for doc in documents
+        ])
+
+        section_rows, doc_sections = [], [0]
+        row = 0
+        for doc in documents:
+            section_rows.extend(row + start for start in _fit_starts(doc.section_starts, len(doc.vectors)))
+            doc_sections.append(len(section_rows))
+            row += len(doc.vectors)
+        section_rows = np.asarray(section_rows + [row], dtype=np.int64)
+        doc_sections = np.asarray(doc_sections, dtype=np.int64)
+
+        section_sums = np.add.reduceat(vectors, section_rows[:-1], axis=0)
+        doc_centroids = normalize(np.add.reduceat(section_sums, doc_sections[:-1], axis=0))
+        chunks = VectorIndex.build(vectors, ids, codec=codec, **params)
+        return cls(chunks, doc_sections, section_rows, doc_centroids, normalize(section_sums))
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    @property
+    def ids(self) -> np.ndarray:
+        """(file_id, chunk_index) of each chunk row."""
+        return self.chunks.ids
+
+    @property
+    def codec(self):
+        return self.chunks.codec
+
+    @property
+    def documents(self) -> int:
+        return len(self.doc_centroids)
+
+    @property
+    def sections(self) -> int:
+        return len(self.section_centroids)
+
+    def _chosen_sections(self, query: np.ndarray, doc_fanout: int, section_fanout: int) -> tuple[np.ndarray, dict]:
+        scanned = {"documents": 0, "sections": 0}
+        if doc_fanout and self.documents > doc_fanout:
+            scanned["documents"] = self.documents
+            docs = np.sort(top_indices(self.doc_centroids @ query, doc_fanout))
+            sections = np.concatenate([np.arange(self.doc_sections[d], self.doc_sections[d + 1]) for d in docs])
+        else:
+            sections = np.arange(self.sections)
+        if section_fanout and len(sections) > section_fanout:
+            scanned["sections"] = len(sections)
+            sections = np.sort(sections[top_indices(self.section_centroids[sections] @ query, section_fanout)])
+        return sections, scanned
+
+    def search(self, query, k: int, doc_fanout: int | None = None, section_fanout: int | None = None,
+               candidates: int | None = None) -> tuple[np.ndarray, np.ndarray, dict]:
+        """
+        Find the k chunk rows most similar to a query vector, scanning only
+        the chunks of the best sections of the best documents.
+
+        Args:
+            query: Query vector
+            k: Number of rows to return
+            doc_fanout: Documents kept after the first level (default
+                CORPUS_DOC_FANOUT; 0 keeps all)
+            section_fanout: Sections kept after the second level (default
+                CORPUS_SECTION_FANOUT; 0 keeps all)
+            candidates: Rows rescored exactly by the chunk index
+
+        Returns:
+            Tuple of (row numbers, cosine similarities, scanned), where scanned
+            counts the documents, sections and chunks that were scored
+        """
+        query = normalize(query)
+        doc_fanout = settings.CORPUS_DOC_FANOUT if doc_fanout is None else doc_fanout
+        section_fanout = settings.CORPUS_SECTION_FANOUT if section_fanout is None else section_fanout
+        sections, scanned = self._chosen_sections(query, doc_fanout, section_fanout)
+
+        if len(sections) == self.sections:
+            rows = None
+            scanned["chunks"] = len(self.chunks)
+        else:
+            starts, ends = self.section_rows[sections], self.section_rows[sections + 1]
+            rows = np.concatenate([np.arange(start, end) for start, end in zip(starts, ends)])
+            scanned["chunks"] = len(rows)
+        found, scores = self.chunks.search(query, k, candidates, rows=rows)
+        return found, scores, scanned
+
+    def describe(self) -> dict:
+        return {**self.chunks.describe(), "documents": self.documents, "sections": self.sections}
+
+    def save(self, directory: str | os.PathLike):
+        """Write the levels next to the chunk index (whose index.json is written last)."""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        np.save(directory / "doc_sections.npy", self.doc_sections)
+        np.save(directory / "section_rows.npy", self.section_rows)
+        np.save(directory / "doc_centroids.npy", self.doc_centroids)
+        np.save(directory / "section_centroids.npy", self.section_centroids)
+        self.chunks.save(directory)
+
+    @classmethod
+    def load(cls, directory: str | os.PathLike) -> "HierarchicalIndex":
+        directory = Path(directory)
+        return cls(VectorIndex.load(directory),
+                   np.load(directory / "doc_sections.npy"), np.load(directory / "section_rows.npy"),
+                   np.load(directory / "doc_centroids.npy"), np.load(directory / "section_centroids.npy"))
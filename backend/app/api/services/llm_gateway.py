@@ -0,0 +1,376 @@
+"""
+LLM gateway module.
+
+This module is the single path from the API to the local Ollama server. It
+protects the server from overload and keeps tail latency predictable:
+
+- one persistent HTTP connection pool (httpx) shared by all requests
+- a concurrency limit on generations, with a bounded wait for a free slot
+- per-user fairness: waiting requests are served round-robin across users,
+  so one user's burst cannot starve everyone else
+- coalescing: identical prompts that are already being generated share the
+  in-flight result instead of starting a second generation; a generation
+  is cancelled once every caller waiting for it is
+- metrics for queue depth, time-to-first-token and tokens per second
+"""
+import asyncio
+from collections import OrderedDict, deque
+from dataclasses import dataclass, replace
+import hashlib
+import json
+import logging
+import statistics
+import time
+
+import httpx
+
+from config import settings
+from services.telemetry import get_metrics, span
+
+logger = logging.getLogger(__name__)
+
+
+class LLMError(Exception):
+    """Raised when the LLM server fails or returns an invalid response."""
+
+
+class LLMBusyError(LLMError):
+    """Raised when no generation slot became free within the queue timeout."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@dataclass
+class LLMResult:
+    """Outcome of a generation, including timing information."""
+    text: str
+    queue_seconds: float
+    ttft_seconds: float | None
+    total_seconds: float
+    output_tokens: int
+    tokens_per_second: float | None
+    coalesced: bool = False
+
+
+class FairLimiter:
+    """
+    Concurrency limiter that grants free slots round-robin across users.
+
+    Waiters are kept in one FIFO per user; when a slot is released it goes to
+    the oldest waiter of the next user in rotation.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self._waiters = OrderedDict()
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(len(q) for q in self._waiters.values())
+
+    async def acquire(self, user_key: str, timeout: float):
+        """
+        Wait for a slot.
+
+        Raises:
+            asyncio.TimeoutError: If no slot was granted within `timeout` seconds
+        """
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(user_key, deque()).append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            if waiter.done() and not waiter.cancelled():
+                # The slot was granted just as we gave up; hand it on
+                self.release()
+            else:
+                waiter.cancel()
+                self._discard(user_key, waiter)
+            raise
+
+    def release(self):
+        """Pass the slot to the next waiting user, or free it."""
+        while self._waiters:
+            user_key, queue = self._waiters.popitem(last=False)
+            waiter = queue.popleft()
+            if queue:
+                # Move the user to the back of the rotation
+                self._waiters[user_key] = queue
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def _discard(self, user_key: str, waiter):
+        queue = self._waiters.get(user_key)
+        if queue is None:
+            return
+        try:
+            queue.remove(waiter)
+        except ValueError:
+            pass
+        if not queue:
+            del self._waiters[user_key]
+
+
+class LLMMetrics:
+    """Rolling counters and latency samples for the gateway."""
+
+    def __init__(self, window: int = 1000):
+        self.requests = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.errors = 0
+        self.output_tokens = 0
+        self.ttft = deque(maxlen=window)
+        self.tokens_per_second = deque(maxlen=window)
+        self.queue_wait = deque(maxlen=window)
+
+    @staticmethod
+    def _summary(samples) -> dict:
+        if not samples:
+            return {"count": 0}
+        ordered = sorted(samples)
+        return {
+            "count": len(ordered),
+            "mean": round(statistics.fmean(ordered), 4),
+            "p50": round(ordered[len(ordered) // 2], 4),
+            "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 4),
+        }
+
+    def snapshot(self, limiter: FairLimiter) -> dict:
+        return {
+            "requests": self.requests,
+            "coalesced": self.coalesced,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "output_tokens": self.output_tokens,
+            "active": limiter.active,
+            "queue_depth": limiter.queue_depth,
+            "queue_wait_seconds": self._summary(self.queue_wait),
+            "ttft_seconds": self._summary(self.ttft),
+            "tokens_per_second": self._summary(self.tokens_per_second),
+        }
+
+
+class LLMGateway:
+    """
+    Client for the Ollama chat API with admission control and coalescing.
+    """
+
+    def __init__(self, base_url: str = settings.OLLAMA_BASE_URL,
+                 model: str = settings.LLM_MODEL,
+                 temperature: float = settings.LLM_TEMPERATURE,
+                 max_concurrency: int = settings.LLM_MAX_CONCURRENCY,
+                 queue_timeout: float = settings.LLM_QUEUE_TIMEOUT,
+                 request_timeout: float = settings.LLM_REQUEST_TIMEOUT,
+                 max_connections: int = settings.LLM_MAX_CONNECTIONS):
+        self.model = model
+        self.temperature = temperature
+        self.queue_timeout = queue_timeout
+        self.limiter = FairLimiter(max_concurrency)
+        self.metrics = LLMMetrics()
+        self._inflight = {}
+        # Callers awaiting each in-flight generation, the first one included
+        self._waiters = {}
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=httpx.Timeout(request_timeout, connect=5.0),
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=max_connections),
+        )
+
+    def _key(self, prompt: str, history: list[dict] | None) -> str:
+        raw = json.dumps([self.model, self.temperature, history or [], prompt])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def generate(self, prompt: str, user_key: str = "anonymous",
+                       history: list[dict] | None = None) -> LLMResult:
+        """
+        Generate a completion for a prompt, optionally continuing a conversation.
+
+        Args:
+            prompt: Prompt text sent as the last user message
+            user_key: Identifier used for fair scheduling between users
+            history: Chat messages ({"role", "content"}) sent before the
+                prompt; an unchanged history lets the server reuse its cache
+
+        Returns:
+            LLMResult with the answer text and timings
+
+        Raises:
+            LLMBusyError: If the request could not get a slot in time
+            LLMError: If the Ollama server fails
+
+        Cancelling the last caller waiting for a generation cancels the
+        generation too; the cancellation completes once it gave up its slot.
+        """
+        self.metrics.requests += 1
+        key = self._key(prompt, history)
+
+        task = self._inflight.get(key)
+        coalesced = task is not None
+        if coalesced:
+            self.metrics.coalesced += 1
+            get_metrics().llm_requests.labels("coalesced").inc()
+        else:
+            task = asyncio.ensure_future(self._generate(prompt, user_key, history))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            # Shielded so a caller that goes away does not cancel a generation others still wait for
+            result = await asyncio.shield(task)
+        finally:
+            # The shielded await only ends before the task when this caller is cancelled
+            if self._leave(task) and not task.done():
+                self._forget(key, task)
+                task.cancel()
+                await asyncio.wait([task])
+        return replace(result, coalesced=True) if coalesced else result
+
+    def _leave(self, task: asyncio.Future) -> bool:
+        """Count one caller of `task` as gone; True if it was the last one."""
+        self._waiters[task] -= 1
+        if self._waiters[task]:
+            return False
+        del self._waiters[task]
+        return True
+
+    def _forget(self, key: str, task: asyncio.Future):
+        # A cancelled generation is forgotten before it ends, and a new one may own the key by then
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if task.done() and not task.cancelled():
+            # Mark the exception as retrieved in case every caller went away
+            task.exception()
+
+    async def _generate(self, prompt: str, user_key: str, history: list[dict] | None) -> LLMResult:
+        enqueued = time.perf_counter()
+        try:
+            await self.limiter.acquire(user_key, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.metrics.rejected += 1
+            get_metrics().llm_requests.labels("rejected").inc()
+            raise LLMBusyError(
+                f"LLM is busy: no generation slot within {self.queue_timeout:.0f}s",
+                retry_after=self.queue_timeout,
+            )
+
+        started = time.perf_counter()
+        queue_seconds = started - enqueued
+        self.metrics.queue_wait.append(queue_seconds)
+        try:
+            with span("llm.generate", model=self.model, queue_seconds=queue_seconds):
+                result = await self._stream_chat(prompt, history, queue_seconds, started)
+            get_metrics().llm_requests.labels("generated").inc()
+            return result
+        except LLMError:
+            self.metrics.errors += 1
+            get_metrics().llm_requests.labels("error").inc()
+            raise
+        except httpx.HTTPError as e:
+            self.metrics.errors += 1
+            get_metrics().llm_requests.labels("error").inc()
+            raise LLMError(f"Ollama request failed: {e}") from e
+        finally:
+            self.limiter.release()
+
+    async def _stream_chat(self, prompt: str, history: list[dict] | None,
+                           queue_seconds: float, started: float) -> LLMResult:
+        payload = {
+            "model": self.model,
+            "messages": [*(history or []), {"role": "user", "content": prompt}],
+            "stream": True,
+            "options": {"temperature": self.temperature},
+        }
+        parts = []
+        first_token_at = None
+        eval_count = None
+        eval_duration = None
+        prompt_eval_count = None
+
+        async with self._client.stream("POST", "/api/chat", json=payload) as response:
+            if response.status_code != 200:
+                body = (await response.aread()).decode("utf-8", errors="replace")
+                raise LLMError(f"Ollama returned {response.status_code}: {body[:200]}")
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                if "error" in data:
+                    raise LLMError(f"Ollama error: {data['error']}")
+                piece = data.get("message", {}).get("content", "")
+                if piece:
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    parts.append(piece)
+                if data.get("done"):
+                    eval_count = data.get("eval_count")
+                    eval_duration = data.get("eval_duration")
+                    prompt_eval_count = data.get("prompt_eval_count")
+                    break
+
+        finished = time.perf_counter()
+        output_tokens = eval_count if eval_count is not None else len(parts)
+        if eval_count and eval_duration:
+            # Ollama reports the generation time in nanoseconds
+            tokens_per_second = eval_count / (eval_duration / 1e9)
+        elif first_token_at is not None and finished > first_token_at:
+            tokens_per_second = output_tokens / (finished - first_token_at)
+        else:
+            tokens_per_second = None
+
+        ttft = first_token_at - started if first_token_at is not None else None
+        if ttft is not None:
+            self.metrics.ttft.append(ttft)
+        if tokens_per_second is not None:
+            self.metrics.tokens_per_second.append(tokens_per_second)
+        self.metrics.output_tokens += output_tokens
+        get_metrics().llm_tokens.labels("output").inc(output_tokens)
+        if prompt_eval_count:
+            get_metrics().llm_tokens.labels("prompt").inc(prompt_eval_count)
+
+        return LLMResult(
+            text="".join(parts),
+            queue_seconds=queue_seconds,
+            ttft_seconds=ttft,
+            total_seconds=finished - started,
+            output_tokens=output_tokens,
+            tokens_per_second=tokens_per_second,
+        )
+
+    def stats(self) -> dict:
+        """Return a snapshot of the gateway metrics."""
+        return self.metrics.snapshot(self.limiter)
+
+    async def aclose(self):
+        """Close the underlying connection pool."""
+        await self._client.aclose()
+
+
+_gateway = None
+
+
+def get_llm_gateway() -> LLMGateway:
+    """Return the process-wide LLM gateway, creating it on first use."""
+    global _gateway
+    if _gateway is None:
+        _gateway = LLMGateway()
+    return _gateway
+
+
+async def close_llm_gateway():
+    """Close the LLM gateway if it was created."""
+    global _gateway
+    if _gateway is not None:
+        await _gateway.aclose()
+        _gateway = None
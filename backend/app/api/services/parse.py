@@ -3,21 +3,105 @@ Document parsing and text processing module.
 
 This module provides functionality for extracting text from various document formats,
 chunking the text into manageable segments, and preparing it for embedding and retrieval.
-It uses the unstructured library for document parsing and the LangChain text splitter 
-for chunking text into semantically meaningful segments.
+It uses the unstructured library for document parsing and the chunking strategies
+in services.chunking for splitting text into segments that fit the embedding model.
 """
-from unstructured.partition.auto import partition
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.embeddings import HuggingFaceEmbeddings
-from fastapi import UploadFile
-from io import BytesIO
+from fastapi import UploadFile, HTTPException
+from services.chunking import get_chunker
+from services.embeddings import get_embedder
+from services.extractors import ExtractorFallback, select_extractor
+from services.partitioning import get_partition_engine, partition_whole
+from services.telemetry import get_metrics
+import asyncio
 import logging 
+import time
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+async def partition_document(file_content: bytes, content_type: str) -> list:
+    """
+    Extract structured elements from file bytes.
+    
+    The elements keep their category (Title, NarrativeText, ListItem, ...),
+    which structure-aware chunking uses to align chunks with sections.
+    Plain text, Markdown, CSV, HTML and PDFs with a text layer are read by
+    the fast-path extractors in services.extractors; everything else, and
+    documents those extractors hand back, goes to unstructured.
+    With PARTITION_WORKERS > 0, PDFs are partitioned in parallel page ranges
+    by worker processes (see services.partitioning); pages that fail are
+    skipped and logged rather than failing the document.
+    
+    Args:
+        file_content: Binary content of the uploaded file (bytes, or a
+            read-only mmap from the local storage backend)
+        content_type: MIME type of the file (e.g., 'application/pdf')
+        
+    Returns:
+        List of elements in document order
+        
+    Raises:
+        Exception: If document parsing fails
+    """
+    logger.info(f"Parsing document with content_type: {content_type}")
+    metrics = get_metrics()
+
+    extractor = select_extractor(file_content, content_type)
+    if extractor is not None:
+        started = time.perf_counter()
+        try:
+            elements = await asyncio.to_thread(extractor.extract, file_content)
+        except ExtractorFallback as e:
+            metrics.parse_extractions.labels(extractor.name, e.reason).inc()
+            logger.info(f"The {extractor.name} extractor handed the document to unstructured: {e.reason}")
+        except Exception as e:
+            metrics.parse_extractions.labels(extractor.name, "error").inc()
+            logger.warning(f"The {extractor.name} extractor failed, falling back to unstructured: {e}")
+        else:
+            metrics.parse_extractions.labels(extractor.name, "fast").inc()
+            metrics.parse_extract_seconds.labels(extractor.name).observe(time.perf_counter() - started)
+            metrics.parse_extract_bytes.labels(extractor.name).inc(len(file_content))
+            return elements
+
+    if not isinstance(file_content, bytes):
+        # The fast path reads a memory map in place; unstructured and the
+        # partitioning workers (which receive it pickled) need bytes
+        file_content = bytes(file_content)
+    started = time.perf_counter()
+    try:
+        engine = get_partition_engine()
+        if engine is not None:
+            result = await engine.partition(file_content, content_type)
+            logger.info(f"Partitioned document in {result.tasks} tasks")
+            elements = result.elements
+        else:
+            # unstructured is imported on first use there: loading it takes
+            # seconds and would otherwise slow down every worker start
+            elements = await asyncio.to_thread(partition_whole, file_content, content_type)
+    except Exception as e:
+        logger.error(f"Error during document parsing: {e}", exc_info=True)
+        raise 
+    metrics.parse_extractions.labels("unstructured", "direct" if extractor is None else "fallback").inc()
+    metrics.parse_extract_seconds.labels("unstructured").observe(time.perf_counter() - started)
+    metrics.parse_extract_bytes.labels("unstructured").inc(len(file_content))
+    return elements
+
+
+def join_elements(elements: list) -> str:
+    """
+    Join extracted elements into a single text string, one element per line.
+    
+    Args:
+        elements: Elements returned by partition_document
+        
+    Returns:
+        The document text
+    """
+    return "\n".join([str(el) for el in elements])
+
+
 async def parse_document(file_content: bytes, content_type: str) -> str:
     """
     Extract raw text from file bytes using the unstructured library.
@@ -35,32 +119,26 @@ async def parse_document(file_content: bytes, content_type: str) -> str:
     Raises:
         Exception: If document parsing fails
     """
-    logger.info(f"Parsing document with content_type: {content_type}")
-    
-    try:
-        with BytesIO(file_content) as buffer:
-            # Use unstructured library to extract elements from the document
-            elements = partition(file=buffer, content_type=content_type)
-       
-        # Join all extracted elements into a single text string
-        raw_text = "\n".join([str(el) for el in elements if el is not None])
-        logger.info(f"Successfully parsed {len(raw_text)} characters.")
-        return raw_text
-    except Exception as e:
-        logger.error(f"Error during document parsing: {e}", exc_info=True)
-        raise 
+    elements = await partition_document(file_content, content_type)
+    raw_text = join_elements(elements)
+    logger.info(f"Successfully parsed {len(raw_text)} characters.")
+    return raw_text
 
 
-def chunk_text(text: str) -> list[str]:
+def chunk_text(text: str, strategy: str | None = None, elements: list | None = None, **params) -> list[str]:
     """
     Split text into smaller chunks for more effective embedding and retrieval.
     
-    Uses LangChain's RecursiveCharacterTextSplitter to divide text into chunks
-    that preserve semantic meaning while staying within size limits optimal
-    for embedding models.
+    Delegates to one of the strategies in services.chunking. By default the
+    token-budget strategy is used, which measures chunks with the embedding
+    model's tokenizer so they are never truncated at embedding time.
     
     Args:
         text: The raw text to be chunked
+        strategy: Chunking strategy name ("token", "element" or "fixed");
+            defaults to the CHUNK_STRATEGY setting
+        elements: Optional unstructured elements, used by the "element" strategy
+        **params: Strategy parameters overriding the configured defaults
         
     Returns:
         List of text chunks
@@ -69,20 +147,11 @@ def chunk_text(text: str) -> list[str]:
         logger.info("Input text is empty, returning empty list of chunks.")
         return []
     
-    logger.info(f"Chunking text of length {len(text)}")
-    
-    # Configure the text splitter with appropriate chunk size and overlap
-    # Chunk size of 512 is chosen to balance context preservation and embedding model limits
-    # Overlap of 50 ensures continuity between chunks
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=512,
-        chunk_overlap=50,
-        length_function=len,
-        add_start_index = False
-    )
+    chunker = get_chunker(strategy, **params)
+    logger.info(f"Chunking text of length {len(text)} with strategy {chunker.name}")
     
     # Split the text into chunks
-    chunks = splitter.split_text(text)
+    chunks = chunker.split(text, elements)
     logger.info(f"Created {len(chunks)} chunks.")
     return chunks
 
@@ -154,8 +223,8 @@ async def parser_main(file: UploadFile) -> dict:
         # Step 4: Generate vector embeddings for each chunk
         vectors = []
         if chunks: 
-             # Use HuggingFace embedding model to generate vector representations
-             embedder = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+             # Use the configured embedding backend to generate vector representations
+             embedder = get_embedder()
              vectors = embedder.embed_documents(chunks)  # List[List[float]]
              logger.info(f"Generated {len(vectors)} vectors.")
         else:
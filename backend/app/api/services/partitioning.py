@@ -0,0 +1,218 @@
+"""
+Parallel document partitioning module.
+
+`unstructured` partitions a document in a single thread, which makes it the
+dominant ingestion cost for long PDFs. With PARTITION_WORKERS > 0 documents
+are partitioned in a pool of worker processes instead:
+
+- PDFs are split into ranges of PARTITION_PAGES_PER_TASK pages (with pypdf);
+  each range is one task. Other formats, and PDFs that cannot be split, are
+  partitioned whole as a single task, which still keeps the work off the
+  API process.
+- Elements are merged in page order, and page numbers in their metadata are
+  shifted back to positions in the original document.
+- A range that fails is retried page by page in its worker, so one bad page
+  only loses that page. Pages lost to a crashed worker are reported the
+  same way and the pool is replaced.
+
+Without the pool, `partition_whole` runs in a thread of the API process.
+"""
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from io import BytesIO
+import logging
+import multiprocessing as mp
+import threading
+
+from config import settings
+from services.telemetry import get_metrics
+
+logger = logging.getLogger(__name__)
+
+PDF_CONTENT_TYPES = {"application/pdf", "application/x-pdf"}
+
+
+@dataclass
+class PartitionResult:
+    """Elements of a document in order, plus the pages that could not be partitioned."""
+    elements: list
+    failed_pages: list[int] = field(default_factory=list)
+    tasks: int = 1
+
+
+def partition_whole(content: bytes, content_type: str) -> list:
+    """Partition a whole document with unstructured, in the calling thread."""
+    from unstructured.partition.auto import partition
+
+    with BytesIO(content) as buffer:
+        elements = partition(file=buffer, content_type=content_type)
+    return [el for el in elements if el is not None]
+
+
+def split_pdf(content: bytes, pages_per_part: int) -> list[tuple[int, int, bytes]]:
+    """
+    Split a PDF into standalone PDFs of at most `pages_per_part` pages.
+
+    Returns:
+        List of (first page number, page count, PDF bytes), first page 1-based
+    """
+    from pypdf import PdfReader, PdfWriter
+
+    reader = PdfReader(BytesIO(content))
+    parts = []
+    for start in range(0, len(reader.pages), pages_per_part):
+        writer = PdfWriter()
+        pages = reader.pages[start:start + pages_per_part]
+        for page in pages:
+            writer.add_page(page)
+        buffer = BytesIO()
+        writer.write(buffer)
+        parts.append((start + 1, len(pages), buffer.getvalue()))
+    return parts
+
+
+def _shift_page_numbers(elements: list, offset: int):
+    if not offset:
+        return
+    for element in elements:
+        metadata = getattr(element, "metadata", None)
+        if metadata is not None and getattr(metadata, "page_number", None) is not None:
+            metadata.page_number += offset
+
+
+def _partition_pages(content: bytes, content_type: str, first_page: int, page_count: int):
+    """
+    Worker task: partition a range of pages, retrying page by page on failure.
+
+    Returns:
+        Tuple of (elements, failed page numbers)
+    """
+    try:
+        elements = partition_whole(content, content_type)
+    except Exception as e:
+        if page_count == 1:
+            logger.warning(f"Partitioning page {first_page} failed: {e}")
+            return [], [first_page]
+        logger.warning(f"Partitioning pages {first_page}-{first_page + page_count - 1} failed, retrying page by page: {e}")
+        elements, failed = [], []
+        for page, _, page_content in split_pdf(content, 1):
+            page_elements, page_failed = _partition_pages(page_content, content_type, first_page + page - 1, 1)
+            elements.extend(page_elements)
+            failed.extend(page_failed)
+        return elements, failed
+    _shift_page_numbers(elements, first_page - 1)
+    return elements, []
+
+
+def _warm_worker():
+    # Pay the import once per worker rather than on its first task
+    import unstructured.partition.auto  # noqa: F401
+
+
+class PartitionEngine:
+    """Partitions documents across a pool of worker processes."""
+
+    def __init__(self, workers: int = settings.PARTITION_WORKERS,
+                 pages_per_task: int = settings.PARTITION_PAGES_PER_TASK):
+        self.workers = workers
+        self.pages_per_task = pages_per_task
+        self._lock = threading.Lock()
+        self._executor = self._start()
+
+    def _start(self) -> ProcessPoolExecutor:
+        # spawn avoids forking a parent that may already hold model/thread state
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=mp.get_context("spawn"),
+                                   initializer=_warm_worker)
+
+    def _restart(self, broken: ProcessPoolExecutor):
+        with self._lock:
+            if self._executor is broken:
+                logger.error("A partitioning worker died; restarting the pool")
+                broken.shutdown(wait=False, cancel_futures=True)
+                self._executor = self._start()
+
+    async def _split(self, content: bytes, content_type: str) -> list[tuple[int, int, bytes]] | None:
+        if content_type not in PDF_CONTENT_TYPES:
+            return None
+        try:
+            parts = await asyncio.to_thread(split_pdf, content, self.pages_per_task)
+        except Exception as e:
+            # Encrypted or malformed PDFs are left to unstructured as a whole
+            logger.warning(f"Could not split PDF into page ranges, partitioning it whole: {e}")
+            return None
+        return parts if len(parts) > 1 else None
+
+    async def partition(self, content: bytes, content_type: str) -> PartitionResult:
+        """
+        Partition a document, in parallel page ranges when it is a PDF.
+
+        Raises:
+            Exception: If the document is partitioned whole and that fails, or
+                no page at all could be partitioned
+        """
+        parts = await self._split(content, content_type)
+        executor = self._executor
+        loop = asyncio.get_running_loop()
+
+        if parts is None:
+            try:
+                elements = await loop.run_in_executor(executor, partition_whole, content, content_type)
+            except BrokenProcessPool:
+                self._restart(executor)
+                raise
+            return PartitionResult(elements=elements)
+
+        outcomes = await asyncio.gather(
+            *(loop.run_in_executor(executor, _partition_pages, part, content_type, first, count)
+              for first, count, part in parts),
+            return_exceptions=True,
+        )
+
+        elements, failed = [], []
+        for (first, count, _), outcome in zip(parts, outcomes):
+            if isinstance(outcome, BaseException):
+                logger.error(f"Partitioning pages {first}-{first + count - 1} failed: {outcome}")
+                if isinstance(outcome, BrokenProcessPool):
+                    self._restart(executor)
+                failed.extend(range(first, first + count))
+                continue
+            part_elements, part_failed = outcome
+            elements.extend(part_elements)
+            failed.extend(part_failed)
+
+        total_pages = sum(count for _, count, _ in parts)
+        if len(failed) == total_pages:
+            raise RuntimeError(f"Partitioning failed for all {total_pages} pages")
+        if failed:
+            get_metrics().parse_failed_pages.inc(len(failed))
+            logger.warning(f"Partitioned {total_pages - len(failed)}/{total_pages} pages; failed pages: {failed}")
+        return PartitionResult(elements=elements, failed_pages=failed, tasks=len(parts))
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_partition_engine() -> PartitionEngine | None:
+    """Return the process-wide partitioning engine, or None when it is disabled."""
+    global _engine
+    if settings.PARTITION_WORKERS <= 0:
+        return None
+    with _engine_lock:
+        if _engine is None:
+            _engine = PartitionEngine()
+        return _engine
+
+
+def shutdown_partition_engine():
+    """Stop the partitioning workers if they were started."""
+    global _engine
+    with _engine_lock:
+        if _engine is not None:
+            _engine.close()
+            _engine = None
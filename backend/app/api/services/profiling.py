@@ -0,0 +1,212 @@
+"""
+Request profiling module.
+
+Opt-in profiling for finding where a slow request spends its time, without
+redeploying:
+
+- A request is profiled when it carries `X-Profile: <PROFILING_TOKEN>`, or
+  when it hits a hot path (PROFILING_PATHS) and is picked by the sample
+  rate, which can be changed at runtime through /admin/profiling.
+- The event-loop thread is sampled with pyinstrument when installed
+  (speedscope JSON, open at https://www.speedscope.app), otherwise with
+  cProfile (.pstats, open with snakeviz). Work pushed to worker threads or
+  processes is not sampled.
+- Parse jobs of a profiled request can also record tracemalloc snapshots
+  (`X-Profile-Memory: true` or the runtime `memory` flag).
+
+Output files are named after the request id, which is returned in the
+`X-Profile-Id` response header. Only one request is profiled at a time;
+others run normally. With PROFILING_ENABLED off, the middleware and admin
+routes are not installed, and `memory_trace` returns a shared null context.
+"""
+import asyncio
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from dataclasses import dataclass
+import hmac
+import json
+import logging
+import os
+import random
+import threading
+import tracemalloc
+import uuid
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Allocation sites kept in each memory report
+_MEMORY_TOP_N = 25
+
+_NULL_CONTEXT = nullcontext()
+
+
+@dataclass
+class ProfileContext:
+    """The profiling requested for the current request."""
+    request_id: str
+    memory: bool
+
+
+class ProfilingState:
+    """Runtime-adjustable profiling flags (changed through the admin endpoint)."""
+
+    def __init__(self):
+        self.sample_rate = settings.PROFILING_SAMPLE_RATE
+        self.memory = settings.PROFILING_MEMORY
+
+    def as_dict(self) -> dict:
+        return {"sample_rate": self.sample_rate, "memory": self.memory}
+
+
+state = ProfilingState()
+
+_current_profile = ContextVar("current_profile", default=None)
+_profile_lock = threading.Lock()
+
+
+def profile_dir() -> str:
+    """Return the profile output directory, creating it if needed."""
+    os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+    return settings.PROFILING_DIR
+
+
+def token_matches(token: str | None) -> bool:
+    """Check a client-supplied token against PROFILING_TOKEN (never matches when unset)."""
+    if not token or not settings.PROFILING_TOKEN:
+        return False
+    return hmac.compare_digest(token, settings.PROFILING_TOKEN)
+
+
+def _should_profile(request) -> bool:
+    if token_matches(request.headers.get("x-profile")):
+        return True
+    return (
+        state.sample_rate > 0
+        and request.url.path.startswith(tuple(settings.PROFILING_PATHS))
+        and random.random() < state.sample_rate
+    )
+
+
+class _Sampler:
+    """pyinstrument when available, cProfile otherwise."""
+
+    def __init__(self):
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            import cProfile
+            self.kind = "cprofile"
+            self._profiler = cProfile.Profile()
+        else:
+            self.kind = "pyinstrument"
+            # Sample the thread whatever task is running: the endpoint runs in
+            # a different task from the middleware
+            self._profiler = Profiler(interval=settings.PROFILING_INTERVAL, async_mode="disabled")
+
+    def start(self):
+        if self.kind == "pyinstrument":
+            self._profiler.start()
+        else:
+            self._profiler.enable()
+
+    def stop(self):
+        if self.kind == "pyinstrument":
+            self._profiler.stop()
+        else:
+            self._profiler.disable()
+
+    def save(self, request_id: str) -> str:
+        """Write the profile and return its file name."""
+        if self.kind == "pyinstrument":
+            from pyinstrument.renderers import SpeedscopeRenderer
+            name = f"{request_id}.speedscope.json"
+            with open(os.path.join(profile_dir(), name), "w") as f:
+                f.write(self._profiler.output(SpeedscopeRenderer()))
+        else:
+            name = f"{request_id}.pstats"
+            self._profiler.dump_stats(os.path.join(profile_dir(), name))
+        return name
+
+
+async def profile_request(request, call_next):
+    """HTTP middleware that profiles the requests selected by `_should_profile`."""
+    if not _should_profile(request) or not _profile_lock.acquire(blocking=False):
+        return await call_next(request)
+
+    try:
+        request_id = request.headers.get("x-request-id") or uuid.uuid4().hex
+        # Request ids become file names
+        request_id = "".join(c for c in request_id if c.isalnum() or c in "-_")[:64] or uuid.uuid4().hex
+        memory = state.memory or request.headers.get("x-profile-memory", "").lower() in ("1", "true")
+        context_token = _current_profile.set(ProfileContext(request_id=request_id, memory=memory))
+
+        sampler = _Sampler()
+        sampler.start()
+        try:
+            response = await call_next(request)
+        finally:
+            sampler.stop()
+            _current_profile.reset(context_token)
+
+        name = await asyncio.to_thread(sampler.save, request_id)
+        logger.info(f"Profiled {request.method} {request.url.path} -> {name}")
+        response.headers["X-Profile-Id"] = request_id
+        return response
+    finally:
+        _profile_lock.release()
+
+
+def memory_trace(stage: str):
+    """
+    Record allocations made inside the block when the current request asked
+    for memory profiling; a no-op otherwise.
+    """
+    profile = _current_profile.get()
+    if profile is None or not profile.memory:
+        return _NULL_CONTEXT
+    return _memory_trace(profile, stage)
+
+
+@contextmanager
+def _memory_trace(profile: ProfileContext, stage: str):
+    started_here = not tracemalloc.is_tracing()
+    if started_here:
+        tracemalloc.start(10)
+    tracemalloc.reset_peak()
+    before = tracemalloc.take_snapshot()
+    try:
+        yield
+    finally:
+        after = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        if started_here:
+            tracemalloc.stop()
+        top = after.compare_to(before, "lineno")[:_MEMORY_TOP_N]
+        report = {
+            "request_id": profile.request_id,
+            "stage": stage,
+            "peak_bytes": peak,
+            "current_bytes": current,
+            "top_allocations": [
+                {"location": str(stat.traceback), "size_diff": stat.size_diff, "count_diff": stat.count_diff}
+                for stat in top
+            ],
+        }
+        with open(os.path.join(profile_dir(), f"{profile.request_id}.{stage}.memory.json"), "w") as f:
+            json.dump(report, f, indent=2)
+
+
+def list_profiles() -> list[dict]:
+    """Return the stored profile files, newest first."""
+    directory = settings.PROFILING_DIR
+    if not os.path.isdir(directory):
+        return []
+    entries = []
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if os.path.isfile(path):
+            stat = os.stat(path)
+            entries.append({"name": name, "bytes": stat.st_size, "modified": stat.st_mtime})
+    return sorted(entries, key=lambda e: e["modified"], reverse=True)
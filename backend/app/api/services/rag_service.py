@@ -6,31 +6,29 @@ against previously embedded document content. It implements the RAG pattern
 to retrieve relevant document chunks and use them as context for generating answers.
 """
 from sqlalchemy.orm import Session
-from langchain.embeddings import HuggingFaceEmbeddings
-from langchain.prompts import ChatPromptTemplate
-from langchain.schema.runnable import RunnablePassthrough
-from langchain.schema.output_parser import StrOutputParser
+import asyncio
+from dataclasses import dataclass
+import time
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity 
 from typing import List, Tuple 
-from models.sqlalchemy.parsed_file import ParsedContent
-from models.pydantic.query_model import SourceChunk
+from models.sqlalchemy.file import Files
+from models.pydantic.query_model import CorpusChunk, SourceChunk
+from services.embeddings import get_embedder
+from services.embedding_pool import embed_queries_async, embed_query_async
+from services.llm_gateway import LLMResult, get_llm_gateway
+from services.chat_sessions import ChatTurn, sessions as chat_sessions
+from services.content_store import find_parse_version, find_parsed_content
+from services.corpus_index import chunk_texts, corpus_version, get_user_index
+from services.context_builder import ContextBudgeter, ContextResult, count_tokens
+from services.reranker import get_reranker
+from services.retrieval_shards import get_retrieval_client
+from services.telemetry import get_metrics
+from services.timing import StageTimer
+from services.vector_store import normalize, top_indices
+from config import settings
+import logging
 
-# Set embedding model name - this should match the model used for document embedding
-EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
-
-# Initialize the embeddings model for transforming queries into vector space
-embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
-
-# Try to initialize the language model for answer generation
-# Ollama provides a local LLM option, but falls back gracefully if not available
-try:
-    from langchain_community.chat_models import ChatOllama
-    llm = ChatOllama(model="llama3", temperature=0)
-    print("Using Ollama LLM.")
-except ImportError:
-    print("Ollama not found. LLM functionality will require manual setup.")
-    llm = None 
+logger = logging.getLogger(__name__)
 
 # Define the prompt template for RAG
 # This instructs the model to answer based only on the provided context
@@ -44,10 +42,7 @@ QUESTION:
 Answer the question based ONLY on the provided context. If the context doesn't contain the answer, state that you cannot answer based on the provided information. Be concise.
 """
 
-# Create a ChatPromptTemplate from the template string
-rag_prompt = ChatPromptTemplate.from_template(RAG_PROMPT_TEMPLATE)
-
-def find_top_k_chunks_manual(query_text: str, stored_chunks: List[str], stored_vectors: List[List[float]], k: int) -> List[SourceChunk]:
+def find_top_k_chunks_manual(query_text: str, stored_chunks: List[str], stored_vectors: List[List[float]], k: int, query_vector=None) -> List[SourceChunk]:
     """
     Find the most relevant document chunks for a given query using vector similarity.
     
@@ -61,6 +56,7 @@ def find_top_k_chunks_manual(query_text: str, stored_chunks: List[str], stored_v
         stored_chunks: List of document text chunks
         stored_vectors: List of vector embeddings corresponding to chunks
         k: Number of top chunks to retrieve
+        query_vector: Optional precomputed embedding of query_text
         
     Returns:
         List of SourceChunk objects containing the most relevant chunks
@@ -68,13 +64,16 @@ def find_top_k_chunks_manual(query_text: str, stored_chunks: List[str], stored_v
     if not stored_vectors or not stored_chunks:
         return []
 
-    # Convert query to vector representation
-    query_vector = embeddings.embed_query(query_text)
-    query_vector_np = np.array(query_vector).reshape(1, -1)
-    stored_vectors_np = np.array(stored_vectors)
+    # Convert query to vector representation (unless the caller already did)
+    if query_vector is None:
+        query_vector = get_embedder().embed_query(query_text)
+    query_vector_np = np.asarray(query_vector, dtype=np.float32)
+    stored_vectors_np = np.asarray(stored_vectors, dtype=np.float32)
 
     # Calculate cosine similarity between query and all chunks
-    similarities = cosine_similarity(query_vector_np, stored_vectors_np)[0]
+    # (plain numpy: importing scikit-learn for this alone slows startup)
+    norms = np.linalg.norm(stored_vectors_np, axis=1) * np.linalg.norm(query_vector_np)
+    similarities = (stored_vectors_np @ query_vector_np) / np.maximum(norms, 1e-12)
 
     # Get the top k chunks (handle edge case where k > available chunks)
     effective_k = min(k, len(similarities))
@@ -93,22 +92,45 @@ def find_top_k_chunks_manual(query_text: str, stored_chunks: List[str], stored_v
     for i in top_k_indices_sorted:
          if 0 <= i < len(stored_chunks):
               results.append(SourceChunk(
-                   chunk_index=i,
+                   chunk_index=int(i),
                    text=stored_chunks[i],
+                   score=float(similarities[i]),
               ))
          else:
               print(f"Warning: Invalid index {i} encountered during top-k search.")
 
     return results
 
-async def process_query(db: Session, user_id: int, file_id: int, query: str, top_k: int) -> tuple[str, List[SourceChunk]]:
+def _rag_prompt(query: str, chunks: List[SourceChunk]) -> tuple[ContextResult, str]:
+    """Merge overlapping chunks, drop repeated text, pack them to the token budget and fill the prompt."""
+    context = ContextBudgeter().build(chunks)
+    return context, RAG_PROMPT_TEMPLATE.format(context=context.text, question=query)
+
+async def _rerank(query: str, chunks: List[SourceChunk], top_k: int, rerank_budget_ms: int | None,
+                  timer: StageTimer, stats: dict) -> List[SourceChunk]:
+    """Rerank retrieved chunks within what is left of the latency budget, recording the outcome in stats."""
+    # Whatever is left of the latency budget is available to the cross-encoder
+    budget_ms = settings.RERANK_BUDGET_MS if rerank_budget_ms is None else rerank_budget_ms
+    remaining = budget_ms / 1000 - timer.elapsed()
+    with timer.stage("rerank"):
+        reranked = await asyncio.to_thread(get_reranker().rerank, query, chunks, top_k, remaining)
+    stats["reranked"] = reranked.applied
+    stats["rerank_skipped_reason"] = reranked.skipped_reason
+    return reranked.chunks
+
+async def process_query(db: Session, user_id: int, file_id: int, query: str, top_k: int,
+                        rerank: bool = False, rerank_candidates: int | None = None,
+                        rerank_budget_ms: int | None = None,
+                        timer: StageTimer | None = None) -> tuple[str, List[SourceChunk], dict]:
     """
     Process a user query against a specific document using RAG.
     
     This function:
     1. Retrieves the parsed document content from the database
-    2. Finds the most relevant chunks for the query
-    3. Generates an answer using the LLM with the chunks as context
+    2. Finds the most relevant chunks for the query, optionally retrieving a
+       larger candidate set and reranking it with a cross-encoder
+    3. Packs the chunks into a de-duplicated, token-budgeted context
+    4. Generates an answer using the LLM with that context
     
     Args:
         db: Database session
@@ -116,22 +138,29 @@ async def process_query(db: Session, user_id: int, file_id: int, query: str, top
         file_id: ID of the file to query against
         query: The natural language query
         top_k: Number of relevant chunks to retrieve
+        rerank: Whether to apply cross-encoder reranking
+        rerank_candidates: Candidates retrieved for reranking (defaults to RERANK_CANDIDATES)
+        rerank_budget_ms: Latency budget for the request up to the end of
+            reranking (defaults to RERANK_BUDGET_MS)
+        timer: Optional StageTimer started by the caller; per-stage durations
+            (db_load, embed, search, rerank, prompt_build, llm) are recorded on it
         
     Returns:
-        Tuple containing (generated_answer, source_chunks)
+        Tuple containing (generated_answer, source_chunks, stats), where stats
+        holds the stage timings, prompt token accounting and reranking outcome
         
     Raises:
-        ValueError: If parsed content is not found or LLM is not available
+        ValueError: If parsed content is not found
+        LLMBusyError: If the LLM gateway has no free generation slot in time
+        LLMError: If answer generation fails
     """
-    # Check if LLM is initialized
-    if not llm:
-         raise ValueError("LLM not initialized. Cannot process query.")
+    timer = timer or StageTimer("query")
+    stats = {"timings": timer.stages}
 
-    # Retrieve parsed content from database
-    parsed_data = db.query(ParsedContent).filter(
-        ParsedContent.file_id == file_id,
-        ParsedContent.user_id == user_id
-    ).first()
+    # Retrieve parsed content from database (possibly shared with identical uploads)
+    with timer.stage("db_load"):
+        file = db.query(Files).filter(Files.id == file_id, Files.user_id == user_id).first()
+        parsed_data = find_parsed_content(db, file) if file else None
 
     # Validate that we found parsed content and it has chunks and vectors
     if not parsed_data:
@@ -143,25 +172,319 @@ async def process_query(db: Session, user_id: int, file_id: int, query: str, top
     stored_chunks = parsed_data.chunks
     stored_vectors = parsed_data.vectors 
 
-    # Find the most relevant chunks for the query
-    relevant_chunks = find_top_k_chunks_manual(query, stored_chunks, stored_vectors, top_k)
+    # Reranking starts from a larger, cheaply retrieved candidate set
+    retrieve_k = max(top_k, rerank_candidates or settings.RERANK_CANDIDATES) if rerank else top_k
+
+    # Embed the query at query priority, then find the most relevant chunks
+    with timer.stage("embed"):
+        query_vector = await embed_query_async(query)
+    with timer.stage("search"):
+        relevant_chunks = find_top_k_chunks_manual(query, stored_chunks, stored_vectors, retrieve_k, query_vector=query_vector)
 
     # If no relevant chunks found, return early with a message
     if not relevant_chunks:
-         return "Could not find relevant information in the document to answer the query.", []
+         return "Could not find relevant information in the document to answer the query.", [], stats
+
+    if rerank:
+        relevant_chunks = await _rerank(query, relevant_chunks, top_k, rerank_budget_ms, timer, stats)
+
+    with timer.stage("prompt_build"):
+        context, prompt = _rag_prompt(query, relevant_chunks)
+        stats.update({
+            "prompt_tokens": count_tokens([prompt])[0],
+            "context_tokens": context.context_tokens,
+            "context_tokens_saved": context.candidate_tokens - context.context_tokens,
+            "chunks_dropped": context.dropped_chunks,
+        })
+    get_metrics().llm_tokens.labels("context_saved").inc(stats["context_tokens_saved"])
+
+    # Generate the answer through the LLM gateway, which pools connections to the
+    # Ollama server and limits concurrent generations; the user id is the
+    # fairness key so one user cannot monopolise the LLM
+    with timer.stage("llm"):
+        result = await get_llm_gateway().generate(prompt, user_key=str(user_id))
+    logger.info(f"Query on file {file_id}: {stats}")
+
+    return result.text, context.chunks, stats
+
+
+async def process_chat_turn(db: Session, user_id: int, file_id: int, query: str, top_k: int,
+                            rerank: bool = False, rerank_candidates: int | None = None,
+                            rerank_budget_ms: int | None = None,
+                            timer: StageTimer | None = None) -> tuple[str, List[SourceChunk], dict]:
+    """
+    Answer a question as the next turn of the user's chat session about a file.
+
+    The conversation is read from the database, so any worker can answer the
+    next turn. A new session starts with the first turn, or when the file was
+    re-parsed or the session went idle. Later turns reuse the worker's
+    decoded vector matrix of the file, only add passages the conversation
+    has not seen yet, and send the earlier turns unchanged ahead of the new
+    question so the LLM server can reuse its cache for them (see
+    services.chat_sessions).
+
+    Args:
+        db: Database session
+        user_id: ID of the user asking
+        file_id: ID of the file the conversation is about
+        query: The natural language question
+        top_k: Number of relevant chunks to retrieve
+        rerank: Whether to apply cross-encoder reranking
+        rerank_candidates: Candidates retrieved for reranking (defaults to RERANK_CANDIDATES)
+        rerank_budget_ms: Latency budget for the request up to the end of
+            reranking (defaults to RERANK_BUDGET_MS)
+        timer: Optional StageTimer started by the caller
+
+    Returns:
+        Tuple containing (generated_answer, source_chunks, stats), where stats
+        also holds the session turn number and whether the history was compacted
+
+    Raises:
+        ValueError: If parsed content is not found
+        LLMBusyError: If the LLM gateway has no free generation slot in time
+        LLMError: If answer generation fails
+    """
+    timer = timer or StageTimer("chat")
+    stats = {"timings": timer.stages}
+
+    # Only the parse result's identity is read while the session is current
+    with timer.stage("db_load"):
+        file = db.query(Files).filter(Files.id == file_id, Files.user_id == user_id).first()
+        version = find_parse_version(db, file) if file else None
+    if not version:
+        chat_sessions.end(db, user_id, file_id)
+        raise ValueError(f"Parsed content for file ID {file_id} not found for this user.")
+
+    vectors = chat_sessions.vectors.get((version.file_id, version.created_at))
+    if vectors is None:
+        with timer.stage("db_load"):
+            parsed_data = find_parsed_content(db, file)
+        if not parsed_data or not parsed_data.chunks or not parsed_data.vectors:
+            raise ValueError(f"File ID {file_id} has not been parsed completely (missing chunks or vectors).")
+        version = parsed_data
+        vectors = chat_sessions.vectors.put((parsed_data.file_id, parsed_data.created_at),
+                                            parsed_data.chunks, parsed_data.vectors)
+    with timer.stage("db_load"):
+        session = chat_sessions.open(db, user_id, file_id, (version.file_id, version.created_at), vectors)
+
+    retrieve_k = max(top_k, rerank_candidates or settings.RERANK_CANDIDATES) if rerank else top_k
+    with timer.stage("embed"):
+        query_vector = await embed_query_async(query)
+    with timer.stage("search"):
+        relevant_chunks = session.retrieve(query_vector, retrieve_k)
+    if rerank:
+        relevant_chunks = await _rerank(query, relevant_chunks, top_k, rerank_budget_ms, timer, stats)
+
+    with timer.stage("prompt_build"):
+        # Passages already in the conversation are not repeated
+        shown = [c for c in relevant_chunks if c.chunk_index in session.shown]
+        context = ContextBudgeter().build([c for c in relevant_chunks if c.chunk_index not in session.shown])
+        history = session.messages()
+        turn = ChatTurn(query, context.text, "", [c.chunk_index for c in context.chunks], 0)
+        history_tokens = count_tokens([message["content"] for message in history])
+        turn_tokens = count_tokens([turn.prompt])[0]
+        stats.update({
+            "prompt_tokens": sum(history_tokens) + turn_tokens,
+            "history_tokens": sum(history_tokens),
+            "context_tokens": context.context_tokens,
+            "context_tokens_saved": context.candidate_tokens - context.context_tokens,
+            "chunks_reused": len(shown),
+        })
+
+    with timer.stage("llm"):
+        result = await get_llm_gateway().generate(turn.prompt, user_key=str(user_id), history=history)
+    turn.answer = result.text
+    turn.tokens = turn_tokens + count_tokens([result.text])[0]
+    with timer.stage("db_save"):
+        stats["compacted"] = chat_sessions.record(db, session, turn)
+    stats["session_turn"] = session.turn_count
+    logger.info(f"Chat turn {session.turn_count} on file {file_id}: {stats}")
+
+    used = {c.chunk_index for c in context.chunks} | {c.chunk_index for c in shown}
+    return result.text, [c for c in relevant_chunks if c.chunk_index in used], stats
+
+@dataclass
+class BatchQuestion:
+    """One question of a batch query, with its prompt and, once generated, its answer or error."""
+    index: int
+    query: str
+    chunks: List[SourceChunk]
+    prompt: str
+    prompt_tokens: int
+    result: LLMResult | None = None
+    error: Exception | None = None
+    llm_seconds: float | None = None
+
+
+async def prepare_batch_query(db: Session, user_id: int, file_id: int, queries: List[str], top_k: int,
+                              timer: StageTimer | None = None) -> List[BatchQuestion]:
+    """
+    Retrieve the context and build the prompt of every question of a batch.
+
+    The work process_query repeats per question is done once for the batch:
+    the parse result is loaded and its vectors decoded once, all questions
+    are embedded in one batch, and their similarities to every chunk are one
+    matrix product.
+
+    Args:
+        db: Database session
+        user_id: ID of the user asking
+        file_id: ID of the file the questions are about
+        queries: The questions
+        top_k: Number of relevant chunks to retrieve per question
+        timer: Optional StageTimer started by the caller; db_load, embed,
+            search and prompt_build are recorded on it
+
+    Returns:
+        One BatchQuestion per query, in order, ready for BatchAnswers
+
+    Raises:
+        ValueError: If parsed content is not found
+    """
+    timer = timer or StageTimer("batch_query")
+
+    with timer.stage("db_load"):
+        file = db.query(Files).filter(Files.id == file_id, Files.user_id == user_id).first()
+        parsed_data = find_parsed_content(db, file) if file else None
+    if not parsed_data:
+        raise ValueError(f"Parsed content for file ID {file_id} not found for this user.")
+    if not parsed_data.chunks or not parsed_data.vectors:
+        raise ValueError(f"File ID {file_id} has not been parsed completely (missing chunks or vectors).")
+    chunks = parsed_data.chunks
+    with timer.stage("db_load"):
+        matrix = normalize(parsed_data.vectors)
+
+    with timer.stage("embed"):
+        query_vectors = normalize(await embed_queries_async(list(queries)))
+    with timer.stage("search"):
+        # (questions x chunks) cosine similarities
+        scores = query_vectors @ matrix.T
+        relevant = [[SourceChunk(chunk_index=int(i), text=chunks[i], score=float(row[i]))
+                     for i in top_indices(row, top_k)] for row in scores]
+
+    with timer.stage("prompt_build"):
+        built = [_rag_prompt(query, found) for query, found in zip(queries, relevant)]
+        prompt_tokens = count_tokens([prompt for _, prompt in built])
+    get_metrics().llm_tokens.labels("context_saved").inc(
+        sum(context.candidate_tokens - context.context_tokens for context, _ in built))
+
+    return [BatchQuestion(index, query, context.chunks, prompt, tokens)
+            for index, (query, (context, prompt), tokens) in enumerate(zip(queries, built, prompt_tokens))]
+
+
+class BatchAnswers:
+    """
+    The answers of a batch query, generated `concurrency` at a time.
+
+    Generation starts as soon as the object is created. Iterating yields each
+    BatchQuestion as its answer (or error) arrives; an error affects only its
+    own question. `on_done` is awaited once every question has finished or
+    was cancelled, and a cancelled question's generation has stopped, even
+    if nobody iterates.
+    """
+
+    def __init__(self, questions: List[BatchQuestion], user_key: str, concurrency: int, on_done=None):
+        self.user_key = user_key
+        self._slots = asyncio.Semaphore(max(1, concurrency))
+        self._tasks = [asyncio.ensure_future(self._answer(question)) for question in questions]
+        self._done = asyncio.ensure_future(self._wait(on_done))
+
+    async def _answer(self, question: BatchQuestion) -> BatchQuestion:
+        async with self._slots:
+            started = time.perf_counter()
+            try:
+                question.result = await get_llm_gateway().generate(question.prompt, user_key=self.user_key)
+            except Exception as e:
+                question.error = e
+            question.llm_seconds = time.perf_counter() - started
+        return question
+
+    async def _wait(self, on_done):
+        if self._tasks:
+            await asyncio.wait(self._tasks)
+        if on_done is not None:
+            await on_done()
+
+    async def __aiter__(self):
+        for next_answer in asyncio.as_completed(self._tasks):
+            yield await next_answer
+
+    def cancel(self):
+        """Stop generating the answers not finished yet (generations shared with other callers go on)."""
+        for task in self._tasks:
+            task.cancel()
+
+
+async def search_corpus(db: Session, user_id: int, query: str, top_k: int,
+                        doc_fanout: int | None = None, section_fanout: int | None = None,
+                        timer: StageTimer | None = None) -> tuple[List[CorpusChunk], dict | None, dict | None]:
+    """
+    Find the chunks most similar to a query across all of a user's files.
 
-    # Combine the relevant chunks into a single context string
-    context_text = "\n---\n".join([chunk.text for chunk in relevant_chunks])
+    Searches the user's corpus index (see services.corpus_index), which is
+    built or loaded on first use and whenever the user's files change. Only
+    the chunks of the best sections of the best files are scanned (see
+    services.hierarchical_index). With RETRIEVAL_SHARDS set, the index
+    search runs on the retrieval shards instead and their results are merged
+    (see services.retrieval_shards).
+
+    Args:
+        db: Database session
+        user_id: ID of the user whose files are searched
+        query: The natural language query
+        top_k: Number of chunks to return
+        doc_fanout: Files kept after scoring file centroids (default
+            CORPUS_DOC_FANOUT; 0 keeps all)
+        section_fanout: Sections kept after scoring section centroids
+            (default CORPUS_SECTION_FANOUT; 0 keeps all)
+        timer: Optional StageTimer started by the caller; records db_load,
+            index (loading or building), embed and search
+
+    Returns:
+        Tuple of (chunks best first, description of the index searched,
+        counts of the files, sections and chunks scanned), where the last
+        two are None when the user has nothing parsed
+
+    Raises:
+        RetrievalUnavailable: If no replica of a retrieval shard answered
+    """
+    timer = timer or StageTimer("corpus_search")
+    with timer.stage("db_load"):
+        version = corpus_version(db, user_id)
+    if not version.parses:
+        return [], None, None
 
-    # Create a RAG chain: context + query -> prompt -> LLM -> output parser
-    rag_chain = (
-        {"context": lambda _: context_text, "question": RunnablePassthrough()}
-        | rag_prompt
-        | llm
-        | StrOutputParser()
-    )
+    shards = get_retrieval_client()
+    if shards is not None:
+        with timer.stage("embed"):
+            query_vector = await embed_query_async(query)
+        with timer.stage("search"):
+            shard_hits, description, scanned = await shards.search(user_id, query_vector, top_k, doc_fanout,
+                                                                   section_fanout, corpus=version.digest)
+        hits = [(file_id, chunk_index) for file_id, chunk_index, _ in shard_hits]
+        scores = [score for _, _, score in shard_hits]
+    else:
+        with timer.stage("index"):
+            # Building encodes every vector of the corpus; keep it off the event loop
+            index = await asyncio.to_thread(get_user_index, db, user_id, version)
+        if index is None:
+            return [], None, None
+        with timer.stage("embed"):
+            query_vector = await embed_query_async(query)
+        with timer.stage("search"):
+            rows, scores, scanned = index.search(query_vector, top_k, doc_fanout, section_fanout)
+        hits = [(int(index.ids[row][0]), int(index.ids[row][1])) for row in rows]
+        description = index.describe()
+    if description is None:
+        return [], None, None
 
-    # Execute the chain to generate an answer
-    answer = await rag_chain.ainvoke(query) 
+    # Shards read the database themselves; one may answer for a file deleted since
+    found = [(hit, score) for hit, score in zip(hits, scores) if hit[0] in version.parses]
+    with timer.stage("db_load"):
+        texts = chunk_texts(db, version, [hit for hit, _ in found])
 
-    return answer, relevant_chunks
\ No newline at end of file
+    results = [
+        CorpusChunk(file_id=file_id, chunk_index=chunk_index, text=texts[(file_id, chunk_index)], score=float(score))
+        for (file_id, chunk_index), score in found if (file_id, chunk_index) in texts
+    ]
+    return results, description, scanned
@@ -0,0 +1,198 @@
+"""
+Cross-encoder reranking module.
+
+This module implements the optional second retrieval stage: a larger
+candidate set found by cosine similarity is rescored with a small CPU
+cross-encoder, and only the best few chunks are passed to the LLM.
+
+- Pairs are scored in batches.
+- Scores are cached per (query, chunk hash), so repeated questions and
+  follow-ups over the same chunks skip the model.
+- Reranking runs under a per-request latency budget. It is skipped when the
+  estimated cost does not fit the remaining budget, and abandoned if a batch
+  pushes it over; in both cases the cosine order is kept.
+- Loading the model takes seconds, more than any budget, so a budgeted
+  request that finds it not loaded yet is skipped and starts loading it in
+  the background for the requests after it.
+"""
+from collections import OrderedDict
+from dataclasses import dataclass
+import hashlib
+import logging
+import threading
+import time
+
+from config import settings
+from models.pydantic.query_model import SourceChunk
+from services.telemetry import get_metrics
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RerankResult:
+    """Reranked chunks plus what happened while producing them."""
+    chunks: list[SourceChunk]
+    applied: bool
+    skipped_reason: str | None = None
+    scored_pairs: int = 0
+    cache_hits: int = 0
+
+
+class _ScoreCache:
+    """Thread-safe bounded LRU cache of cross-encoder scores."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value: float):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.capacity:
+                self._data.popitem(last=False)
+
+
+class CrossEncoderReranker:
+    """
+    Reranks retrieved chunks with a sentence-transformers CrossEncoder.
+
+    The model is loaded on first use (in the background when the request has
+    a budget). The average cost per scored pair is tracked so the budget
+    check can predict whether reranking will fit.
+    """
+
+    def __init__(self, model_name: str = settings.RERANK_MODEL,
+                 batch_size: int = settings.RERANK_BATCH_SIZE,
+                 cache_size: int = settings.RERANK_CACHE_SIZE):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.cache = _ScoreCache(cache_size)
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._loader = None
+        self._loader_lock = threading.Lock()
+        self._seconds_per_pair = None
+
+    def _get_model(self):
+        with self._model_lock:
+            if self._model is None:
+                from sentence_transformers import CrossEncoder
+                self._model = CrossEncoder(self.model_name, device="cpu")
+                logger.info(f"Loaded reranker model {self.model_name}")
+            return self._model
+
+    def _load_in_background(self):
+        """Start loading the model in a thread, unless one already is."""
+        with self._loader_lock:
+            if self._loader is None:
+                self._loader = threading.Thread(target=self._background_load, name="reranker-load", daemon=True)
+                self._loader.start()
+
+    def _background_load(self):
+        try:
+            self._get_model()
+        except Exception:
+            logger.exception(f"Loading reranker model {self.model_name} failed")
+            # A later request tries again
+            with self._loader_lock:
+                self._loader = None
+
+    @staticmethod
+    def _key(query: str, text: str) -> tuple[str, str]:
+        digest = hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+        return query, digest
+
+    def rerank(self, query: str, chunks: list[SourceChunk], top_n: int,
+               budget_seconds: float | None = None) -> RerankResult:
+        """
+        Rescore chunks against the query and keep the best `top_n`.
+
+        Args:
+            query: The user's query
+            chunks: Candidate chunks in cosine-similarity order
+            top_n: Number of chunks to return
+            budget_seconds: Time left for reranking; None means unbounded
+
+        Returns:
+            RerankResult; when reranking is skipped or abandoned the first
+            `top_n` candidates are returned unchanged
+        """
+        fallback = chunks[:top_n]
+        if len(chunks) <= 1:
+            return RerankResult(chunks=fallback, applied=False, skipped_reason="too_few_candidates")
+
+        deadline = None if budget_seconds is None else time.perf_counter() + budget_seconds
+        keys = [self._key(query, c.text) for c in chunks]
+        scores = [self.cache.get(k) for k in keys]
+        missing = [i for i, s in enumerate(scores) if s is None]
+        cache_hits = len(chunks) - len(missing)
+        get_metrics().cache_requests.labels("rerank", "hit").inc(cache_hits)
+        get_metrics().cache_requests.labels("rerank", "miss").inc(len(missing))
+
+        if missing and budget_seconds is not None:
+            if self._model is None:
+                self._load_in_background()
+                return RerankResult(chunks=fallback, applied=False, skipped_reason="model_loading",
+                                    cache_hits=cache_hits)
+            estimate = (self._seconds_per_pair or 0.0) * len(missing)
+            if budget_seconds <= 0 or estimate > budget_seconds:
+                return RerankResult(chunks=fallback, applied=False, skipped_reason="budget",
+                                    cache_hits=cache_hits)
+
+        if missing:
+            model = self._get_model()
+            for offset in range(0, len(missing), self.batch_size):
+                batch = missing[offset:offset + self.batch_size]
+                started = time.perf_counter()
+                batch_scores = model.predict([(query, chunks[i].text) for i in batch],
+                                             batch_size=self.batch_size, show_progress_bar=False)
+                self._record_cost(time.perf_counter() - started, len(batch))
+                for i, score in zip(batch, batch_scores):
+                    scores[i] = float(score)
+                    self.cache.put(keys[i], scores[i])
+
+                if deadline is not None and time.perf_counter() > deadline and offset + self.batch_size < len(missing):
+                    # Scores computed so far stay cached for the next request
+                    return RerankResult(chunks=fallback, applied=False, skipped_reason="budget_exceeded",
+                                        scored_pairs=offset + len(batch), cache_hits=cache_hits)
+
+        order = sorted(range(len(chunks)), key=lambda i: scores[i], reverse=True)[:top_n]
+        reranked = [
+            SourceChunk(
+                chunk_index=chunks[i].chunk_index,
+                text=chunks[i].text,
+                score=chunks[i].score,
+                rerank_score=scores[i],
+            )
+            for i in order
+        ]
+        return RerankResult(chunks=reranked, applied=True, scored_pairs=len(missing), cache_hits=cache_hits)
+
+    def _record_cost(self, seconds: float, pairs: int):
+        """Keep an exponential moving average of the scoring cost per pair."""
+        per_pair = seconds / max(pairs, 1)
+        if self._seconds_per_pair is None:
+            self._seconds_per_pair = per_pair
+        else:
+            self._seconds_per_pair = 0.8 * self._seconds_per_pair + 0.2 * per_pair
+
+
+_reranker = None
+
+
+def get_reranker() -> CrossEncoderReranker:
+    """Return the process-wide reranker (the model itself loads on first rerank)."""
+    global _reranker
+    if _reranker is None:
+        _reranker = CrossEncoderReranker()
+    return _reranker
@@ -0,0 +1,116 @@
+"""
+Response cache module for parse results.
+
+Opening a file calls `/file/parse/{owner}/{fileid}`, whose response carries
+the full text and every chunk of the document. Serialized responses are kept
+in a bounded in-process LRU cache, limited by total size in bytes, and each
+carries an ETag derived from the parse result's version:
+
+- a request whose `If-None-Match` matches the current version gets a 304
+  without the parse result being loaded from the database
+- otherwise the cached body is served as long as its ETag is still current
+- a stale entry (the file was re-parsed, or its shared parse changed hands)
+  simply misses and is replaced; routes also invalidate entries they know
+  to be gone
+
+The version is read from the database on every request, so workers of a
+multi-process server never serve each other's stale results.
+"""
+from collections import OrderedDict
+from dataclasses import dataclass
+import hashlib
+import json
+import threading
+
+from config import settings
+from services.telemetry import get_metrics
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    """A serialized JSON response and the version it was built from."""
+    etag: str
+    body: bytes
+
+
+def make_etag(*parts) -> str:
+    """Return a strong ETag for the version identified by `parts`."""
+    digest = hashlib.blake2b(":".join(str(part) for part in parts).encode("utf-8"), digest_size=12)
+    return f'"{digest.hexdigest()}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Whether an If-None-Match header value covers `etag` (weak comparison, as RFC 9110 asks)."""
+    if not if_none_match:
+        return False
+    candidates = [c.strip() for c in if_none_match.split(",")]
+    return "*" in candidates or etag in (c.removeprefix("W/") for c in candidates)
+
+
+def serialize(payload: dict) -> bytes:
+    """Encode a response the way FastAPI's JSONResponse does."""
+    return json.dumps(payload, ensure_ascii=False, allow_nan=False, indent=None,
+                      separators=(",", ":"), default=_encode_default).encode("utf-8")
+
+
+def _encode_default(value):
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class ResponseCache:
+    """Thread-safe LRU cache of serialized responses, bounded by total body size."""
+
+    def __init__(self, name: str, max_bytes: int):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, etag: str) -> CachedResponse | None:
+        """Return the entry for `key` if it is at version `etag`."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry.etag == etag:
+                self._data.move_to_end(key)
+            else:
+                entry = None
+        get_metrics().cache_requests.labels(self.name, "hit" if entry else "miss").inc()
+        return entry
+
+    def put(self, key, entry: CachedResponse):
+        # Bodies larger than a quarter of the cache would evict most of it
+        if len(entry.body) > self.max_bytes // 4:
+            self.invalidate(key)
+            return
+        with self._lock:
+            self._pop(key)
+            self._data[key] = entry
+            self.size_bytes += len(entry.body)
+            while self.size_bytes > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self.size_bytes -= len(evicted.body)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size_bytes = 0
+
+    def _pop(self, key):
+        old = self._data.pop(key, None)
+        if old is not None:
+            self.size_bytes -= len(old.body)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._data), "size_bytes": self.size_bytes, "max_bytes": self.max_bytes}
+
+
+# Parse responses, keyed by file ID
+parse_results = ResponseCache("parse_result", settings.PARSE_CACHE_MB * 1024 * 1024)
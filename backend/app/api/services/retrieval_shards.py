@@ -0,0 +1,329 @@
+"""
+Retrieval shard module: corpus search across separate shard processes.
+
+By default every API worker loads and searches corpus indexes itself, so
+each worker holds its own copy of the vectors. With RETRIEVAL_SHARDS set,
+corpus search is sent to retrieval shards instead (retrieval_service.py),
+and the API tier only embeds the query and loads the winning chunk texts:
+
+- Each file (RETRIEVAL_SHARD_KEY=file) or each user's whole corpus
+  (RETRIEVAL_SHARD_KEY=user) belongs to one shard, chosen by rendezvous
+  hashing of its id over the shard names. Adding or removing a shard moves
+  only the keys that shard gains or loses, about 1/n of them.
+- Every request names the target shard and lists all shard names, so a
+  shard process works out which files it owns from the request alone. A
+  rebalanced map therefore needs no coordination: the shards index their
+  new share of the files on the next search. Requests also carry the
+  digest of the API's corpus version, so a shard only reads the user's
+  file list from the database when that digest changes.
+- A search goes to every shard that can hold the user's files: all of
+  them, or only the user's shard. The API merges the per-shard top-k.
+- Each shard has one or more replicas that serve identical results. Reads
+  rotate across replicas. A replica that fails is tried only after the
+  others for RETRIEVAL_REPLICA_BACKOFF seconds, and the next replica is
+  tried at once.
+- A map changed at runtime is written to RETRIEVAL_SHARD_MAP_FILE, and
+  every API worker switches to it the next time it gets the client after
+  the file changed.
+
+The protocol is JSON over HTTP (models.pydantic.retrieval_model). The
+query vector is sent as base64 float32.
+"""
+import asyncio
+import base64
+from dataclasses import dataclass
+import hashlib
+import heapq
+import itertools
+import json
+import logging
+import os
+from pathlib import Path
+import tempfile
+import threading
+import time
+
+import httpx
+import numpy as np
+
+from config import settings
+from services.telemetry import get_metrics
+
+logger = logging.getLogger(__name__)
+
+SHARD_KEYS = ("file", "user")
+
+
+def shard_for(key: int, shards) -> str:
+    """The shard owning `key`: the name with the highest hash of (name, key)."""
+    def weight(name: str) -> int:
+        digest = hashlib.blake2b(f"{name}:{key}".encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "big")
+    return max(shards, key=weight)
+
+
+@dataclass(frozen=True)
+class ShardSpec:
+    """One shard of a shard map, as seen by the process serving it."""
+    name: str
+    shards: tuple[str, ...]
+    key: str = "file"
+
+    def owns(self, user_id: int, file_id: int) -> bool:
+        return shard_for(file_id if self.key == "file" else user_id, self.shards) == self.name
+
+    @property
+    def digest(self) -> str:
+        return f"{self.key}:{self.name}/{','.join(sorted(self.shards))}"
+
+
+class RetrievalUnavailable(Exception):
+    """Raised when no replica of a shard answered."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def parse_shard_map(spec: str) -> dict[str, list[str]]:
+    """
+    Parse "name=url,url;name=url" into replica URLs per shard name.
+
+    Raises:
+        ValueError: If a shard has no name or no replica, or a name repeats
+    """
+    shards = {}
+    for entry in filter(None, (part.strip() for part in spec.split(";"))):
+        name, _, urls = entry.partition("=")
+        replicas = [url.strip().rstrip("/") for url in urls.split(",") if url.strip()]
+        if not name.strip() or not replicas:
+            raise ValueError(f"Invalid retrieval shard {entry!r}; expected name=url[,url...]")
+        if name.strip() in shards:
+            raise ValueError(f"Retrieval shard {name.strip()!r} is listed twice")
+        shards[name.strip()] = replicas
+    return shards
+
+
+def encode_vector(vector) -> str:
+    return base64.b64encode(np.ascontiguousarray(vector, dtype=np.float32).tobytes()).decode("ascii")
+
+
+def decode_vector(data: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(data), dtype=np.float32)
+
+
+class ReplicaSet:
+    """The replicas of one shard: round-robin reads, failed replicas last."""
+
+    def __init__(self, urls: list[str]):
+        self.urls = urls
+        self._turn = itertools.count()
+        self._failed_until = {}
+
+    def order(self, now: float) -> list[str]:
+        start = next(self._turn) % len(self.urls)
+        rotated = self.urls[start:] + self.urls[:start]
+        # Stable sort: healthy replicas in rotation order, then failed ones
+        return sorted(rotated, key=lambda url: self._failed_until.get(url, 0) > now)
+
+    def failed(self, url: str, now: float):
+        self._failed_until[url] = now + settings.RETRIEVAL_REPLICA_BACKOFF
+
+    def succeeded(self, url: str):
+        self._failed_until.pop(url, None)
+
+    def stats(self, now: float) -> list[dict]:
+        return [{"url": url, "healthy": self._failed_until.get(url, 0) <= now} for url in self.urls]
+
+
+class RetrievalClient:
+    """Scatter-gather corpus search over the shards of a shard map."""
+
+    def __init__(self, shards: dict[str, list[str]], key: str = settings.RETRIEVAL_SHARD_KEY,
+                 timeout: float = settings.RETRIEVAL_TIMEOUT):
+        self._client = httpx.AsyncClient(timeout=httpx.Timeout(timeout, connect=min(timeout, 2.0)))
+        # (replicas per shard name, shard key), replaced as a whole so a search
+        # in flight keeps the map it started with
+        self.shard_map = ({}, key)
+        self.rebalance(shards)
+
+    def rebalance(self, shards: dict[str, list[str]], key: str | None = None):
+        """
+        Switch to a new shard map. Searches started afterwards use it; the
+        shards index the files they gained on their next search.
+        """
+        key = key or self.key
+        shards = {name: [url.rstrip("/") for url in urls] for name, urls in shards.items()}
+        if not shards:
+            raise ValueError("A shard map needs at least one shard")
+        if not all(shards.values()):
+            raise ValueError("Every shard needs at least one replica")
+        if key not in SHARD_KEYS:
+            raise ValueError(f"Unknown shard key {key!r}; expected one of {SHARD_KEYS}")
+        # Replica health survives a rebalance for shards that keep their URLs
+        previous = self.replicas
+        self.shard_map = ({name: previous[name] if name in previous and previous[name].urls == urls
+                           else ReplicaSet(urls) for name, urls in shards.items()}, key)
+
+    @property
+    def replicas(self) -> dict[str, ReplicaSet]:
+        return self.shard_map[0]
+
+    @property
+    def key(self) -> str:
+        return self.shard_map[1]
+
+    async def _search_shard(self, name: str, replicas: ReplicaSet, payload: dict) -> dict:
+        metrics = get_metrics()
+        error = None
+        for url in replicas.order(time.monotonic()):
+            started = time.perf_counter()
+            try:
+                response = await self._client.post(f"{url}/search", json=payload)
+                if response.status_code < 500:
+                    # 4xx would be the same on every replica
+                    response.raise_for_status()
+                    replicas.succeeded(url)
+                    metrics.retrieval_requests.labels(name, "ok").inc()
+                    metrics.retrieval_seconds.labels(name).observe(time.perf_counter() - started)
+                    return response.json()
+                error = f"HTTP {response.status_code}"
+            except httpx.HTTPStatusError:
+                raise
+            except httpx.HTTPError as e:
+                error = f"{type(e).__name__}: {e}"
+            replicas.failed(url, time.monotonic())
+            metrics.retrieval_requests.labels(name, "failover").inc()
+            logger.warning(f"Retrieval replica {url} of shard {name} failed ({error}); trying the next one")
+        metrics.retrieval_requests.labels(name, "unavailable").inc()
+        raise RetrievalUnavailable(f"No replica of retrieval shard {name} answered ({error})",
+                                   settings.RETRIEVAL_REPLICA_BACKOFF)
+
+    async def search(self, user_id: int, query_vector, top_k: int, doc_fanout: int | None = None,
+                     section_fanout: int | None = None, corpus: str | None = None
+                     ) -> tuple[list[tuple[int, int, float]], dict | None, dict | None]:
+        """
+        Search the user's corpus on the shards and merge their results.
+
+        `corpus` is the digest of the caller's CorpusVersion of the user. Shards
+        remember which of the user's files they own per digest, so while it is
+        unchanged they skip reading the file list from the database.
+
+        Returns:
+            Tuple of ((file_id, chunk_index, score) best first, description
+            of the shard indexes searched, summed scan counts), the last two
+            None when no shard holds vectors of the user
+
+        Raises:
+            RetrievalUnavailable: If every replica of a needed shard failed
+        """
+        replicas, key = self.shard_map
+        names = list(replicas)
+        payload = {"user_id": user_id, "vector": encode_vector(query_vector), "top_k": top_k,
+                   "doc_fanout": doc_fanout, "section_fanout": section_fanout,
+                   "shards": names, "key": key, "corpus": corpus}
+        # Every shard may own some of the user's files, or one shard owns them all
+        targets = [shard_for(user_id, names)] if key == "user" else names
+        answers = await asyncio.gather(*(self._search_shard(name, replicas[name], {**payload, "shard": name})
+                                         for name in targets))
+
+        hits = heapq.nlargest(top_k, (tuple(hit) for answer in answers for hit in answer["hits"]),
+                              key=lambda hit: hit[2])
+        described = {name: answer["index"] for name, answer in zip(targets, answers) if answer["index"]}
+        if not described:
+            return [], None, None
+        scanned = {}
+        for answer in answers:
+            for level, count in (answer["scanned"] or {}).items():
+                scanned[level] = scanned.get(level, 0) + count
+        index = {"sharded": True, "shard_key": key, "size": sum(d["size"] for d in described.values()),
+                 "shards": described}
+        return [(int(file_id), int(chunk), float(score)) for file_id, chunk, score in hits], index, scanned
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        replicas, key = self.shard_map
+        return {"shard_key": key, "shards": {name: replica_set.stats(now) for name, replica_set in replicas.items()}}
+
+    async def aclose(self):
+        await self._client.aclose()
+
+
+_client = None
+# (mtime, size) of the shard map file the client last loaded
+_map_file_stamp = None
+_map_file_lock = threading.Lock()
+
+
+def _file_stamp(path: Path) -> tuple[int, int] | None:
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _reload_map_file(client: RetrievalClient):
+    """Switch `client` to the shard map file when it changed since it was last loaded."""
+    global _map_file_stamp
+    path = Path(settings.RETRIEVAL_SHARD_MAP_FILE)
+    stamp = _file_stamp(path)
+    if stamp is None or stamp == _map_file_stamp:
+        return
+    with _map_file_lock:
+        if stamp == _map_file_stamp:
+            return
+        # Recorded even when the file is invalid, so it is reported once rather than on every search
+        _map_file_stamp = stamp
+        try:
+            saved = json.loads(path.read_text(encoding="utf-8"))
+            client.rebalance(saved["shards"], saved["key"])
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.error(f"Ignoring retrieval shard map file {path}: {e}")
+            return
+        logger.info(f"Loaded retrieval shard map from {path}: {sorted(client.replicas)}")
+
+
+def save_shard_map(client: RetrievalClient):
+    """
+    Write the client's shard map to RETRIEVAL_SHARD_MAP_FILE, so the other
+    API workers (and this one after a restart) switch to it.
+    """
+    global _map_file_stamp
+    path = Path(settings.RETRIEVAL_SHARD_MAP_FILE)
+    replicas, key = client.shard_map
+    data = {"key": key, "shards": {name: replica_set.urls for name, replica_set in replicas.items()}}
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Written beside the file and renamed over it: workers read the old map or the new one
+    fd, staging = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as out:
+            json.dump(data, out, indent=2)
+        os.replace(staging, path)
+    except BaseException:
+        Path(staging).unlink(missing_ok=True)
+        raise
+    with _map_file_lock:
+        _map_file_stamp = _file_stamp(path)
+
+
+def get_retrieval_client() -> RetrievalClient | None:
+    """
+    Return the process-wide retrieval client, or None when retrieval runs in
+    process. The client follows the shard map file when there is one.
+    """
+    global _client
+    if _client is None and settings.RETRIEVAL_SHARDS:
+        _client = RetrievalClient(parse_shard_map(settings.RETRIEVAL_SHARDS))
+    if _client is not None and settings.RETRIEVAL_SHARD_MAP_FILE:
+        _reload_map_file(_client)
+    return _client
+
+
+async def close_retrieval_client():
+    """Close the retrieval client if it was created."""
+    global _client, _map_file_stamp
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+        _map_file_stamp = None
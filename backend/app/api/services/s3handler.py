@@ -4,16 +4,19 @@ S3 Storage Handler Module.
 This module provides functionality for interacting with AWS S3 for document storage.
 It handles uploading files to S3, downloading files from S3, and error handling
 for these operations. It uses boto3 for AWS SDK functionality.
+
+`S3Handler` is the `s3` storage backend (see services.storage).
 """
 from fastapi import UploadFile,HTTPException
 from decouple import config
-import boto3
 from datetime import datetime
+from typing import Iterator
+from services.storage import STREAM_CHUNK_SIZE, StorageBackend, not_found
 
 # handles s3 content
 
 
-class S3Handler:
+class S3Handler(StorageBackend):
     """
     Handler for AWS S3 operations including file uploads and downloads.
     
@@ -21,6 +24,8 @@ class S3Handler:
     handling configuration, credentials, and error management.
     """
 
+    name = "s3"
+
     def __init__(self):
         """
         Initialize the S3Handler with AWS credentials and bucket configuration.
@@ -28,6 +33,9 @@ class S3Handler:
         Reads configuration from environment variables using python-decouple.
         Sets up the boto3 S3 client with appropriate region and credentials.
         """
+        # Imported here rather than at module level to keep app startup fast
+        import boto3
+
         self.s3 = boto3.client(
             's3' ,
             aws_access_key_id=config('AWS_ACCESS_KEY'),
@@ -56,15 +64,16 @@ class S3Handler:
             s3_key = f"user_{user_id}/{timestamp}_{file.filename}"
             
             # Upload file
-            self.s3.upload_fileobj(
-                file.file,
-                self.bucket,
-                s3_key,
-                ExtraArgs={
-                    'ContentType': file.content_type,
-                    'ACL': 'private' 
-                }
-            )
+            with self._timed("upload", s3_key):
+                self.s3.upload_fileobj(
+                    file.file,
+                    self.bucket,
+                    s3_key,
+                    ExtraArgs={
+                        'ContentType': file.content_type,
+                        'ACL': 'private' 
+                    }
+                )
             return s3_key
         except Exception as e:
             raise HTTPException(
@@ -76,13 +85,66 @@ class S3Handler:
                 file.file.close()
 
     
-    # download_file => input: s3_key output:file content
-    def download_file_from_s3(self, s3_key: str) -> bytes:
+    # upload => input: file object, key output: None
+    def upload(self, fileobj, key: str, content_type: str):
+        """
+        Upload a file object to S3 under a caller-chosen key.
+        
+        Used for content-addressed storage, where the key is derived from the
+        content hash; re-uploading the same content to the same key is harmless.
+        
+        Args:
+            fileobj: Binary file object positioned at the start of the content
+            key: S3 key to store the object under
+            content_type: MIME type of the content
+            
+        Raises:
+            HTTPException: If the upload fails due to S3 errors
+        """
+        try:
+            with self._timed("upload", key):
+                self.s3.upload_fileobj(
+                    fileobj,
+                    self.bucket,
+                    key,
+                    ExtraArgs={
+                        'ContentType': content_type,
+                        'ACL': 'private'
+                    }
+                )
+        except Exception as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"S3 Upload Error: {str(e)}"
+            )
+
+    # delete => input: key output: None
+    def delete(self, key: str):
+        """
+        Delete an object from S3 (deleting a missing key is not an error).
+        
+        Args:
+            key: S3 key of the object to delete
+            
+        Raises:
+            HTTPException: If the deletion fails due to S3 errors
+        """
+        try:
+            with self._timed("delete", key):
+                self.s3.delete_object(Bucket=self.bucket, Key=key)
+        except Exception as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"S3 Delete Error: {str(e)}"
+            )
+
+    # download => input: key output: file content
+    def download(self, key: str) -> bytes:
         """
         Download a file from S3 and return its content.
         
         Args:
-            s3_key: S3 key (path) of the file to download
+            key: S3 key (path) of the file to download
             
         Returns:
             Binary content of the file as bytes
@@ -91,22 +153,63 @@ class S3Handler:
             HTTPException: If file not found (404) or other S3 errors (500)
         """
         try:
-            response = self.s3.get_object(Bucket=self.bucket, Key=s3_key)
-            # Read the content from the streaming body
-            file_content = response['Body'].read()
+            with self._timed("download", key):
+                response = self.s3.get_object(Bucket=self.bucket, Key=key)
+                # Read the content from the streaming body
+                file_content = response['Body'].read()
             return file_content
         except self.s3.exceptions.NoSuchKey:
+            raise not_found(key)
+        except Exception as e:
+            # Catch other potential Boto3/S3 errors
             raise HTTPException(
-                status_code=404,
-                detail=f"File not found in S3 with key: {s3_key}"
+                status_code=500,
+                detail=f"S3 Download Error: {str(e)}"
             )
+
+    # stream => input: key, byte range output: chunks of file content
+    def stream(self, key: str, start: int = 0, end: int | None = None,
+               chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+        """
+        Stream bytes [start, end) of an object with a ranged GET.
+        
+        Raises:
+            HTTPException: If file not found (404) or other S3 errors (500)
+        """
+        if end is not None and end <= start:
+            return iter(())
+        byte_range = f"bytes={start}-" if end is None else f"bytes={start}-{end - 1}"
+        try:
+            with self._timed("stream", key):
+                response = self.s3.get_object(Bucket=self.bucket, Key=key, Range=byte_range)
+        except self.s3.exceptions.NoSuchKey:
+            raise not_found(key)
         except Exception as e:
-            # Catch other potential Boto3/S3 errors
             raise HTTPException(
                 status_code=500,
                 detail=f"S3 Download Error: {str(e)}"
             )
+        return response['Body'].iter_chunks(chunk_size)
+
+    def _head(self, key: str) -> dict | None:
+        from botocore.exceptions import ClientError
 
+        try:
+            with self._timed("head", key):
+                return self.s3.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise HTTPException(
+                status_code=500,
+                detail=f"S3 Head Error: {str(e)}"
+            )
 
-   
+    def size(self, key: str) -> int:
+        head = self._head(key)
+        if head is None:
+            raise not_found(key)
+        return head['ContentLength']
 
+    def exists(self, key: str) -> bool:
+        return self._head(key) is not None
@@ -0,0 +1,208 @@
+"""
+Object storage module: where uploaded documents are kept.
+
+Routes and the content store talk to a `StorageBackend`, selected by
+STORAGE_BACKEND:
+
+- `s3`: `S3Handler` (services.s3handler), objects in S3_BUCKET_NAME
+- `local`: `LocalStorage`, one file per key under STORAGE_DIR. Uploads are
+  written to a temporary file, fsynced and renamed into place, so a key is
+  either absent or complete. Downloads are memory-mapped and handed to the
+  parser without copying the document into the process.
+
+Both back the same operations: upload, whole and streamed (optionally
+ranged) download, size, exists and delete. Keys are paths such as
+`content/sha256/<hash>/<generation>`. A missing key is reported as HTTPException 404 and
+other failures as 500, as routes expect.
+"""
+from contextlib import contextmanager
+import mmap
+import os
+from pathlib import Path
+import shutil
+import tempfile
+import threading
+from typing import Iterator
+
+from fastapi import HTTPException
+
+from config import settings
+from services.telemetry import get_metrics, span
+
+# Bytes per read and per chunk of a streamed download
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+
+class StorageBackend:
+    """Interface of an object store; keys are '/'-separated paths."""
+
+    name = "base"
+
+    @contextmanager
+    def _timed(self, operation: str, key: str):
+        with span(f"storage.{operation}", backend=self.name, key=key), \
+                get_metrics().storage_seconds.labels(self.name, operation).time():
+            yield
+
+    def upload(self, fileobj, key: str, content_type: str):
+        """Store the content of a binary file object under `key`, replacing any previous object."""
+        raise NotImplementedError
+
+    def download(self, key: str):
+        """Return the whole object as a bytes-like object (bytes or a read-only mmap)."""
+        raise NotImplementedError
+
+    def stream(self, key: str, start: int = 0, end: int | None = None,
+               chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+        """Yield bytes [start, end) of the object (to its end when `end` is None) in chunks."""
+        raise NotImplementedError
+
+    def size(self, key: str) -> int:
+        """Return the object's size in bytes."""
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        """Delete an object (deleting a missing key is not an error)."""
+        raise NotImplementedError
+
+
+def not_found(key: str) -> HTTPException:
+    return HTTPException(status_code=404, detail=f"File not found in storage with key: {key}")
+
+
+class LocalStorage(StorageBackend):
+    """Objects as files under a root directory on this node."""
+
+    name = "local"
+
+    def __init__(self, root: str | None = None):
+        self.root = Path(root or settings.STORAGE_DIR).resolve()
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        path = (self.root / key).resolve()
+        if not path.is_relative_to(self.root) or path == self.root:
+            raise HTTPException(status_code=400, detail=f"Invalid storage key: {key}")
+        return path
+
+    def upload(self, fileobj, key: str, content_type: str):
+        path = self._path(key)
+        staging = None
+        try:
+            with self._timed("upload", key):
+                path.parent.mkdir(parents=True, exist_ok=True)
+                # Written beside the target and renamed over it: readers see the old object or the new one
+                fd, staging = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+                with os.fdopen(fd, "wb") as out:
+                    shutil.copyfileobj(fileobj, out, STREAM_CHUNK_SIZE)
+                    out.flush()
+                    os.fsync(out.fileno())
+                os.replace(staging, path)
+                staging = None
+                _fsync_directory(path.parent)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Storage Upload Error: {str(e)}")
+        finally:
+            if staging is not None:
+                Path(staging).unlink(missing_ok=True)
+
+    def download(self, key: str):
+        """Return the object memory-mapped read-only; pages are read as the parser touches them."""
+        path = self._path(key)
+        try:
+            with self._timed("download", key), open(path, "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    # Empty files cannot be mapped
+                    return b""
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            raise not_found(key)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Storage Download Error: {str(e)}")
+
+    def stream(self, key: str, start: int = 0, end: int | None = None,
+               chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+        path = self._path(key)
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            raise not_found(key)
+        return self._read_range(f, start, end, chunk_size)
+
+    @staticmethod
+    def _read_range(f, start: int, end: int | None, chunk_size: int) -> Iterator[bytes]:
+        with f:
+            f.seek(start)
+            remaining = None if end is None else end - start
+            while remaining is None or remaining > 0:
+                chunk = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def size(self, key: str) -> int:
+        try:
+            return self._path(key).stat().st_size
+        except FileNotFoundError:
+            raise not_found(key)
+
+    def exists(self, key: str) -> bool:
+        return self._path(key).is_file()
+
+    def delete(self, key: str):
+        try:
+            with self._timed("delete", key):
+                self._path(key).unlink(missing_ok=True)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Storage Delete Error: {str(e)}")
+
+
+def _fsync_directory(directory: Path):
+    # Makes the rename itself durable; not every platform can open a directory
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def create_storage(name: str | None = None) -> StorageBackend:
+    """
+    Build the storage backend `name` (default STORAGE_BACKEND).
+
+    Raises:
+        ValueError: If the backend name is unknown
+    """
+    name = name or settings.STORAGE_BACKEND
+    if name == "local":
+        return LocalStorage()
+    if name == "s3":
+        # boto3 is only imported with the S3 backend
+        from services.s3handler import S3Handler
+        return S3Handler()
+    raise ValueError(f"Unknown storage backend: {name!r} (expected 's3' or 'local')")
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage() -> StorageBackend:
+    """Return the process-wide storage backend, creating it on first use."""
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            _storage = create_storage()
+        return _storage
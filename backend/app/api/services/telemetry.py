@@ -0,0 +1,233 @@
+"""
+Metrics and tracing module.
+
+This module instruments the upload, parse and query pipelines:
+
+- Prometheus metrics (request latency per route, pipeline stage latency,
+  parse volume, embedding batch sizes, S3 and database latency, LLM tokens
+  and cache hit rates), served on `/metrics`.
+- OpenTelemetry spans for every request and pipeline stage.
+
+Both are optional. With metrics disabled (or `prometheus_client` missing)
+every instrument is a shared no-op object, and with tracing disabled `span()`
+returns a shared null context, so instrumented code pays only a method call.
+
+Under gunicorn (PROMETHEUS_MULTIPROC_DIR set by gunicorn.conf.py) every
+worker writes its samples to files in that directory, and `/metrics` adds up
+the files of all workers, so a scrape reports the whole server whichever
+worker answers it.
+
+For tests, metrics can be read from a private registry and spans from an
+in-memory exporter:
+
+    metrics = Metrics(enabled=True)
+    metrics.registry.get_sample_value("rag_parse_chunks_total")
+
+    exporter = configure_tracing("memory")
+    ...
+    exporter.get_finished_spans()
+"""
+from contextlib import nullcontext
+from functools import lru_cache
+import logging
+import os
+import time
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from sub-millisecond DB statements to long generations
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Texts per embedding call
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+
+class _NullMetric:
+    """Stands in for every instrument when metrics are disabled."""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, amount: float = 1):
+        pass
+
+    def observe(self, amount: float):
+        pass
+
+    def set(self, value: float):
+        pass
+
+    def time(self):
+        return _NULL_CONTEXT
+
+
+_NULL_METRIC = _NullMetric()
+_NULL_CONTEXT = nullcontext()
+
+
+class Metrics:
+    """
+    The application's metric instruments, registered on their own registry.
+
+    A private registry (rather than the prometheus_client global one) keeps
+    separate instances independent, which is what tests need.
+    """
+
+    def __init__(self, enabled: bool = settings.METRICS_ENABLED):
+        self.registry = None
+        if enabled:
+            try:
+                import prometheus_client
+            except ImportError:
+                logger.warning("prometheus_client is not installed; metrics are disabled")
+            else:
+                self._prometheus = prometheus_client
+                self.registry = prometheus_client.CollectorRegistry()
+        self.enabled = self.registry is not None
+
+        self.http_request_seconds = self._histogram(
+            "rag_http_request_seconds", "HTTP request latency", ["method", "route", "status"])
+        self.stage_seconds = self._histogram(
+            "rag_stage_seconds", "Pipeline stage latency", ["pipeline", "stage"])
+        self.parse_bytes = self._counter("rag_parse_bytes_total", "Bytes of documents parsed")
+        self.parse_chunks = self._counter("rag_parse_chunks_total", "Chunks produced by parsing")
+        self.parse_vectors = self._counter("rag_parse_vectors_total", "Vectors stored by parsing")
+        self.parse_extractions = self._counter(
+            "rag_parse_extractions_total", "Documents per text extractor and outcome (fast, direct, fallback reasons)",
+            ["extractor", "outcome"])
+        self.parse_extract_seconds = self._histogram(
+            "rag_parse_extract_seconds", "Text extraction latency per extractor", ["extractor"])
+        self.parse_extract_bytes = self._counter(
+            "rag_parse_extract_bytes_total", "Document bytes extracted per extractor", ["extractor"])
+        self.parse_failed_pages = self._counter("rag_parse_failed_pages_total", "PDF pages skipped because partitioning failed")
+        self.embedding_batch_size = self._histogram(
+            "rag_embedding_batch_size", "Texts per embedding call", ["kind"], buckets=BATCH_SIZE_BUCKETS)
+        self.storage_seconds = self._histogram(
+            "rag_storage_request_seconds", "Object storage latency per backend", ["backend", "operation"])
+        self.db_seconds = self._histogram("rag_db_statement_seconds", "Database statement latency", ["operation"])
+        self.llm_requests = self._counter("rag_llm_requests_total", "LLM gateway requests", ["outcome"])
+        self.llm_tokens = self._counter("rag_llm_tokens_total", "Tokens processed by the LLM", ["kind"])
+        self.retrieval_requests = self._counter(
+            "rag_retrieval_requests_total", "Requests to retrieval shard replicas", ["shard", "outcome"])
+        self.retrieval_seconds = self._histogram(
+            "rag_retrieval_request_seconds", "Retrieval shard request latency", ["shard"])
+        self.cache_requests = self._counter("rag_cache_requests_total", "Cache lookups", ["cache", "result"])
+        self.admission_requests = self._counter(
+            "rag_admission_requests_total", "Admission decisions per priority class", ["priority", "result"])
+        self.admission_queue_seconds = self._histogram(
+            "rag_admission_queue_seconds", "Time admitted requests waited for a slot", ["priority"])
+        self.dedup_hits = self._counter("rag_dedup_hits_total", "Uploads and parses served from identical content", ["kind"])
+        self.dedup_bytes_saved = self._counter("rag_dedup_bytes_saved_total", "Upload bytes not stored again thanks to deduplication")
+
+    def _histogram(self, name: str, documentation: str, labels=(), buckets=LATENCY_BUCKETS):
+        if not self.enabled:
+            return _NULL_METRIC
+        return self._prometheus.Histogram(name, documentation, labels, registry=self.registry, buckets=buckets)
+
+    def _counter(self, name: str, documentation: str, labels=()):
+        if not self.enabled:
+            return _NULL_METRIC
+        return self._prometheus.Counter(name, documentation, labels, registry=self.registry)
+
+    def render(self) -> tuple[bytes, str]:
+        """
+        Return the metrics in the Prometheus text format and its content type;
+        in multiprocess mode, those of every worker of the server.
+        """
+        registry = self.registry
+        if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+            from prometheus_client import multiprocess
+            registry = self._prometheus.CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        return self._prometheus.generate_latest(registry), self._prometheus.CONTENT_TYPE_LATEST
+
+
+@lru_cache(maxsize=1)
+def get_metrics() -> Metrics:
+    """Return the process-wide metric instruments."""
+    return Metrics()
+
+
+_tracer = None
+
+
+def configure_tracing(exporter: str = settings.TRACING_EXPORTER):
+    """
+    Enable OpenTelemetry tracing with the given exporter.
+
+    Args:
+        exporter: "none", "console", "otlp" (configured through the standard
+            OTEL_EXPORTER_OTLP_* environment variables) or "memory"
+
+    Returns:
+        The span exporter, or None when tracing is disabled
+
+    Raises:
+        ValueError: If the exporter is unknown
+    """
+    global _tracer
+    if exporter in ("", "none"):
+        _tracer = None
+        return None
+
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, SimpleSpanProcessor
+
+    if exporter == "memory":
+        from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+        span_exporter = InMemorySpanExporter()
+        processor = SimpleSpanProcessor(span_exporter)
+    elif exporter == "console":
+        from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+        span_exporter = ConsoleSpanExporter()
+        processor = BatchSpanProcessor(span_exporter)
+    elif exporter == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        span_exporter = OTLPSpanExporter()
+        processor = BatchSpanProcessor(span_exporter)
+    else:
+        raise ValueError(f"Unknown tracing exporter '{exporter}'. Available: none, console, otlp, memory")
+
+    # A private provider, so reconfiguring (e.g. between tests) does not fight
+    # the once-only global provider
+    provider = TracerProvider(resource=Resource.create({"service.name": settings.TRACING_SERVICE_NAME}))
+    provider.add_span_processor(processor)
+    _tracer = provider.get_tracer(__name__)
+    logger.info(f"Tracing enabled with the {exporter} exporter")
+    return span_exporter
+
+
+def tracing_enabled() -> bool:
+    return _tracer is not None
+
+
+def span(name: str, **attributes):
+    """
+    Context manager that records a span when tracing is enabled.
+
+    Spans nest through the current context, so stage spans opened inside a
+    request end up as children of the request span.
+    """
+    if _tracer is None:
+        return _NULL_CONTEXT
+    return _tracer.start_as_current_span(name, attributes=attributes or None)
+
+
+def instrument_engine(engine):
+    """Record the latency of every SQL statement executed on `engine`."""
+    metrics = get_metrics()
+    if not metrics.enabled:
+        return
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._telemetry_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "UNKNOWN"
+        metrics.db_seconds.labels(operation).observe(time.perf_counter() - context._telemetry_started)
@@ -0,0 +1,63 @@
+"""
+Request stage timing module.
+
+This module provides a small stopwatch that records how long each stage of
+a request takes (database load, embedding, search, LLM, ...). The recorded
+durations are reported in API responses and as a `Server-Timing` header,
+which browsers show in the network panel. A timer created with a pipeline
+name also exports every stage as a tracing span and a stage latency metric.
+"""
+from contextlib import contextmanager
+import time
+
+from services.telemetry import get_metrics, span
+
+
+class StageTimer:
+    """
+    Records named stage durations in milliseconds for one request.
+
+    Usage:
+        timer = StageTimer("query")
+        with timer.stage("db_load"):
+            ...
+        timer.finish()
+        response.headers["Server-Timing"] = timer.server_timing()
+    """
+
+    def __init__(self, pipeline: str | None = None):
+        self.pipeline = pipeline
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time the enclosed block; repeated stages accumulate."""
+        start = time.perf_counter()
+        try:
+            if self.pipeline is None:
+                yield
+            else:
+                with span(f"{self.pipeline}.{name}"):
+                    yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.stages[name] = self.stages.get(name, 0.0) + seconds * 1000
+            if self.pipeline is not None:
+                get_metrics().stage_seconds.labels(self.pipeline, name).observe(seconds)
+
+    def elapsed(self) -> float:
+        """Seconds since the timer was created."""
+        return time.perf_counter() - self.started
+
+    def finish(self):
+        """Record the total request time."""
+        self.stages["total"] = self.elapsed() * 1000
+
+    def as_dict(self) -> dict:
+        """Return stage durations in milliseconds, rounded for display."""
+        return {name: round(ms, 2) for name, ms in self.stages.items()}
+
+    def server_timing(self) -> str:
+        """Format the stages as a Server-Timing header value."""
+        return ", ".join(f"{name};dur={ms:.2f}" for name, ms in self.stages.items())
@@ -0,0 +1,399 @@
+"""
+Vector store module: compact indexes for searching many chunks at once.
+
+Holding a corpus as float32 costs 4 bytes per dimension per chunk (1.5 KB
+for a 384-dimensional MiniLM vector). A `VectorIndex` keeps the vectors
+encoded by a codec instead:
+
+- flat: float32 as stored, scored exactly
+- int8: scalar quantization, one byte per dimension with a per-dimension
+        offset and step trained from the stored embeddings (4x smaller)
+- pq:   product quantization; each vector is split into m subspaces and
+        every subspace is coded as the nearest of up to 256 k-means
+        centroids, so a vector takes m bytes (32x smaller at 384 dims, m=48)
+
+Search is asymmetric: the query stays in float32 and is scored against the
+codes directly, through a rescaled query (int8) or per-subspace lookup
+tables (pq), without decoding the corpus. The best `candidates` rows are
+then rescored exactly against the float vectors, which a saved index keeps
+on disk and memory-maps, so only those rows are read.
+
+Vectors are L2-normalised when indexed, so scores are cosine similarities,
+as in `find_top_k_chunks_manual`. A saved index records its codec and the
+codec's parameters in index.json and is always read back with them.
+"""
+import json
+import logging
+import os
+from pathlib import Path
+
+import numpy as np
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Rows scored per step, which bounds the temporary arrays of a search
+SEARCH_BLOCK_ROWS = 8192
+
+# Version of the on-disk layout written by VectorIndex.save
+INDEX_FORMAT = 1
+
+
+def normalize(vectors) -> np.ndarray:
+    """Return float32 rows scaled to unit length (zero rows stay zero)."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def top_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(scores, -k)[-k:]
+    return top[np.argsort(scores[top])[::-1]]
+
+
+class VectorCodec:
+    """
+    Base class for codecs. A codec is trained on a sample of the vectors,
+    encodes rows to codes, and scores codes against a prepared query.
+    """
+    name = "base"
+    # True when `score` returns exact inner products; approximate codecs keep
+    # the float vectors so their shortlist can be rescored exactly
+    exact = False
+
+    def train(self, vectors: np.ndarray, seed: int = 0) -> "VectorCodec":
+        return self
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def prepare(self, query: np.ndarray):
+        """Precompute whatever `score` needs for one query."""
+        return query
+
+    def score(self, prepared, codes: np.ndarray) -> np.ndarray:
+        """Approximate inner products between the query and a block of codes."""
+        raise NotImplementedError
+
+    def params(self) -> dict:
+        """Parameters recorded in index.json."""
+        return {}
+
+    def state(self) -> dict[str, np.ndarray]:
+        """Trained arrays, saved next to the index."""
+        return {}
+
+    @classmethod
+    def restore(cls, params: dict, state: dict[str, np.ndarray]) -> "VectorCodec":
+        return cls(**params)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in self.state().values())
+
+
+class FlatCodec(VectorCodec):
+    """Stores float32 vectors and scores them exactly."""
+    name = "flat"
+    exact = True
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.ascontiguousarray(vectors, dtype=np.float32)
+
+    def score(self, prepared, codes: np.ndarray) -> np.ndarray:
+        return codes @ prepared
+
+
+class Int8Codec(VectorCodec):
+    """
+    Scalar quantization to one unsigned byte per dimension.
+
+    Each dimension gets an offset and step covering the central range of the
+    training values (outliers are clipped), so x ~ offset + step * code and
+    q . x ~ q . offset + (q * step) . code.
+    """
+    name = "int8"
+
+    # Quantiles of the training values mapped to codes 0 and 255
+    CLIP_QUANTILE = 0.001
+
+    def __init__(self):
+        self.offset = None
+        self.step = None
+
+    def train(self, vectors: np.ndarray, seed: int = 0) -> "Int8Codec":
+        low = np.quantile(vectors, self.CLIP_QUANTILE, axis=0)
+        high = np.quantile(vectors, 1 - self.CLIP_QUANTILE, axis=0)
+        self.offset = low.astype(np.float32)
+        self.step = np.maximum((high - low) / 255, 1e-12).astype(np.float32)
+        return self
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.rint((vectors - self.offset) / self.step)
+        return np.clip(codes, 0, 255).astype(np.uint8)
+
+    def prepare(self, query: np.ndarray):
+        return query * self.step, float(query @ self.offset)
+
+    def score(self, prepared, codes: np.ndarray) -> np.ndarray:
+        scaled_query, bias = prepared
+        return codes.astype(np.float32) @ scaled_query + bias
+
+    def state(self) -> dict[str, np.ndarray]:
+        return {"offset": self.offset, "step": self.step}
+
+    @classmethod
+    def restore(cls, params: dict, state: dict[str, np.ndarray]) -> "Int8Codec":
+        codec = cls()
+        codec.offset, codec.step = state["offset"], state["step"]
+        return codec
+
+
+class PQCodec(VectorCodec):
+    """
+    Product quantization with one byte per subspace.
+
+    Scoring builds a (subspaces x centroids) table of inner products between
+    the query's sub-vectors and every centroid; a code's score is the sum of
+    its table entries (asymmetric distance computation).
+    """
+    name = "pq"
+
+    # Training rows used per centroid at most
+    TRAIN_PER_CENTROID = 40
+
+    def __init__(self, subspaces: int = settings.VECTOR_PQ_SUBSPACES, centroids: int = 256,
+                 iterations: int = 15):
+        self.subspaces = subspaces
+        self.centroids = centroids
+        self.iterations = iterations
+        self.codebooks = None
+
+    def train(self, vectors: np.ndarray, seed: int = 0) -> "PQCodec":
+        dimension = vectors.shape[1]
+        if dimension % self.subspaces:
+            # Subspaces must split the vector evenly; use the nearest count that does
+            fitted = max(m for m in range(1, self.subspaces + 1) if dimension % m == 0)
+            logger.info(f"PQ: {self.subspaces} subspaces do not divide {dimension} dimensions, using {fitted}")
+            self.subspaces = fitted
+        self.centroids = min(self.centroids, 256, len(vectors))
+        rng = np.random.default_rng(seed)
+        if len(vectors) > self.TRAIN_PER_CENTROID * self.centroids:
+            # More rows barely move the centroids but slow every k-means iteration
+            rows = rng.choice(len(vectors), self.TRAIN_PER_CENTROID * self.centroids, replace=False)
+            vectors = vectors[np.sort(rows)]
+        self.codebooks = np.stack([
+            _kmeans(part, self.centroids, self.iterations, rng)
+            for part in self._split(vectors)
+        ])
+        return self
+
+    def _split(self, vectors: np.ndarray) -> list[np.ndarray]:
+        # Contiguous copies: matrix products on strided column slices skip BLAS
+        return [np.ascontiguousarray(part) for part in np.split(vectors, self.subspaces, axis=1)]
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.empty((len(vectors), self.subspaces), dtype=np.uint8)
+        for j, part in enumerate(self._split(vectors)):
+            codes[:, j] = _nearest(part, self.codebooks[j])
+        return codes
+
+    def prepare(self, query: np.ndarray):
+        sub_queries = query.reshape(self.subspaces, -1)
+        return np.einsum("mkd,md->mk", self.codebooks, sub_queries).astype(np.float32)
+
+    def score(self, prepared, codes: np.ndarray) -> np.ndarray:
+        scores = np.zeros(len(codes), dtype=np.float32)
+        for j in range(self.subspaces):
+            scores += np.take(prepared[j], codes[:, j])
+        return scores
+
+    def params(self) -> dict:
+        return {"subspaces": self.subspaces, "centroids": self.centroids, "iterations": self.iterations}
+
+    def state(self) -> dict[str, np.ndarray]:
+        return {"codebooks": self.codebooks}
+
+    @classmethod
+    def restore(cls, params: dict, state: dict[str, np.ndarray]) -> "PQCodec":
+        codec = cls(**params)
+        codec.codebooks = state["codebooks"]
+        return codec
+
+
+def _nearest(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    # argmin |x - c|^2 = argmin (|c|^2 - 2 x.c), in blocks to bound the distance matrix
+    squared = (centroids * centroids).sum(axis=1)
+    nearest = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), SEARCH_BLOCK_ROWS):
+        block = vectors[start:start + SEARCH_BLOCK_ROWS]
+        nearest[start:start + len(block)] = np.argmin(squared - 2 * (block @ centroids.T), axis=1)
+    return nearest
+
+
+def _kmeans(vectors: np.ndarray, k: int, iterations: int, rng: np.random.Generator) -> np.ndarray:
+    """Lloyd's k-means; empty clusters are re-seeded from random training rows."""
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].astype(np.float32)
+    for _ in range(iterations):
+        assignment = _nearest(vectors, centroids)
+        counts = np.bincount(assignment, minlength=k)
+        sums = np.stack([np.bincount(assignment, weights=column, minlength=k) for column in vectors.T], axis=1)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        if empty.any():
+            centroids[empty] = vectors[rng.choice(len(vectors), int(empty.sum()), replace=False)]
+    return centroids
+
+
+# Registry of codecs, keyed by the names used in the VECTOR_CODEC setting
+VECTOR_CODECS = {
+    "flat": FlatCodec,
+    "int8": Int8Codec,
+    "pq": PQCodec,
+}
+
+
+def create_codec(name: str, **params) -> VectorCodec:
+    """Instantiate a codec by name (see VECTOR_CODECS)."""
+    if name not in VECTOR_CODECS:
+        raise ValueError(f"Unknown vector codec '{name}'; choose one of {sorted(VECTOR_CODECS)}")
+    return VECTOR_CODECS[name](**params)
+
+
+class VectorIndex:
+    """
+    Encoded vectors plus the row ids they belong to.
+
+    `ids` is an int64 array of shape (n, 2) holding (file_id, chunk_index)
+    per row. `vectors` are the normalised float32 rows used for rescoring;
+    after `load` they are a read-only memory map, and they are not kept for
+    flat indexes, whose codes already are the vectors.
+    """
+
+    def __init__(self, codec: VectorCodec, codes: np.ndarray, ids: np.ndarray, dimension: int,
+                 vectors: np.ndarray | None = None):
+        self.codec = codec
+        self.codes = codes
+        self.ids = ids
+        self.dimension = dimension
+        self.vectors = None if codec.exact else vectors
+
+    @classmethod
+    def build(cls, vectors, ids, codec: str = "flat", train_sample: int = settings.VECTOR_TRAIN_SAMPLE,
+              seed: int = 0, **params) -> "VectorIndex":
+        """
+        Train a codec on (a sample of) the vectors and encode all of them.
+
+        Args:
+            vectors: Array-like of shape (n, dimension)
+            ids: Array-like of shape (n, 2) with (file_id, chunk_index) per row
+            codec: Codec name from VECTOR_CODECS
+            train_sample: Rows sampled for training the codec
+            seed: Seed for sampling and k-means initialisation
+            **params: Codec parameters (e.g. subspaces for pq)
+        """
+        vectors = normalize(vectors).reshape(len(vectors), -1)
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1, 2)
+        if len(vectors) != len(ids):
+            raise ValueError(f"{len(vectors)} vectors but {len(ids)} ids")
+        if not len(vectors):
+            raise ValueError("Cannot build an index without vectors")
+        rng = np.random.default_rng(seed)
+        sample = vectors
+        if len(vectors) > train_sample:
+            sample = vectors[np.sort(rng.choice(len(vectors), train_sample, replace=False))]
+        encoder = create_codec(codec, **params).train(sample, seed=seed)
+        codes = np.concatenate([
+            encoder.encode(vectors[start:start + SEARCH_BLOCK_ROWS])
+            for start in range(0, len(vectors), SEARCH_BLOCK_ROWS)
+        ])
+        return cls(encoder, codes, ids, vectors.shape[1], vectors)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held in memory: codes, row ids and the codec's trained state."""
+        return int(self.codes.nbytes + self.ids.nbytes + self.codec.nbytes)
+
+    def approximate_scores(self, query: np.ndarray, rows: np.ndarray | None = None) -> np.ndarray:
+        """Codec scores of every row, or of the given rows, for a normalised query."""
+        prepared = self.codec.prepare(query)
+        count = len(self) if rows is None else len(rows)
+        scores = np.empty(count, dtype=np.float32)
+        for start in range(0, count, SEARCH_BLOCK_ROWS):
+            block = (self.codes[start:start + SEARCH_BLOCK_ROWS] if rows is None
+                     else self.codes[rows[start:start + SEARCH_BLOCK_ROWS]])
+            scores[start:start + len(block)] = self.codec.score(prepared, block)
+        return scores
+
+    def search(self, query, k: int, candidates: int | None = None,
+               rows: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Find the k rows most similar to a query vector.
+
+        The codec's scores select `candidates` rows (at least k), which are
+        rescored exactly when float vectors are available. `rows` limits the
+        search to a subset of the rows.
+
+        Returns:
+            Tuple of (row numbers, cosine similarities), best first
+        """
+        query = normalize(query)
+        scores = self.approximate_scores(query, rows)
+        if self.vectors is None:
+            top = top_indices(scores, k)
+            return (top if rows is None else rows[top]), scores[top]
+
+        shortlist = top_indices(scores, max(k, candidates or settings.VECTOR_RESCORE_CANDIDATES))
+        shortlist = np.sort(shortlist if rows is None else rows[shortlist])
+        # Sorted rows read the memory-mapped vectors front to back
+        exact = np.asarray(self.vectors[shortlist]) @ query
+        order = top_indices(exact, k)
+        return shortlist[order], exact[order]
+
+    def describe(self) -> dict:
+        """The codec and size of the index, as recorded in index.json."""
+        return {
+            "codec": self.codec.name,
+            "params": self.codec.params(),
+            "size": len(self),
+            "dimension": self.dimension,
+            "memory_bytes": self.nbytes,
+        }
+
+    def save(self, directory: str | os.PathLike):
+        """
+        Write the index to a directory: index.json, ids.npy, codes.npy,
+        codec_<array>.npy and, unless flat, vectors.npy for rescoring.
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        np.save(directory / "ids.npy", self.ids)
+        np.save(directory / "codes.npy", self.codes)
+        for name, array in self.codec.state().items():
+            np.save(directory / f"codec_{name}.npy", array)
+        if self.vectors is not None:
+            np.save(directory / "vectors.npy", np.asarray(self.vectors, dtype=np.float32))
+        # Written last: a directory with index.json is complete
+        meta = {"format": INDEX_FORMAT, **self.describe(), "state": sorted(self.codec.state())}
+        (directory / "index.json").write_text(json.dumps(meta, indent=2))
+
+    @classmethod
+    def load(cls, directory: str | os.PathLike) -> "VectorIndex":
+        """Read an index written by `save`; the float vectors are memory-mapped."""
+        directory = Path(directory)
+        meta = json.loads((directory / "index.json").read_text())
+        if meta.get("format") != INDEX_FORMAT:
+            raise ValueError(f"Unsupported index format {meta.get('format')} in {directory}")
+        state = {name: np.load(directory / f"codec_{name}.npy") for name in meta["state"]}
+        codec = VECTOR_CODECS[meta["codec"]].restore(meta["params"], state)
+        vectors_path = directory / "vectors.npy"
+        vectors = np.load(vectors_path, mmap_mode="r") if vectors_path.exists() else None
+        return cls(codec, np.load(directory / "codes.npy"), np.load(directory / "ids.npy"), meta["dimension"], vectors)
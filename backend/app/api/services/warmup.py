@@ -0,0 +1,127 @@
+"""
+Model warm-up and readiness module.
+
+Heavy dependencies (torch/sentence-transformers or ONNX Runtime, the
+tokenizers and unstructured) are imported on first use, so the app starts
+in about a second. With WARMUP_ON_STARTUP the lifespan hook loads them in a
+background task instead. The server accepts traffic right away and
+`/health/ready` reports 503 until every component has loaded, so an
+orchestrator only routes queries to warm workers.
+
+Under gunicorn with preload, `preload_models` loads the weights in the master
+before workers fork, so all workers share one copy.
+"""
+import asyncio
+import logging
+import time
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ReadinessState:
+    """Load status of every warmed-up component."""
+
+    def __init__(self):
+        self.components = {}
+
+    def mark(self, name: str, status: str, **details):
+        self.components[name] = {"status": status, **details}
+
+    @property
+    def ready(self) -> bool:
+        # Nothing registered means warm-up is disabled and models load lazily
+        return all(c["status"] == "ready" for c in self.components.values())
+
+    def snapshot(self) -> dict:
+        return {"ready": self.ready, "components": dict(self.components)}
+
+
+readiness = ReadinessState()
+
+
+async def _load_embedder():
+    # Goes through the same path as queries, so the worker pool starts too when enabled
+    from services.embedding_pool import embed_query_async
+    await embed_query_async("warm up")
+
+
+def _load_tokenizer():
+    from services.context_builder import count_tokens
+    from services.chunking import get_tokenizer
+    get_tokenizer(settings.EMBEDDING_MODEL_NAME)
+    count_tokens(["warm up"])
+
+
+def _load_parser():
+    import unstructured.partition.auto  # noqa: F401
+
+
+# Loaded in this order: the query path first
+WARMUP_STEPS = (
+    ("embedder", _load_embedder),
+    ("tokenizer", _load_tokenizer),
+    ("parser", _load_parser),
+)
+
+
+async def warm_up():
+    """Load every component, recording its status and load time."""
+    for name, step in WARMUP_STEPS:
+        readiness.mark(name, "loading")
+        started = time.perf_counter()
+        try:
+            if asyncio.iscoroutinefunction(step):
+                await step()
+            else:
+                await asyncio.to_thread(step)
+        except Exception as e:
+            logger.exception(f"Warm-up of {name} failed")
+            readiness.mark(name, "failed", error=str(e))
+        else:
+            seconds = round(time.perf_counter() - started, 3)
+            readiness.mark(name, "ready", seconds=seconds)
+            logger.info(f"Warmed up {name} in {seconds}s")
+
+
+def start_warm_up() -> asyncio.Task:
+    """Mark all components pending and start loading them in the background."""
+    for name, _ in WARMUP_STEPS:
+        readiness.mark(name, "pending")
+    return asyncio.create_task(warm_up())
+
+
+def preload_models():
+    """
+    Load model weights in the current process without running inference.
+
+    Called in the gunicorn master before workers fork: the weights are then
+    shared copy-on-write, and each worker's warm-up only runs a first
+    inference (which starts the runtime's thread pools in the worker). ONNX
+    Runtime sessions start thread pools when created, which do not survive
+    fork, so they are left to the workers, as is the embedding worker pool.
+    """
+    from services.chunking import get_tokenizer
+    from services.embeddings import get_embedder
+
+    def load_tokenizers():
+        for name in {settings.EMBEDDING_MODEL_NAME, settings.CONTEXT_TOKENIZER}:
+            get_tokenizer(name)
+
+    steps = [
+        ("tokenizer", load_tokenizers),
+        ("parser", _load_parser),
+    ]
+    if settings.EMBEDDING_WORKERS <= 0 and settings.EMBEDDING_BACKEND == "huggingface":
+        steps.insert(0, ("embedder", get_embedder))
+
+    for name, step in steps:
+        started = time.perf_counter()
+        try:
+            step()
+        except Exception:
+            # Workers fall back to loading it themselves
+            logger.exception(f"Preloading {name} failed")
+        else:
+            logger.info(f"Preloaded {name} in {time.perf_counter() - started:.2f}s")
@@ -0,0 +1,89 @@
+"""
+Corpus snapshot command line.
+
+Exports parse results (chunks, vectors and metadata) to columnar,
+memory-mappable snapshots, restores them into a database, and prebuilds
+corpus indexes from them, so new workers warm up without reading every
+`ParsedContent` row through the ORM. See services/corpus_snapshot.py for
+the layout.
+
+Run from backend/app/api:
+    python snapshot.py export                      # everything, full snapshot
+    python snapshot.py export --incremental        # parse results created since the last snapshot
+    python snapshot.py export --user alice         # one user's parse results
+    python snapshot.py list
+    python snapshot.py warm                        # build corpus indexes from the snapshots
+    python snapshot.py import --user alice         # restore missing parse results into the database
+
+The snapshot directory defaults to the SNAPSHOT_DIR setting.
+"""
+import argparse
+import json
+import sys
+import time
+
+from config import database, settings
+from models.sqlalchemy import content_blob  # noqa: F401  (files reference its table)
+from models.sqlalchemy.users import User
+from services.corpus_index import get_user_index, indexes
+from services.corpus_snapshot import (
+    SnapshotSet, export_snapshot, import_snapshots, list_snapshots, read_manifest,
+)
+
+
+def _user_id(db, username: str | None) -> int | None:
+    if username is None:
+        return None
+    user = db.query(User.id).filter(User.username == username).first()
+    if user is None:
+        sys.exit(f"User '{username}' not found")
+    return user.id
+
+
+def export(db, args) -> dict:
+    path = export_snapshot(db, args.dir, _user_id(db, args.user), incremental=args.incremental)
+    return {"snapshot": str(path), **read_manifest(path)}
+
+
+def list_(db, args) -> dict:
+    return {"snapshots": [{"name": path.name, **read_manifest(path)} for path in list_snapshots(args.dir)]}
+
+
+def warm(db, args) -> dict:
+    # Index builds read vectors from the snapshots in SNAPSHOT_DIR
+    settings.SNAPSHOT_DIR = args.dir
+    user_id = _user_id(db, args.user)
+    users = [user_id] if user_id is not None else [row.id for row in db.query(User.id).order_by(User.id)]
+    built = {}
+    for uid in users:
+        start = time.perf_counter()
+        index = get_user_index(db, uid)
+        if index is not None:
+            built[uid] = {"size": len(index), "sections": index.sections, "codec": index.codec.name,
+                          "seconds": round(time.perf_counter() - start, 3)}
+        # Only the saved copies matter; the command exits afterwards
+        indexes.clear()
+    return {"indexes": built, "index_dir": settings.VECTOR_INDEX_DIR}
+
+
+def import_(db, args) -> dict:
+    return import_snapshots(db, SnapshotSet(args.dir), _user_id(db, args.user))
+
+
+COMMANDS = {"export": export, "list": list_, "warm": warm, "import": import_}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("command", choices=COMMANDS)
+    parser.add_argument("--dir", default=settings.SNAPSHOT_DIR or "snapshots", help="Snapshot directory")
+    parser.add_argument("--user", help="Username to limit the command to (default: everyone)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="export: only parse results created since the previous snapshot")
+    args = parser.parse_args()
+
+    db = database.SessionLocal()
+    try:
+        print(json.dumps(COMMANDS[args.command](db, args), indent=2))
+    finally:
+        db.close()
@@ -21,6 +21,12 @@ export const login = async (username, password, navigate) => {
   }
 };
 
+// Authorization header for API calls, once the user has logged in
+export const authHeaders = () => {
+  const token = localStorage.getItem('ragnarok_token');
+  return token ? { Authorization: `Bearer ${token}` } : {};
+};
+
 export const logout = () => {
   localStorage.removeItem('ragnarok_token');
   localStorage.removeItem('ragnarok_user');
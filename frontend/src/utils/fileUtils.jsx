@@ -1,4 +1,5 @@
 import axios from "axios";
+import { authHeaders } from "./authUtils";
 
 export const upload_file = async (file, owner) => {
     const baseUrl = `http://localhost:5050/file/upload/${owner}`;
@@ -11,6 +12,7 @@ export const upload_file = async (file, owner) => {
         const response = await axios.post(baseUrl, formData, {
             headers: {
                 'Content-Type': 'multipart/form-data',
+                ...authHeaders(),
             },
         });
         console.log(response)
@@ -53,7 +55,7 @@ export const getAllFilesByOwner = async (owner) => {
     const baseUrl = `http://localhost:5050/file/get-all/${owner}`
     try {
         
-        const response = await axios.get(baseUrl)
+        const response = await axios.get(baseUrl, { headers: authHeaders() })
         console.log(response)
         return response.data.files
         }
@@ -88,6 +90,7 @@ export const parseFileById = async (owner, fileId) => {
             method: 'GET', 
             headers: {
                 'Accept': 'application/json',
+                ...authHeaders(),
             },
         });
 
@@ -1,3 +1,4 @@
+import { authHeaders } from "./authUtils";
 
 export const submitQuery = async (owner, fileId, query, top_k = 5) => {
     if (!owner || !fileId || !query) {
@@ -18,6 +19,7 @@ export const submitQuery = async (owner, fileId, query, top_k = 5) => {
             headers: {
                 'Content-Type': 'application/json',
                 'Accept': 'application/json',
+                ...authHeaders(),
             },
             body: JSON.stringify(requestBody)
         });